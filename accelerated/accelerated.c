@@ -62,8 +62,26 @@ PyObject *py_varint_encode(PyObject *self, PyObject *args) {
   unsigned char buffer[100];
   Py_ssize_t index = sizeof(buffer);
   unsigned PY_LONG_LONG value;
+  PyObject *value_obj;
+  PyObject *long_obj;
 
-  if (!PyArg_ParseTuple(args, "K", &value))
+  if (!PyArg_ParseTuple(args, "O", &value_obj))
+    return NULL;
+
+  long_obj = PyNumber_Long(value_obj);
+  if (!long_obj)
+    return NULL;
+
+  if (_PyLong_Sign(long_obj) < 0) {
+    Py_DECREF(long_obj);
+    PyErr_SetString(
+        PyExc_ValueError, "Varint can not encode a negative number.");
+    return NULL;
+  }
+
+  value = PyLong_AsUnsignedLongLong(long_obj);
+  Py_DECREF(long_obj);
+  if (value == (unsigned PY_LONG_LONG)-1 && PyErr_Occurred())
     return NULL;
 
   // Can't really happen but just in case.
@@ -77,6 +95,9 @@ PyObject *py_varint_encode(PyObject *self, PyObject *args) {
 }
 
 
+// Decode a Varint from the buffer into result. Returns 1 on success and 0 if
+// the buffer ends before the Varint does or the Varint is longer than 64 bits.
+// On success decoded_length is set to the number of bytes consumed.
 int varint_decode(unsigned PY_LONG_LONG *result,
                   const char *buffer, Py_ssize_t length,
                   Py_ssize_t *decoded_length) {
@@ -98,217 +119,327 @@ int varint_decode(unsigned PY_LONG_LONG *result,
     }
 
     shift += 7;
-  } while (shift < 64);
+  }
 
-  // Error decoding varint - buffer too short.
+  // Error decoding varint - buffer too short or too many bytes.
   return 0;
 }
 
 
+// Raise the error matching the pure python decoders: running out of buffer is
+// an IndexError, a Varint longer than 64 bits is a ValueError.
+static void set_varint_error(const char *buffer, Py_ssize_t length) {
+  Py_ssize_t pos;
+
+  for (pos = 0; pos < length && pos < 10; pos++) {
+    if ((buffer[pos] & 0x80) == 0)
+      break;
+  }
+
+  if (pos >= length) {
+    PyErr_SetString(PyExc_IndexError, "Buffer too short to decode varint.");
+  } else {
+    PyErr_SetString(PyExc_ValueError, "Too many bytes when decoding varint.");
+  }
+}
+
+
+// Parse the (buffer, pos) arguments shared by the decoding functions.
+static int parse_buffer_and_pos(PyObject *args, const char **buffer,
+                                Py_ssize_t *length, Py_ssize_t *pos) {
+  *pos = 0;
+  if (!PyArg_ParseTuple(args, "s#|n", buffer, length, pos))
+    return 0;
+
+  if (*pos < 0 || *pos > *length) {
+    PyErr_SetString(PyExc_IndexError, "Position outside buffer.");
+    return 0;
+  }
+
+  return 1;
+}
+
+
 PyObject *py_varint_decode(PyObject *self, PyObject *args) {
   const char *buffer;
   Py_ssize_t pos = 0;
   Py_ssize_t length = 0;
+  Py_ssize_t decoded_length = 0;
   unsigned PY_LONG_LONG result = 0;
 
-  if (!PyArg_ParseTuple(args, "s#n", &buffer, &length, &pos))
+  if (!parse_buffer_and_pos(args, &buffer, &length, &pos))
     return NULL;
 
-  if (varint_decode(&result, buffer+pos, length, &length)) {
-    return Py_BuildValue("Kn", result, pos + length);
+  if (varint_decode(&result, buffer + pos, length - pos, &decoded_length)) {
+    return Py_BuildValue("Kn", result, pos + decoded_length);
   }
 
-  PyErr_SetString(PyExc_RuntimeError, "Too many bytes when decoding varint.");
+  set_varint_error(buffer + pos, length - pos);
   return NULL;
 }
 
 
-PyObject *py_split_buffer(PyObject *self, PyObject *args, PyObject *kwargs) {
-  char *buffer;
-  Py_ssize_t buffer_len = 0;
+PyObject *py_signed_varint_decode(PyObject *self, PyObject *args) {
+  const char *buffer;
+  Py_ssize_t pos = 0;
   Py_ssize_t length = 0;
-  Py_ssize_t index = 0;
-  static const char *kwlist[] = {"buffer", "index", "length", NULL};
-  PyObject *encoded_tag = NULL;
+  Py_ssize_t decoded_length = 0;
+  unsigned PY_LONG_LONG result = 0;
 
-  PyObject *result = PyList_New(0);
-  if (!result)
+  if (!parse_buffer_and_pos(args, &buffer, &length, &pos))
     return NULL;
 
-  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s#|nn", (char **)kwlist,
-                                   &buffer, &buffer_len, &index, &length))
+  if (varint_decode(&result, buffer + pos, length - pos, &decoded_length)) {
+    // Negative numbers are stored as their 64 bit two's complement.
+    return Py_BuildValue("Ln", (PY_LONG_LONG)result, pos + decoded_length);
+  }
+
+  set_varint_error(buffer + pos, length - pos);
+  return NULL;
+}
+
+
+PyObject *py_read_tag(PyObject *self, PyObject *args) {
+  const char *buffer;
+  Py_ssize_t pos = 0;
+  Py_ssize_t length = 0;
+  Py_ssize_t end;
+
+  if (!parse_buffer_and_pos(args, &buffer, &length, &pos))
     return NULL;
 
+  // The tag is returned still encoded so it only needs to be delimited.
+  for (end = pos; end < length; end++) {
+    if ((buffer[end] & 0x80) == 0) {
+      return Py_BuildValue("s#n", buffer + pos, end + 1 - pos, end + 1);
+    }
+  }
+
+  PyErr_SetString(PyExc_ValueError, "Invalid tag");
+  return NULL;
+}
+
+
+// Create the (encoded_tag, encoded_length, data) tuple for a field and append
+// it to the result list. If base is not NULL the data is returned as a buffer
+// object pointing into base at data_offset instead of a copy. Returns 0 on
+// error.
+static int append_field(PyObject *result,
+                        const char *tag, Py_ssize_t tag_length,
+                        const char *encoded_length, Py_ssize_t length_length,
+                        const char *data, Py_ssize_t data_length,
+                        PyObject *base, Py_ssize_t data_offset) {
+  PyObject *entry = NULL;
+  PyObject *data_obj = NULL;
+  int ok;
+
+  if (base) {
+    data_obj = PyBuffer_FromObject(base, data_offset, data_length);
+  } else {
+    data_obj = PyString_FromStringAndSize(data, data_length);
+  }
+
+  if (!data_obj)
+    return 0;
+
+  // Note: "N" steals the reference to data_obj.
+  entry = Py_BuildValue("s#s#N", tag, tag_length, encoded_length,
+                        length_length, data_obj);
+  if (!entry)
+    return 0;
+
+  ok = PyList_Append(result, entry) == 0;
+  Py_DECREF(entry);
+
+  return ok;
+}
+
+
+// Split the buffer into a list of (encoded_tag, encoded_length, data) tuples.
+// Parsing starts at index and stops at length, which like in the python
+// implementation is an offset from the start of the buffer. If views is not NULL, the data of length delimited fields with an encoded
+// tag contained in views is returned as a buffer object into view_base.
+static PyObject *split_buffer(const char *buffer, Py_ssize_t buffer_len,
+                              Py_ssize_t index, Py_ssize_t length,
+                              PyObject *views, PyObject *view_base) {
+  const char *start = buffer;
+  PyObject *result = NULL;
+
   if (index < 0 || length < 0 || index > buffer_len) {
     PyErr_SetString(
         PyExc_ValueError, "Invalid parameters.");
     return NULL;
   }
 
+  result = PyList_New(0);
+  if (!result)
+    return NULL;
+
   // Advance the buffer to the required start index.
   buffer += index;
 
   // Determine the length we will be splitting.
-  if (length == 0 || length > buffer_len - index) {
-    length = buffer_len - index;
+  if (length == 0 || length > buffer_len) {
+    length = buffer_len;
   }
+  length -= index;
 
   // We advance the buffer and decrement the length until there is no more
   // buffer space left.
   while (length > 0) {
-    Py_ssize_t decoded_length = 0;
-    unsigned PY_LONG_LONG tag;
-    int tag_type;
+    const char *tag = buffer;
+    Py_ssize_t tag_length = 0;
+    Py_ssize_t data_length = 0;
+    Py_ssize_t length_length = 0;
+    unsigned PY_LONG_LONG value;
+    PyObject *base = NULL;
 
     // Read the tag off the buffer.
-    varint_decode(&tag, buffer, length, &decoded_length);
+    if (!varint_decode(&value, buffer, length, &tag_length)) {
+      PyErr_SetString(PyExc_ValueError, "Invalid tag");
+      goto error;
+    }
 
-    // Prepare to pass the encoded tag into the result tuple.
-    encoded_tag = PyString_FromStringAndSize(buffer, decoded_length);
-    buffer += decoded_length;
-    length -= decoded_length;
+    buffer += tag_length;
+    length -= tag_length;
 
     // Handle the tag depending on its type.
-    tag_type = tag & TAG_TYPE_MASK;
-    switch (tag_type) {
-      case WIRETYPE_VARINT: {
-        // Decode the varint and position ourselves at the next tag.
-        Py_ssize_t tag_length = 0;
-        PyObject *entry = NULL;
-
-        varint_decode(&tag, buffer, length, &tag_length);
-
-        // Create an entry to add to the result set. Note: We use
-        // PyTuple_SetItem which steals the references here instead of
-        // PyTuple_Pack which does not (meaning its more involved to use).
-        entry = PyTuple_New(3);
-        PyTuple_SET_ITEM(
-            entry, 0, encoded_tag);
-
-        // Empty string "".
-        PyTuple_SET_ITEM(
-            entry, 1,
-            PyString_FromStringAndSize(buffer, 0));
-
-        PyTuple_SET_ITEM(
-            entry, 2,
-            PyString_FromStringAndSize(buffer, tag_length));
-
-        PyList_Append(result, entry);
-        Py_DECREF(entry);
-
-        buffer += tag_length;
-        length -= tag_length;
-
+    switch (value & TAG_TYPE_MASK) {
+      case WIRETYPE_VARINT:
+        if (!varint_decode(&value, buffer, length, &data_length)) {
+          set_varint_error(buffer, length);
+          goto error;
+        }
         break;
-      }
-
-      case WIRETYPE_FIXED64: {
-        // Fixed size data.
-        Py_ssize_t tag_length = 8;
-
-        PyObject *entry = PyTuple_New(3);
-        PyTuple_SET_ITEM(
-            entry, 0, encoded_tag);
-
-        // Empty string "".
-        PyTuple_SET_ITEM(
-            entry, 1,
-            PyString_FromStringAndSize(buffer, 0));
-
-        PyTuple_SET_ITEM(
-            entry, 2,
-            PyString_FromStringAndSize(buffer, tag_length));
-
-        PyList_Append(result, entry);
-        Py_DECREF(entry);
-
-        buffer += tag_length;
-        length -= tag_length;
 
+      case WIRETYPE_FIXED64:
+        data_length = 8;
         break;
-      }
-
-      case WIRETYPE_FIXED32: {
-        // Fixed size data.
-        Py_ssize_t tag_length = 4;
-
-        PyObject *entry = PyTuple_New(3);
-        PyTuple_SET_ITEM(
-            entry, 0, encoded_tag);
-
-        // Empty string "".
-        PyTuple_SET_ITEM(
-            entry, 1,
-            PyString_FromStringAndSize(buffer, 0));
-
-        PyTuple_SET_ITEM(
-            entry, 2,
-            PyString_FromStringAndSize(buffer, tag_length));
-
-        PyList_Append(result, entry);
-        Py_DECREF(entry);
-
-        buffer += tag_length;
-        length -= tag_length;
 
+      case WIRETYPE_FIXED32:
+        data_length = 4;
         break;
-      }
 
-      case WIRETYPE_LENGTH_DELIMITED: {
+      case WIRETYPE_LENGTH_DELIMITED:
         // Decode the length varint and position ourselves at the start of the
         // data.
-        Py_ssize_t decoded_length = 0;
-        unsigned PY_LONG_LONG data_size;
-        PyObject *entry = NULL;
-
-        varint_decode(&data_size, buffer, length, &decoded_length);
+        if (!varint_decode(&value, buffer, length, &length_length)) {
+          set_varint_error(buffer, length);
+          goto error;
+        }
 
         // Check that we do not exceed the available buffer here.
-        if (data_size + decoded_length > (unsigned int)length) {
+        if (value > (unsigned PY_LONG_LONG)(length - length_length)) {
           PyErr_SetString(
               PyExc_ValueError, "Length tag exceeds available buffer.");
-
           goto error;
         }
 
-        entry = PyTuple_New(3);
-        PyTuple_SET_ITEM(
-            entry, 0, encoded_tag);
+        data_length = (Py_ssize_t)value;
 
-        // Empty string "".
-        PyTuple_SET_ITEM(
-            entry, 1,
-            PyString_FromStringAndSize(buffer, decoded_length));
+        if (views) {
+          PyObject *encoded_tag = PyString_FromStringAndSize(tag, tag_length);
+          int contained;
 
-        PyTuple_SET_ITEM(
-            entry, 2,
-            PyString_FromStringAndSize(buffer + decoded_length, data_size));
+          if (!encoded_tag)
+            goto error;
 
-        PyList_Append(result, entry);
-        Py_DECREF(entry);
-
-        buffer += decoded_length + data_size;
-        length -= decoded_length + data_size;
+          contained = PySequence_Contains(views, encoded_tag);
+          Py_DECREF(encoded_tag);
+          if (contained < 0)
+            goto error;
 
+          if (contained)
+            base = view_base;
+        }
         break;
-      }
 
       default:
         PyErr_SetString(
-            PyExc_ValueError, "Unexpected Tag");
-
+            PyExc_ValueError, "Unexpected Tag.");
         goto error;
     }
+
+    if (length_length + data_length > length) {
+      PyErr_SetString(
+          PyExc_ValueError, "Field exceeds available buffer.");
+      goto error;
+    }
+
+    if (!append_field(result, tag, tag_length, buffer, length_length,
+                      buffer + length_length, data_length, base,
+                      buffer + length_length - start)) {
+      goto error;
+    }
+
+    buffer += length_length + data_length;
+    length -= length_length + data_length;
   }
 
   return result;
 
 error:
-  Py_DECREF(encoded_tag);
+  Py_DECREF(result);
   return NULL;
 }
 
+
+// The length argument may be None, meaning the whole buffer.
+static int parse_length(PyObject *length_obj, Py_ssize_t *length) {
+  if (length_obj == Py_None) {
+    *length = 0;
+    return 1;
+  }
+
+  *length = PyNumber_AsSsize_t(length_obj, PyExc_OverflowError);
+  return !(*length == -1 && PyErr_Occurred());
+}
+
+
+PyObject *py_split_buffer(PyObject *self, PyObject *args, PyObject *kwargs) {
+  const char *buffer;
+  Py_ssize_t buffer_len = 0;
+  Py_ssize_t length = 0;
+  Py_ssize_t index = 0;
+  PyObject *length_obj = Py_None;
+  static const char *kwlist[] = {"buffer", "index", "length", NULL};
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s#|nO", (char **)kwlist,
+                                   &buffer, &buffer_len, &index, &length_obj))
+    return NULL;
+
+  if (!parse_length(length_obj, &length))
+    return NULL;
+
+  return split_buffer(buffer, buffer_len, index, length, NULL, NULL);
+}
+
+
+PyObject *py_split_buffer_into_views(PyObject *self, PyObject *args,
+                                     PyObject *kwargs) {
+  PyObject *base;
+  PyObject *views;
+  const char *buffer;
+  Py_ssize_t buffer_len = 0;
+  Py_ssize_t length = 0;
+  Py_ssize_t index = 0;
+  PyObject *length_obj = Py_None;
+  static const char *kwlist[] = {"buffer", "view_tags", "index", "length",
+                                 NULL};
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO|nO", (char **)kwlist,
+                                   &base, &views, &index, &length_obj))
+    return NULL;
+
+  if (!parse_length(length_obj, &length))
+    return NULL;
+
+  if (PyObject_AsReadBuffer(base, (const void **)&buffer, &buffer_len) < 0)
+    return NULL;
+
+  return split_buffer(buffer, buffer_len, index, length, views, base);
+}
+
 /* Retrieves the semantic protobuf version
  * Returns a Python object if successful or NULL on error
  */
@@ -333,13 +464,28 @@ static PyMethodDef _semantic_methods[] = {
     {"varint_decode",
      (PyCFunction)py_varint_decode,
      METH_VARARGS,
-     "Decode a varing from a buffer."},
+     "Decode a varint from a buffer."},
+
+    {"signed_varint_decode",
+     (PyCFunction)py_signed_varint_decode,
+     METH_VARARGS,
+     "Decode a signed varint from a buffer."},
+
+    {"read_tag",
+     (PyCFunction)py_read_tag,
+     METH_VARARGS,
+     "Read an encoded tag from a buffer."},
 
     {"split_buffer",
      (PyCFunction)py_split_buffer,
      METH_VARARGS | METH_KEYWORDS,
      "Split a buffer into tags and wire format data."},
 
+    {"split_buffer_into_views",
+     (PyCFunction)py_split_buffer_into_views,
+     METH_VARARGS | METH_KEYWORDS,
+     "Split a buffer, returning views for the data of the given tags."},
+
     {NULL}  /* Sentinel */
 };
 
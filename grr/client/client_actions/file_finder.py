@@ -15,9 +15,11 @@ import psutil
 import logging
 
 from grr.client import actions
+from grr.client import streaming
 from grr.client.client_actions import standard as standard_actions
 from grr.client.vfs_handlers import files
 
+from grr.lib import config_lib
 from grr.lib import utils
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import crypto as rdf_crypto
@@ -448,100 +450,62 @@ class FileFinderOS(actions.ActionPlugin):
   OVERLAP_SIZE = 1024 * 1024
   CHUNK_SIZE = 10 * 1024 * 1024
 
-  def _StreamFile(self, fd, offset, length):
-    """Generates overlapping blocks of data read from a file."""
-    to_read = length
-    fd.seek(offset)
-
-    overlap = fd.read(min(self.OVERLAP_SIZE, to_read))
-    to_read -= len(overlap)
-
-    yield overlap
-
-    while to_read > 0:
-      data = fd.read(min(self.CHUNK_SIZE, to_read))
-      if not data:
-        return
-      to_read -= len(data)
-
-      combined_data = overlap + data
-      yield combined_data
-      overlap = combined_data[-self.OVERLAP_SIZE:]
-
-  def _MatchRegex(self, regex, chunk, pos):
-    match = regex.Search(chunk[pos:])
-    if not match:
-      return None, 0
-    else:
-      start, end = match.span()
-      return start + pos, end - start
-
   def ContentsRegexMatchCondition(self, condition_obj, path, stat_obj, result):
     params = condition_obj.contents_regex_match
-    regex = params.regex
-
-    return self._ScanForMatches(params, path,
-                                functools.partial(self._MatchRegex, regex),
-                                result)
-
-  def _MatchLiteral(self, literal, chunk, pos):
-    pos = chunk.find(literal, pos)
-    if pos == -1:
-      return None, 0
-    else:
-      return pos, len(literal)
+    matcher = streaming.RegexMatcher(params.regex.Compile())
+    return self._ScanForMatches(params, path, matcher, result)
 
   def ContentsLiteralMatchCondition(self, condition_obj, path, stat_obj,
                                     result):
     params = condition_obj.contents_literal_match
+    matcher = streaming.LiteralMatcher(utils.SmartStr(params.literal))
+    return self._ScanForMatches(params, path, matcher, result)
 
-    literal = utils.SmartStr(params.literal)
+  def ContentsMultiMatchCondition(self, condition_obj, path, stat_obj, result):
+    params = condition_obj.contents_multi_match
+    matcher = streaming.MultiMatcher(
+        literals=[utils.SmartStr(literal) for literal in params.literals],
+        regexes=[regex.Compile() for regex in params.regexes])
+    return self._ScanForMatches(params, path, matcher, result)
 
-    return self._ScanForMatches(params, path,
-                                functools.partial(self._MatchLiteral, literal),
-                                result)
-
-  def _ScanForMatches(self, params, path, matching_func, result):
+  def _ScanForMatches(self, params, path, matcher, result):
     try:
       fd = open(path, mode="rb")
     except IOError:
       return False
 
-    current_offset = params.start_offset
+    streamer = streaming.Streamer(
+        chunk_size=self.CHUNK_SIZE,
+        overlap_size=self.OVERLAP_SIZE,
+        lookahead_size=params.bytes_after)
+
     findings = []
-    for chunk in self._StreamFile(fd, current_offset, params.length):
-      pos, match_length = matching_func(chunk, 0)
-      while pos is not None:
-        if (len(chunk) > self.OVERLAP_SIZE and
-            pos + match_length < self.OVERLAP_SIZE):
-          # We already processed this hit.
-          pos, match_length = matching_func(chunk, pos + 1)
-          continue
+    with fd:
+      chunks = streamer.StreamFile(
+          fd,
+          offset=params.start_offset,
+          amount=params.length,
+          use_mmap=config_lib.CONFIG["Client.mmap_content_scans"])
+      for chunk in chunks:
+        for span in chunk.Scan(matcher):
+          offset, data = chunk.Context(span, params.bytes_before,
+                                       params.bytes_after)
+          finding = rdf_client.BufferReference(
+              offset=offset, length=len(data), data=data)
+          if len(span) > 2:
+            # Multi pattern matchers report which pattern was found.
+            finding.pattern = matcher.patterns[span[2]]
+          findings.append(finding)
+          if params.mode == params.Mode.FIRST_HIT:
+            break
+
+        if findings and params.mode == params.Mode.FIRST_HIT:
+          chunks.close()
+          break
 
-        context_start = max(pos - params.bytes_before, 0)
-        # This might cut off some data if the hit is at the chunk border.
-        context_end = min(pos + match_length + params.bytes_after, len(chunk))
-        data = chunk[context_start:context_end]
-        findings.append(
-            rdf_client.BufferReference(
-                offset=current_offset + context_start,
-                length=len(data),
-                data=data,))
-        if params.mode == params.Mode.FIRST_HIT:
-          for finding in findings:
-            result.matches.append(finding)
-          return True
-
-        pos, match_length = matching_func(chunk, pos + 1)
-
-      current_offset += len(chunk) - self.OVERLAP_SIZE
-
-    if findings:
-      for finding in findings:
-        result.matches.append(finding)
-      return True
-    else:
-      return False
+    for finding in findings:
+      result.matches.append(finding)
+    return bool(findings)
 
   def ParseConditions(self, args):
     type_enum = rdf_file_finder.FileFinderCondition.Type
@@ -552,6 +516,7 @@ class FileFinderOS(actions.ActionPlugin):
         type_enum.SIZE: 0,
         type_enum.CONTENTS_REGEX_MATCH: 1,
         type_enum.CONTENTS_LITERAL_MATCH: 1,
+        type_enum.CONTENTS_MULTI_MATCH: 1,
     }
     condition_handlers = {
         type_enum.MODIFICATION_TIME: self.ModificationTimeCondition,
@@ -559,7 +524,8 @@ class FileFinderOS(actions.ActionPlugin):
         type_enum.INODE_CHANGE_TIME: self.InodeChangeTimeCondition,
         type_enum.SIZE: self.SizeCondition,
         type_enum.CONTENTS_REGEX_MATCH: self.ContentsRegexMatchCondition,
-        type_enum.CONTENTS_LITERAL_MATCH: self.ContentsLiteralMatchCondition
+        type_enum.CONTENTS_LITERAL_MATCH: self.ContentsLiteralMatchCondition,
+        type_enum.CONTENTS_MULTI_MATCH: self.ContentsMultiMatchCondition
     }
 
     sorted_conditions = sorted(
@@ -302,6 +302,34 @@ class FileFinderTest(test_lib.EmptyActionTest):
       self.assertEqual(
           buffer_ref.data[bytes_before:bytes_before + len(literal)], literal)
 
+  def testMultiMatchCondition(self):
+    searching_path = os.path.join(self.base_path, "searching")
+    paths = [searching_path + "/{dpkg.log,dpkg_false.log,auth.log}"]
+
+    cmmc = rdf_file_finder.FileFinderContentsMultiMatchCondition
+    condition = rdf_file_finder.FileFinderCondition(
+        condition_type="CONTENTS_MULTI_MATCH",
+        contents_multi_match=cmmc(
+            literals=["session opened", "Accepted"],
+            regexes=["SESSION CLOSED", "for user ([a-z]+)john"],
+            mode="ALL_HITS",
+            bytes_after=4))
+    raw_results = self._RunFileFinder(
+        paths, self.stat_action, conditions=[condition])
+    relative_results = self._GetRelativeResults(
+        raw_results, base_path=searching_path)
+    self.assertEqual(relative_results, ["auth.log"])
+
+    matches = raw_results[0].matches
+    self.assertEqual([m.pattern for m in matches], [
+        "Accepted", "session opened", "for user ([a-z]+)john", "SESSION CLOSED",
+        "for user ([a-z]+)john", "session opened"
+    ])
+    orig_data = open(os.path.join(searching_path, "auth.log")).read()
+    for match in matches:
+      self.assertEqual(orig_data[match.offset:match.offset + match.length],
+                       match.data)
+
   def testRegexMatchCondition(self):
     searching_path = os.path.join(self.base_path, "searching")
     paths = [searching_path + "/{dpkg.log,dpkg_false.log,auth.log}"]
@@ -2,12 +2,12 @@
 """Client actions related to searching files and directories."""
 
 
-import functools
 import stat
 
 import logging
 
 from grr.client import actions
+from grr.client import streaming
 from grr.client import vfs
 from grr.lib import utils
 from grr.lib.rdfvalues import client as rdf_client
@@ -205,29 +205,6 @@ class Grep(actions.ActionPlugin):
   in_rdfvalue = rdf_client.GrepSpec
   out_rdfvalues = [rdf_client.BufferReference]
 
-  def FindRegex(self, regex, data):
-    """Search the data for a hit."""
-    for match in regex.FindIter(data):
-      yield (match.start(), match.end())
-
-  def FindLiteral(self, pattern, data):
-    """Search the data for a hit."""
-    utils.XorByteArray(pattern, self.xor_in_key)
-
-    offset = 0
-    while 1:
-      # We assume here that data.find does not make a copy of pattern.
-      offset = data.find(pattern, offset)
-
-      if offset < 0:
-        break
-
-      yield (offset, offset + len(pattern))
-
-      offset += 1
-
-    utils.XorByteArray(pattern, self.xor_in_key)
-
   BUFF_SIZE = 1024 * 1024 * 10
   ENVELOPE_SIZE = 1000
   HIT_LIMIT = 10000
@@ -236,34 +213,34 @@ class Grep(actions.ActionPlugin):
     """Search the file for the pattern.
 
     This implements the grep algorithm used to scan files. It reads
-    the data in chunks of BUFF_SIZE (10 MB currently) and can use
-    different functions to search for matching patterns. In every
-    step, a buffer that is a bit bigger than the block size is used in
-    order to return all the requested results. Specifically, a
-    preamble is used in order to not miss any patterns that start in
-    one block of data and end in the next and also a postscript buffer
-    is kept such that the algorithm can return bytes trailing the
-    pattern even if the pattern is at the end of one block.
+    the data in chunks of BUFF_SIZE (10 MB currently) into a single
+    buffer which is reused for the whole file. In every step, the
+    buffer holds a bit more than the block size in order to return all
+    the requested results. Specifically, a preamble is kept in order
+    to not miss any patterns that start in one block of data and end in
+    the next and also a postscript is read ahead such that the
+    algorithm can return bytes trailing the pattern even if the pattern
+    is at the end of one block.
 
     One block:
     -----------------------------
     | Pre | Data         | Post |
     -----------------------------
-    Searching the pattern is done here:
-    <------------------->
+    Hits ending here are reported:
+          <------------->
 
     The following block is constructed like this:
     -----------------------------
     | Pre | Data         | Post |
     -----------------------------
-                         |
-                   -----------------------------
-                   | Pre | Data         | Post |
-                   -----------------------------
+                   |
+             -----------------------------
+             | Pre | Data         | Post |
+             -----------------------------
 
-    The preamble is filled from Data so every hit that happens to fall
-    entirely into the preamble has to be discarded since it has
-    already been discovered in the step before.
+    The preamble is filled from Data so every hit that ends in the
+    preamble is discarded since it has already been discovered in the
+    step before.
 
     Grepping for memory
 
@@ -278,8 +255,8 @@ class Grep(actions.ActionPlugin):
 
     This should guarantee that there are no hits when the pattern is
     not present in memory. However, since the data will be copied to
-    the preamble and the postscript, a single pattern might in some
-    cases produce multiple hits.
+    the preamble, a single pattern might in some cases produce
+    multiple hits.
 
     Args:
       args: A protobuf describing the grep request.
@@ -290,65 +267,52 @@ class Grep(actions.ActionPlugin):
     """
     fd = vfs.VFSOpen(args.target, progress_callback=self.Progress)
     fd.Seek(args.start_offset)
-    base_offset = args.start_offset
 
     self.xor_in_key = args.xor_in_key
     self.xor_out_key = args.xor_out_key
 
-    if args.regex:
-      find_func = functools.partial(self.FindRegex, args.regex)
+    if args.literals or args.regexes:
+      matcher = XoredMultiMatcher(
+          literals=[utils.SmartStr(literal) for literal in args.literals],
+          regexes=[regex.Compile() for regex in args.regexes],
+          overlapping_regexes=False,
+          xor_key=self.xor_in_key)
+    elif args.regex:
+      # Regex hits don't overlap, like re.finditer.
+      matcher = streaming.RegexMatcher(args.regex.Compile(), overlapping=False)
     elif args.literal:
-      find_func = functools.partial(self.FindLiteral,
-                                    bytearray(utils.SmartStr(args.literal)))
+      matcher = XoredLiteralMatcher(
+          bytearray(utils.SmartStr(args.literal)), self.xor_in_key)
     else:
       raise RuntimeError("Grep needs a regex or a literal.")
 
-    preamble_size = 0
-    postscript_size = 0
-    hits = 0
-    data = ""
-    while fd.Tell() < args.start_offset + args.length:
-
-      # Base size to read is at most the buffer size.
-      to_read = min(args.length, self.BUFF_SIZE,
-                    args.start_offset + args.length - fd.Tell())
-      # Read some more data for the snippet.
-      to_read += self.ENVELOPE_SIZE - postscript_size
-      read_data = fd.Read(to_read)
-
-      data = data[-postscript_size - self.ENVELOPE_SIZE:] + read_data
-
-      postscript_size = max(0, self.ENVELOPE_SIZE - (to_read - len(read_data)))
-      data_size = len(data) - preamble_size - postscript_size
+    def ReadInto(buf):
+      data = fd.Read(len(buf))
+      buf[:len(data)] = data
+      return len(data)
 
-      if data_size == 0 and postscript_size == 0:
-        break
+    streamer = streaming.Streamer(
+        chunk_size=self.BUFF_SIZE,
+        overlap_size=self.ENVELOPE_SIZE,
+        lookahead_size=self.ENVELOPE_SIZE)
 
-      for (start, end) in find_func(data):
-        # Ignore hits in the preamble.
-        if end <= preamble_size:
-          continue
-
-        # Ignore hits in the postscript.
-        if end > preamble_size + data_size:
-          continue
-
-        # Offset of file in the end after length.
-        if end + base_offset - preamble_size > args.start_offset + args.length:
-          break
-
-        out_data = ""
-        for i in xrange(
-            max(0, start - args.bytes_before),
-            min(len(data), end + args.bytes_after)):  # pyformat: disable
-          out_data += chr(ord(data[i]) ^ self.xor_out_key)
+    hits = 0
+    for chunk in streamer.Stream(ReadInto, args.start_offset, args.length):
+      for span in chunk.Scan(matcher):
+        _, data = chunk.Context(span, args.bytes_before, args.bytes_after)
+        out_data = utils.Xor(data, self.xor_out_key)
 
-        hits += 1
-        self.SendReply(
-            offset=base_offset + start - preamble_size,
+        reference = rdf_client.BufferReference(
+            offset=chunk.offset + span[0],
             data=out_data,
             length=len(out_data),
             pathspec=fd.pathspec)
+        if len(span) > 2:
+          reference.pattern = matcher.EncodedPattern(span[2],
+                                                     self.xor_out_key)
+
+        hits += 1
+        self.SendReply(reference)
 
         if args.mode == rdf_client.GrepSpec.Mode.FIRST_HIT:
           return
@@ -361,7 +325,55 @@ class Grep(actions.ActionPlugin):
 
       self.Progress()
 
-      base_offset += data_size
 
-      # Allow for overlap with previous matches.
-      preamble_size = min(len(data), self.ENVELOPE_SIZE)
+class XoredLiteralMatcher(streaming.LiteralMatcher):
+  """Finds an XOR encoded literal which is only decoded while searching."""
+
+  def __init__(self, literal, xor_key):
+    super(XoredLiteralMatcher, self).__init__(literal)
+    self.xor_key = xor_key
+
+  def Match(self, data, position, endpos):
+    utils.XorByteArray(self.literal, self.xor_key)
+    try:
+      # We assume here that data.find does not make a copy of the literal.
+      return super(XoredLiteralMatcher, self).Match(data, position, endpos)
+    finally:
+      utils.XorByteArray(self.literal, self.xor_key)
+
+
+class XoredMultiMatcher(streaming.MultiMatcher):
+  """Finds any of several patterns, with XOR encoded literals.
+
+  Encoded literals are searched one by one since combining them would keep
+  them decoded in memory for the whole search.
+  """
+
+  def __init__(self,
+               literals=(),
+               regexes=(),
+               overlapping_regexes=True,
+               xor_key=0):
+    self.xor_key = xor_key
+    super(XoredMultiMatcher, self).__init__(
+        literals=literals,
+        regexes=regexes,
+        overlapping_regexes=overlapping_regexes)
+    self.num_literals = len(literals)
+
+  def _LiteralMatchers(self, literals):
+    if not self.xor_key:
+      return super(XoredMultiMatcher, self)._LiteralMatchers(literals)
+
+    return [
+        streaming.IndexedMatcher(
+            XoredLiteralMatcher(bytearray(literal), self.xor_key), index)
+        for index, literal in enumerate(literals)
+    ]
+
+  def EncodedPattern(self, index, xor_key):
+    """Returns a pattern XOR encoded with xor_key."""
+    if index < self.num_literals:
+      # Recode the literal without decoding it first.
+      return utils.Xor(self.patterns[index], self.xor_key ^ xor_key)
+    return utils.Xor(self.patterns[index], xor_key)
@@ -510,6 +510,22 @@ class GrepTest(test_lib.EmptyActionTest):
     for x in result:
       self.assertTrue("10" in utils.Xor(x.data, self.XOR_OUT_KEY))
 
+  def testGrepRegexHitsDoNotOverlap(self):
+    data = "X" * 10 + "aaaa" + "X" * 10 + "aa" + "X"
+    MockVFSHandlerFind.filesystem[self.filename] = data
+
+    request = rdf_client.GrepSpec(
+        regex="a+",
+        xor_out_key=self.XOR_OUT_KEY,
+        start_offset=0,
+        target=rdf_paths.PathSpec(
+            path=self.filename, pathtype=rdf_paths.PathSpec.PathType.OS))
+
+    result = self.RunAction(searching.Grep, request)
+    self.assertEqual([x.offset for x in result], [10, 24])
+    self.assertEqual([utils.Xor(x.data, self.XOR_OUT_KEY) for x in result],
+                     ["aaaa", "aa"])
+
   def testGrepLength(self):
     data = "X" * 100 + "HIT"
 
@@ -686,6 +702,31 @@ class GrepTest(test_lib.EmptyActionTest):
       self.assertEqual(result[0].length, len(expected))
       self.assertEqual(utils.Xor(result[0].data, self.XOR_OUT_KEY), expected)
 
+  def testMultiplePatterns(self):
+    data = "X" * 100 + "HIT" + "X" * 10 + "MISS" + "X" * 10 + "Line7" + "X" * 5
+    MockVFSHandlerFind.filesystem[self.filename] = data
+
+    request = rdf_client.GrepSpec(
+        literals=[
+            utils.Xor("MISS", self.XOR_IN_KEY),
+            utils.Xor("HIT", self.XOR_IN_KEY),
+            utils.Xor("NOTTHERE", self.XOR_IN_KEY)
+        ],
+        regexes=["line[0-9]"],
+        xor_in_key=self.XOR_IN_KEY,
+        xor_out_key=self.XOR_OUT_KEY)
+    request.target.path = self.filename
+    request.target.pathtype = rdf_paths.PathSpec.PathType.OS
+    request.start_offset = 0
+    request.bytes_before = 2
+    request.bytes_after = 2
+
+    result = self.RunAction(searching.Grep, request)
+    self.assertEqual([r.offset for r in result], [100, 113, 127])
+    self.assertEqual([utils.Xor(r.pattern, self.XOR_OUT_KEY) for r in result],
+                     ["HIT", "MISS", "line[0-9]"])
+    self.assertEqual(utils.Xor(result[1].data, self.XOR_OUT_KEY), "XXMISSXX")
+
   def testHitLimit(self):
     limit = searching.Grep.HIT_LIMIT
 
@@ -1,7 +1,11 @@
 #!/usr/bin/env python
 """Tests for the client."""
 
+import Queue
+import threading
+import time
 
+import mock
 
 # Need to import client to add the flags.
 from grr.client import actions
@@ -13,6 +17,7 @@ from grr.client import client_actions
 from grr.client import comms
 from grr.lib import flags
 from grr.lib import rdfvalue
+from grr.lib import stats
 from grr.lib import test_lib
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import flows as rdf_flows
@@ -181,6 +186,53 @@ class BasicContextTests(test_lib.GRRBaseTest):
       result.append(item)
     self.assertEqual(result, ["C"] * 10 + ["A", "B"] * 10)
 
+  def testSizeQueueFull(self):
+    queue = comms.SizeQueue(maxsize=10)
+    queue.Put("A" * 10)
+    self.assertTrue(queue.Full())
+    self.assertEqual(queue.Size(), 10)
+
+    self.assertRaises(Queue.Full, queue.Put, "B", block=False)
+    # High priority messages are queued regardless of the size.
+    queue.Put("C", priority=rdf_flows.GrrMessage.Priority.HIGH_PRIORITY)
+    self.assertEqual(queue.Size(), 11)
+
+    self.assertEqual(list(queue.Get()), ["C", "A" * 10])
+    self.assertEqual(queue.Size(), 0)
+    self.assertFalse(queue.Full())
+
+  def testSizeQueueBlocksUntilDrained(self):
+    nanny = mock.MagicMock()
+    queue = comms.SizeQueue(maxsize=10, nanny=nanny)
+    queue.Put("A" * 10)
+
+    blocked_time = stats.STATS.GetMetricValue(
+        "grr_client_out_queue_blocked_time")
+    put_thread = threading.Thread(target=queue.Put, args=("B",))
+    put_thread.start()
+
+    # Wait until the second Put is blocked and heartbeats.
+    for _ in range(50):
+      if nanny.Heartbeat.called:
+        break
+      time.sleep(0.1)
+    self.assertTrue(put_thread.is_alive())
+
+    self.assertEqual(list(queue.Get()), ["A" * 10])
+    put_thread.join(5)
+    self.assertFalse(put_thread.is_alive())
+    self.assertEqual(list(queue.Get()), ["B"])
+
+    self.assertEqual(
+        stats.STATS.GetMetricValue("grr_client_out_queue_blocked_time").count,
+        blocked_time.count + 1)
+
+  def testSizeQueuePutTimeout(self):
+    queue = comms.SizeQueue(maxsize=10)
+    queue.Put("A" * 10)
+    self.assertRaises(Queue.Full, queue.Put, "B", timeout=0.1)
+    self.assertEqual(list(queue.Get()), ["A" * 10])
+
 
 def main(argv):
   test_lib.main(argv)
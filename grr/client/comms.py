@@ -76,6 +76,8 @@ Examples:
 
 
 import base64
+import heapq
+import itertools
 import os
 
 import pdb
@@ -153,6 +155,14 @@ class HTTPManager(object):
     self.active_base_url = None
     self.error_poll_min = config_lib.CONFIG["Client.error_poll_min"]
 
+    # The size of the message bundles we post. This adapts to how long posts
+    # take so slow links get smaller posts which don't time out.
+    self.max_post_size = config_lib.CONFIG["Client.max_post_size"]
+    self.min_post_size = min(self.max_post_size,
+                             config_lib.CONFIG["Client.min_post_size"])
+    self.post_target_duration = config_lib.CONFIG["Client.post_target_duration"]
+    self.post_size = self.max_post_size
+
   def _GetBaseURLs(self):
     """Gathers a list of base URLs we will try."""
     result = config_lib.CONFIG["Client.server_urls"]
@@ -190,6 +200,17 @@ class HTTPManager(object):
 
     return base + url
 
+  def UpdatePostSize(self, duration):
+    """Adapts the post size to the time the last post took.
+
+    Args:
+      duration: The number of seconds the last post took or None if it failed.
+    """
+    if duration is None or duration > self.post_target_duration:
+      self.post_size = max(self.min_post_size, self.post_size / 2)
+    elif duration < self.post_target_duration / 2.0:
+      self.post_size = min(self.max_post_size, self.post_size * 2)
+
   def OpenServerEndpoint(self,
                          path,
                          verify_cb=lambda x: True,
@@ -474,6 +495,7 @@ class CommsInit(registry.InitHook):
     stats.STATS.RegisterCounterMetric("grr_client_slave_restarts")
     stats.STATS.RegisterCounterMetric("grr_client_sent_bytes")
     stats.STATS.RegisterCounterMetric("grr_client_sent_messages")
+    stats.STATS.RegisterEventMetric("grr_client_out_queue_blocked_time")
 
 
 class Status(object):
@@ -529,8 +551,9 @@ class GRRClientWorker(object):
     # Queue of messages from the server to be processed.
     self._in_queue = []
 
-    # Queue of messages to be sent to the server.
+    # Heap of messages to be sent to the server.
     self._out_queue = []
+    self._out_queue_counter = itertools.count()
 
     # A tally of the total byte count of messages
     self._out_queue_size = 0
@@ -599,13 +622,8 @@ class GRRClientWorker(object):
     queue = rdf_flows.MessageList()
 
     length = 0
-    self._out_queue.sort(key=lambda msg: msg[0])
-
-    # Front pops are quadratic so we reverse the queue.
-    self._out_queue.reverse()
-
     while self._out_queue and length < max_size:
-      message = self._out_queue.pop()[1]
+      message = heapq.heappop(self._out_queue)[2]
       queue.job.Append(message)
       stats.STATS.IncrementCounter("grr_client_sent_messages")
 
@@ -616,9 +634,6 @@ class GRRClientWorker(object):
       length += message_length
       self._out_queue_size -= message_length
 
-    # Restore the old order.
-    self._out_queue.reverse()
-
     return queue
 
   def SendReply(self,
@@ -763,7 +778,8 @@ class GRRClientWorker(object):
     # The simple queue has no size restrictions so we never block and ignore
     # this parameter.
     _ = blocking
-    self._out_queue.append((-1 * priority, message))
+    heapq.heappush(self._out_queue,
+                   (-1 * priority, next(self._out_queue_counter), message))
 
     # Maintain the tally of the output queue size.  We estimate the size of the
     # message by only considering the args member. This is usually close enough
@@ -926,14 +942,16 @@ class SizeQueue(object):
   on. In the client we want to limit the total memory footprint, hence we need
   to use the total size as a measure of how full the queue is.
 
-  TODO(user): this class needs some attention to ensure it is thread safe.
+  Items are kept in a heap ordered by priority and, within the same priority,
+  by the order they were put in.
   """
   total_size = 0
 
   def __init__(self, maxsize=1024, nanny=None):
     self.lock = threading.RLock()
+    self.not_full = threading.Condition(self.lock)
     self.queue = []
-    self._reversed = []
+    self.counter = itertools.count()
     self.total_size = 0
     self.maxsize = maxsize
     self.nanny = nanny
@@ -962,45 +980,50 @@ class SizeQueue(object):
     if isinstance(item, rdfvalue.RDFValue):
       item = item.SerializeToString()
 
-    if priority >= rdf_flows.GrrMessage.Priority.HIGH_PRIORITY:
-      pass  # If high priority is set we dont care about the size of the queue.
+    with self.lock:
+      if priority >= rdf_flows.GrrMessage.Priority.HIGH_PRIORITY:
+        pass  # If high priority is set we dont care about the queue size.
 
-    elif not block:
-      if self.total_size >= self.maxsize:
-        raise Queue.Full
+      elif not block:
+        if self.total_size >= self.maxsize:
+          raise Queue.Full
 
-    else:
-      count = 0
-      # Wait until the queue has more space. We do not hold the lock here to
-      # ensure that the posting thread can drain this queue while we block here.
-      while self.total_size >= self.maxsize:
-        time.sleep(1)
-        self.nanny.Heartbeat()
-        count += 1
+      elif self.total_size >= self.maxsize:
+        self._WaitForSpace(timeout)
 
-        if timeout and count > timeout:
+      heapq.heappush(self.queue, (-1 * priority, next(self.counter), item))
+      self.total_size += len(item)
+
+  def _WaitForSpace(self, timeout):
+    """Waits until the queue has space, must be called with the lock held."""
+    start = time.time()
+    try:
+      # Waiting releases the lock so the posting thread can drain this queue
+      # while we block here. We wake up every second to heartbeat.
+      while self.total_size >= self.maxsize:
+        if timeout and time.time() - start > timeout:
           raise Queue.Full
 
-    with self.lock:
-      self.queue.append((-1 * priority, item))
-      self.total_size += len(item)
+        self.not_full.wait(1)
+        if self.nanny:
+          self.nanny.Heartbeat()
+    finally:
+      stats.STATS.RecordEvent("grr_client_out_queue_blocked_time",
+                              time.time() - start)
 
   def Get(self):
     """Retrieves the items from the queue."""
-    with self.lock:
-      if self._reversed:
-        # We have leftovers from a partial Get().
-        self._reversed.reverse()
-        self.queue = self._reversed + self.queue
-
-      self.queue.sort(key=lambda msg: msg[0])  # by priority only.
-      self.queue.reverse()
-      self._reversed, self.queue = self.queue, []
+    while True:
+      with self.lock:
+        if not self.queue:
+          return
 
-      while self._reversed:
-        item = self._reversed.pop()[1]
+        item = heapq.heappop(self.queue)[2]
         self.total_size -= len(item)
-        yield item
+        if self.total_size < self.maxsize:
+          self.not_full.notify_all()
+
+      yield item
 
   def Size(self):
     return self.total_size
@@ -1329,8 +1352,11 @@ class GRRHTTPClient(object):
     if response.code == 200:
       stats.STATS.IncrementCounter("grr_client_received_bytes",
                                    len(response.data))
+      self.http_manager.UpdatePostSize(response.duration)
       return response
 
+    self.http_manager.UpdatePostSize(None)
+
     # An unspecified error occured.
     return response
 
@@ -1351,7 +1377,7 @@ class GRRHTTPClient(object):
     if self.http_manager.consecutive_connection_errors == 0:
       # Grab some messages to send
       message_list = self.client_worker.Drain(
-          max_size=config_lib.CONFIG["Client.max_post_size"])
+          max_size=self.http_manager.post_size)
     else:
       message_list = rdf_flows.MessageList()
 
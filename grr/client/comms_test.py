@@ -233,6 +233,36 @@ class HTTPManagerTest(test_lib.GRRBaseTest):
 
     self.assertEqual(result.data, "Good")
 
+  def testPostSizeAdaptsToDuration(self):
+    with test_lib.ConfigOverrider({
+        "Client.max_post_size": 1000,
+        "Client.min_post_size": 100,
+        "Client.post_target_duration": 10
+    }):
+      manager = MockHTTPManager()
+
+    self.assertEqual(manager.post_size, 1000)
+
+    # Slow and failed posts halve the post size down to the minimum.
+    manager.UpdatePostSize(20)
+    self.assertEqual(manager.post_size, 500)
+    manager.UpdatePostSize(None)
+    self.assertEqual(manager.post_size, 250)
+    manager.UpdatePostSize(11)
+    manager.UpdatePostSize(11)
+    self.assertEqual(manager.post_size, 100)
+
+    # Posts close to the target duration keep the size.
+    manager.UpdatePostSize(8)
+    self.assertEqual(manager.post_size, 100)
+
+    # Fast posts double it up to the maximum.
+    manager.UpdatePostSize(1)
+    self.assertEqual(manager.post_size, 200)
+    for _ in range(5):
+      manager.UpdatePostSize(1)
+    self.assertEqual(manager.post_size, 1000)
+
 
 def main(argv):
   test_lib.main(argv)
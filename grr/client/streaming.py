@@ -0,0 +1,462 @@
+#!/usr/bin/env python
+"""Scanning of file contents in overlapping chunks.
+
+Content scans used to glue every chunk they read to the end of the previous
+one and to slice the result for every search, which copied each byte of the
+scanned file several times. The streamer here reads into a single buffer which
+is reused for the whole file, or maps the file into memory, and matchers search
+it in place using start and end positions. Several patterns can be searched
+in a single pass with a MultiMatcher.
+"""
+
+import heapq
+import mmap
+import os
+import re
+import stat
+
+
+class Chunk(object):
+  """A window of a stream which is scanned for hits.
+
+  The data of a chunk is a buffer which may be shared with other chunks. Only
+  hits ending in data[overlap_end:end] are reported, hits ending before that
+  were reported by the previous chunk and hits ending later by the next one.
+  The bytes between start and overlap_end and the bytes between end and limit
+  are there so hits crossing the window borders are found and get their
+  context.
+  """
+
+  def __init__(self, data, offset, start, overlap_end, end, limit):
+    """Constructor.
+
+    Args:
+      data: The buffer holding the chunk data.
+      offset: The stream offset of data[0].
+      start: The first index of data belonging to the chunk.
+      overlap_end: The index up to which the chunk overlaps the previous one.
+      end: The index at which the window of the chunk ends.
+      limit: The index past the last byte available for context.
+    """
+    self.data = data
+    self.offset = offset
+    self.start = start
+    self.overlap_end = overlap_end
+    self.end = end
+    self.limit = limit
+
+  def Scan(self, matcher):
+    """Yields the spans of the hits in this chunk.
+
+    Args:
+      matcher: A Matcher.
+
+    Yields:
+      (begin, end) index tuples, or (begin, end, pattern index) tuples for
+      MultiMatcher objects.
+    """
+    for span in matcher.FindAll(self.data, self.start, self.end, self.limit):
+      if self.overlap_end < span[1] <= self.end:
+        yield span
+
+  def Context(self, span, bytes_before, bytes_after):
+    """Returns the stream offset and the data of a hit with its context."""
+    begin, end = span[:2]
+    context_start = max(self.start, begin - bytes_before)
+    context_end = min(self.limit, end + bytes_after)
+    return (self.offset + context_start,
+            str(self.data[context_start:context_end]))
+
+
+class Matcher(object):
+  """Finds hits of a pattern in a buffer.
+
+  Overlapping matchers report every hit, including hits starting inside an
+  earlier one. Other matchers continue searching at the end of each hit, like
+  re.finditer does.
+  """
+
+  overlapping = True
+
+  def Match(self, data, position, endpos):
+    """Returns the span of the first hit in data[position:endpos] or None."""
+    raise NotImplementedError()
+
+  def FindAll(self, data, position, end, endpos):
+    """Yields the spans of all hits starting in data[position:end].
+
+    For overlapping matchers the search continues right after the start of
+    every hit, otherwise at its end.
+
+    Args:
+      data: The buffer to search.
+      position: The index to start searching at.
+      end: Hits must start before this index.
+      endpos: Hits must end before this index.
+    """
+    while position < end:
+      span = self.Match(data, position, endpos)
+      if span is None or span[0] >= end:
+        return
+
+      yield span
+      if self.overlapping:
+        position = span[0] + 1
+      else:
+        position = max(span[1], span[0] + 1)
+
+
+class LiteralMatcher(Matcher):
+  """Finds a literal string."""
+
+  def __init__(self, literal):
+    self.literal = literal
+
+  def Match(self, data, position, endpos):
+    begin = data.find(self.literal, position, endpos)
+    if begin == -1:
+      return None
+    return begin, begin + len(self.literal)
+
+
+class RegexMatcher(Matcher):
+  """Finds a compiled regular expression."""
+
+  def __init__(self, regex, overlapping=True):
+    self.regex = regex
+    self.overlapping = overlapping
+
+  def Match(self, data, position, endpos):
+    match = self.regex.search(data, position, endpos)
+    if match is None:
+      return None
+    return match.span()
+
+
+class IndexedMatcher(Matcher):
+  """Tags the hits of a single pattern matcher with a pattern index."""
+
+  def __init__(self, matcher, index):
+    self.matcher = matcher
+    self.index = index
+    self.overlapping = matcher.overlapping
+
+  def Match(self, data, position, endpos):
+    span = self.matcher.Match(data, position, endpos)
+    if span is None:
+      return None
+    return span[0], span[1], self.index
+
+
+class LiteralSetMatcher(Matcher):
+  """Finds any of a set of literal strings in a single pass.
+
+  The literals are merged into a prefix tree which is compiled into one
+  regular expression, so the search runs in the regex engine instead of once
+  per literal. Where several literals match at the same offset, the longest one
+  is reported.
+  """
+
+  def __init__(self, literals):
+    """Constructor.
+
+    Args:
+      literals: The literal strings to search for. Hits are tagged with the
+        index of the literal in this list.
+    """
+    self.indices = {}
+    for index, literal in enumerate(literals):
+      self.indices.setdefault(literal, index)
+
+    trie = {}
+    for literal in self.indices:
+      node = trie
+      for char in literal:
+        node = node.setdefault(char, {})
+      node[""] = {}
+
+    self.regex = re.compile(self._TrieToRegex(trie), re.S)
+
+  def _TrieToRegex(self, node):
+    """Converts a prefix tree node into a regular expression."""
+    alternatives = []
+    for char in sorted(node):
+      if not char:
+        continue
+
+      # Collapse chains of nodes with a single child into a literal.
+      prefix = [char]
+      child = node[char]
+      while len(child) == 1 and "" not in child:
+        char, child = child.items()[0]
+        prefix.append(char)
+
+      alternatives.append(re.escape("".join(prefix)) + self._TrieToRegex(child))
+
+    if not alternatives:
+      return ""
+
+    # The end of a literal comes last so longer literals are preferred.
+    if "" in node:
+      alternatives.append("")
+
+    if len(alternatives) == 1:
+      return alternatives[0]
+    return "(?:%s)" % "|".join(alternatives)
+
+  def Match(self, data, position, endpos):
+    match = self.regex.search(data, position, endpos)
+    if match is None:
+      return None
+    begin, end = match.span()
+    return begin, end, self.indices[str(match.group())]
+
+
+class RegexSetMatcher(Matcher):
+  """Finds any of a set of regular expressions in a single pass.
+
+  The expressions are combined into one alternation, each of them in a named
+  group which identifies it. Where several expressions match at the same
+  offset, only the first one is reported. Expressions with groups of their
+  own or with inline flags can't be combined like this and have to be
+  searched separately.
+  """
+
+  # The re module supports at most 100 groups per expression.
+  MAX_REGEXES = 99
+
+  INLINE_FLAGS_RE = re.compile(r"\(\?[iLmsux]+\)")
+
+  def __init__(self, indexed_regexes, overlapping=True):
+    """Constructor.
+
+    Args:
+      indexed_regexes: (pattern index, compiled regular expression) tuples.
+        The expressions must all use the same flags.
+      overlapping: Whether hits starting inside earlier hits are reported.
+    """
+    self.overlapping = overlapping
+    alternatives = []
+    self.indices = {}
+    flags = 0
+    for index, regex in indexed_regexes:
+      group = "p%d" % index
+      self.indices[group] = index
+      alternatives.append("(?P<%s>%s)" % (group, regex.pattern))
+      flags = regex.flags
+
+    self.regex = re.compile("|".join(alternatives), flags)
+
+  @classmethod
+  def CanCombine(cls, regex):
+    return not regex.groups and not cls.INLINE_FLAGS_RE.search(regex.pattern)
+
+  def Match(self, data, position, endpos):
+    match = self.regex.search(data, position, endpos)
+    if match is None:
+      return None
+    begin, end = match.span()
+    return begin, end, self.indices[match.lastgroup]
+
+
+class MultiMatcher(Matcher):
+  """Finds any of several literals and regular expressions.
+
+  All literals are searched in one pass and so are all regular expressions
+  which can be combined. The spans of the hits are (begin, end, index)
+  tuples, where index refers to the pattern in self.patterns which matched,
+  literals first.
+  """
+
+  def __init__(self, literals=(), regexes=(), overlapping_regexes=True):
+    """Constructor.
+
+    Args:
+      literals: The literal strings to search for.
+      regexes: Compiled regular expressions to search for.
+      overlapping_regexes: Whether hits of the regular expressions starting
+        inside earlier hits of the same expressions are reported. Hits of
+        literals always may overlap.
+    """
+    literals = list(literals)
+    regexes = list(regexes)
+    self.patterns = literals + [regex.pattern for regex in regexes]
+
+    self.matchers = self._LiteralMatchers(literals)
+
+    combinable = []
+    for index, regex in enumerate(regexes, len(literals)):
+      if RegexSetMatcher.CanCombine(regex):
+        combinable.append((index, regex))
+      else:
+        self.matchers.append(
+            IndexedMatcher(
+                RegexMatcher(regex, overlapping=overlapping_regexes), index))
+
+    for i in xrange(0, len(combinable), RegexSetMatcher.MAX_REGEXES):
+      batch = combinable[i:i + RegexSetMatcher.MAX_REGEXES]
+      if len(batch) == 1:
+        index, regex = batch[0]
+        self.matchers.append(
+            IndexedMatcher(
+                RegexMatcher(regex, overlapping=overlapping_regexes), index))
+      else:
+        self.matchers.append(
+            RegexSetMatcher(batch, overlapping=overlapping_regexes))
+
+  def _LiteralMatchers(self, literals):
+    """Returns the matchers for the literals."""
+    if len(literals) == 1:
+      return [IndexedMatcher(LiteralMatcher(literals[0]), 0)]
+    elif literals:
+      return [LiteralSetMatcher(literals)]
+    return []
+
+  def Match(self, data, position, endpos):
+    spans = [matcher.Match(data, position, endpos) for matcher in self.matchers]
+    spans = [span for span in spans if span is not None]
+    if not spans:
+      return None
+    return min(spans)
+
+  def FindAll(self, data, position, end, endpos):
+    # Every matcher runs over the data once and the hits are merged.
+    return heapq.merge(*[
+        matcher.FindAll(data, position, end, endpos)
+        for matcher in self.matchers
+    ])
+
+
+class Streamer(object):
+  """Splits streams into overlapping chunks."""
+
+  def __init__(self, chunk_size, overlap_size=0, lookahead_size=0):
+    """Constructor.
+
+    Args:
+      chunk_size: The number of new bytes in every chunk.
+      overlap_size: The number of bytes every chunk shares with the previous
+        one. Hits which are longer than this might be missed.
+      lookahead_size: The number of bytes following the window of every chunk
+        which are available as context of hits.
+    """
+    self.chunk_size = chunk_size
+    self.overlap_size = overlap_size
+    self.lookahead_size = lookahead_size
+
+  def StreamFile(self, fd, offset=0, amount=None, use_mmap=False):
+    """Yields the chunks of a file.
+
+    Args:
+      fd: A file object opened for reading in binary mode.
+      offset: The file offset to start at.
+      amount: The maximum number of bytes to scan. Context may come from
+        after this.
+      use_mmap: Map regular files into memory instead of reading them.
+
+    Yields:
+      Chunk objects. Their data is only valid until the next chunk is
+      requested.
+    """
+    mapped = use_mmap and self._MapFile(fd)
+    if not mapped:
+      fd.seek(offset)
+      for chunk in self.Stream(fd.readinto, offset, amount):
+        yield chunk
+      return
+
+    try:
+      for chunk in self.StreamMemory(mapped, offset, amount):
+        yield chunk
+    finally:
+      mapped.close()
+
+  def _MapFile(self, fd):
+    try:
+      st = os.fstat(fd.fileno())
+      # Empty files can't be mapped and devices might not support it.
+      if not stat.S_ISREG(st.st_mode) or not st.st_size:
+        return None
+      return mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError, AttributeError):
+      return None
+
+  def StreamMemory(self, data, offset=0, amount=None):
+    """Yields chunks of a buffer without copying it.
+
+    Args:
+      data: A buffer supporting find() and slicing, e.g. an mmap.
+      offset: The index to start at.
+      amount: The maximum number of bytes to scan.
+
+    Yields:
+      Chunk objects sharing the buffer.
+    """
+    stream_end = len(data)
+    if amount is not None:
+      stream_end = min(stream_end, offset + amount)
+
+    window_start = offset
+    while window_start < stream_end:
+      window_end = min(window_start + self.chunk_size, stream_end)
+      yield Chunk(
+          data,
+          0,
+          start=max(offset, window_start - self.overlap_size),
+          overlap_end=window_start,
+          end=window_end,
+          limit=min(len(data), window_end + self.lookahead_size))
+      window_start = window_end
+
+  def Stream(self, read_into, offset=0, amount=None):
+    """Yields chunks of a stream read into a single reused buffer.
+
+    Args:
+      read_into: A callable filling a writable buffer, returning the number of
+        bytes read or 0 at the end of the stream.
+      offset: The stream offset of the first byte read, for reporting.
+      amount: The maximum number of bytes to scan.
+
+    Yields:
+      Chunk objects. Their data is only valid until the next chunk is
+      requested.
+    """
+    buf = bytearray(self.overlap_size + self.chunk_size + self.lookahead_size)
+    view = memoryview(buf)
+    # The stream offset of buf[0], the number of bytes in the buffer and the
+    # number of bytes at its start which were part of the previous window.
+    buf_offset = offset
+    filled = 0
+    overlap = 0
+    eof = False
+    stream_end = None if amount is None else offset + amount
+
+    while True:
+      while filled < len(buf) and not eof:
+        read = read_into(view[filled:])
+        if not read:
+          eof = True
+        filled += read or 0
+
+      end = filled
+      if not eof:
+        end -= self.lookahead_size
+      if stream_end is not None:
+        end = min(end, stream_end - buf_offset)
+
+      if end <= overlap:
+        return
+
+      yield Chunk(buf, buf_offset, 0, overlap, end, filled)
+
+      if eof and end == filled:
+        return
+      if stream_end is not None and buf_offset + end >= stream_end:
+        return
+
+      # Keep the end of this window and the lookahead for the next chunk.
+      keep_from = max(0, end - self.overlap_size)
+      buf[:filled - keep_from] = buf[keep_from:filled]
+      buf_offset += keep_from
+      filled -= keep_from
+      overlap = end - keep_from
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""Tests for grr.client.streaming."""
+
+import io
+import os
+import re
+
+from grr.client import streaming
+from grr.lib import flags
+from grr.lib import test_lib
+
+
+class StreamerTest(test_lib.GRRBaseTest):
+  """Tests for the chunk streamer."""
+
+  def _Scan(self, chunks, matcher, bytes_before=0, bytes_after=0):
+    results = []
+    for chunk in chunks:
+      for span in chunk.Scan(matcher):
+        results.append(chunk.Context(span, bytes_before, bytes_after))
+    return results
+
+  def _WriteFile(self, data):
+    path = os.path.join(self.temp_dir, "scanned")
+    with open(path, "wb") as fd:
+      fd.write(data)
+    return path
+
+  def testHitsAcrossChunkBordersAreFoundOnce(self):
+    data = "x" * 8 + "needle" + "x" * 8 + "needle" + "x" * 3
+    streamer = streaming.Streamer(chunk_size=10, overlap_size=6)
+    matcher = streaming.LiteralMatcher("needle")
+
+    results = self._Scan(
+        streamer.Stream(io.BytesIO(data).readinto), matcher)
+    self.assertEqual(results, [(8, "needle"), (22, "needle")])
+
+    results = self._Scan(streamer.StreamMemory(data), matcher)
+    self.assertEqual(results, [(8, "needle"), (22, "needle")])
+
+  def testHitEndingAtOverlapBorderIsFoundOnce(self):
+    data = "x" * 4 + "needle" + "x" * 20
+    streamer = streaming.Streamer(chunk_size=10, overlap_size=6)
+    matcher = streaming.LiteralMatcher("needle")
+
+    results = self._Scan(streamer.Stream(io.BytesIO(data).readinto), matcher)
+    self.assertEqual(results, [(4, "needle")])
+
+  def testOverlappingHits(self):
+    streamer = streaming.Streamer(chunk_size=3, overlap_size=2)
+    matcher = streaming.LiteralMatcher("aa")
+
+    results = self._Scan(streamer.StreamMemory("aaaa"), matcher)
+    self.assertEqual(results, [(0, "aa"), (1, "aa"), (2, "aa")])
+
+  def testNonOverlappingRegexHits(self):
+    streamer = streaming.Streamer(chunk_size=100)
+    matcher = streaming.RegexMatcher(re.compile("a+"), overlapping=False)
+
+    results = self._Scan(streamer.StreamMemory("aaaXaa"), matcher)
+    self.assertEqual(results, [(0, "aaa"), (4, "aa")])
+
+  def testContextAcrossChunkBorders(self):
+    data = "0123456789abcdefghij"
+    streamer = streaming.Streamer(
+        chunk_size=8, overlap_size=4, lookahead_size=4)
+    matcher = streaming.RegexMatcher(re.compile("[89]"))
+
+    results = self._Scan(
+        streamer.Stream(io.BytesIO(data).readinto),
+        matcher,
+        bytes_before=3,
+        bytes_after=4)
+    self.assertEqual(results, [(5, "56789abc"), (6, "6789abcd")])
+
+  def testAmount(self):
+    data = "needle" * 10
+    streamer = streaming.Streamer(chunk_size=7, overlap_size=6)
+    matcher = streaming.LiteralMatcher("needle")
+
+    results = self._Scan(
+        streamer.Stream(io.BytesIO(data[6:]).readinto, offset=6, amount=20),
+        matcher)
+    self.assertEqual(results, [(6, "needle"), (12, "needle"), (18, "needle")])
+
+    results = self._Scan(
+        streamer.StreamMemory(data, offset=6, amount=20), matcher)
+    self.assertEqual(results, [(6, "needle"), (12, "needle"), (18, "needle")])
+
+  def testContextAfterAmount(self):
+    streamer = streaming.Streamer(chunk_size=4, lookahead_size=3)
+    matcher = streaming.LiteralMatcher("ab")
+
+    results = self._Scan(
+        streamer.Stream(io.BytesIO("xxabcdef").readinto, amount=4),
+        matcher,
+        bytes_after=3)
+    self.assertEqual(results, [(2, "abcde")])
+
+  def testStreamFileWithAndWithoutMmap(self):
+    data = "".join("line %d with a needle\n" % i for i in range(1000))
+    path = self._WriteFile(data)
+    streamer = streaming.Streamer(
+        chunk_size=100, overlap_size=10, lookahead_size=5)
+    matcher = streaming.RegexMatcher(re.compile("needle"))
+    expected = [(m.start() - 2, data[m.start() - 2:m.end() + 5])
+                for m in re.finditer("needle", data)]
+
+    for use_mmap in [False, True]:
+      with open(path, "rb") as fd:
+        results = self._Scan(
+            streamer.StreamFile(fd, use_mmap=use_mmap),
+            matcher,
+            bytes_before=2,
+            bytes_after=5)
+      self.assertEqual(results, expected)
+
+  def testStreamEmptyFile(self):
+    path = self._WriteFile("")
+    streamer = streaming.Streamer(chunk_size=100)
+
+    for use_mmap in [False, True]:
+      with open(path, "rb") as fd:
+        self.assertEqual(list(streamer.StreamFile(fd, use_mmap=use_mmap)), [])
+
+
+class MultiMatcherTest(test_lib.GRRBaseTest):
+  """Tests for matching several patterns at once."""
+
+  def _FindAll(self, matcher, data):
+    return [(begin, data[begin:end], matcher.patterns[index])
+            for begin, end, index in matcher.FindAll(data, 0, len(data),
+                                                     len(data))]
+
+  def testLiterals(self):
+    matcher = streaming.MultiMatcher(literals=["foo", "bar", "baz", "ba"])
+    self.assertEqual(
+        self._FindAll(matcher, "foo-bar.ba.bazfoo"),
+        [(0, "foo", "foo"), (4, "bar", "bar"), (8, "ba", "ba"),
+         (11, "baz", "baz"), (14, "foo", "foo")])
+
+  def testLiteralsWithSpecialCharacters(self):
+    literals = ["a.b", "\x00(", "a|b", "a"]
+    matcher = streaming.MultiMatcher(literals=literals)
+    self.assertEqual(
+        self._FindAll(matcher, "axb a|b \x00("),
+        [(0, "a", "a"), (4, "a|b", "a|b"), (8, "\x00(", "\x00(")])
+
+  def testRegexes(self):
+    regexes = [re.compile("f.o", re.I), re.compile("(ba)r", re.I),
+               re.compile("BAZ", re.I), re.compile("b(?=a)", re.I)]
+    matcher = streaming.MultiMatcher(regexes=regexes)
+    self.assertEqual(
+        self._FindAll(matcher, "fxo bar baz"),
+        [(0, "fxo", "f.o"), (4, "b", "b(?=a)"), (4, "bar", "(ba)r"),
+         (8, "baz", "BAZ")])
+
+  def testManyRegexes(self):
+    regexes = [re.compile("x%dy" % i) for i in range(250)]
+    matcher = streaming.MultiMatcher(regexes=regexes)
+    self.assertEqual(len(matcher.matchers), 3)
+
+    data = "x7y x107y x249y"
+    self.assertEqual(
+        self._FindAll(matcher, data),
+        [(0, "x7y", "x7y"), (4, "x107y", "x107y"), (10, "x249y", "x249y")])
+
+  def testLiteralsAndRegexes(self):
+    matcher = streaming.MultiMatcher(
+        literals=["needle"], regexes=[re.compile("n[aeiou]+dle")])
+    self.assertEqual(
+        self._FindAll(matcher, "noodle needle"),
+        [(0, "noodle", "n[aeiou]+dle"), (7, "needle", "needle"),
+         (7, "needle", "n[aeiou]+dle")])
+
+  def testHitsAcrossChunkBorders(self):
+    data = "x" * 8 + "needle" + "x" * 8 + "pin" + "x" * 3
+    streamer = streaming.Streamer(chunk_size=10, overlap_size=6)
+    matcher = streaming.MultiMatcher(literals=["needle", "pin"])
+
+    spans = []
+    for chunk in streamer.Stream(io.BytesIO(data).readinto):
+      for begin, _, index in chunk.Scan(matcher):
+        spans.append((chunk.offset + begin, matcher.patterns[index]))
+    self.assertEqual(spans, [(8, "needle"), (22, "pin")])
+
+
+class MultiMatcherBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Compares searching many literals at once with one pass per literal."""
+
+  REPEATS = 3
+
+  @test_lib.SetLabel("benchmark")
+  def testManyLiterals(self):
+    """Searches 1MB of data for 500 literals, returning the number of hits."""
+    literals = ["indicator%04d" % i for i in range(500)]
+    data = bytearray(os.urandom(1024 * 1024) + "indicator0123")
+
+    def SearchSeparately():
+      hits = 0
+      for literal in literals:
+        matcher = streaming.LiteralMatcher(literal)
+        hits += len(list(matcher.FindAll(data, 0, len(data), len(data))))
+      return hits
+
+    def SearchAtOnce():
+      matcher = streaming.MultiMatcher(literals=literals)
+      return len(list(matcher.FindAll(data, 0, len(data), len(data))))
+
+    self.TimeIt(SearchSeparately, name="Separate passes")
+    self.TimeIt(SearchAtOnce, name="Single pass")
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
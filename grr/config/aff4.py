@@ -21,3 +21,23 @@ config_lib.DEFINE_string(
     "AFF4.change_email", None,
     "Email used by AFF4NotificationEmailListener to notify "
     "about AFF4 changes.")
+
+config_lib.DEFINE_integer(
+    "AFF4.image_max_readahead", 64,
+    "The maximum number of chunks AFF4 images read ahead when they are read "
+    "sequentially.")
+
+config_lib.DEFINE_integer(
+    "AFF4.image_prefetch_threads", 10,
+    "The number of threads reading chunks of AFF4 images ahead in the "
+    "background. Set to 0 to only read ahead synchronously.")
+
+config_lib.DEFINE_float(
+    "FileStore.hash_filter_error_rate", 0.01,
+    "The false positive rate the bloom filters of the hash file stores are "
+    "built for.")
+
+config_lib.DEFINE_integer(
+    "FileStore.hash_filter_reload_interval", 600,
+    "The number of seconds after which the bloom filters of the hash file "
+    "stores are read from the data store again.")
@@ -104,6 +104,13 @@ config_lib.DEFINE_float("Client.error_poll_min", 60,
 
 config_lib.DEFINE_float("Client.poll_slew", 1.15, "Slew of poll time.")
 
+config_lib.DEFINE_bool(
+    "Client.mmap_content_scans", False,
+    "Map regular files into memory when scanning their contents instead of "
+    "reading them. This saves memory and copying but a file truncated while "
+    "it is scanned crashes the client on POSIX systems and can't be truncated "
+    "on Windows.")
+
 config_lib.DEFINE_integer("Client.connection_error_limit", 60 * 24,
                           "If the client encounters this many connection "
                           "errors, it exits and restarts. Retries are one "
@@ -122,6 +129,16 @@ config_lib.DEFINE_list(
 config_lib.DEFINE_integer("Client.max_post_size", 40000000,
                           "Maximum size of the post.")
 
+config_lib.DEFINE_integer(
+    "Client.min_post_size", 256 * 1024,
+    "Minimum size of the post. The client shrinks its posts down to this "
+    "size when posts take longer than Client.post_target_duration.")
+
+config_lib.DEFINE_integer(
+    "Client.post_target_duration", 10,
+    "The number of seconds a post should take. The post size is halved when "
+    "posts take longer and doubled when they take less than half of this.")
+
 config_lib.DEFINE_integer("Client.max_out_queue", 51200000,
                           "Maximum size of the output queue.")
 
@@ -262,6 +279,20 @@ config_lib.DEFINE_string(
     default="ZCOMPRESS",
     help="Type of compression (ZCOMPRESS, UNCOMPRESSED)")
 
+config_lib.DEFINE_integer(
+    "Network.compression_fast_level", 1,
+    "The zlib compression level used for message bundles smaller than "
+    "Network.compression_large_bundle_size.")
+
+config_lib.DEFINE_integer(
+    "Network.compression_level", 6,
+    "The zlib compression level used for large message bundles.")
+
+config_lib.DEFINE_integer(
+    "Network.compression_large_bundle_size", 512 * 1024,
+    "Message bundles of at least this size are compressed with "
+    "Network.compression_level.")
+
 # Installer options.
 config_lib.DEFINE_string(
     name="Installer.logfile",
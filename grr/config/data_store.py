@@ -17,6 +17,15 @@ config_lib.DEFINE_string("Datastore.implementation", "FakeDataStore",
 config_lib.DEFINE_string("Blobstore.implementation", "MemoryStreamBlobstore",
                          "Blob storage subsystem to use.")
 
+config_lib.DEFINE_string(
+    "Blobstore.file_store_location",
+    default="%(Datastore.location)/blobs",
+    help="Directory the FileBlobstore keeps the blobs in.")
+
+config_lib.DEFINE_integer(
+    "Blobstore.file_store_index_size", 100000,
+    "How many digests of existing blobs the FileBlobstore keeps in memory.")
+
 config_lib.DEFINE_integer(
     "Datastore.transaction_timeout",
     default=600,
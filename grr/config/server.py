@@ -55,6 +55,31 @@ config_lib.DEFINE_integer("Worker.queue_shards", 5,
                           "Queue notifications will be sharded across "
                           "this number of datastore subjects.")
 
+config_lib.DEFINE_integer("Worker.notification_fetch_threads", 0,
+                          "If set, notification shards and worker queues are "
+                          "scanned concurrently using up to this many "
+                          "threads. 0 scans them one after another.")
+
+config_lib.DEFINE_string("Worker.queue_notifier", "PollingQueueNotifier",
+                         "The QueueNotifier used to wake up idle workers when "
+                         "new notifications are queued. Workers always fall "
+                         "back to polling the data store.")
+
+config_lib.DEFINE_string("Worker.queue_notifier_socket_dir",
+                         "%(Config.prefix)/var/run/grr-worker-notifier",
+                         "Directory holding the sockets idle workers listen "
+                         "on when using the UnixSocketQueueNotifier.")
+
+config_lib.DEFINE_bool("Worker.shard_assignment", False,
+                       "If True, notification shards are assigned to the "
+                       "live workers with consistent hashing. Workers mostly "
+                       "process their own shards and only read other shards "
+                       "when they are idle.")
+
+config_lib.DEFINE_integer("Worker.heartbeat_interval", 30,
+                          "How often workers using shard assignment announce "
+                          "themselves to the worker pool, in seconds.")
+
 config_lib.DEFINE_integer("Worker.notification_expiry_time", 600,
                           "The queue manager expires stale notifications "
                           "after this many seconds.")
@@ -137,6 +162,24 @@ config_lib.DEFINE_list("Cron.disabled_system_jobs", [],
                        "important. Leave empty unless you are sure that you "
                        "know what you are doing.")
 
+config_lib.DEFINE_integer("Cron.hunt_results_processing_threads", 0,
+                          "If set, the results of up to this many hunts are "
+                          "processed by output plugins at once, and the next "
+                          "batch of results is read while the current one is "
+                          "processed. 0 processes hunts one after another.")
+
+config_lib.DEFINE_integer("Cron.hunt_output_plugin_threads", 0,
+                          "If set, every output plugin type runs on its own "
+                          "pool of up to this many threads, so a slow plugin "
+                          "does not hold up the other plugins of a hunt. 0 "
+                          "runs the plugins one after another.")
+
+config_lib.DEFINE_integer("Cron.hunt_output_plugin_backoff", 0,
+                          "If set, a hunt's output plugin which failed is "
+                          "skipped for this many seconds, doubling with every "
+                          "further error. Skipped batches are reported as "
+                          "errors. 0 runs the plugin on every batch.")
+
 config_lib.DEFINE_string("Frontend.bind_address", "::",
                          "The ip address to bind.")
 
@@ -147,6 +190,21 @@ config_lib.DEFINE_integer("Frontend.port_max", None,
                           "use ports between Frontend.bind_port and "
                           "Frontend.port_max.")
 
+config_lib.DEFINE_bool("Frontend.event_loop", False,
+                       "If set, the frontend accepts connections on a single "
+                       "event loop and processes requests on a bounded pool "
+                       "of Frontend.worker_threads threads instead of starting "
+                       "a thread per connection.")
+
+config_lib.DEFINE_integer("Frontend.worker_threads", 50,
+                          "The maximum number of threads processing requests "
+                          "when Frontend.event_loop is set.")
+
+config_lib.DEFINE_integer("Frontend.max_pending_requests", 500,
+                          "When Frontend.event_loop is set and this many "
+                          "requests are waiting for a worker thread, no new "
+                          "connections are accepted until the backlog drains.")
+
 config_lib.DEFINE_integer("Frontend.max_queue_size", 500,
                           "Maximum number of messages to queue for the client.")
 
@@ -158,6 +216,37 @@ config_lib.DEFINE_integer("Frontend.message_expiry_time", 600,
                           "Maximum time messages remain valid within the "
                           "system.")
 
+config_lib.DEFINE_integer("Frontend.cipher_cache_size", 50000,
+                          "Maximum number of client session ciphers the "
+                          "frontend keeps for encrypting responses.")
+
+config_lib.DEFINE_integer("Frontend.cipher_rotation_time", 3600,
+                          "Session ciphers used to encrypt responses for a "
+                          "client are regenerated after this many seconds.")
+
+config_lib.DEFINE_string("Frontend.client_task_hints", "NoClientTaskHints",
+                         "The ClientTaskHints used to skip reading the task "
+                         "queue of idle clients. Frontends and workers must "
+                         "use the same implementation.")
+
+config_lib.DEFINE_integer("Frontend.task_hint_buckets", 65536,
+                          "The number of buckets client task hints are kept "
+                          "in. Queues sharing a bucket are read when any of "
+                          "them gets tasks.")
+
+config_lib.DEFINE_integer("Frontend.task_hint_refresh_time", 1,
+                          "Frontends using the DataStoreClientTaskHints read "
+                          "the updated hints this often, in seconds.")
+
+config_lib.DEFINE_integer("Frontend.task_hint_reconcile_time", 600,
+                          "The task queue of an idle client is read at least "
+                          "this often, in seconds, regardless of the client "
+                          "task hints.")
+
+config_lib.DEFINE_integer("Frontend.idle_client_cache_size", 100000,
+                          "Maximum number of idle clients the frontend "
+                          "remembers.")
+
 config_lib.DEFINE_string("Frontend.upload_store", "FileUploadFileStore",
                          "The implementation of the upload file store.")
 
@@ -249,6 +338,31 @@ config_lib.DEFINE_integer(
     help="Maximum lifetime (in seconds) of data in the "
     "stats store. Default is three days.")
 
+config_lib.DEFINE_bool(
+    "StatsStore.rollups_enabled",
+    default=True,
+    help="If True, the stats store also keeps downsampled rollups of the "
+    "stats data at 1 minute, 1 hour and 1 day resolution. Long time ranges "
+    "are read from the rollups instead of the raw samples.")
+
+config_lib.DEFINE_integer(
+    "StatsStore.rollup_1m_ttl",
+    default=60 * 60 * 24 * 14,
+    help="Maximum lifetime (in seconds) of the 1 minute stats rollups. "
+    "Default is two weeks.")
+
+config_lib.DEFINE_integer(
+    "StatsStore.rollup_1h_ttl",
+    default=60 * 60 * 24 * 90,
+    help="Maximum lifetime (in seconds) of the 1 hour stats rollups. "
+    "Default is 90 days.")
+
+config_lib.DEFINE_integer(
+    "StatsStore.rollup_1d_ttl",
+    default=60 * 60 * 24 * 365 * 2,
+    help="Maximum lifetime (in seconds) of the 1 day stats rollups. "
+    "Default is two years.")
+
 config_lib.DEFINE_bool(
     "AdminUI.allow_hunt_results_delete",
     default=False,
@@ -18,6 +18,7 @@ import logging
 from grr.lib import aff4
 from grr.lib import rdfvalue
 from grr.lib import utils
+from grr.lib.aff4_objects import sequential_collection
 from grr.lib.flows.general import export as flow_export
 from grr.lib.rdfvalues import crypto as rdf_crypto
 from grr.lib.rdfvalues import structs as rdf_structs
@@ -273,3 +274,60 @@ def FilterCollection(collection, offset, count=0, filter_value=None):
     items = list(itertools.islice(collection.GenerateItems(offset), count))
 
   return items
+
+
+def _DecodeCursor(cursor):
+  match = re.match(r"^([0-9a-f]{1,16})(?:\.([0-9a-f]{1,6}))?$", cursor)
+  if not match:
+    raise ValueError("Invalid cursor: %s" % cursor)
+
+  return (int(match.group(1), 16), int(match.group(2) or "0", 16))
+
+
+def FilterCollectionAfterCursor(collection, cursor, count=0,
+                                filter_value=None):
+  """Filters a sequential collection, getting count elements after a cursor.
+
+  Unlike an offset, a cursor identifies a position in the collection itself,
+  so every call continues reading where the previous one stopped, even when
+  the items are filtered.
+
+  Args:
+    collection: A SequentialCollection.
+    cursor: A cursor returned by a previous call, or "0" to start from the
+      first item.
+    count: The maximum number of items to return, 0 for all of them.
+    filter_value: If set, only items whose serialized form contains this
+      string are returned.
+
+  Returns:
+    A (items, next_cursor) tuple. Passing next_cursor to the next call
+    continues after the last item read, including items that did not match
+    the filter.
+
+  Raises:
+    ValueError: if the cursor or the count are invalid or the collection does
+      not support cursors.
+  """
+  if count < 0:
+    raise ValueError("Count needs to be greater than or equal to zero")
+
+  if not isinstance(collection, sequential_collection.SequentialCollection):
+    raise ValueError("Collection %s does not support cursors." %
+                     collection.urn)
+
+  position = _DecodeCursor(cursor)
+
+  count = count or sys.maxint
+  items = []
+  for position, item in collection.Scan(
+      after_timestamp=position, include_suffix=True):
+    if filter_value and not re.search(
+        re.escape(filter_value), item.SerializeToString(), re.I):
+      continue
+
+    items.append(item)
+    if len(items) >= count:
+      break
+
+  return items, "%016x.%06x" % position
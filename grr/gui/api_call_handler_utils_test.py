@@ -18,6 +18,7 @@ from grr.lib import aff4
 from grr.lib import flags
 from grr.lib import test_lib
 from grr.lib.aff4_objects import collects
+from grr.lib.aff4_objects import sequential_collection
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import crypto as rdf_crypto
 from grr.lib.rdfvalues import paths as rdf_paths
@@ -318,6 +319,61 @@ class FilterCollectionTest(test_lib.GRRBaseTest):
     self.assertEqual(data[0].path, "/var/os/tmp-8")
 
 
+class FilterCollectionAfterCursorTest(test_lib.GRRBaseTest):
+  """Test for FilterCollectionAfterCursor."""
+
+  def setUp(self):
+    super(FilterCollectionAfterCursorTest, self).setUp()
+
+    with aff4.FACTORY.Create(
+        "aff4:/tmp/foo/bar",
+        sequential_collection.GeneralIndexedCollection,
+        token=self.token) as fd:
+      for i in range(10):
+        fd.Add(rdf_paths.PathSpec(path="/var/os/tmp-%d" % i, pathtype="OS"))
+
+    self.fd = aff4.FACTORY.Open("aff4:/tmp/foo/bar", token=self.token)
+
+  def testContinuesAfterCursor(self):
+    paths = []
+    cursor = "0"
+    for _ in range(4):
+      data, cursor = api_call_handler_utils.FilterCollectionAfterCursor(
+          self.fd, cursor, 3)
+      paths.extend(item.path for item in data)
+
+    self.assertEqual(paths, ["/var/os/tmp-%d" % i for i in range(10)])
+
+    # The last cursor stays valid and returns items added later on.
+    self.fd.Add(rdf_paths.PathSpec(path="/var/os/tmp-10", pathtype="OS"))
+    data, _ = api_call_handler_utils.FilterCollectionAfterCursor(
+        self.fd, cursor, 3)
+    self.assertEqual([item.path for item in data], ["/var/os/tmp-10"])
+
+  def testFilteredItemsAreNotReadAgain(self):
+    data, cursor = api_call_handler_utils.FilterCollectionAfterCursor(
+        self.fd, "0", 1, "tmp-8")
+    self.assertEqual([item.path for item in data], ["/var/os/tmp-8"])
+
+    data, _ = api_call_handler_utils.FilterCollectionAfterCursor(
+        self.fd, cursor, 0, None)
+    self.assertEqual([item.path for item in data], ["/var/os/tmp-9"])
+
+  def testRaisesOnInvalidCursor(self):
+    with self.assertRaises(ValueError):
+      api_call_handler_utils.FilterCollectionAfterCursor(self.fd, "foo", 0)
+
+  def testRaisesOnCollectionWithoutCursors(self):
+    with aff4.FACTORY.Create(
+        "aff4:/tmp/foo/baz", collects.RDFValueCollection,
+        token=self.token) as fd:
+      fd.Add(rdf_paths.PathSpec(path="/var/os/tmp", pathtype="OS"))
+
+    fd = aff4.FACTORY.Open("aff4:/tmp/foo/baz", token=self.token)
+    with self.assertRaises(ValueError):
+      api_call_handler_utils.FilterCollectionAfterCursor(fd, "0", 0)
+
+
 def main(argv):
   test_lib.main(argv)
 
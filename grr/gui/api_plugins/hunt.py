@@ -137,7 +137,6 @@ class ApiHunt(rdf_structs.RDFProtoStruct):
     self.total_net_usage = hunt_stats.network_bytes_sent_stats.sum
 
     if with_full_summary:
-      # This is an expensive call. Avoid it if not needed.
       all_clients_count, completed_clients_count, _ = hunt.GetClientsCounts()
       self.all_clients_count = all_clients_count
       self.completed_clients_count = completed_clients_count
@@ -358,13 +357,19 @@ class ApiListHuntResultsHandler(api_call_handler_base.ApiCallHandler):
   def Handle(self, args, token=None):
     results_collection = aff4.FACTORY.Open(
         args.hunt_id.ToURN().Add("Results"), mode="r", token=token)
-    items = api_call_handler_utils.FilterCollection(results_collection,
-                                                    args.offset, args.count,
-                                                    args.filter)
-    wrapped_items = [ApiHuntResult().InitFromGrrMessage(item) for item in items]
+    result = ApiListHuntResultsResult()
+    if args.HasField("cursor"):
+      items, result.next_cursor = (
+          api_call_handler_utils.FilterCollectionAfterCursor(
+              results_collection, args.cursor, args.count, args.filter))
+    else:
+      items = api_call_handler_utils.FilterCollection(results_collection,
+                                                      args.offset, args.count,
+                                                      args.filter)
 
-    return ApiListHuntResultsResult(
-        items=wrapped_items, total_count=len(results_collection))
+    result.items = [ApiHuntResult().InitFromGrrMessage(item) for item in items]
+    result.total_count = len(results_collection)
+    return result
 
 
 class ApiListHuntCrashesArgs(rdf_structs.RDFProtoStruct):
@@ -673,9 +678,7 @@ class ApiGetHuntClientCompletionStatsHandler(
         mode="r",
         token=token)
 
-    clients_by_status = hunt.GetClientsByStatus()
-    started_clients = clients_by_status["STARTED"]
-    completed_clients = clients_by_status["COMPLETED"]
+    started_clients, completed_clients = hunt.GetClientCompletionStats()
 
     (start_stats, complete_stats) = self._SampleClients(started_clients,
                                                         completed_clients)
@@ -693,34 +696,15 @@ class ApiGetHuntClientCompletionStatsHandler(
     if not started_clients and not completed_clients:
       return ([], [])
 
-    cdict = {}
-    for client in started_clients:
-      cdict.setdefault(client, []).append(client.age)
-
-    fdict = {}
-    for client in completed_clients:
-      fdict.setdefault(client, []).append(client.age)
-
-    cl_age = [int(min(x) / 1e6) for x in cdict.values()]
-    fi_age = [int(min(x) / 1e6) for x in fdict.values()]
-
-    cl_hist = {}
-    fi_hist = {}
-
-    for age in cl_age:
-      cl_hist.setdefault(age, 0)
-      cl_hist[age] += 1
-
-    for age in fi_age:
-      fi_hist.setdefault(age, 0)
-      fi_hist[age] += 1
+    cl_hist = dict(started_clients)
+    fi_hist = dict(completed_clients)
 
-    t0 = min(cl_age) - 1
+    t0 = min(cl_hist or fi_hist) - 1
     times = [t0]
     cl = [0]
     fi = [0]
 
-    all_times = set(cl_age) | set(fi_age)
+    all_times = set(cl_hist) | set(fi_hist)
     cl_count = 0
     fi_count = 0
 
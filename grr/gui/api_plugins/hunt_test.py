@@ -687,6 +687,56 @@ class ApiDeleteHuntHandlerTest(api_test_lib.ApiCallHandlerTest,
           self.hunt_urn, aff4_type=implementation.GRRHunt, token=self.token)
 
 
+class ApiListHuntResultsHandlerTest(api_test_lib.ApiCallHandlerTest,
+                                    standard_test.StandardHuntTestMixin):
+  """Test for ApiListHuntResultsHandler."""
+
+  def setUp(self):
+    super(ApiListHuntResultsHandlerTest, self).setUp()
+
+    self.handler = hunt_plugin.ApiListHuntResultsHandler()
+
+    with self.CreateHunt(description="the hunt") as hunt_obj:
+      self.hunt_id = hunt_obj.urn.Basename()
+      results_urn = hunt_obj.results_collection_urn
+
+    for i in range(5):
+      hunt_results.HuntResultCollection.StaticAdd(
+          results_urn,
+          self.token,
+          rdf_flows.GrrMessage(payload=rdfvalue.RDFString("result-%d" % i)))
+
+  def _ListResults(self, **kwargs):
+    return self.handler.Handle(
+        hunt_plugin.ApiListHuntResultsArgs(hunt_id=self.hunt_id, **kwargs),
+        token=self.token)
+
+  def testListsResultsByOffset(self):
+    result = self._ListResults(offset=1, count=2)
+    self.assertEqual([item.payload for item in result.items],
+                     ["result-1", "result-2"])
+    self.assertEqual(result.total_count, 5)
+    self.assertFalse(result.HasField("next_cursor"))
+
+  def testListsResultsByCursor(self):
+    payloads = []
+    cursor = "0"
+    for _ in range(3):
+      result = self._ListResults(cursor=cursor, count=2)
+      self.assertEqual(result.total_count, 5)
+      payloads.extend(item.payload for item in result.items)
+      cursor = result.next_cursor
+
+    self.assertEqual(payloads, ["result-%d" % i for i in range(5)])
+
+  def testFiltersResultsByCursor(self):
+    result = self._ListResults(cursor="0", count=1, filter="result-3")
+    self.assertEqual([item.payload for item in result.items], ["result-3"])
+
+    result = self._ListResults(cursor=result.next_cursor)
+    self.assertEqual([item.payload for item in result.items], ["result-4"])
+
+
 class DummyFlowWithSingleReply(flow.GRRFlow):
   """Just emits 1 reply."""
 
@@ -65,6 +65,25 @@ class ApiGetStatsStoreMetricHandler(api_call_handler_base.ApiCallHandler):
   args_type = ApiGetStatsStoreMetricArgs
   result_type = ApiStatsStoreMetric
 
+  # Sampling periods by the length of the requested time range, longest range
+  # first. Periods of an hour or more are read from the stats store rollups of
+  # the same resolution.
+  SAMPLING_PERIODS = [
+      (rdfvalue.Duration("60d"), rdfvalue.Duration("1d")),
+      (rdfvalue.Duration("7d"), rdfvalue.Duration("1h")),
+      (rdfvalue.Duration("1d"), rdfvalue.Duration("5m")),
+      (rdfvalue.Duration("6h"), rdfvalue.Duration("1m")),
+  ]
+  DEFAULT_SAMPLING_PERIOD = rdfvalue.Duration("30s")
+
+  def GetSamplingPeriod(self, requested_duration):
+    """Returns the sampling period to use for a time range of given length."""
+    for min_duration, sampling_period in self.SAMPLING_PERIODS:
+      if requested_duration >= min_duration:
+        return sampling_period
+
+    return self.DEFAULT_SAMPLING_PERIOD
+
   def Handle(self, args, token):
     stats_store = aff4.FACTORY.Create(
         stats_store_lib.StatsStore.DATA_STORE_ROOT,
@@ -100,10 +119,14 @@ class ApiGetStatsStoreMetricHandler(api_call_handler_base.ApiCallHandler):
     result = ApiStatsStoreMetric(
         start=base_start_time, end=end_time, metric_name=args.metric_name)
 
+    sampling_duration = self.GetSamplingPeriod(end_time - start_time)
+
+    # Long time ranges are read from the stats store rollups.
     data = stats_store.MultiReadStats(
         process_ids=filtered_ids,
         metric_name=utils.SmartStr(args.metric_name),
-        timestamp=(start_time, end_time))
+        timestamp=(start_time, end_time),
+        period=sampling_duration)
 
     if not data:
       return result
@@ -117,14 +140,6 @@ class ApiGetStatsStoreMetricHandler(api_call_handler_base.ApiCallHandler):
     if metric_metadata.fields_defs:
       query.InAll()
 
-    requested_duration = end_time - start_time
-    if requested_duration >= rdfvalue.Duration("1d"):
-      sampling_duration = rdfvalue.Duration("5m")
-    elif requested_duration >= rdfvalue.Duration("6h"):
-      sampling_duration = rdfvalue.Duration("1m")
-    else:
-      sampling_duration = rdfvalue.Duration("30s")
-
     if metric_metadata.metric_type == metric_metadata.MetricType.COUNTER:
       query.TakeValue().MakeIncreasing().Normalize(
           sampling_duration,
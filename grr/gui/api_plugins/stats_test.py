@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""This module contains tests for stats API handlers."""
+
+
+
+from grr.gui import api_test_lib
+from grr.gui.api_plugins import stats as stats_plugin
+
+from grr.lib import aff4
+from grr.lib import flags
+from grr.lib import rdfvalue
+from grr.lib import stats
+from grr.lib import test_lib
+from grr.lib import utils
+
+from grr.lib.aff4_objects import stats_store as aff4_stats_store
+
+
+class ApiGetStatsStoreMetricHandlerTest(api_test_lib.ApiCallHandlerTest):
+  """Test for ApiGetStatsStoreMetricHandler."""
+
+  def setUp(self):
+    super(ApiGetStatsStoreMetricHandlerTest, self).setUp()
+    self.handler = stats_plugin.ApiGetStatsStoreMetricHandler()
+
+  def testSamplingPeriodGrowsWithTimeRange(self):
+    for requested, expected in [("1h", "30s"), ("6h", "1m"), ("1d", "5m"),
+                                ("7d", "1h"), ("60d", "1d"), ("365d", "1d")]:
+      self.assertEqual(
+          self.handler.GetSamplingPeriod(rdfvalue.Duration(requested)),
+          rdfvalue.Duration(expected))
+
+  def testLongTimeRangesAreReadFromDailyRollups(self):
+    stats_collector = stats.StatsCollector()
+    stats_collector.RegisterGaugeMetric("sample_gauge_value", float)
+
+    day = 60 * 60 * 24
+    start = 100 * day
+    rollups = aff4_stats_store.GetRollupTiers()[2:]
+    with utils.Stubber(stats, "STATS", stats_collector):
+      for i in range(60):
+        # Two samples a day, only their daily average is read back.
+        for value, offset in [(i, 0), (i + 1, day / 2)]:
+          stats_collector.SetGaugeValue("sample_gauge_value", float(value))
+          with aff4.FACTORY.Create(
+              None,
+              aff4_stats_store.StatsStore,
+              mode="w",
+              token=self.token) as stats_store:
+            stats_store.WriteStats(
+                process_id="worker_1",
+                timestamp=(start + i * day + offset) * 1000000,
+                sync=True,
+                rollups=rollups)
+
+    periods = []
+    multi_read_stats = aff4_stats_store.StatsStore.MultiReadStats
+
+    def MultiReadStats(stats_store, **kwargs):
+      periods.append(kwargs["period"])
+      return multi_read_stats(stats_store, **kwargs)
+
+    with utils.Stubber(aff4_stats_store.StatsStore, "MultiReadStats",
+                       MultiReadStats):
+      result = self.handler.Handle(
+          stats_plugin.ApiGetStatsStoreMetricArgs(
+              component="WORKER",
+              metric_name="sample_gauge_value",
+              start=rdfvalue.RDFDatetime().FromSecondsFromEpoch(start),
+              end=rdfvalue.RDFDatetime().FromSecondsFromEpoch(start + 60 * day),
+              aggregation_mode="AGG_NONE"),
+          token=self.token)
+
+    self.assertEqual(periods, [rdfvalue.Duration("1d")])
+    self.assertEqual(len(result.data_points), 60)
+    self.assertEqual([p.value for p in result.data_points[:3]],
+                     [0.5, 1.5, 2.5])
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -22,6 +22,7 @@ from grr.lib import lexer
 from grr.lib import rdfvalue
 from grr.lib import registry
 from grr.lib import stats
+from grr.lib import threadpool
 from grr.lib import type_info
 from grr.lib import utils
 from grr.lib.rdfvalues import aff4_rdfvalues
@@ -2671,7 +2672,9 @@ class ChunkCache(utils.FastStore):
     super(ChunkCache, self).__init__(*args, **kw)
 
   def KillObject(self, obj):
-    if self.kill_cb:
+    # Chunks read from the data store are kept as immutable strings and never
+    # need to be written back.
+    if self.kill_cb and not isinstance(obj, basestring):
       self.kill_cb(obj)
 
   def __getstate__(self):
@@ -2680,6 +2683,72 @@ class ChunkCache(utils.FastStore):
     return self.__dict__
 
 
+class ChunkPrefetch(object):
+  """A batch of image chunks which is read in the background."""
+
+  POOL_NAME = "aff4_image_prefetch"
+
+  def __init__(self, fetch_cb, chunks):
+    """Constructor.
+
+    Args:
+      fetch_cb: A callable returning a dict mapping the chunk numbers it is
+        called with to the chunk data.
+      chunks: The chunk numbers to read.
+    """
+    self.fetch_cb = fetch_cb
+    self.chunks = set(chunks)
+    self.results = {}
+    self.done = threading.Event()
+
+  @classmethod
+  def GetPool(cls):
+    """Returns the shared prefetch thread pool or None if it's disabled."""
+    max_threads = config_lib.CONFIG["AFF4.image_prefetch_threads"]
+    if max_threads <= 0:
+      return None
+
+    pool = threadpool.ThreadPool.Factory(
+        cls.POOL_NAME, min_threads=1, max_threads=max_threads)
+    pool.Start()
+    return pool
+
+  def Schedule(self):
+    """Queues the batch on the prefetch pool.
+
+    Returns:
+      False if prefetching is disabled or the pool is busy.
+    """
+    pool = self.GetPool()
+    if pool is None:
+      return False
+
+    try:
+      pool.AddTask(
+          target=self.Run,
+          args=(),
+          name="prefetch_chunks",
+          blocking=False,
+          inline=False)
+    except threadpool.Full:
+      return False
+
+    return True
+
+  def Run(self):
+    try:
+      self.results = self.fetch_cb(sorted(self.chunks))
+    except Exception as e:  # pylint: disable=broad-except
+      # The chunks are simply read again when they are needed.
+      logging.warning("Prefetching chunks failed: %s", e)
+    finally:
+      self.done.set()
+
+  def Wait(self):
+    self.done.wait()
+    return self.results
+
+
 class AFF4ImageBase(AFF4Stream):
   """An AFF4 Image is stored in segments.
 
@@ -2697,7 +2766,9 @@ class AFF4ImageBase(AFF4Stream):
   # Subclasses should set the name of the type of stream to use for chunks.
   STREAM_TYPE = None
 
-  # How many chunks should be cached.
+  # How many chunks are read at once. While the stream is read sequentially
+  # this grows up to AFF4.image_max_readahead chunks and the chunks following
+  # the ones being read are fetched in the background.
   LOOK_AHEAD = 10
 
   class SchemaCls(AFF4Stream.SchemaCls):
@@ -2776,8 +2847,9 @@ class AFF4ImageBase(AFF4Stream):
     """Build a cache for our chunks."""
     super(AFF4ImageBase, self).Initialize()
     self.offset = 0
+    self._ResetReadahead()
     # A cache for segments.
-    self.chunk_cache = ChunkCache(self._WriteChunk, 100)
+    self.chunk_cache = self._MakeChunkCache()
 
     if "r" in self.mode:
       self.size = int(self.Get(self.Schema.SIZE))
@@ -2821,23 +2893,52 @@ class AFF4ImageBase(AFF4Stream):
     self.size = offset
     self.offset = offset
     self.chunk_cache.Flush()
+    self._ResetReadahead()
+
+  def _MakeChunkCache(self):
+    # Room for a full readahead window being read and the next one being
+    # prefetched.
+    return ChunkCache(self._WriteChunk, max(100, 2 * self.max_readahead))
+
+  def _ResetReadahead(self):
+    self.max_readahead = max(self.LOOK_AHEAD,
+                             config_lib.CONFIG["AFF4.image_max_readahead"])
+    self.readahead = self.LOOK_AHEAD
+    self.last_read_chunk = None
+    # The first chunk which was neither read nor scheduled for prefetching.
+    self.next_unread_chunk = 0
+    # Prefetches whose results have not been put in the chunk cache yet.
+    self.prefetches = []
 
   def _ReadChunk(self, chunk):
     self._ReadChunks([chunk])
     return self.chunk_cache.Get(chunk)
 
   def _ReadChunks(self, chunks):
+    for chunk, data in self._FetchChunks(chunks).iteritems():
+      self.chunk_cache.Put(chunk, data)
+
+  def _FetchChunks(self, chunks):
+    """Reads chunks from the data store.
+
+    This may be called from the prefetch pool so it must not modify the image.
+
+    Args:
+      chunks: A list of chunk numbers.
+
+    Returns:
+      A dict mapping chunk numbers to the chunk data for the chunks found.
+    """
     chunk_names = {
         self.urn.Add(self.CHUNK_ID_TEMPLATE % chunk): chunk
         for chunk in chunks
     }
+    result = {}
     for child in FACTORY.MultiOpen(
         chunk_names, mode="rw", token=self.token, age=self.age_policy):
       if isinstance(child, AFF4Stream):
-        fd = StringIO.StringIO(child.read())
-        fd.dirty = False
-        fd.chunk = chunk_names[child.urn]
-        self.chunk_cache.Put(fd.chunk, fd)
+        result[chunk_names[child.urn]] = child.read()
+    return result
 
   def _WriteChunk(self, chunk):
     if chunk.dirty:
@@ -2848,48 +2949,109 @@ class AFF4ImageBase(AFF4Stream):
 
   def _GetChunkForWriting(self, chunk):
     """Opens a chunk for writing, creating a new one if it doesn't exist yet."""
-    try:
-      chunk = self.chunk_cache.Get(chunk)
-      chunk.dirty = True
-      return chunk
-    except KeyError:
-      pass
+    # Prefetched data might be older than what is about to be written.
+    self.prefetches = []
 
     try:
-      chunk = self._ReadChunk(chunk)
-      chunk.dirty = True
-      return chunk
+      fd = self.chunk_cache.Get(chunk)
     except KeyError:
-      pass
+      try:
+        fd = self._ReadChunk(chunk)
+      except KeyError:
+        fd = ""
+
+    if isinstance(fd, basestring):
+      # Chunks read from the data store are immutable strings.
+      fd = StringIO.StringIO(fd)
+      fd.chunk = chunk
+      self.chunk_cache.Put(chunk, fd)
 
-    fd = StringIO.StringIO()
-    fd.chunk = chunk
     fd.dirty = True
-    self.chunk_cache.Put(chunk, fd)
     return fd
 
+  def _CollectPrefetches(self, chunk):
+    """Moves finished prefetches into the cache, waiting for chunk if needed."""
+    pending = []
+    for prefetch in self.prefetches:
+      if chunk in prefetch.chunks or prefetch.done.is_set():
+        for chunk_number, data in prefetch.Wait().iteritems():
+          if chunk_number not in self.chunk_cache:
+            self.chunk_cache.Put(chunk_number, data)
+      else:
+        pending.append(prefetch)
+    self.prefetches = pending
+
+  def _UpdateReadahead(self, chunk):
+    """Grows the readahead window on sequential reads, resets it otherwise."""
+    if self.last_read_chunk is not None and chunk == self.last_read_chunk + 1:
+      self.readahead = min(self.readahead * 2, self.max_readahead)
+    elif chunk != self.last_read_chunk:
+      # Random access, the readahead would most likely be wasted.
+      self.readahead = self.LOOK_AHEAD
+      self.next_unread_chunk = chunk
+      self.prefetches = []
+    self.last_read_chunk = chunk
+
+  def _ScheduleReadahead(self, chunk):
+    """Prefetches the chunks in the readahead window following chunk."""
+    # Only go to the data store once half of the window has been consumed so
+    # the prefetches are done in reasonably large batches.
+    if self.next_unread_chunk > chunk + self.readahead / 2:
+      return
+
+    last_chunk = (self.size - 1) / self.chunksize
+    end = min(chunk + 1 + self.readahead, last_chunk + 1)
+    start = max(self.next_unread_chunk, chunk + 1)
+    if start >= end:
+      return
+
+    missing_chunks = [
+        chunk_number for chunk_number in xrange(start, end)
+        if chunk_number not in self.chunk_cache
+    ]
+    if missing_chunks:
+      prefetch = ChunkPrefetch(self._FetchChunks, missing_chunks)
+      if not prefetch.Schedule():
+        return
+      self.prefetches.append(prefetch)
+
+    self.next_unread_chunk = end
+
   def _GetChunkForReading(self, chunk):
     """Returns the relevant chunk from the datastore and reads ahead."""
+    self._UpdateReadahead(chunk)
+    if self.prefetches:
+      self._CollectPrefetches(chunk)
+
     try:
-      return self.chunk_cache.Get(chunk)
+      result = self.chunk_cache.Get(chunk)
     except KeyError:
-      pass
+      # We don't have this chunk already cached. The most common read
+      # access pattern is contiguous reading so since we have to go to
+      # the data store already, we read ahead to reduce round trips.
+      missing_chunks = []
+      for chunk_number in range(chunk, chunk + self.readahead):
+        if chunk_number not in self.chunk_cache:
+          missing_chunks.append(chunk_number)
+
+      self._ReadChunks(missing_chunks)
+      self.next_unread_chunk = max(self.next_unread_chunk,
+                                   chunk + self.readahead)
+      # This should work now - otherwise we just give up.
+      try:
+        result = self.chunk_cache.Get(chunk)
+      except KeyError:
+        raise ChunkNotFoundError("Cannot open chunk %s" % chunk)
 
-    # We don't have this chunk already cached. The most common read
-    # access pattern is contiguous reading so since we have to go to
-    # the data store already, we read ahead to reduce round trips.
+    self._ScheduleReadahead(chunk)
+    return result
 
-    missing_chunks = []
-    for chunk_number in range(chunk, chunk + self.LOOK_AHEAD):
-      if chunk_number not in self.chunk_cache:
-        missing_chunks.append(chunk_number)
+  def _ReadFromChunk(self, fd, chunk_offset, length):
+    if isinstance(fd, basestring):
+      return fd[chunk_offset:chunk_offset + length]
 
-    self._ReadChunks(missing_chunks)
-    # This should work now - otherwise we just give up.
-    try:
-      return self.chunk_cache.Get(chunk)
-    except KeyError:
-      raise ChunkNotFoundError("Cannot open chunk %s" % chunk)
+    fd.seek(chunk_offset)
+    return fd.read(length)
 
   def _ReadPartial(self, length):
     """Read as much as possible, but not more than length."""
@@ -2901,7 +3063,7 @@ class AFF4ImageBase(AFF4Stream):
     retries = 0
     while retries < self.NUM_RETRIES:
       fd = self._GetChunkForReading(chunk)
-      if fd:
+      if fd is not None:
         break
       # Arriving here means we know about blobs that cannot be found in the db.
       # The most likely reason is that they have not been synced yet so we
@@ -2913,16 +3075,14 @@ class AFF4ImageBase(AFF4Stream):
     if retries >= self.NUM_RETRIES:
       raise IOError("Chunk not found for reading.")
 
-    fd.seek(chunk_offset)
-
-    result = fd.read(available_to_read)
+    result = self._ReadFromChunk(fd, chunk_offset, available_to_read)
     self.offset += len(result)
 
     return result
 
   def Read(self, length):
     """Read a block of data from the file."""
-    result = ""
+    result = []
 
     # The total available size in the file
     length = int(length)
@@ -2934,8 +3094,8 @@ class AFF4ImageBase(AFF4Stream):
         break
 
       length -= len(data)
-      result += data
-    return result
+      result.append(data)
+    return "".join(result)
 
   def _WritePartial(self, data):
     """Writes at most one chunk of data."""
@@ -2995,12 +3155,14 @@ class AFF4ImageBase(AFF4Stream):
       self.chunk_cache.Flush()
       res = self.__dict__.copy()
       del res["chunk_cache"]
+      res["prefetches"] = []
       return res
     return self.__dict__
 
   def __setstate__(self, state):
     self.__dict__ = state
-    self.chunk_cache = ChunkCache(self._WriteChunk, 100)
+    self._ResetReadahead()
+    self.chunk_cache = self._MakeChunkCache()
 
 
 class AFF4Image(AFF4ImageBase):
@@ -425,6 +425,9 @@ class GRRForeman(aff4.AFF4Object):
         creates_new_object_version=False,
         default=rdf_foreman.ForemanRules())
 
+  # The rules compiled by _GetRuleIndex.
+  _rule_index = None
+
   def ExpireRules(self):
     """Removes any rules with an expiration date in the past."""
     rules = self.Get(self.Schema.RULES)
@@ -460,9 +463,13 @@ class GRRForeman(aff4.AFF4Object):
 
     return False
 
-  def _EvaluateRules(self, objects, rule, client_id):
-    """Evaluates the rules."""
-    return rule.client_rule_set.Evaluate(objects, client_id)
+  def _GetRuleIndex(self):
+    """Returns the compiled rules, compiling them again if they changed."""
+    rules = self.Get(self.Schema.RULES)
+    if self._rule_index is None or self._rule_index.rules is not rules:
+      self._rule_index = rdf_foreman.ForemanRuleIndex(rules)
+
+    return self._rule_index
 
   def _RunActions(self, rule, client_id):
     """Run all the actions specified in the rule.
@@ -519,8 +526,15 @@ class GRRForeman(aff4.AFF4Object):
     """
     client_id = rdf_client.ClientURN(client_id)
 
-    rules = self.Get(self.Schema.RULES)
-    if not rules:
+    index = self._GetRuleIndex()
+    if not index.rules:
+      return 0
+
+    now = time.time() * 1e6
+    expired_rules = index.first_expiry < now
+    if index.last_expiry < now:
+      # No rule can match any client anymore.
+      self.ExpireRules()
       return 0
 
     client = aff4.FACTORY.Open(client_id, mode="rw", token=self.token)
@@ -529,45 +543,21 @@ class GRRForeman(aff4.AFF4Object):
     except AttributeError:
       last_foreman_run = 0
 
-    latest_rule = max(rule.created for rule in rules)
-
-    if latest_rule <= int(last_foreman_run):
+    if index.latest_rule <= int(last_foreman_run):
       return 0
 
     # Update the latest checked rule on the client.
-    client.Set(client.Schema.LAST_FOREMAN_TIME(latest_rule))
-    client.Close()
-
-    # For efficiency we collect all the objects we want to open first and then
-    # open them all in one round trip.
-    object_urns = {}
-    relevant_rules = []
-    expired_rules = False
-
-    now = time.time() * 1e6
-
-    for rule in rules:
-      if rule.expires < now:
-        expired_rules = True
-        continue
-      if rule.created <= int(last_foreman_run):
-        continue
-
-      relevant_rules.append(rule)
-
-      for path in rule.client_rule_set.GetPathsToCheck():
-        aff4_object = client_id.Add(path)
-        object_urns[str(aff4_object)] = aff4_object
-
-    # Retrieve all aff4 objects we need.
-    objects = {}
-    for fd in aff4.FACTORY.MultiOpen(object_urns, token=self.token):
-      objects[fd.urn] = fd
+    client.Set(client.Schema.LAST_FOREMAN_TIME(index.latest_rule))
+    try:
+      # The client object is only readable until it is closed.
+      matching_rules = index.MatchingRules(
+          client, int(last_foreman_run), token=self.token)
+    finally:
+      client.Close()
 
     actions_count = 0
-    for rule in relevant_rules:
-      if self._EvaluateRules(objects, rule, client_id):
-        actions_count += self._RunActions(rule, client_id)
+    for rule in matching_rules:
+      actions_count += self._RunActions(rule, client_id)
 
     if expired_rules:
       self.ExpireRules()
@@ -6,15 +6,20 @@ under aff4:/files to handle new file hash and new file creations.
 """
 
 import hashlib
+import threading
+import time
 
 import logging
 
 from grr.lib import fingerprint
 from grr.lib import access_control
 from grr.lib import aff4
+from grr.lib import bloom_filter
+from grr.lib import config_lib
 from grr.lib import data_store
 from grr.lib import rdfvalue
 from grr.lib import registry
+from grr.lib import stats
 from grr.lib.aff4_objects import aff4_grr
 from grr.lib.rdfvalues import nsrl as rdf_nsrl
 
@@ -177,6 +182,247 @@ class FileStoreHash(rdfvalue.RDFURN):
     self.fingerprint_type, self.hash_type, self.hash_value = relative_path
 
 
+class HashFilter(object):
+  """A bloom filter of the digests stored in a hash file store.
+
+  Most hashes checked against the file store are not in it. The filter is
+  rebuilt periodically from the store's contents, and the digests added since
+  then are recorded next to it. This way every process can rule out most
+  misses without going to the data store.
+
+  The serialized filter can be far larger than a single data store value may
+  be, so it is stored in chunks. All chunks of a filter carry the timestamp of
+  the rebuild which wrote them, and the version attribute records it together
+  with the number of chunks. Processes only read the chunks again when the
+  version changes.
+  """
+
+  VERSION_ATTRIBUTE = "metadata:hash_filter_version"
+  CHUNK_PREFIX = "metadata:hash_filter_chunk/"
+  ADDED_PREFIX = "index:hash_filter_added/"
+
+  CHUNK_SIZE = 1024 * 1024
+
+  # Additions are written asynchronously, so they may become visible with a
+  # timestamp somewhat older than the time they were last read at.
+  ADDED_READ_SLACK = 60 * 1000000
+
+  # Process wide cache of loaded filters by urn.
+  _filters = {}
+  _filters_lock = threading.Lock()
+
+  def __init__(self, urn, token=None):
+    self.urn = urn
+    self.token = token
+    self.bloom_filter = None
+    self.version = None
+    self.added = set()
+    self.added_read_time = 0
+    self.load_time = 0
+    self.lock = threading.Lock()
+
+  @classmethod
+  def GetFilter(cls, urn, token=None):
+    """Returns the up to date filter for the store at urn."""
+    with cls._filters_lock:
+      hash_filter = cls._filters.get(urn)
+      if hash_filter is None:
+        hash_filter = cls._filters[urn] = cls(urn, token=token)
+
+    hash_filter.Refresh()
+    return hash_filter
+
+  @classmethod
+  def FlushCache(cls):
+    with cls._filters_lock:
+      cls._filters.clear()
+
+  def _ChunkAttribute(self, index):
+    return self.CHUNK_PREFIX + "%08d" % index
+
+  def _ReadVersion(self):
+    """Returns the number of chunks and the version of the stored filter.
+
+    The number of chunks is 0 if no filter was stored yet.
+    """
+    num_chunks, version = data_store.DB.Resolve(
+        self.urn, self.VERSION_ATTRIBUTE, token=self.token)
+    # The attribute is not registered, so some data stores return the count
+    # as a string.
+    return int(num_chunks or 0), version
+
+  def _ReadFilter(self, version, num_chunks):
+    """Reads the chunks of the filter written at version.
+
+    Args:
+      version: The timestamp of the chunks.
+      num_chunks: The number of chunks of the filter.
+
+    Returns:
+      The BloomFilter or None if the chunks were replaced meanwhile or are
+      invalid.
+    """
+    chunks = sorted(
+        (predicate, value)
+        for predicate, value, _ in data_store.DB.ResolvePrefix(
+            self.urn,
+            self.CHUNK_PREFIX,
+            timestamp=(version, version),
+            token=self.token))
+    if len(chunks) != num_chunks:
+      return None
+
+    try:
+      return bloom_filter.BloomFilter.FromSerializedString("".join(
+          value for _, value in chunks))
+    except bloom_filter.DecodeError as e:
+      logging.warning("Invalid hash filter for %s: %s", self.urn, e)
+      return None
+
+  def _ReadAdded(self, bloom, now):
+    """Adds the digests recorded since they were last read to bloom."""
+    start = max(0, self.added_read_time - self.ADDED_READ_SLACK)
+    for predicate, _, _ in data_store.DB.ResolvePrefix(
+        self.urn,
+        self.ADDED_PREFIX,
+        timestamp=(start, now + self.ADDED_READ_SLACK),
+        token=self.token):
+      digest = predicate[len(self.ADDED_PREFIX):]
+      if digest not in self.added:
+        self.added.add(digest)
+        bloom.Add(digest)
+
+    self.added_read_time = now
+
+  def Refresh(self):
+    """Updates the filter from the data store if the cached one is too old."""
+    now = time.time()
+    reload_interval = config_lib.CONFIG["FileStore.hash_filter_reload_interval"]
+    with self.lock:
+      if now - self.load_time < reload_interval:
+        return
+
+      self.load_time = now
+      num_chunks, version = self._ReadVersion()
+      if not num_chunks:
+        self.bloom_filter = None
+        self.version = None
+        return
+
+      bloom = self.bloom_filter
+      if version != self.version:
+        bloom = self._ReadFilter(version, num_chunks)
+        if bloom is None:
+          # A rebuild replaced the chunks while they were read, try again with
+          # the new version next time.
+          self.load_time = 0
+          return
+
+        self.version = version
+        self.added = set()
+        self.added_read_time = 0
+
+      self._ReadAdded(bloom, int(now * 1e6))
+      self.bloom_filter = bloom
+
+      stats.STATS.SetGaugeValue(
+          "filestore_hash_filter_estimated_false_positive_rate",
+          bloom.EstimatedFalsePositiveRate(),
+          fields=[str(self.urn)])
+
+  def MayContain(self, digest):
+    """False if the digest is certainly not in the store."""
+    bloom = self.bloom_filter
+    # Without a filter everything has to be looked up.
+    return bloom is None or digest in bloom
+
+  def Add(self, digest):
+    """Records a digest which was added to the store."""
+    data_store.DB.Set(
+        self.urn, self.ADDED_PREFIX + digest, "", sync=False, token=self.token)
+
+    bloom = self.bloom_filter
+    if bloom is not None:
+      self.added.add(digest)
+      bloom.Add(digest)
+
+  def Rebuild(self, list_digests):
+    """Builds a new filter from the store contents.
+
+    Args:
+      list_digests: A callable returning all the digests in the store.
+    """
+    start_time = int(time.time() * 1e6)
+    digests = list_digests()
+
+    # Leave room for the digests added until the next rebuild.
+    bloom = bloom_filter.BloomFilter(
+        capacity=max(1000, 2 * len(digests)),
+        error_rate=config_lib.CONFIG["FileStore.hash_filter_error_rate"])
+    for digest in digests:
+      bloom.Add(digest)
+
+    serialized = bloom.SerializeToString()
+    old_num_chunks, _ = self._ReadVersion()
+
+    # Every chunk is written on its own, a single write of a large filter
+    # could exceed the maximum request size of the data store.
+    num_chunks = 0
+    for offset in xrange(0, len(serialized), self.CHUNK_SIZE):
+      data_store.DB.Set(
+          self.urn,
+          self._ChunkAttribute(num_chunks),
+          serialized[offset:offset + self.CHUNK_SIZE],
+          timestamp=start_time,
+          replace=True,
+          token=self.token)
+      num_chunks += 1
+
+    # The version is written last, so readers never see it before the chunks.
+    data_store.DB.Set(
+        self.urn,
+        self.VERSION_ATTRIBUTE,
+        num_chunks,
+        timestamp=start_time,
+        replace=True,
+        token=self.token)
+
+    # Drop the chunks a larger previous filter had beyond the new ones.
+    stale = [
+        self._ChunkAttribute(index)
+        for index in xrange(num_chunks, old_num_chunks)
+    ]
+    if stale:
+      data_store.DB.DeleteAttributes(
+          self.urn, stale, sync=True, token=self.token)
+
+    # Everything added before the store was listed is in the new filter.
+    added = [
+        predicate
+        for predicate, _, _ in data_store.DB.ResolvePrefix(
+            self.urn,
+            self.ADDED_PREFIX,
+            timestamp=(0, start_time),
+            token=self.token)
+    ]
+    if added:
+      data_store.DB.DeleteAttributes(
+          self.urn, added, end=start_time, sync=True, token=self.token)
+
+    with self.lock:
+      self.version = start_time
+      self.added = set()
+      self.added_read_time = start_time
+      self._ReadAdded(bloom, int(time.time() * 1e6))
+      self.bloom_filter = bloom
+      self.load_time = time.time()
+
+    stats.STATS.SetGaugeValue(
+        "filestore_hash_filter_estimated_false_positive_rate",
+        bloom.EstimatedFalsePositiveRate(),
+        fields=[str(self.urn)])
+
+
 class HashFileStore(FileStore):
   """FileStore that stores files referenced by hash."""
 
@@ -187,6 +433,7 @@ class HashFileStore(FileStore):
       "generic": ["md5", "sha1", "sha256", "SignedData"],
       "pecoff": ["md5", "sha1"]
   }
+  HASH_FILTER_NAME = "hash_filter"
 
   def AddURN(self, sha256hash, file_urn):
     index_urn = self.PATH.Add("generic/sha256").Add(sha256hash)
@@ -274,16 +521,54 @@ class HashFileStore(FileStore):
     Yields:
       Tuples of (RDFURN, hash object) that exist in the store.
     """
+    hash_filter = self.GetHashFilter()
     hash_map = {}
+    rejected = 0
     for hsh in hashes:
       if hsh.HasField("sha256"):
+        digest = str(hsh.sha256)
+        if not hash_filter.MayContain(digest):
+          rejected += 1
+          continue
+
         # The canonical name of the file is where we store the file hash.
         hash_map[aff4.ROOT_URN.Add("files/hash/generic/sha256").Add(
-            str(hsh.sha256))] = hsh
+            digest)] = hsh
 
-    for metadata in aff4.FACTORY.Stat(list(hash_map), token=self.token):
+    for metadata in self._StatWithFilter(hash_filter, hash_map, rejected):
       yield metadata["urn"], hash_map[metadata["urn"]]
 
+  def GetHashFilter(self):
+    return HashFilter.GetFilter(
+        self.PATH.Add(self.HASH_FILTER_NAME), token=self.token)
+
+  def _StatWithFilter(self, hash_filter, hash_map, rejected):
+    """Looks up the hashes the filter let through and counts its errors."""
+    stats.STATS.IncrementCounter(
+        "filestore_hash_filter_rejections",
+        delta=rejected,
+        fields=[str(hash_filter.urn)])
+    found = list(aff4.FACTORY.Stat(list(hash_map), token=self.token))
+    if hash_filter.bloom_filter is not None and len(found) < len(hash_map):
+      stats.STATS.IncrementCounter(
+          "filestore_hash_filter_false_positives",
+          delta=len(hash_map) - len(found),
+          fields=[str(hash_filter.urn)])
+    return found
+
+  def _ListFilterDigests(self):
+    """Returns all the digests CheckHashes can find in this store."""
+    sha256_urn = self.PATH.Add("generic/sha256")
+    return [
+        urn.Basename()
+        for urn in aff4.FACTORY.Open(sha256_urn, token=self.token)
+        .ListChildren()
+    ]
+
+  def RebuildHashFilter(self):
+    """Builds the filter of the digests in this store from scratch."""
+    self.GetHashFilter().Rebuild(self._ListFilterDigests)
+
   def _GetHashers(self, hash_types):
     return [
         getattr(hashlib, hash_type) for hash_type in hash_types
@@ -403,6 +688,7 @@ class HashFileStore(FileStore):
       with aff4.FACTORY.Open(
           canonical_urn, mode="rw", token=self.token) as new_fd:
         new_fd.Set(new_fd.Schema.STAT(None))
+      self.GetHashFilter().Add(str(hashes.sha256))
 
     self._AddToIndex(canonical_urn, fd.urn)
 
@@ -600,18 +886,41 @@ class NSRLFileStore(HashFileStore):
     Yields:
       Tuples of (RDFURN, hash object) that exist in the store.
     """
+    hash_filter = self.GetHashFilter()
     hash_map = {}
+    rejected = 0
     for hsh in hashes:
       if hsh.HasField("sha1"):
-        hash_urn = self.PATH.Add(str(hsh.sha1))
+        digest = str(hsh.sha1)
+        if not hash_filter.MayContain(digest):
+          rejected += 1
+          continue
+
+        hash_urn = self.PATH.Add(digest)
         logging.debug("Checking URN %s", str(hash_urn))
         hash_map[hash_urn] = hsh
 
-    for metadata in aff4.FACTORY.Stat(list(hash_map), token=self.token):
+    for metadata in self._StatWithFilter(hash_filter, hash_map, rejected):
       yield metadata["urn"], hash_map[metadata["urn"]]
 
-  def AddHash(self, sha1, md5, crc, file_name, file_size, product_code_list,
-              op_system_code_list, special_code):
+  def _ListFilterDigests(self):
+    # NSRL files are not in the child index, there are too many of them.
+    return [
+        rdfvalue.RDFURN(subject).Basename()
+        for subject, _, _ in data_store.DB.ScanAttribute(
+            self.PATH, "aff4:type", token=self.token, relaxed_order=True)
+    ]
+
+  def AddHash(self,
+              sha1,
+              md5,
+              crc,
+              file_name,
+              file_size,
+              product_code_list,
+              op_system_code_list,
+              special_code,
+              update_filter=True):
     """Adds a new file from the NSRL hash database.
 
     We create a new subject in:
@@ -627,6 +936,9 @@ class NSRLFileStore(HashFileStore):
       product_code_list: List of products this file is part of.
       op_system_code_list: List of operating systems this file is part of.
       special_code: Special code (malicious/special/normal file).
+      update_filter: Whether to record the hash for the hash filter. Bulk
+        imports should pass False and call RebuildHashFilter once they are
+        done instead.
     """
     file_store_urn = self.PATH.Add(sha1)
 
@@ -645,6 +957,9 @@ class NSRLFileStore(HashFileStore):
               op_system_code=op_system_code_list,
               file_type=special_code))
 
+    if update_filter:
+      self.GetHashFilter().Add(sha1)
+
   def AddFile(self, fd, sync=False):
     """AddFile is not used for the NSRLFileStore."""
     return None
@@ -655,8 +970,20 @@ class FileStoreInit(registry.InitHook):
 
   pre = ["GRRAFF4Init"]
 
+  def RunOnce(self):
+    stats.STATS.RegisterCounterMetric(
+        "filestore_hash_filter_rejections", fields=[("filter", str)])
+    stats.STATS.RegisterCounterMetric(
+        "filestore_hash_filter_false_positives", fields=[("filter", str)])
+    stats.STATS.RegisterGaugeMetric(
+        "filestore_hash_filter_estimated_false_positive_rate",
+        float,
+        fields=[("filter", str)])
+
   def Run(self):
     """Create FileStore and HashFileStore namespaces."""
+    # Filters loaded before might belong to a different data store.
+    HashFilter.FlushCache()
     try:
       filestore = aff4.FACTORY.Create(
           FileStore.PATH, FileStore, mode="rw", token=aff4.FACTORY.root_token)
@@ -9,6 +9,7 @@ import time
 from grr.lib import action_mocks
 from grr.lib import aff4
 from grr.lib import config_lib
+from grr.lib import data_store
 from grr.lib import flags
 from grr.lib import rdfvalue
 from grr.lib import test_lib
@@ -17,6 +18,7 @@ from grr.lib.aff4_objects import aff4_grr
 from grr.lib.aff4_objects import filestore
 from grr.lib.aff4_objects import filestore_test_lib
 from grr.lib.flows.general import file_finder
+from grr.lib.rdfvalues import crypto as rdf_crypto
 from grr.lib.rdfvalues import file_finder as rdf_file_finder
 from grr.lib.rdfvalues import paths as rdf_paths
 
@@ -500,6 +502,189 @@ class HashFileStoreTest(test_lib.AFF4ObjectTest):
     ])
 
 
+class HashFilterTest(test_lib.AFF4ObjectTest):
+  """Tests for the bloom filters in front of the hash file stores."""
+
+  def setUp(self):
+    super(HashFilterTest, self).setUp()
+    self.hash_fs = aff4.FACTORY.Open(
+        filestore.HashFileStore.PATH, token=self.token)
+
+  def _AddHash(self, data):
+    digest = hashlib.sha256(data).hexdigest()
+    with aff4.FACTORY.Create(
+        filestore.HashFileStore.PATH.Add("generic/sha256").Add(digest),
+        aff4_grr.VFSBlobImage,
+        token=self.token):
+      pass
+    return rdf_crypto.Hash(sha256=digest.decode("hex"))
+
+  def _CheckHashes(self, hashes):
+    return [hash_obj for _, hash_obj in self.hash_fs.CheckHashes(hashes)]
+
+  def testEverythingIsLookedUpWithoutFilter(self):
+    known = self._AddHash("foo")
+    unknown = rdf_crypto.Hash(sha256=hashlib.sha256("bar").digest())
+
+    self.assertIsNone(self.hash_fs.GetHashFilter().bloom_filter)
+    self.assertEqual(self._CheckHashes([known, unknown]), [known])
+
+  def testMissesAreAnsweredByFilter(self):
+    known = self._AddHash("foo")
+    unknown = rdf_crypto.Hash(sha256=hashlib.sha256("bar").digest())
+    self.hash_fs.RebuildHashFilter()
+
+    with test_lib.Instrument(aff4.FACTORY, "Stat") as stat:
+      self.assertEqual(self._CheckHashes([known, unknown]), [known])
+
+    looked_up = [urn for args in stat.args for urn in args[0]]
+    self.assertEqual(looked_up, [
+        filestore.HashFileStore.PATH.Add("generic/sha256").Add(
+            str(known.sha256))
+    ])
+
+  def testAddedHashesAreSeenByOtherProcesses(self):
+    self.hash_fs.RebuildHashFilter()
+    new_hash = self._AddHash("foo")
+    self.hash_fs.GetHashFilter().Add(str(new_hash.sha256))
+    self.assertEqual(self._CheckHashes([new_hash]), [new_hash])
+
+    # Another process loads the filter and the additions from the data store.
+    filestore.HashFilter.FlushCache()
+    self.assertTrue(
+        self.hash_fs.GetHashFilter().MayContain(str(new_hash.sha256)))
+
+    # The additions are folded into the filter when it is rebuilt.
+    self.hash_fs.RebuildHashFilter()
+    self.assertFalse(
+        list(
+            data_store.DB.ResolvePrefix(
+                self.hash_fs.GetHashFilter().urn,
+                filestore.HashFilter.ADDED_PREFIX,
+                token=self.token)))
+    self.assertEqual(self._CheckHashes([new_hash]), [new_hash])
+
+  def testFilterIsStoredInChunks(self):
+    hashes = [self._AddHash(str(i)) for i in range(10)]
+    with utils.Stubber(filestore.HashFilter, "CHUNK_SIZE", 100):
+      self.hash_fs.RebuildHashFilter()
+
+    hash_filter = self.hash_fs.GetHashFilter()
+    chunks = list(
+        data_store.DB.ResolvePrefix(
+            hash_filter.urn,
+            filestore.HashFilter.CHUNK_PREFIX,
+            token=self.token))
+    self.assertGreater(len(chunks), 1)
+    num_chunks, _ = data_store.DB.Resolve(
+        hash_filter.urn, filestore.HashFilter.VERSION_ATTRIBUTE,
+        token=self.token)
+    self.assertEqual(num_chunks, len(chunks))
+
+    filestore.HashFilter.FlushCache()
+    self.assertEqual(self._CheckHashes(hashes), hashes)
+    self.assertIsNotNone(self.hash_fs.GetHashFilter().bloom_filter)
+
+    # A smaller filter leaves none of the previous chunks behind.
+    self.hash_fs.RebuildHashFilter()
+    self.assertEqual(
+        len(
+            list(
+                data_store.DB.ResolvePrefix(
+                    hash_filter.urn,
+                    filestore.HashFilter.CHUNK_PREFIX,
+                    token=self.token))), 1)
+
+  def testChunkCountReadAsString(self):
+    known = self._AddHash("foo")
+    with utils.Stubber(filestore.HashFilter, "CHUNK_SIZE", 100):
+      self.hash_fs.RebuildHashFilter()
+
+    # Data stores may return the unregistered count attribute as a string.
+    urn = self.hash_fs.GetHashFilter().urn
+    num_chunks, version = data_store.DB.Resolve(
+        urn, filestore.HashFilter.VERSION_ATTRIBUTE, token=self.token)
+    data_store.DB.Set(
+        urn,
+        filestore.HashFilter.VERSION_ATTRIBUTE,
+        str(num_chunks),
+        timestamp=version,
+        replace=True,
+        token=self.token)
+
+    hash_filter = filestore.HashFilter(urn, token=self.token)
+    hash_filter.Refresh()
+    self.assertIsNotNone(hash_filter.bloom_filter)
+    self.assertTrue(hash_filter.MayContain(str(known.sha256)))
+
+    # Rebuilding removes the chunks beyond the new count.
+    self.hash_fs.RebuildHashFilter()
+    self.assertEqual(
+        len(
+            list(
+                data_store.DB.ResolvePrefix(
+                    urn, filestore.HashFilter.CHUNK_PREFIX,
+                    token=self.token))), 1)
+
+  def testFilterIsOnlyReadWhenItChanges(self):
+    self.hash_fs.RebuildHashFilter()
+    urn = self.hash_fs.GetHashFilter().urn
+
+    # The filter as loaded by another process.
+    hash_filter = filestore.HashFilter(urn, token=self.token)
+    with test_lib.Instrument(filestore.HashFilter, "_ReadFilter") as read:
+      hash_filter.Refresh()
+      self.assertEqual(read.call_count, 1)
+
+      new_hash = self._AddHash("foo")
+      data_store.DB.Set(
+          urn,
+          filestore.HashFilter.ADDED_PREFIX + str(new_hash.sha256),
+          "",
+          token=self.token)
+
+      hash_filter.load_time = 0
+      hash_filter.Refresh()
+      self.assertEqual(read.call_count, 1)
+      # Additions are still picked up.
+      self.assertTrue(hash_filter.MayContain(str(new_hash.sha256)))
+
+      self.hash_fs.RebuildHashFilter()
+      hash_filter.load_time = 0
+      hash_filter.Refresh()
+      self.assertEqual(read.call_count, 2)
+      self.assertTrue(hash_filter.MayContain(str(new_hash.sha256)))
+
+  def testNSRLFilter(self):
+    nsrl_fs = aff4.FACTORY.Open(filestore.NSRLFileStore.PATH, token=self.token)
+    sha1 = "e1f7e62b3909263f3a2518bbae6a9ee36d5b502b"
+    nsrl_fs.AddHash(
+        sha1,
+        "bb0a15eefe63fd41f8dc9dee01c5cf9a",
+        None,
+        "idea.dll",
+        100,
+        None,
+        None,
+        "M",
+        update_filter=False)
+    self.assertFalse(
+        list(
+            data_store.DB.ResolvePrefix(
+                nsrl_fs.GetHashFilter().urn,
+                filestore.HashFilter.ADDED_PREFIX,
+                token=self.token)))
+    nsrl_fs.RebuildHashFilter()
+
+    known = rdf_crypto.Hash(sha1=sha1.decode("hex"))
+    unknown = rdf_crypto.Hash(sha1="\x00" * 20)
+    hash_filter = nsrl_fs.GetHashFilter()
+    self.assertTrue(hash_filter.MayContain(sha1))
+    self.assertFalse(hash_filter.MayContain(str(unknown.sha1)))
+    self.assertEqual([h for _, h in nsrl_fs.CheckHashes([known, unknown])],
+                     [known])
+
+
 def main(argv):
   # Run the full test suite
   test_lib.GrrTestProgram(argv=argv)
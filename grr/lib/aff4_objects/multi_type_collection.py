@@ -4,6 +4,7 @@
 from grr.lib import aff4
 from grr.lib import data_store
 from grr.lib import rdfvalue
+from grr.lib import utils
 
 from grr.lib.aff4_objects import sequential_collection
 
@@ -96,6 +97,71 @@ class MultiTypeCollection(aff4.AFF4Object):
                         token=token,
                         **kwargs)
 
+  @classmethod
+  def StaticAddMany(cls,
+                    collection_urn,
+                    token,
+                    rdf_values,
+                    timestamp=None,
+                    mutation_pool=None,
+                    **kwargs):
+    """Adds a batch of rdf values to a collection.
+
+    All values are written through a single mutation pool. NOTE: The caller is
+    responsible for ensuring that the collection exists and is of the correct
+    type.
+
+    Args:
+      collection_urn: The urn of the collection to add to.
+
+      token: The database access token to write with.
+
+      rdf_values: A list of rdf values to add to the collection. Values that
+          are not GrrMessages are wrapped into GrrMessages.
+
+      timestamp: The timestamp (in microseconds) to store the rdf values
+          at. Defaults to the current time.
+
+      mutation_pool: An optional MutationPool object to write to. If not given,
+                     the values are written when this method returns.
+
+      **kwargs: Keyword arguments to pass through to the underlying database
+        call.
+
+    Raises:
+      ValueError: one of rdf_values has unexpected type.
+
+    """
+    messages = []
+    for rdf_value in rdf_values:
+      if rdf_value is None:
+        raise ValueError("Can't add None to MultiTypeCollection")
+
+      if not isinstance(rdf_value, rdf_flows.GrrMessage):
+        rdf_value = rdf_flows.GrrMessage(payload=rdf_value)
+      messages.append(rdf_value)
+
+    pool = mutation_pool or data_store.DB.GetMutationPool(token=token)
+    for value_type, type_messages in utils.GroupBy(
+        messages,
+        lambda x: x.args_rdf_name or rdf_flows.GrrMessage.__name__).iteritems():
+      sequential_collection.GrrMessageCollection.StaticAddMany(
+          collection_urn.Add(value_type),
+          token,
+          type_messages,
+          timestamp=timestamp,
+          mutation_pool=pool,
+          **kwargs)
+
+      pool.Set(collection_urn,
+               "%s%s" % (cls.VALUE_TYPE_PREFIX, value_type),
+               1,
+               timestamp=0,
+               **kwargs)
+
+    if not mutation_pool:
+      pool.Flush()
+
   def ListStoredTypes(self):
     res = []
     for attribute, _, _ in data_store.DB.ResolveRow(self.urn, token=self.token):
@@ -141,6 +207,17 @@ class MultiTypeCollection(aff4.AFF4Object):
       yield item
 
   def LengthByType(self, type_name):
+    """Returns the number of stored records of the given type.
+
+    Every per-type subcollection keeps its own index and stored length, so
+    only the records added since the length was last stored are read.
+
+    Args:
+      type_name: Type of the records to count.
+
+    Returns:
+      The number of records.
+    """
     sub_collection_urn = self.urn.Add(type_name)
     sub_collection = aff4.FACTORY.Create(
         sub_collection_urn,
@@ -198,18 +275,9 @@ class MultiTypeCollection(aff4.AFF4Object):
         yield item
 
   def __len__(self):
-    l = 0
-    sub_collection_urns = [
-        self.urn.Add(stored_type) for stored_type in self.ListStoredTypes()
-    ]
-    for sub_collection_urn in sub_collection_urns:
-      sub_collection = aff4.FACTORY.Create(
-          sub_collection_urn,
-          aff4_type=sequential_collection.GrrMessageCollection,
-          token=self.token)
-      l += len(sub_collection)
-
-    return l
+    return sum(
+        self.LengthByType(stored_type)
+        for stored_type in self.ListStoredTypes())
 
   def OnDelete(self, deletion_pool=None):
     super(MultiTypeCollection, self).OnDelete(deletion_pool=deletion_pool)
@@ -9,6 +9,7 @@ from grr.lib import test_lib
 from grr.lib import utils
 
 from grr.lib.aff4_objects import multi_type_collection
+from grr.lib.aff4_objects import sequential_collection
 
 from grr.lib.rdfvalues import flows as rdf_flows
 
@@ -48,6 +49,24 @@ class MultiTypeCollectionTest(test_lib.AFF4ObjectTest):
             rdfvalue.RDFURN.__name__
         ]), set(self.collection.ListStoredTypes()))
 
+  def testStaticAddMany(self):
+    values = [rdfvalue.RDFInteger(0), rdfvalue.RDFString("foo"),
+              rdf_flows.GrrMessage(payload=rdfvalue.RDFInteger(1))]
+    with test_lib.Instrument(data_store.DB, "ApplyMutations") as apply_call:
+      multi_type_collection.MultiTypeCollection.StaticAddMany(
+          self.collection.urn, self.token, values)
+    self.assertEqual(apply_call.call_count, 1)
+
+    self.assertEqual(
+        set([rdfvalue.RDFInteger.__name__, rdfvalue.RDFString.__name__]),
+        set(self.collection.ListStoredTypes()))
+    self.assertEqual(
+        [v.payload for _, v in self.collection.ScanByType(
+            rdfvalue.RDFInteger.__name__)], [0, 1])
+    self.assertEqual(
+        [v.payload for _, v in self.collection.ScanByType(
+            rdfvalue.RDFString.__name__)], ["foo"])
+
   def testStoresEmptyGrrMessage(self):
     self.collection.Add(rdf_flows.GrrMessage())
 
@@ -101,6 +120,25 @@ class MultiTypeCollectionTest(test_lib.AFF4ObjectTest):
     self.assertEqual(101,
                      self.collection.LengthByType(rdfvalue.RDFString.__name__))
 
+  def testLengthIsStoredForEveryType(self):
+    for i in range(20):
+      self.collection.Add(rdf_flows.GrrMessage(payload=rdfvalue.RDFInteger(i)))
+    for i in range(30):
+      self.collection.Add(rdf_flows.GrrMessage(payload=rdfvalue.RDFString(i)))
+
+    with test_lib.FakeTime(rdfvalue.RDFDatetime.Now() + rdfvalue.Duration(
+        "10m")):
+      self.assertEqual(len(self.collection), 50)
+
+    isc = sequential_collection.IndexedSequentialCollection
+    for type_name, length in [(rdfvalue.RDFInteger.__name__, 20),
+                              (rdfvalue.RDFString.__name__, 30)]:
+      value, _ = data_store.DB.Resolve(
+          self.collection.urn.Add(type_name),
+          isc.LENGTH_ATTRIBUTE,
+          token=self.token)
+      self.assertEqual(int(value.split(":")[0], 16), length)
+
   def testDeletingCollectionDeletesAllSubcollections(self):
     self.collection.Add(rdf_flows.GrrMessage(payload=rdfvalue.RDFInteger(0)))
     self.collection.Add(rdf_flows.GrrMessage(payload=rdfvalue.RDFString("foo")))
@@ -15,11 +15,11 @@ class Queue(aff4.AFF4Object):
   rdf_type = None
 
   # The attribute where we store value.
-  VALUE_ATTRIBUTE = "aff4:sequential_value"
+  VALUE_ATTRIBUTE = data_store.DataStore.QUEUE_ITEM_ATTRIBUTE
 
   # The attribute where we store locks. A lock is a timestamp indicating when
   # the lock becomes stale at the record may be claimed again.
-  LOCK_ATTRIBUTE = "aff4:lease"
+  LOCK_ATTRIBUTE = data_store.DataStore.QUEUE_LOCK_ATTRIBUTE
 
   # The largest possible suffix - maximum value expressible by 6 hex digits.
   MAX_SUFFIX = 0xffffff
@@ -33,7 +33,7 @@ class Queue(aff4.AFF4Object):
     return urn.Add("Records").Add("%016x.%06x" % (timestamp, suffix))
 
   @classmethod
-  def StaticAdd(cls, queue_urn, token, rdf_value):
+  def StaticAdd(cls, queue_urn, token, rdf_value, mutation_pool=None):
     """Adds an rdf value the queue.
 
     Adds an rdf value to a queue. Does not require that the queue be locked, or
@@ -47,6 +47,9 @@ class Queue(aff4.AFF4Object):
 
       rdf_value: The rdf value to add to the queue.
 
+      mutation_pool: An optional MutationPool object to write to. If not given,
+                     the data_store is used directly.
+
     Raises:
       ValueError: rdf_value has unexpected type.
 
@@ -61,11 +64,17 @@ class Queue(aff4.AFF4Object):
       queue_urn = rdfvalue.RDFURN(queue_urn)
 
     result_subject = cls._MakeURN(queue_urn, timestamp)
-    data_store.DB.Set(result_subject,
-                      cls.VALUE_ATTRIBUTE,
-                      rdf_value.SerializeToString(),
-                      timestamp=timestamp,
-                      token=token)
+    if mutation_pool:
+      mutation_pool.Set(result_subject,
+                        cls.VALUE_ATTRIBUTE,
+                        rdf_value.SerializeToString(),
+                        timestamp=timestamp)
+    else:
+      data_store.DB.Set(result_subject,
+                        cls.VALUE_ATTRIBUTE,
+                        rdf_value.SerializeToString(),
+                        timestamp=timestamp,
+                        token=token)
 
   def Add(self, rdf_value):
     """Adds an rdf value to the queue.
@@ -123,51 +132,20 @@ class Queue(aff4.AFF4Object):
     if not self.locked:
       raise aff4.LockError("Queue must be locked to claim records.")
 
-    now = rdfvalue.RDFDatetime.Now()
-
     after_urn = None
     if start_time:
       after_urn = self._MakeURN(self.urn,
                                 start_time.AsMicroSecondsFromEpoch(), 0)
-    results = []
-
-    filtered_count = 0
 
-    for subject, values in data_store.DB.ScanAttributes(
-        self.urn.Add("Records"), [self.VALUE_ATTRIBUTE, self.LOCK_ATTRIBUTE],
-        max_records=4 * limit,
+    return data_store.DB.QueueClaimRecords(
+        self.urn,
+        self.rdf_type,
+        limit=limit,
+        timeout=timeout,
         after_urn=after_urn,
-        token=self.token):
-      if self.VALUE_ATTRIBUTE not in values:
-        # Unlikely case, but could happen if, say, a thread called RefreshClaims
-        # so late that another thread already deleted the record. Go ahead and
-        # clean this up.
-        data_store.DB.DeleteAttributes(
-            subject, [self.LOCK_ATTRIBUTE], token=self.token)
-        continue
-      if self.LOCK_ATTRIBUTE in values:
-        timestamp = rdfvalue.RDFDatetime.FromSerializedString(values[
-            self.LOCK_ATTRIBUTE][1])
-        if timestamp > now:
-          continue
-      rdf_value = self.rdf_type.FromSerializedString(values[
-          self.VALUE_ATTRIBUTE][1])
-      if record_filter(rdf_value):
-        filtered_count += 1
-        if max_filtered and filtered_count >= max_filtered:
-          break
-        continue
-      results.append((subject, rdf_value))
-      filtered_count = 0
-      if len(results) >= limit:
-        break
-
-    expiration = rdfvalue.RDFDatetime.Now() + rdfvalue.Duration(timeout)
-
-    with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
-      for subject, _ in results:
-        mutation_pool.Set(subject, self.LOCK_ATTRIBUTE, expiration)
-    return results
+        record_filter=record_filter,
+        max_filtered=max_filtered,
+        token=self.token)
 
   def RefreshClaims(self, ids, timeout="30m"):
     """Refreshes claims on records identified by ids.
@@ -181,10 +159,7 @@ class Queue(aff4.AFF4Object):
       LockError: If the queue is not locked.
 
     """
-    expiration = rdfvalue.RDFDatetime.Now() + rdfvalue.Duration(timeout)
-    with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
-      for subject in ids:
-        mutation_pool.Set(subject, self.LOCK_ATTRIBUTE, expiration)
+    data_store.DB.QueueRefreshClaims(ids, timeout=timeout, token=self.token)
 
   @classmethod
   def DeleteRecords(cls, ids, token):
@@ -197,8 +172,7 @@ class Queue(aff4.AFF4Object):
     Raises:
       LockError: If the queue is not locked.
     """
-    data_store.DB.MultiDeleteAttributes(
-        ids, [cls.LOCK_ATTRIBUTE, cls.VALUE_ATTRIBUTE], token=token)
+    data_store.DB.QueueDeleteRecords(ids, token=token)
 
   @classmethod
   def DeleteRecord(cls, record_id, token):
@@ -218,7 +192,7 @@ class Queue(aff4.AFF4Object):
     Raises:
       LockError: If the queue is not locked.
     """
-    data_store.DB.MultiDeleteAttributes(ids, [cls.LOCK_ATTRIBUTE], token=token)
+    data_store.DB.QueueReleaseRecords(ids, token=token)
 
   @classmethod
   def ReleaseRecord(cls, record_id, token):
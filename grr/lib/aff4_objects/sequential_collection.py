@@ -2,6 +2,7 @@
 """A collection of records stored sequentially.
 """
 
+import bisect
 import collections
 import random
 import threading
@@ -124,6 +125,84 @@ class SequentialCollection(aff4.AFF4Object):
 
     return cls._ParseURN(result_subject)
 
+  @classmethod
+  def StaticAddMany(cls,
+                    collection_urn,
+                    token,
+                    rdf_values,
+                    timestamp=None,
+                    mutation_pool=None,
+                    **kwargs):
+    """Adds a batch of rdf values to a collection.
+
+    All values are written through a single mutation pool. They share the same
+    timestamp and get consecutive suffixes, so they are stored in the order
+    given and a batch can be referred to by its first (timestamp, suffix) pair
+    and its length. NOTE: The caller is responsible for ensuring that the
+    collection exists and is of the correct type.
+
+    Args:
+      collection_urn: The urn of the collection to add to.
+
+      token: The database access token to write with.
+
+      rdf_values: A list of rdf values to add to the collection.
+
+      timestamp: The timestamp (in microseconds) to store the rdf values
+          at. Defaults to the current time.
+
+      mutation_pool: An optional MutationPool object to write to. If not given,
+                     the values are written when this method returns.
+
+      **kwargs: Keyword arguments to pass through to the underlying database
+        call.
+
+    Returns:
+      A list of (timestamp, suffix) pairs which identify the values within the
+      collection, in the same order as rdf_values.
+
+    Raises:
+      ValueError: one of rdf_values has unexpected type.
+
+    """
+    for rdf_value in rdf_values:
+      if not isinstance(rdf_value, cls.RDF_TYPE):
+        raise ValueError("This collection only accepts values of type %s." %
+                         cls.RDF_TYPE.__name__)
+
+    if timestamp is None:
+      timestamp = rdfvalue.RDFDatetime.Now()
+    if isinstance(timestamp, rdfvalue.RDFDatetime):
+      timestamp = timestamp.AsMicroSecondsFromEpoch()
+
+    if not isinstance(collection_urn, rdfvalue.RDFURN):
+      collection_urn = rdfvalue.RDFURN(collection_urn)
+
+    now = rdfvalue.RDFDatetime.Now()
+    pool = mutation_pool or data_store.DB.GetMutationPool(token=token)
+    result = []
+    # Each timestamp has room for MAX_SUFFIX values.
+    for batch in utils.Grouper(rdf_values, cls.MAX_SUFFIX):
+      first_suffix = random.randint(1, cls.MAX_SUFFIX - len(batch) + 1)
+      for i, rdf_value in enumerate(batch):
+        if not rdf_value.age:
+          rdf_value.age = now
+
+        suffix = first_suffix + i
+        pool.Set(cls._MakeURN(collection_urn, timestamp, suffix),
+                 cls.ATTRIBUTE,
+                 rdf_value.SerializeToString(),
+                 timestamp=timestamp,
+                 **kwargs)
+        result.append((timestamp, suffix))
+
+      timestamp += 1
+
+    if not mutation_pool:
+      pool.Flush()
+
+    return result
+
   def Add(self, rdf_value, timestamp=None, suffix=None, **kwargs):
     """Adds an rdf value to the collection.
 
@@ -314,6 +393,16 @@ class IndexedSequentialCollection(SequentialCollection):
 
   INDEX_ATTRIBUTE_PREFIX = "index:sc_"
 
+  # An attribute of this name at timestamp <t> indicates that the collection
+  # holds n records up to and including the one stored at timestamp t. The
+  # record count and the timestamp suffix are stored as the value, so the
+  # length of the collection is found by only reading the records added since.
+  # It shares a prefix with the index entries, so both are read at once, but
+  # is not mistaken for one of them.
+
+  LENGTH_ATTRIBUTE = "index:sclength"
+  INDEX_READ_PREFIX = "index:sc"
+
   # The time to wait before creating an index for a record - hacky defense
   # against the correct index changing due to a late write.
 
@@ -322,14 +411,25 @@ class IndexedSequentialCollection(SequentialCollection):
   def __init__(self, urn, **kwargs):
     super(IndexedSequentialCollection, self).__init__(urn, **kwargs)
     self._index = None
+    # The sorted record numbers in self._index, built when first needed.
+    self._index_keys = None
+    # The (record count, (timestamp, suffix) of the last counted record) pair
+    # stored in LENGTH_ATTRIBUTE.
+    self._length = None
 
   def _ReadIndex(self):
     if self._index:
       return
     self._index = {0: (0, 0)}
+    self._index_keys = None
     self._max_indexed = 0
     for (attr, value, ts) in data_store.DB.ResolvePrefix(
-        self.urn, self.INDEX_ATTRIBUTE_PREFIX, token=self.token):
+        self.urn, self.INDEX_READ_PREFIX, token=self.token):
+      if attr == self.LENGTH_ATTRIBUTE:
+        count, suffix = value.split(":")
+        self._length = (int(count, 16), (ts, int(suffix, 16)))
+        continue
+
       i = int(attr[len(self.INDEX_ATTRIBUTE_PREFIX):], 16)
       self._index[i] = (ts, int(value, 16))
       self._max_indexed = max(i, self._max_indexed)
@@ -351,44 +451,83 @@ class IndexedSequentialCollection(SequentialCollection):
                             timestamp=ts[0],
                             replace=True)
           self._index[i] = ts
+          if self._index_keys is not None:
+            # i is past all the indexed records, so the keys stay sorted.
+            self._index_keys.append(i)
           self._max_indexed = max(i, self._max_indexed)
         except access_control.UnauthorizedAccess:
           pass
 
+  def _MaybeWriteLength(self, i, ts, mutation_pool):
+    """Records that record i, stored at ts, is the last one counted."""
+    if self._length and self._length[0] > i:
+      return
+
+    try:
+      mutation_pool.Set(self.urn,
+                        self.LENGTH_ATTRIBUTE,
+                        "%08x:%06x" % (i + 1, ts[1]),
+                        timestamp=ts[0],
+                        replace=True)
+      self._length = (i + 1, ts)
+    except access_control.UnauthorizedAccess:
+      pass
+
+  def _StartPoint(self, i):
+    """Finds the known record closest to record i.
+
+    Args:
+      i: The record number to seek to.
+
+    Returns:
+      A (record number, timestamp) pair. Scanning after the timestamp starts
+      with the record of that number, which is never past record i.
+    """
+    idx = i - i % self.INDEX_SPACING
+    if idx not in self._index:
+      # Index entries are written lazily, so some may be missing.
+      if self._index_keys is None:
+        self._index_keys = sorted(self._index)
+      idx = self._index_keys[bisect.bisect_right(self._index_keys, i) - 1]
+    ts = self._index[idx]
+    if self._length and idx < self._length[0] - 1 <= i:
+      idx = self._length[0] - 1
+      ts = self._length[1]
+
+    return idx, max((0, 0), (ts[0], ts[1] - 1))
+
   def _IndexedScan(self, i, max_records=None):
     """Scan records starting with index i."""
     self._ReadIndex()
 
-    # The record number that we will read next.
-    idx = 0
-    # The timestamp that we will start reading from.
-    start_ts = 0
-    if i >= self._max_indexed:
-      start_ts = max((0, 0), (self._index[self._max_indexed][0],
-                              self._index[self._max_indexed][1] - 1))
-      idx = self._max_indexed
-    else:
-      try:
-        possible_idx = i - i % self.INDEX_SPACING
-        start_ts = (max(0, self._index[possible_idx][0]),
-                    self._index[possible_idx][1] - 1)
-        idx = possible_idx
-      except KeyError:
-        pass
+    # The record number that we will read next and the timestamp that we will
+    # start reading from.
+    idx, start_ts = self._StartPoint(i)
 
     if max_records is not None:
       max_records += i - idx
 
+    # Only records older than INDEX_WRITE_DELAY are counted in the stored
+    # length, for the same reason they are the only ones indexed.
+    settled_ts = (rdfvalue.RDFDatetime.Now() - self.INDEX_WRITE_DELAY
+                 ).AsMicroSecondsFromEpoch()
+    last_settled = None
+
     with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
       for (ts, value) in self.Scan(
           after_timestamp=start_ts,
           max_records=max_records,
           include_suffix=True):
         self._MaybeWriteIndex(idx, ts, mutation_pool)
+        if ts[0] < settled_ts:
+          last_settled = (idx, ts)
         if idx >= i:
           yield (idx, ts, value)
         idx += 1
 
+      if last_settled:
+        self._MaybeWriteLength(last_settled[0], last_settled[1], mutation_pool)
+
   def GenerateItems(self, offset=0):
     for (_, _, value) in self._IndexedScan(offset):
       yield value
@@ -403,8 +542,12 @@ class IndexedSequentialCollection(SequentialCollection):
 
   def CalculateLength(self):
     self._ReadIndex()
+    last_known = self._max_indexed
+    if self._length:
+      last_known = max(last_known, self._length[0] - 1)
+
     highest_index = None
-    for (i, _, _) in self._IndexedScan(self._max_indexed):
+    for (i, _, _) in self._IndexedScan(last_known):
       highest_index = i
     if highest_index is None:
       return 0
@@ -433,6 +576,15 @@ class IndexedSequentialCollection(SequentialCollection):
       BACKGROUND_INDEX_UPDATER.AddIndexToUpdate(collection_urn)
     return r
 
+  @classmethod
+  def StaticAddMany(cls, collection_urn, token, rdf_values, **kwargs):
+    r = super(IndexedSequentialCollection, cls).StaticAddMany(
+        collection_urn, token, rdf_values, **kwargs)
+    # Update the index about as often as adding the values one by one would.
+    if random.randint(0, cls.INDEX_SPACING) < len(rdf_values):
+      BACKGROUND_INDEX_UPDATER.AddIndexToUpdate(collection_urn)
+    return r
+
 
 class GeneralIndexedCollection(IndexedSequentialCollection):
   """An indexed sequential collection of RDFValues with different types."""
@@ -449,6 +601,20 @@ class GeneralIndexedCollection(IndexedSequentialCollection):
         rdf_protodict.EmbeddedRDFValue(payload=rdf_value),
         **kwargs)
 
+  @classmethod
+  def StaticAddMany(cls, collection_urn, token, rdf_values, **kwargs):
+    now = rdfvalue.RDFDatetime.Now()
+    for rdf_value in rdf_values:
+      if not rdf_value.age:
+        rdf_value.age = now
+
+    return super(GeneralIndexedCollection, cls).StaticAddMany(
+        collection_urn,
+        token,
+        [rdf_protodict.EmbeddedRDFValue(payload=rdf_value)
+         for rdf_value in rdf_values],
+        **kwargs)
+
   def Scan(self, **kwargs):
     for (timestamp, rdf_value) in super(GeneralIndexedCollection, self).Scan(
         **kwargs):
@@ -4,6 +4,7 @@
 import threading
 
 from grr.lib import aff4
+from grr.lib import data_store
 from grr.lib import flags
 from grr.lib import rdfvalue
 from grr.lib import test_lib
@@ -73,6 +74,30 @@ class SequentialCollectionTest(test_lib.AFF4ObjectTest):
       self.assertEqual(even_results[0], 0)
       self.assertEqual(even_results[49], 98)
 
+  def testStaticAddMany(self):
+    urn = rdfvalue.RDFURN("aff4:/sequential_collection/testStaticAddMany")
+    with aff4.FACTORY.Create(
+        urn, TestSequentialCollection, token=self.token) as collection:
+      with test_lib.Instrument(data_store.DB, "ApplyMutations") as apply_call:
+        timestamps = TestSequentialCollection.StaticAddMany(
+            urn, self.token, [rdfvalue.RDFInteger(i) for i in range(100)])
+      self.assertEqual(apply_call.call_count, 1)
+
+      # The values share a timestamp and have consecutive suffixes.
+      self.assertEqual(len(set(ts for ts, _ in timestamps)), 1)
+      suffixes = [suffix for _, suffix in timestamps]
+      self.assertEqual(suffixes, range(suffixes[0], suffixes[0] + 100))
+
+      self.assertEqual([v for _, v in collection.Scan()], range(100))
+      self.assertEqual(
+          sorted(collection.MultiResolve(timestamps[:3])), [0, 1, 2])
+
+  def testStaticAddManyWrongType(self):
+    self.assertRaises(
+        ValueError, TestSequentialCollection.StaticAddMany,
+        rdfvalue.RDFURN("aff4:/sequential_collection/testStaticAddManyWrong"),
+        self.token, [rdfvalue.RDFInteger(1), rdfvalue.RDFString("foo")])
+
   def testDelete(self):
     with aff4.FACTORY.Create(
         "aff4:/sequential_collection/testDelete",
@@ -145,6 +170,19 @@ class IndexedSequentialCollectionTest(test_lib.AFF4ObjectTest):
       self.assertEqual(collection.CalculateLength(), 100)
       self.assertEqual(len(collection), 100)
 
+  def testStaticAddManyGet(self):
+    urn = "aff4:/sequential_collection/testStaticAddManyGet"
+    with aff4.FACTORY.Create(
+        urn, TestIndexedSequentialCollection, token=self.token) as collection:
+      for i in range(0, 100, 10):
+        TestIndexedSequentialCollection.StaticAddMany(
+            rdfvalue.RDFURN(urn), self.token,
+            [rdfvalue.RDFInteger(j) for j in range(i, i + 10)])
+      for i in range(100):
+        self.assertEqual(collection[i], i)
+
+      self.assertEqual(len(collection), 100)
+
   def testIndexCreate(self):
     with aff4.FACTORY.Create(
         "aff4:/sequential_collection/testIndexCreate",
@@ -201,6 +239,64 @@ class IndexedSequentialCollectionTest(test_lib.AFF4ObjectTest):
         for i in range(data_size - 1020, data_size - 1040, -1):
           self.assertEqual(collection[i], i)
 
+  def _CountScannedRecords(self, collection):
+    scanned = []
+    original_scan = collection.Scan
+
+    def Scan(**kwargs):
+      for item in original_scan(**kwargs):
+        scanned.append(item)
+        yield item
+
+    return scanned, utils.Stubber(collection, "Scan", Scan)
+
+  def testLengthIsStored(self):
+    urn = "aff4:/sequential_collection/testLengthIsStored"
+    with aff4.FACTORY.Create(
+        urn, TestIndexedSequentialCollection, token=self.token) as collection:
+      for i in range(3000):
+        collection.Add(rdfvalue.RDFInteger(i))
+
+    later = rdfvalue.RDFDatetime.Now() + rdfvalue.Duration("10m")
+    with test_lib.FakeTime(later):
+      collection = aff4.FACTORY.Open(urn, token=self.token)
+      self.assertEqual(collection.CalculateLength(), 3000)
+      self.assertEqual(collection._length[0], 3000)
+
+      for i in range(3000, 3010):
+        collection.Add(rdfvalue.RDFInteger(i))
+
+    with test_lib.FakeTime(later + rdfvalue.Duration("1s")):
+      collection = aff4.FACTORY.Open(urn, token=self.token)
+      scanned, stubber = self._CountScannedRecords(collection)
+      with stubber:
+        self.assertEqual(collection.CalculateLength(), 3010)
+      # Only the last counted record is read again, the new records are not
+      # counted in the stored length yet.
+      self.assertEqual(len(scanned), 11)
+      self.assertEqual(collection._length[0], 3000)
+
+  def testReadsSeekToStoredLength(self):
+    urn = "aff4:/sequential_collection/testReadsSeekToStoredLength"
+    with aff4.FACTORY.Create(
+        urn, TestIndexedSequentialCollection, token=self.token) as collection:
+      for i in range(1500):
+        collection.Add(rdfvalue.RDFInteger(i))
+
+    with test_lib.FakeTime(rdfvalue.RDFDatetime.Now() + rdfvalue.Duration(
+        "10m")):
+      collection = aff4.FACTORY.Open(urn, token=self.token)
+      self.assertEqual(len(collection), 1500)
+
+      collection = aff4.FACTORY.Open(urn, token=self.token)
+      scanned, stubber = self._CountScannedRecords(collection)
+      with stubber:
+        self.assertEqual(collection[1499], 1499)
+        self.assertEqual(collection[1030], 1030)
+      # The first read starts at the last counted record, the second one at
+      # the closest index entry.
+      self.assertEqual(len(scanned), 1 + 7)
+
   def testListing(self):
     test_urn = "aff4:/sequential_collection/testIndexedListing"
     with aff4.FACTORY.Create(
@@ -100,9 +100,6 @@ class BlobImage(aff4.AFF4ImageBase):
   # Size of a sha256 hash
   _HASH_SIZE = 32
 
-  # How many chunks we read ahead
-  _READAHEAD = 5
-
   @classmethod
   def _GenerateChunkIds(cls, fds):
     for fd in fds:
@@ -182,42 +179,22 @@ class BlobImage(aff4.AFF4ImageBase):
     """Chunks must be added using the AddBlob() method."""
     raise NotImplementedError("Direct writing of BlobImage not allowed.")
 
-  def _GetChunkForReading(self, chunk):
-    """Retrieve the relevant blob from the AFF4 data store or cache."""
-    offset = chunk * self._HASH_SIZE
-    self.index.seek(offset)
-
-    chunk_name = self.index.read(self._HASH_SIZE).encode("hex")
-
-    try:
-      return self.chunk_cache.Get(chunk_name)
-    except KeyError:
-      pass
-
-    # We don't have this chunk already cached. The most common read
-    # access pattern is contiguous reading so since we have to go to
-    # the data store already, we read ahead to reduce round trips.
-    self.index.seek(offset)
-    readahead = []
-
-    for _ in range(self._READAHEAD):
-      name = self.index.read(self._HASH_SIZE).encode("hex")
-      if name and name not in self.chunk_cache:
-        readahead.append(name)
-
-    self._ReadChunks(readahead)
-    try:
-      return self.chunk_cache.Get(chunk_name)
-    except KeyError:
-      raise aff4.ChunkNotFoundError("Cannot open chunk %s" % chunk)
-
-  def _ReadChunks(self, chunks):
-    res = data_store.DB.ReadBlobs(chunks, token=self.token)
-    for blob_hash, content in res.iteritems():
-      fd = StringIO.StringIO(content)
-      fd.dirty = False
-      fd.chunk = blob_hash
-      self.chunk_cache.Put(blob_hash, fd)
+  def _FetchChunks(self, chunks):
+    """Reads the blobs of the given chunks from the blob store."""
+    index = self.index.getvalue()
+    chunk_hashes = {}
+    for chunk in chunks:
+      blob_hash = index[chunk * self._HASH_SIZE:(chunk + 1) * self._HASH_SIZE]
+      if blob_hash:
+        chunk_hashes[chunk] = blob_hash.encode("hex")
+
+    blobs = data_store.DB.ReadBlobs(
+        list(set(chunk_hashes.values())), token=self.token)
+    return {
+        chunk: blobs[blob_hash]
+        for chunk, blob_hash in chunk_hashes.iteritems()
+        if blobs.get(blob_hash) is not None
+    }
 
   def _WriteChunk(self, chunk):
     if chunk.dirty:
@@ -332,18 +309,15 @@ class AFF4SparseImage(aff4.AFF4ImageBase):
         "The highest numbered chunk in this object.",
         default=-1)
 
-  def _ReadChunks(self, chunks):
+  def _FetchChunks(self, chunks):
     chunk_hashes = self._ChunkNrsToHashes(chunks)
-    chunk_nrs = {}
-    for k, v in chunk_hashes.iteritems():
-      chunk_nrs.setdefault(v, []).append(k)
-    res = data_store.DB.ReadBlobs(chunk_hashes.values(), token=self.token)
-    for blob_hash, content in res.iteritems():
-      for chunk_nr in chunk_nrs[blob_hash]:
-        fd = StringIO.StringIO(content)
-        fd.dirty = False
-        fd.chunk = chunk_nr
-        self.chunk_cache.Put(chunk_nr, fd)
+    blobs = data_store.DB.ReadBlobs(
+        list(set(chunk_hashes.values())), token=self.token)
+    return {
+        chunk_nr: blobs[blob_hash]
+        for chunk_nr, blob_hash in chunk_hashes.iteritems()
+        if blobs.get(blob_hash) is not None
+    }
 
   def _WriteChunk(self, chunk):
     if chunk.dirty:
@@ -377,7 +351,7 @@ class AFF4SparseImage(aff4.AFF4ImageBase):
     # the data store already, we read ahead to reduce round trips.
 
     missing_chunks = []
-    for chunk_number in range(chunk, chunk + 10):
+    for chunk_number in range(chunk, chunk + self._READAHEAD):
       if chunk_number not in self.chunk_cache:
         missing_chunks.append(chunk_number)
 
@@ -390,24 +364,7 @@ class AFF4SparseImage(aff4.AFF4ImageBase):
 
   def _GetChunkForWriting(self, chunk):
     """Returns the relevant chunk from the datastore."""
-    try:
-      chunk = self.chunk_cache.Get(chunk)
-      chunk.dirty = True
-      return chunk
-    except KeyError:
-      pass
-
-    try:
-      chunk = self._ReadChunk(chunk)
-      chunk.dirty = True
-      return chunk
-    except KeyError:
-      pass
-
-    fd = StringIO.StringIO()
-    fd.chunk = chunk
-    fd.dirty = True
-    self.chunk_cache.Put(chunk, fd)
+    fd = super(AFF4SparseImage, self)._GetChunkForWriting(chunk)
 
     # Keep track of the biggest chunk_number we've seen so far.
     if chunk > self.last_chunk:
@@ -431,9 +388,7 @@ class AFF4SparseImage(aff4.AFF4ImageBase):
 
     fd = self._GetChunkForReading(chunk)
 
-    fd.seek(chunk_offset)
-
-    result = fd.read(available_to_read)
+    result = self._ReadFromChunk(fd, chunk_offset, available_to_read)
     self.offset += len(result)
 
     return result
@@ -50,6 +50,7 @@ from grr.lib import rdfvalue
 from grr.lib import registry
 from grr.lib import stats
 from grr.lib import timeseries
+from grr.lib import utils
 
 from grr.lib.rdfvalues import structs
 
@@ -132,6 +133,148 @@ class StatsStoreMetricsMetadata(structs.RDFProtoStruct):
     return result
 
 
+class StatsStoreRollupValue(structs.RDFProtoStruct):
+  """Aggregate of the values of a metric over one rollup interval."""
+
+  protobuf = jobs_pb2.StatsStoreRollupValue
+
+  def Update(self, store_value):
+    """Adds a new sample of the metric to the aggregate."""
+    self.last_value = store_value
+    if store_value.value_type in (stats.MetricMetadata.ValueType.INT,
+                                  stats.MetricMetadata.ValueType.FLOAT):
+      value = store_value.value
+      if not self.count or value < self.min:
+        self.min = value
+      if not self.count or value > self.max:
+        self.max = value
+      self.sum += value
+
+    self.count += 1
+
+  def GetValue(self, metric_type):
+    """Returns the value that stands for the whole interval.
+
+    Gauges are averaged over the interval. Counters and distributions are
+    cumulative so their last value is what a query normalizing over the
+    interval would use anyway.
+
+    Args:
+      metric_type: The stats.MetricMetadata.MetricType of the metric.
+
+    Returns:
+      The value of the metric for this interval.
+    """
+    if (metric_type == stats.MetricMetadata.MetricType.GAUGE and
+        self.last_value.value_type in (stats.MetricMetadata.ValueType.INT,
+                                       stats.MetricMetadata.ValueType.FLOAT) and
+        self.count):
+      return self.sum / self.count
+
+    return self.last_value.value
+
+
+class StatsStoreRollup(object):
+  """Maintains the rollup of all metrics for one resolution tier.
+
+  Rollups are stored next to the raw values in the process' subject, using one
+  attribute prefix per tier. The rollup of the current interval is rewritten
+  every time new values are written so that queries see the latest data.
+
+  Each rollup is stored with the timestamp of the last microsecond of its
+  interval, so it comes after all the samples it aggregates and a rollup
+  stamped at or before a point in time covers no later samples.
+  """
+
+  PREFIX = "aff4:stats_store_rollup/"
+
+  def __init__(self, name, resolution, ttl):
+    """Constructor.
+
+    Args:
+      name: The name of the tier, used in the attribute names.
+      resolution: Length of the rollup intervals in seconds.
+      ttl: How long the rollups of this tier are kept, in seconds.
+    """
+    self.name = name
+    self.resolution = resolution
+    self.ttl = ttl
+    self.prefix = self.PREFIX + name + "/"
+    self.interval_start = None
+    self.interval_end = None
+    self.aggregates = {}
+
+  def GetIntervalEnd(self, timestamp):
+    """Returns the end of the interval the timestamp falls into."""
+    resolution = self.resolution * 1000000
+    return timestamp - timestamp % resolution + resolution - 1
+
+  def Load(self, interval_end, stored_values):
+    """Starts tracking an interval from the rollups already stored for it.
+
+    A process restarted in the middle of an interval writes to the same
+    subject, so the samples aggregated before the restart are merged into
+    instead of being replaced.
+
+    Args:
+      interval_end: The end of the interval, as returned by GetIntervalEnd.
+      stored_values: (attribute, serialized StatsStoreRollupValue, timestamp)
+        tuples of the rollups stored for this interval.
+    """
+    self.interval_end = interval_end
+    self.interval_start = interval_end + 1 - self.resolution * 1000000
+    self.aggregates = {}
+
+    for attribute, value_string, _ in stored_values:
+      metric_name = attribute[len(self.prefix):]
+      aggregate = StatsStoreRollupValue.FromSerializedString(value_string)
+      key = (metric_name, tuple(
+          field.value for field in aggregate.last_value.fields_values))
+      self.aggregates[key] = aggregate
+
+  def Update(self, values, timestamp):
+    """Adds samples of the raw metrics to the current interval.
+
+    Args:
+      values: Dict mapping raw stats store attributes to lists of
+        StatsStoreValue, as written by StatsStoreProcessData.WriteStats.
+      timestamp: Time of the samples in microseconds since epoch.
+    """
+    interval_end = self.GetIntervalEnd(timestamp)
+    if interval_end != self.interval_end:
+      self.Load(interval_end, [])
+
+    for attribute, store_values in values.iteritems():
+      metric_name = attribute[len(StatsStoreProcessData.STATS_STORE_PREFIX):]
+      for store_value in store_values:
+        key = (metric_name,
+               tuple(field.value for field in store_value.fields_values))
+        aggregate = self.aggregates.get(key)
+        if aggregate is None:
+          aggregate = self.aggregates[key] = StatsStoreRollupValue()
+        aggregate.Update(store_value)
+
+  def GetValues(self):
+    """Returns the rollups of the current interval, keyed by attribute."""
+    result = {}
+    for (metric_name, _), aggregate in self.aggregates.iteritems():
+      result.setdefault(self.prefix + metric_name, []).append(
+          (aggregate, self.interval_end))
+
+    return result
+
+
+def GetRollupTiers():
+  """Returns the configured rollup tiers, finest resolution first."""
+  return [
+      StatsStoreRollup("1m", 60, config_lib.CONFIG["StatsStore.rollup_1m_ttl"]),
+      StatsStoreRollup("1h", 60 * 60,
+                       config_lib.CONFIG["StatsStore.rollup_1h_ttl"]),
+      StatsStoreRollup("1d", 60 * 60 * 24,
+                       config_lib.CONFIG["StatsStore.rollup_1d_ttl"]),
+  ]
+
+
 class StatsStoreProcessData(aff4.AFF4Object):
   """Stores stats data for a particular process."""
 
@@ -163,7 +306,14 @@ class StatsStoreProcessData(aff4.AFF4Object):
           self.Schema.METRICS_METADATA, store_metadata, age=timestamp)
       self.Flush(sync=sync)
 
-  def WriteStats(self, timestamp=None, sync=False):
+  def WriteStats(self, timestamp=None, sync=False, rollups=None):
+    """Writes the current values of all metrics.
+
+    Args:
+      timestamp: Timestamp of the values in microseconds. Defaults to now.
+      sync: Whether to write synchronously.
+      rollups: An optional list of StatsStoreRollup tiers to update.
+    """
     to_set = {}
     metrics_metadata = stats.STATS.GetAllMetricsMetadata()
     self.WriteMetadataDescriptors(
@@ -194,24 +344,68 @@ class StatsStoreProcessData(aff4.AFF4Object):
 
         to_set[self.STATS_STORE_PREFIX + name] = [store_value]
 
-    # Write actual data
-    data_store.DB.MultiSet(
-        self.urn,
-        to_set,
-        replace=False,
-        token=self.token,
-        timestamp=timestamp,
-        sync=sync)
+    if not rollups:
+      # Write actual data
+      data_store.DB.MultiSet(
+          self.urn,
+          to_set,
+          replace=False,
+          token=self.token,
+          timestamp=timestamp,
+          sync=sync)
+      return
+
+    if timestamp is None:
+      timestamp = rdfvalue.RDFDatetime.Now().AsMicroSecondsFromEpoch()
+
+    mutation_pool = data_store.DB.GetMutationPool(token=self.token)
+    with mutation_pool:
+      mutation_pool.MultiSet(
+          self.urn, to_set, timestamp=timestamp, replace=False)
+
+      for rollup in rollups:
+        interval_end = rollup.GetIntervalEnd(timestamp)
+        if interval_end != rollup.interval_end:
+          rollup.Load(interval_end,
+                      data_store.DB.ResolvePrefix(
+                          self.urn,
+                          rollup.prefix,
+                          timestamp=(interval_end, interval_end),
+                          token=self.token))
+        rollup.Update(to_set, timestamp)
+        rollup_values = rollup.GetValues()
+        # Replace what was written for the current interval so far.
+        mutation_pool.DeleteAttributes(
+            self.urn,
+            rollup_values.keys(),
+            start=rollup.interval_end,
+            end=rollup.interval_end)
+        mutation_pool.MultiSet(self.urn, rollup_values, replace=False)
+
+  def DeleteStats(self, timestamp=ALL_TIMESTAMPS, sync=False, rollup=None):
+    """Deletes all stats in the given time range.
+
+    Args:
+      timestamp: The time range to delete.
+      sync: Whether to write synchronously.
+      rollup: If set, delete the rollups of this StatsStoreRollup tier instead
+        of the raw values.
 
-  def DeleteStats(self, timestamp=ALL_TIMESTAMPS, sync=False):
-    """Deletes all stats in the given time range."""
+    Raises:
+      ValueError: If NEWEST_TIMESTAMP is given.
+    """
 
     if timestamp == self.NEWEST_TIMESTAMP:
       raise ValueError("Can't use NEWEST_TIMESTAMP in DeleteStats.")
 
+    if rollup is None:
+      prefix = self.STATS_STORE_PREFIX
+    else:
+      prefix = rollup.prefix
+
     predicates = []
     for key in stats.STATS.GetAllMetricsMetadata().keys():
-      predicates.append(self.STATS_STORE_PREFIX + key)
+      predicates.append(prefix + key)
 
     start = None
     end = None
@@ -242,7 +436,11 @@ class StatsStore(aff4.AFF4Volume):
     if self.urn is None:
       self.urn = self.DATA_STORE_ROOT
 
-  def WriteStats(self, process_id=None, timestamp=None, sync=False):
+  def WriteStats(self,
+                 process_id=None,
+                 timestamp=None,
+                 sync=False,
+                 rollups=None):
     """Writes current stats values to the data store with a given timestamp."""
     if not process_id:
       raise ValueError("process_id can't be None")
@@ -252,7 +450,7 @@ class StatsStore(aff4.AFF4Volume):
         StatsStoreProcessData,
         mode="rw",
         token=self.token)
-    process_data.WriteStats(timestamp=timestamp, sync=sync)
+    process_data.WriteStats(timestamp=timestamp, sync=sync, rollups=rollups)
 
   def ListUsedProcessIds(self):
     """List process ids that were used when saving data to stats store."""
@@ -316,8 +514,27 @@ class StatsStore(aff4.AFF4Volume):
                      process_ids=None,
                      metric_name=None,
                      timestamp=ALL_TIMESTAMPS,
-                     limit=10000):
-    """Reads historical data for multiple process ids at once."""
+                     limit=10000,
+                     period=None):
+    """Reads historical data for multiple process ids at once.
+
+    Args:
+      process_ids: The processes to read stats of. Defaults to all of them.
+      metric_name: If set, only this metric is read.
+      timestamp: The time range to read.
+      limit: The maximum number of values to read.
+      period: The sampling period (an rdfvalue.Duration) the caller will
+        normalize the data to. If given, the values are read from the coarsest
+        rollup tier that still has at least this resolution. Rollups are
+        stamped with the end of their interval (see StatsStoreRollup). The
+        part of the time range after the last rollup of a process, usually the
+        interval still in progress, is read from the raw values.
+
+    Returns:
+      A dict of process ids to dicts of metric names to lists of (value,
+      timestamp) tuples. Metrics with fields are nested one more dict level
+      per field.
+    """
     if not process_ids:
       process_ids = self.ListUsedProcessIds()
 
@@ -327,13 +544,98 @@ class StatsStore(aff4.AFF4Volume):
         self.DATA_STORE_ROOT.Add(process_id) for process_id in process_ids
     ]
 
-    multi_query_results = data_store.DB.MultiResolvePrefix(
-        subjects,
-        StatsStoreProcessData.STATS_STORE_PREFIX + (metric_name or ""),
-        token=self.token,
-        timestamp=timestamp,
-        limit=limit)
+    rollup = self._GetRollupTierForPeriod(period)
+    if rollup is None or timestamp == self.NEWEST_TIMESTAMP:
+      multi_query_results = data_store.DB.MultiResolvePrefix(
+          subjects,
+          StatsStoreProcessData.STATS_STORE_PREFIX + (metric_name or ""),
+          token=self.token,
+          timestamp=timestamp,
+          limit=limit)
+
+      return self._ParseStats(multi_query_results, multi_metadata,
+                              StatsStoreProcessData.STATS_STORE_PREFIX,
+                              StatsStoreValue)
+
+    rollup_results = list(
+        data_store.DB.MultiResolvePrefix(
+            subjects,
+            rollup.prefix + (metric_name or ""),
+            token=self.token,
+            timestamp=timestamp,
+            limit=limit))
+
+    # The raw values are read where the rollups of a process do not cover the
+    # requested range: usually just the interval still in progress, but also
+    # time before the first rollup was written.
+    covered = {}
+    for subject, subject_results in rollup_results:
+      if subject_results:
+        timestamps = [ts for _, _, ts in subject_results]
+        covered[utils.SmartStr(subject)] = (
+            min(timestamps) - rollup.resolution * 1000000 + 1, max(timestamps))
+
+    raw_ranges = [timestamp]
+    if timestamp != self.ALL_TIMESTAMPS and len(covered) == len(subjects):
+      start, end = [
+          rdfvalue.RDFDatetime(t).AsMicroSecondsFromEpoch() for t in timestamp
+      ]
+      head_end = max(first for first, _ in covered.values()) - 1
+      tail_start = min(last for _, last in covered.values()) + 1
+      if head_end < tail_start:
+        raw_ranges = []
+        if head_end >= start:
+          raw_ranges.append((start, head_end))
+        if tail_start <= end:
+          raw_ranges.append((tail_start, end))
+
+    raw_results = {}
+    for raw_range in raw_ranges:
+      for subject, subject_results in data_store.DB.MultiResolvePrefix(
+          subjects,
+          StatsStoreProcessData.STATS_STORE_PREFIX + (metric_name or ""),
+          token=self.token,
+          timestamp=raw_range,
+          limit=limit):
+        first, last = covered.get(utils.SmartStr(subject), (None, None))
+        raw_results.setdefault(subject, []).extend(
+            result for result in subject_results
+            if first is None or not first <= result[2] <= last)
+
+    return self._MergeStats(
+        self._ParseStats(rollup_results, multi_metadata, rollup.prefix,
+                         StatsStoreRollupValue),
+        self._ParseStats(raw_results.items(), multi_metadata,
+                         StatsStoreProcessData.STATS_STORE_PREFIX,
+                         StatsStoreValue))
+
+  def _MergeStats(self, first, second):
+    """Merges the values of the stats dict second into those of first."""
+    for key, value in second.iteritems():
+      if key not in first:
+        first[key] = value
+      elif isinstance(value, dict):
+        self._MergeStats(first[key], value)
+      else:
+        first[key] = sorted(first[key] + value, key=lambda x: x[1])
 
+    return first
+
+  def _GetRollupTierForPeriod(self, period):
+    """Returns the coarsest rollup tier usable for the period or None."""
+    if period is None:
+      return None
+
+    period = rdfvalue.Duration(period).seconds
+    for rollup in reversed(GetRollupTiers()):
+      if rollup.resolution <= period:
+        return rollup
+
+    return None
+
+  def _ParseStats(self, multi_query_results, multi_metadata, prefix,
+                  value_cls):
+    """Parses MultiResolvePrefix results into MultiReadStats results."""
     results = {}
     for subject, subject_results in multi_query_results:
       subject = rdfvalue.RDFURN(subject)
@@ -343,14 +645,21 @@ class StatsStore(aff4.AFF4Volume):
 
       part_results = {}
       for predicate, value_string, timestamp in subject_results:
-        metric_name = predicate[len(StatsStoreProcessData.STATS_STORE_PREFIX):]
+        metric_name = predicate[len(prefix):]
 
         try:
           metadata = subject_metadata_map[metric_name]
         except KeyError:
           continue
 
-        stored_value = StatsStoreValue.FromSerializedString(value_string)
+        if value_cls is StatsStoreRollupValue:
+          rollup_value = StatsStoreRollupValue.FromSerializedString(
+              value_string)
+          stored_value = rollup_value.last_value
+          value = rollup_value.GetValue(metadata.metric_type)
+        else:
+          stored_value = StatsStoreValue.FromSerializedString(value_string)
+          value = stored_value.value
 
         fields_values = []
         if metadata.fields_defs:
@@ -367,14 +676,18 @@ class StatsStore(aff4.AFF4Volume):
         else:
           result_values_list = part_results.setdefault(metric_name, [])
 
-        result_values_list.append((stored_value.value, timestamp))
+        result_values_list.append((value, timestamp))
 
       results[subject.Basename()] = part_results
 
     return results
 
-  def DeleteStats(self, process_id=None, timestamp=ALL_TIMESTAMPS, sync=False):
-    """Deletes all stats in the given time range."""
+  def DeleteStats(self,
+                  process_id=None,
+                  timestamp=ALL_TIMESTAMPS,
+                  sync=False,
+                  rollup=None):
+    """Deletes all stats (or rollups of a tier) in the given time range."""
 
     if not process_id:
       raise ValueError("process_id can't be None")
@@ -384,7 +697,7 @@ class StatsStore(aff4.AFF4Volume):
         StatsStoreProcessData,
         mode="w",
         token=self.token)
-    process_data.DeleteStats(timestamp=timestamp, sync=sync)
+    process_data.DeleteStats(timestamp=timestamp, sync=sync, rollup=rollup)
 
 
 class StatsStoreDataQuery(object):
@@ -420,12 +733,11 @@ class StatsStoreDataQuery(object):
   def _TimeSeriesFromData(self, data, attr=None):
     """Build time series from StatsStore data."""
 
-    series = timeseries.Timeseries()
-
+    points = []
     for value, timestamp in data:
       if attr:
         try:
-          series.Append(getattr(value, attr), timestamp)
+          value = getattr(value, attr)
         except AttributeError:
           raise ValueError("Can't find attribute %s in value %s." % (attr,
                                                                      value))
@@ -433,9 +745,9 @@ class StatsStoreDataQuery(object):
         if hasattr(value, "sum") or hasattr(value, "count"):
           raise ValueError("Can't treat complext type as simple value: %s" %
                            value)
-        series.Append(value, timestamp)
+      points.append((value, timestamp))
 
-    return series
+    return timeseries.Timeseries.FromValueTimestampPairs(points)
 
   @property
   def ts(self):
@@ -676,12 +988,17 @@ class StatsStoreWorker(object):
     self.thread_name = thread_name
     self.sleep = sleep or config_lib.CONFIG["StatsStore.write_interval"]
 
+    self.rollups = None
+    if config_lib.CONFIG["StatsStore.rollups_enabled"]:
+      self.rollups = GetRollupTiers()
+
   def _RunLoop(self):
     while True:
       logging.debug("Writing stats to stats store.")
 
       try:
-        self.stats_store.WriteStats(process_id=self.process_id, sync=False)
+        self.stats_store.WriteStats(
+            process_id=self.process_id, sync=False, rollups=self.rollups)
       except Exception as e:  # pylint: disable=broad-except
         logging.exception("StatsStore exception caught during WriteStats(): %s",
                           e)
@@ -693,6 +1010,13 @@ class StatsStoreWorker(object):
             process_id=self.process_id,
             timestamp=(0, now - config_lib.CONFIG["StatsStore.ttl"] * 1000000),
             sync=False)
+
+        for rollup in self.rollups or []:
+          self.stats_store.DeleteStats(
+              process_id=self.process_id,
+              timestamp=(0, now - rollup.ttl * 1000000),
+              sync=False,
+              rollup=rollup)
       except Exception as e:  # pylint: disable=broad-except
         logging.exception(
             "StatsStore exception caught during DeleteStats(): %s", e)
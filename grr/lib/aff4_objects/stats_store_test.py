@@ -332,6 +332,167 @@ class StatsStoreTest(test_lib.AFF4ObjectTest):
     self.assertEqual(results["pid1"]["counter"], [(2, 44)])
     self.assertEqual(results["pid2"]["counter"], [(1, 44)])
 
+  def testRollupsAreReadForLongPeriods(self):
+    stats.STATS.RegisterCounterMetric("counter")
+    rollups = stats_store.GetRollupTiers()
+
+    for minute in range(3):
+      for second in [0, 30]:
+        stats.STATS.IncrementCounter("counter")
+        self.stats_store.WriteStats(
+            process_id=self.process_id,
+            timestamp=(minute * 60 + second) * 1000000,
+            sync=True,
+            rollups=rollups)
+
+    # Rollups are stamped with the last microsecond of their interval.
+    results = self.stats_store.MultiReadStats(
+        process_ids=[self.process_id], period=rdfvalue.Duration("5m"))
+    self.assertEqual(results[self.process_id]["counter"],
+                     [(2, 60 * 1000000 - 1), (4, 120 * 1000000 - 1),
+                      (6, 180 * 1000000 - 1)])
+
+    # The raw values are still used for short periods.
+    results = self.stats_store.MultiReadStats(
+        process_ids=[self.process_id], period=rdfvalue.Duration("30s"))
+    self.assertEqual(len(results[self.process_id]["counter"]), 6)
+
+  def testRawValuesAreReadWhereRollupsEnd(self):
+    stats.STATS.RegisterCounterMetric("counter")
+    rollups = stats_store.GetRollupTiers()
+
+    for second in range(0, 180, 30):
+      stats.STATS.IncrementCounter("counter")
+      self.stats_store.WriteStats(
+          process_id=self.process_id,
+          timestamp=second * 1000000,
+          sync=True,
+          rollups=rollups)
+
+    # The rollup of the minute still in progress ends after the requested
+    # range, so the range after the last complete minute is read from the
+    # raw values.
+    results = self.stats_store.MultiReadStats(
+        process_ids=[self.process_id],
+        timestamp=(0, 150 * 1000000),
+        period=rdfvalue.Duration("5m"))
+    self.assertEqual(results[self.process_id]["counter"],
+                     [(2, 60 * 1000000 - 1), (4, 120 * 1000000 - 1),
+                      (5, 120 * 1000000), (6, 150 * 1000000)])
+
+  def testRawValuesAreReadBeforeFirstRollup(self):
+    stats.STATS.RegisterCounterMetric("counter")
+
+    # Rollups only get written from the second minute on.
+    for second in range(0, 180, 30):
+      stats.STATS.IncrementCounter("counter")
+      self.stats_store.WriteStats(
+          process_id=self.process_id,
+          timestamp=second * 1000000,
+          sync=True,
+          rollups=stats_store.GetRollupTiers() if second >= 60 else None)
+
+    results = self.stats_store.MultiReadStats(
+        process_ids=[self.process_id],
+        timestamp=(0, 180 * 1000000),
+        period=rdfvalue.Duration("5m"))
+    self.assertEqual(results[self.process_id]["counter"],
+                     [(1, 0), (2, 30 * 1000000), (4, 120 * 1000000 - 1),
+                      (6, 180 * 1000000 - 1)])
+
+  def testGaugeRollupsAreAveraged(self):
+    stats.STATS.RegisterGaugeMetric("int_gauge", int)
+    rollups = stats_store.GetRollupTiers()
+
+    for i, value in enumerate([10, 20, 60]):
+      stats.STATS.SetGaugeValue("int_gauge", value)
+      self.stats_store.WriteStats(
+          process_id=self.process_id,
+          timestamp=i * 20 * 1000000,
+          sync=True,
+          rollups=rollups)
+
+    results = self.stats_store.MultiReadStats(
+        process_ids=[self.process_id], period=rdfvalue.Duration("1h"))
+    self.assertEqual(results[self.process_id]["int_gauge"],
+                     [(30, 3600 * 1000000 - 1)])
+
+  def testRollupsAreMergedAfterRestartMidInterval(self):
+    stats.STATS.RegisterGaugeMetric("int_gauge", int)
+
+    for i, value in enumerate([10, 20, 60, 30]):
+      # A restarted process starts with fresh rollup tiers.
+      if i in (0, 2):
+        rollups = stats_store.GetRollupTiers()
+
+      stats.STATS.SetGaugeValue("int_gauge", value)
+      self.stats_store.WriteStats(
+          process_id=self.process_id,
+          timestamp=i * 20 * 1000000,
+          sync=True,
+          rollups=rollups)
+
+    results = self.stats_store.MultiReadStats(
+        process_ids=[self.process_id], period=rdfvalue.Duration("1h"))
+    self.assertEqual(results[self.process_id]["int_gauge"],
+                     [(30, 3600 * 1000000 - 1)])
+
+    row = data_store.DB.ResolvePrefix(
+        "aff4:/stats_store/some_pid",
+        "aff4:stats_store_rollup/1d/int_gauge",
+        token=self.token)
+    self.assertEqual(len(row), 1)
+    aggregate = stats_store.StatsStoreRollupValue.FromSerializedString(
+        row[0][1])
+    self.assertEqual(aggregate.count, 4)
+    self.assertEqual(aggregate.min, 10)
+    self.assertEqual(aggregate.max, 60)
+    self.assertEqual(aggregate.sum, 120)
+
+  def testRollupsWithFieldsAreReadCorrectly(self):
+    stats.STATS.RegisterCounterMetric("counter", fields=[("source", str)])
+    rollups = stats_store.GetRollupTiers()
+
+    stats.STATS.IncrementCounter("counter", fields=["http"])
+    stats.STATS.IncrementCounter("counter", delta=2, fields=["rpc"])
+    self.stats_store.WriteStats(
+        process_id=self.process_id, timestamp=42, sync=True, rollups=rollups)
+
+    results = self.stats_store.MultiReadStats(
+        process_ids=[self.process_id], period=rdfvalue.Duration("1m"))
+    self.assertEqual(results[self.process_id]["counter"]["http"],
+                     [(1, 60 * 1000000 - 1)])
+    self.assertEqual(results[self.process_id]["counter"]["rpc"],
+                     [(2, 60 * 1000000 - 1)])
+
+  def testDeleteStatsDeletesRollupsOfTier(self):
+    stats.STATS.RegisterCounterMetric("counter")
+    rollups = stats_store.GetRollupTiers()
+
+    stats.STATS.IncrementCounter("counter")
+    self.stats_store.WriteStats(
+        process_id=self.process_id, timestamp=42, sync=True, rollups=rollups)
+
+    self.stats_store.DeleteStats(
+        process_id=self.process_id,
+        timestamp=(0, 60 * 1000000),
+        sync=True,
+        rollup=rollups[0])
+
+    row = data_store.DB.ResolvePrefix(
+        "aff4:/stats_store/some_pid",
+        "aff4:stats_store_rollup/",
+        token=self.token)
+    self.assertEqual(
+        sorted(x[0] for x in row if x[0].endswith("/counter")), [
+            "aff4:stats_store_rollup/1d/counter",
+            "aff4:stats_store_rollup/1h/counter"
+        ])
+
+    # Raw values are not affected.
+    stats_history = self.stats_store.ReadStats(process_id=self.process_id)
+    self.assertEqual(stats_history["counter"], [(1, 42)])
+
   def testReadMetadataReturnsAllUsedMetadata(self):
     # Register metrics
     stats.STATS.RegisterCounterMetric("counter")
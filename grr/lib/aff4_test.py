@@ -512,6 +512,58 @@ class AFF4ImageTest(test_lib.AFF4ObjectTest):
 
     self.assertEqual(count, 0)
 
+  def _CreateChunkedImage(self, chunks):
+    data = "".join("%09d\n" % i for i in range(chunks))
+    with aff4.FACTORY.Create(
+        "aff4:/foo", aff4_type=aff4.AFF4Image, token=self.token) as fd:
+      fd.SetChunksize(10)
+      fd.Write(data)
+    return data
+
+  def _ReadChunkByChunk(self, fd):
+    result = []
+    while True:
+      data = fd.Read(10)
+      if not data:
+        return "".join(result)
+      result.append(data)
+
+  def testSequentialReadGrowsReadahead(self):
+    data = self._CreateChunkedImage(500)
+
+    with test_lib.ConfigOverrider({"AFF4.image_max_readahead": 40}):
+      fd = aff4.FACTORY.Open("aff4:/foo", token=self.token)
+      self.assertEqual(fd.readahead, fd.LOOK_AHEAD)
+      self.assertEqual(self._ReadChunkByChunk(fd), data)
+      self.assertEqual(fd.readahead, 40)
+
+      # Seeking somewhere else starts over with a small window.
+      fd.Seek(1230)
+      self.assertEqual(fd.Read(10), data[1230:1240])
+      self.assertEqual(fd.readahead, fd.LOOK_AHEAD)
+
+  def testSequentialReadWithoutPrefetchThreads(self):
+    data = self._CreateChunkedImage(500)
+
+    with test_lib.ConfigOverrider({"AFF4.image_prefetch_threads": 0}):
+      fd = aff4.FACTORY.Open("aff4:/foo", token=self.token)
+      self.assertEqual(self._ReadChunkByChunk(fd), data)
+      self.assertFalse(fd.prefetches)
+
+  def testPrefetchedChunksAreNotWrittenBack(self):
+    data = self._CreateChunkedImage(100)
+
+    fd = aff4.FACTORY.Open("aff4:/foo", mode="rw", token=self.token)
+    self.assertEqual(fd.Read(500), data[:500])
+    fd.Seek(500)
+    fd.Write("x" * 10)
+    fd.Seek(0)
+    self.assertEqual(fd.Read(1000), data[:500] + "x" * 10 + data[510:])
+    fd.Close()
+
+    fd = aff4.FACTORY.Open("aff4:/foo", token=self.token)
+    self.assertEqual(fd.Read(1000), data[:500] + "x" * 10 + data[510:])
+
 
 @mock.patch.object(aff4.AFF4Stream, "MULTI_STREAM_CHUNK_SIZE", 10)
 class AFF4StreamTest(test_lib.AFF4ObjectTest):
@@ -2115,6 +2167,96 @@ class ForemanTests(test_lib.AFF4ObjectTest):
         rules = foreman.Get(foreman.Schema.RULES)
         self.assertEqual(len(rules), num_rules)
 
+  def _SetRules(self, rules):
+    foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
+    rule_set = foreman.Schema.RULES()
+    for rule in rules:
+      rule_set.Append(rule)
+    foreman.Set(foreman.Schema.RULES, rule_set)
+    foreman.Close()
+
+  def _WindowsRule(self, path, created):
+    """A rule matching Windows clients with an aff4 object at path."""
+    return rdf_foreman.ForemanRule(
+        created=int(created),
+        expires=int(created + 3600 * 1e6),
+        description="Test rule",
+        client_rule_set=rdf_foreman.ForemanClientRuleSet(rules=[
+            rdf_foreman.ForemanClientRule(
+                rule_type=rdf_foreman.ForemanClientRule.Type.OS,
+                os=rdf_foreman.ForemanOsClientRule(os_windows=True)),
+            rdf_foreman.ForemanClientRule(
+                rule_type=rdf_foreman.ForemanClientRule.Type.REGEX,
+                regex=rdf_foreman.ForemanRegexClientRule(
+                    path=path, attribute_name="type", attribute_regex="."))
+        ]),
+        actions=[
+            rdf_foreman.ForemanRuleAction(
+                flow_name="Test Flow", argv=rdf_protodict.Dict(foo="bar"))
+        ])
+
+  def testRulesAreCompiledOnlyWhenTheyChange(self):
+    now = time.time() * 1e6
+    self._SetRules([self._WindowsRule("fs/os", now)])
+
+    foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
+    index = foreman._GetRuleIndex()
+    self.assertIs(foreman._GetRuleIndex(), index)
+
+    rule_set = foreman.Schema.RULES()
+    rule_set.Append(self._WindowsRule("fs/tsk", now))
+    foreman.Set(foreman.Schema.RULES, rule_set)
+    self.assertIsNot(foreman._GetRuleIndex(), index)
+    self.assertEqual(foreman._GetRuleIndex().rules, rule_set)
+
+  def testOnlyObjectsOfPossiblyMatchingRulesAreOpened(self):
+    for client_id, system in [("C.0000000000000031", "Windows 7"),
+                              ("C.0000000000000032", "Linux")]:
+      fd = aff4.FACTORY.Create(
+          client_id, aff4_grr.VFSGRRClient, token=self.token)
+      fd.Set(fd.Schema.SYSTEM, rdfvalue.RDFString(system))
+      fd.Close()
+      aff4.FACTORY.Create(
+          rdf_client.ClientURN(client_id).Add("fs/os"),
+          aff4.AFF4Volume,
+          token=self.token).Close()
+
+    self._SetRules([self._WindowsRule("fs/os", time.time() * 1e6)])
+
+    opened_urns = []
+    multi_open = aff4.FACTORY.MultiOpen
+
+    def MultiOpen(urns, **kwargs):
+      opened_urns.extend(urns)
+      return multi_open(urns, **kwargs)
+
+    foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
+    with utils.Stubber(flow.GRRFlow, "StartFlow", self.StartFlow):
+      with utils.Stubber(aff4.FACTORY, "MultiOpen", MultiOpen):
+        self.clients_launched = []
+        self.assertEqual(foreman.AssignTasksToClient("C.0000000000000032"), 0)
+        self.assertEqual(opened_urns, [])
+
+        client_id = rdf_client.ClientURN("C.0000000000000031")
+        self.assertEqual(foreman.AssignTasksToClient(client_id), 1)
+        self.assertEqual(opened_urns, [client_id.Add("fs/os")])
+        self.assertEqual(self.clients_launched, [(client_id, "Test Flow")])
+
+  def testExpiredRulesAreRemovedWithoutOpeningClients(self):
+    with test_lib.FakeTime(1000):
+      self._SetRules([self._WindowsRule("fs/os", 1000 * 1e6)])
+
+    with test_lib.FakeTime(1000 + 7200):
+      foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
+
+      def Open(urn, **_):
+        self.fail("%s was opened." % urn)
+
+      with utils.Stubber(aff4.FACTORY, "Open", Open):
+        self.assertEqual(foreman.AssignTasksToClient("C.0000000000000033"), 0)
+
+      self.assertFalse(foreman.Get(foreman.Schema.RULES))
+
 
 def main(argv):
   # Run the full test suite
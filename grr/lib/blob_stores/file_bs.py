@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""A content addressed blob store keeping the blobs in local files.
+
+Every blob is stored in its own file named after the SHA-256 of its content in
+a directory tree sharded by the leading hex digits of the digest, e.g.
+<root>/ab/cd/abcd.... Since the name depends only on the content, blobs never
+change once they are written and can be read without any locking.
+"""
+
+import errno
+import hashlib
+import os
+import re
+import tempfile
+
+import logging
+from grr.lib import blob_store
+from grr.lib import config_lib
+from grr.lib import registry
+from grr.lib import stats
+from grr.lib import utils
+
+
+class FileBlobstore(blob_store.Blobstore):
+  """A blob store storing blobs as files in a local directory tree."""
+
+  # How many levels of two hex digit directories the blobs are sharded into.
+  SHARD_LEVELS = 2
+
+  DIGEST_RE = re.compile("^[0-9a-f]{64}$")
+
+  def __init__(self, path=None):
+    super(FileBlobstore, self).__init__()
+    self.root_path = path or config_lib.CONFIG["Blobstore.file_store_location"]
+    # Digests of blobs that are known to exist. Blobs are never deleted so
+    # this only saves looking at the file system, other processes writing to
+    # the same directory are picked up on a miss.
+    self.known_digests = utils.FastStore(
+        max_size=config_lib.CONFIG["Blobstore.file_store_index_size"])
+
+  def _BlobPath(self, digest):
+    # The digest becomes part of a path so it has to be checked.
+    if not self.DIGEST_RE.match(digest):
+      raise ValueError("Invalid blob digest: %r" % digest)
+
+    shards = [digest[2 * i:2 * i + 2] for i in xrange(self.SHARD_LEVELS)]
+    return os.path.join(self.root_path, *(shards + [digest]))
+
+  def _Exists(self, digest):
+    if digest in self.known_digests:
+      return True
+
+    if os.path.exists(self._BlobPath(digest)):
+      self.known_digests.Put(digest, True)
+      return True
+
+    return False
+
+  def _WriteBlob(self, digest, content):
+    """Atomically writes a blob file."""
+    path = self._BlobPath(digest)
+    dirname = os.path.dirname(path)
+    try:
+      os.makedirs(dirname)
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+
+    # The blob is written to a temporary file first so readers never see a
+    # partially written blob. If another process stores the same blob
+    # concurrently, the rename just replaces it with identical content.
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".tmp")
+    try:
+      with os.fdopen(fd, "wb") as out:
+        out.write(content)
+      os.rename(tmp_path, path)
+    except:
+      try:
+        os.unlink(tmp_path)
+      except OSError:
+        pass
+      raise
+
+    self.known_digests.Put(digest, True)
+
+  def _ReadBlob(self, digest):
+    try:
+      with open(self._BlobPath(digest), "rb") as fd:
+        return fd.read()
+    except IOError as e:
+      if e.errno == errno.ENOENT:
+        return None
+      raise
+
+  def StoreBlobs(self, contents, token=None):
+    """Creates or overwrites blobs."""
+    contents_by_digest = {
+        hashlib.sha256(content).hexdigest(): content
+        for content in contents
+    }
+
+    for digest, content in contents_by_digest.iteritems():
+      if self._Exists(digest):
+        logging.debug("Blob %s already stored.", digest)
+        continue
+
+      self._WriteBlob(digest, content)
+      stats.STATS.IncrementCounter("file_blobstore_bytes_written", len(content))
+      logging.debug("Got blob %s (length %s)", digest, len(content))
+
+    return contents_by_digest.keys()
+
+  def ReadBlobs(self, digests, token=None):
+    res = {}
+    for digest in digests:
+      res[digest] = self._ReadBlob(digest)
+      if res[digest] is not None:
+        self.known_digests.Put(digest, True)
+    return res
+
+  def BlobsExist(self, digests, token=None):
+    """Check if blobs for the given digests already exist."""
+    return {digest: self._Exists(digest) for digest in digests}
+
+
+class FileBlobstoreInit(registry.InitHook):
+  """Registers the file blob store metrics."""
+
+  def RunOnce(self):
+    stats.STATS.RegisterCounterMetric("file_blobstore_bytes_written")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""Tests for the file based blob store."""
+
+import hashlib
+import os
+import StringIO
+import time
+
+
+from grr.lib import aff4
+from grr.lib import data_store
+from grr.lib import flags
+from grr.lib import test_lib
+from grr.lib import utils
+from grr.lib.aff4_objects import standard as aff4_standard
+from grr.lib.blob_stores import file_bs
+from grr.lib.blob_stores import memory_stream_bs
+
+
+class FileBlobstoreTest(test_lib.GRRBaseTest):
+  """Tests for the FileBlobstore."""
+
+  def setUp(self):
+    super(FileBlobstoreTest, self).setUp()
+    self.blobs_path = os.path.join(self.temp_dir, "blobs")
+    self.blobstore = file_bs.FileBlobstore(path=self.blobs_path)
+
+  def testStoreAndReadBlobs(self):
+    contents = ["foo", "bar" * 1000, ""]
+    digests = self.blobstore.StoreBlobs(contents, token=self.token)
+    self.assertItemsEqual(
+        digests, [hashlib.sha256(content).hexdigest() for content in contents])
+
+    blobs = self.blobstore.ReadBlobs(digests, token=self.token)
+    self.assertItemsEqual(blobs.values(), contents)
+    for digest, content in blobs.iteritems():
+      self.assertEqual(digest, hashlib.sha256(content).hexdigest())
+
+  def testBlobsAreShardedByDigest(self):
+    digest = self.blobstore.StoreBlob("foo", token=self.token)
+    self.assertTrue(
+        os.path.exists(
+            os.path.join(self.blobs_path, digest[:2], digest[2:4], digest)))
+
+  def testMissingBlobs(self):
+    digest = self.blobstore.StoreBlob("foo", token=self.token)
+    missing = hashlib.sha256("bar").hexdigest()
+
+    self.assertEqual(
+        self.blobstore.ReadBlobs([digest, missing], token=self.token),
+        {digest: "foo",
+         missing: None})
+    self.assertEqual(
+        self.blobstore.BlobsExist([digest, missing], token=self.token),
+        {digest: True,
+         missing: False})
+
+  def testBlobsWrittenByOtherInstancesAreFound(self):
+    other_blobstore = file_bs.FileBlobstore(path=self.blobs_path)
+    digest = hashlib.sha256("foo").hexdigest()
+    self.assertFalse(self.blobstore.BlobExists(digest, token=self.token))
+
+    other_blobstore.StoreBlob("foo", token=self.token)
+    self.assertTrue(self.blobstore.BlobExists(digest, token=self.token))
+    self.assertEqual(self.blobstore.ReadBlob(digest, token=self.token), "foo")
+
+  def testInvalidDigestsAreRejected(self):
+    self.assertRaises(ValueError, self.blobstore.ReadBlobs, ["../../etc"])
+    self.assertRaises(ValueError, self.blobstore.BlobsExist, ["ABCD"])
+
+  def testBlobImage(self):
+    content = "ABCDEFG" * 1000
+
+    with utils.Stubber(data_store.DB, "blobstore", self.blobstore):
+      with aff4.FACTORY.Create(
+          "aff4:/foo", aff4_type=aff4_standard.BlobImage,
+          token=self.token) as fd:
+        fd.SetChunksize(100)
+        fd.AppendContent(StringIO.StringIO(content))
+
+      fd = aff4.FACTORY.Open("aff4:/foo", token=self.token)
+      self.assertEqual(fd.Read(len(content)), content)
+
+    # The blobs did not end up in the data store.
+    self.assertFalse(
+        list(aff4.FACTORY.Open("aff4:/blobs", token=self.token).ListChildren()))
+
+
+class FileBlobstoreBenchmarks(test_lib.MicroBenchmarks):
+  """Compares the FileBlobstore to the data store based blob store."""
+
+  units = "s"
+
+  def _Benchmark(self, name, blobstore, blob_count=1000, blob_size=64 * 1024):
+    blobs = [os.urandom(blob_size) for _ in xrange(blob_count)]
+
+    start_time = time.time()
+    for i in xrange(0, blob_count, 100):
+      digests = blobstore.StoreBlobs(blobs[i:i + 100], token=self.token)
+    self.AddResult("%s store" % name, time.time() - start_time, blob_count)
+
+    digests = [hashlib.sha256(blob).hexdigest() for blob in blobs]
+    start_time = time.time()
+    for i in xrange(0, blob_count, 100):
+      blobstore.BlobsExist(digests[i:i + 100], token=self.token)
+    self.AddResult("%s exist" % name, time.time() - start_time, blob_count)
+
+    start_time = time.time()
+    for i in xrange(0, blob_count, 100):
+      blobstore.ReadBlobs(digests[i:i + 100], token=self.token)
+    self.AddResult("%s read" % name, time.time() - start_time, blob_count)
+
+  @test_lib.SetLabel("benchmark")
+  def testBlobstores(self):
+    """Stores, checks and reads 64kb blobs in batches of 100."""
+    self._Benchmark("Memory stream",
+                    memory_stream_bs.MemoryStreamBlobstore())
+    self._Benchmark("File",
+                    file_bs.FileBlobstore(
+                        path=os.path.join(self.temp_dir, "blobs")))
+
+
+def main(argv):
+  # Run the full test suite
+  test_lib.GrrTestProgram(argv=argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -5,3 +5,6 @@
 
 # The memory stream object based blob store.
 from grr.lib.blob_stores import memory_stream_bs
+
+# The local file based blob store.
+from grr.lib.blob_stores import file_bs
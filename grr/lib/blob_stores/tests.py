@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+"""GRR blob store tests.
+
+This module loads and registers all the blob store tests.
+"""
+
+# These need to register plugins so,
+# pylint: disable=unused-import
+
+from grr.lib.blob_stores import file_bs_test
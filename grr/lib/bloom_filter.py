@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""A bloom filter for quickly ruling out set membership."""
+
+import hashlib
+import math
+import struct
+import threading
+
+
+class Error(Exception):
+  """Base error class."""
+
+
+class DecodeError(Error):
+  """Raised when a serialized filter can not be parsed."""
+
+
+class BloomFilter(object):
+  """A space efficient set which may give false positives but no negatives.
+
+  The filter is sized for an expected number of items and false positive rate.
+  Adding more items than that still works but makes false positives more
+  likely, so the filter should be rebuilt with a larger capacity.
+
+  Items can be added from several threads. Lookups do not take the lock, an
+  item being added concurrently may or may not be found.
+  """
+
+  # Number of bits, number of hash functions, number of items added.
+  HEADER = struct.Struct("<QII")
+
+  def __init__(self, capacity=1000, error_rate=0.01):
+    """Constructor.
+
+    Args:
+      capacity: The number of items the filter is sized for.
+      error_rate: The false positive rate once capacity items were added.
+    """
+    capacity = max(1, capacity)
+    num_bits = int(-capacity * math.log(error_rate) / math.log(2)**2)
+    num_hashes = int(round(float(num_bits) / capacity * math.log(2)))
+
+    # Round up to whole bytes.
+    self.num_bits = max(8, (num_bits + 7) / 8 * 8)
+    self.num_hashes = max(1, num_hashes)
+    self.count = 0
+    self.bits = bytearray(self.num_bits / 8)
+    self.lock = threading.Lock()
+
+  def _Positions(self, item):
+    # Double hashing gives the filter any number of hash functions from a
+    # single digest.
+    h1, h2 = struct.unpack("<QQ", hashlib.md5(item).digest())
+    return [(h1 + i * h2) % self.num_bits for i in xrange(self.num_hashes)]
+
+  def Add(self, item):
+    positions = self._Positions(item)
+    # Setting a bit is a read-modify-write of its byte, concurrent writers
+    # could lose each other's bits.
+    with self.lock:
+      for position in positions:
+        self.bits[position >> 3] |= 1 << (position & 7)
+      self.count += 1
+
+  def __contains__(self, item):
+    bits = self.bits
+    for position in self._Positions(item):
+      if not bits[position >> 3] & (1 << (position & 7)):
+        return False
+    return True
+
+  def __len__(self):
+    return self.count
+
+  def EstimatedFalsePositiveRate(self):
+    """Returns the false positive rate expected for the items added so far."""
+    return (1 - math.exp(-float(self.num_hashes) * self.count / self.num_bits)
+           )**self.num_hashes
+
+  def SerializeToString(self):
+    with self.lock:
+      return (self.HEADER.pack(self.num_bits, self.num_hashes, self.count) +
+              str(self.bits))
+
+  @classmethod
+  def FromSerializedString(cls, data):
+    """Parses a filter serialized with SerializeToString.
+
+    Args:
+      data: The serialized filter.
+
+    Returns:
+      A BloomFilter.
+
+    Raises:
+      DecodeError: If the data is not a valid filter.
+    """
+    try:
+      num_bits, num_hashes, count = cls.HEADER.unpack_from(data)
+    except struct.error as e:
+      raise DecodeError(e)
+
+    if len(data) != cls.HEADER.size + num_bits / 8 or not num_hashes:
+      raise DecodeError("Invalid bloom filter.")
+
+    result = cls.__new__(cls)
+    result.num_bits = num_bits
+    result.num_hashes = num_hashes
+    result.count = count
+    result.bits = bytearray(data[cls.HEADER.size:])
+    result.lock = threading.Lock()
+    return result
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Tests for grr.lib.bloom_filter."""
+
+import threading
+
+from grr.lib import bloom_filter
+from grr.lib import flags
+from grr.lib import test_lib
+
+
+class BloomFilterTest(test_lib.GRRBaseTest):
+  """Tests for the bloom filter."""
+
+  def testNoFalseNegatives(self):
+    bf = bloom_filter.BloomFilter(capacity=1000)
+    items = ["item%d" % i for i in range(1000)]
+    for item in items:
+      bf.Add(item)
+
+    self.assertEqual(len(bf), 1000)
+    for item in items:
+      self.assertIn(item, bf)
+
+  def testConcurrentAdds(self):
+    bf = bloom_filter.BloomFilter(capacity=4000)
+
+    def AddItems(prefix):
+      for i in range(1000):
+        bf.Add("%s%d" % (prefix, i))
+
+    threads = [
+        threading.Thread(target=AddItems, args=("thread%d-" % i,))
+        for i in range(4)
+    ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(len(bf), 4000)
+    for i in range(4):
+      for j in range(1000):
+        self.assertIn("thread%d-%d" % (i, j), bf)
+
+  def testFalsePositiveRate(self):
+    bf = bloom_filter.BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+      bf.Add("item%d" % i)
+
+    false_positives = sum(1 for i in range(10000) if "other%d" % i in bf)
+    self.assertLess(false_positives, 300)
+    self.assertAlmostEqual(bf.EstimatedFalsePositiveRate(), 0.01, delta=0.005)
+
+  def testEmptyFilterContainsNothing(self):
+    bf = bloom_filter.BloomFilter()
+    self.assertNotIn("item", bf)
+    self.assertEqual(bf.EstimatedFalsePositiveRate(), 0)
+
+  def testSerialization(self):
+    bf = bloom_filter.BloomFilter(capacity=100)
+    for i in range(100):
+      bf.Add("item%d" % i)
+
+    parsed = bloom_filter.BloomFilter.FromSerializedString(
+        bf.SerializeToString())
+    self.assertEqual(len(parsed), 100)
+    self.assertEqual(parsed.num_hashes, bf.num_hashes)
+    for i in range(100):
+      self.assertIn("item%d" % i, parsed)
+
+  def testInvalidData(self):
+    self.assertRaises(bloom_filter.DecodeError,
+                      bloom_filter.BloomFilter.FromSerializedString, "abc")
+
+    data = bloom_filter.BloomFilter(capacity=100).SerializeToString()
+    self.assertRaises(bloom_filter.DecodeError,
+                      bloom_filter.BloomFilter.FromSerializedString, data[:-1])
+
+
+def main(argv):
+  # Run the full test suite
+  test_lib.GrrTestProgram(argv=argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""Hints telling the frontend which clients may have pending tasks.
+
+Most client polls find an empty task queue, yet draining a queue takes a lock
+and a read in the data store. The QueueManager records every queue it
+schedules tasks on with the task hints, and the frontend skips the data store
+for clients that were idle on their previous poll and had no tasks scheduled
+since.
+
+Hints are kept in a fixed number of buckets, each holding the last time tasks
+were scheduled on any queue hashing into it. Collisions only cause needless
+data store reads, never missed tasks. The frontend still queries idle clients
+at least every Frontend.task_hint_reconcile_time seconds, so a lost hint can
+only delay tasks and never strand them.
+"""
+
+
+import threading
+import time
+import zlib
+
+import logging
+
+from grr.lib import access_control
+from grr.lib import config_lib
+from grr.lib import data_store
+from grr.lib import registry
+from grr.lib import rdfvalue
+
+# The task hints used by this process. Initialized by ClientTaskHintsInit.
+HINTS = None
+
+
+class ClientTaskHints(object):
+  """The task hints base class.
+
+  The base class keeps no hints: all clients may always have tasks.
+  """
+
+  __metaclass__ = registry.MetaclassRegistry
+
+  # Hints that can make the frontend skip a queue read need the tasks to be in
+  # the data store before Scheduled() is called, so the QueueManager writes
+  # tasks synchronously when this is set.
+  enabled = False
+
+  def Scheduled(self, queues):
+    """Records that tasks were written to the given queues.
+
+    This must only be called once the tasks are written, otherwise a client
+    polling in between may be considered idle.
+
+    Args:
+      queues: A list of queue urns.
+    """
+
+  def MayHaveTasks(self, queue, since):
+    """Checks whether tasks may have been scheduled on a queue.
+
+    Args:
+      queue: The queue urn.
+      since: The time in seconds since the epoch the queue was last seen empty.
+
+    Returns:
+      False if no tasks were scheduled on the queue after the given time.
+    """
+    _ = queue, since
+    return True
+
+
+class NoClientTaskHints(ClientTaskHints):
+  """Every poll drains the client's queue from the data store."""
+
+
+class LocalClientTaskHints(ClientTaskHints):
+  """Hints for tasks scheduled in this process.
+
+  Only suitable when the frontend runs in the same process as all the code
+  scheduling client tasks, such as in the single server deployment.
+  """
+
+  enabled = True
+
+  def __init__(self, num_buckets=None):
+    super(LocalClientTaskHints, self).__init__()
+    if num_buckets is None:
+      num_buckets = config_lib.CONFIG["Frontend.task_hint_buckets"]
+
+    self.num_buckets = num_buckets
+    self.lock = threading.Lock()
+    # Maps bucket numbers to the time tasks were last scheduled in them.
+    self.bucket_times = {}
+
+  def _Bucket(self, queue):
+    return (zlib.crc32(str(queue)) & 0xffffffff) % self.num_buckets
+
+  def Scheduled(self, queues):
+    now = time.time()
+    with self.lock:
+      for queue in queues:
+        self.bucket_times[self._Bucket(queue)] = now
+
+  def MayHaveTasks(self, queue, since):
+    with self.lock:
+      return self.bucket_times.get(self._Bucket(queue), 0) >= since
+
+
+class DataStoreClientTaskHints(LocalClientTaskHints):
+  """Hints shared between processes through a single data store row.
+
+  Every time tasks are scheduled the buckets of their queues are updated in
+  the data store. Frontends read the buckets updated since their last read at
+  most every Frontend.task_hint_refresh_time seconds, so an idle poll costs no
+  data store access at all.
+  """
+
+  HINTS_SUBJECT = rdfvalue.RDFURN("aff4:/client_task_hints")
+  BUCKET_PREFIX = "hint:"
+  BUCKET_TEMPLATE = BUCKET_PREFIX + "%08x"
+
+  # Bucket times are written using the clock of the scheduling process and
+  # compared against the clock of the frontend.
+  CLOCK_SKEW = 5
+
+  MAX_TIMESTAMP = 2**63 - 1
+
+  def __init__(self, num_buckets=None, refresh_time=None):
+    super(DataStoreClientTaskHints, self).__init__(num_buckets=num_buckets)
+    if refresh_time is None:
+      refresh_time = config_lib.CONFIG["Frontend.task_hint_refresh_time"]
+
+    self.refresh_time = refresh_time
+    self.token = access_control.ACLToken(
+        username="GRRClientTaskHints", reason="Implied.")
+    self.token.supervisor = True
+    self.last_refresh = 0
+    self.last_read = 0
+    # Set once all buckets were read, later refreshes only read the buckets
+    # updated in the meantime.
+    self.valid = False
+
+  def Scheduled(self, queues):
+    super(DataStoreClientTaskHints, self).Scheduled(queues)
+
+    now = rdfvalue.RDFDatetime.Now().AsMicroSecondsFromEpoch()
+    values = dict((self.BUCKET_TEMPLATE % self._Bucket(queue), ["1"])
+                  for queue in queues)
+    try:
+      data_store.DB.MultiSet(
+          self.HINTS_SUBJECT,
+          values,
+          timestamp=now,
+          sync=False,
+          token=self.token)
+    except data_store.Error as e:
+      # Frontends fall back to querying the queue once the hint expires.
+      logging.warning("Unable to store client task hints: %s", e)
+
+  def _Refresh(self):
+    """Reads the buckets updated since the last refresh from the data store."""
+    now = rdfvalue.RDFDatetime.Now().AsMicroSecondsFromEpoch()
+    if self.valid:
+      timestamp = (self.last_read - self.CLOCK_SKEW * 1000000,
+                   self.MAX_TIMESTAMP)
+    else:
+      timestamp = data_store.DB.NEWEST_TIMESTAMP
+
+    try:
+      values = data_store.DB.ResolvePrefix(
+          self.HINTS_SUBJECT,
+          self.BUCKET_PREFIX,
+          timestamp=timestamp,
+          token=self.token)
+    except data_store.Error as e:
+      logging.warning("Unable to read client task hints: %s", e)
+      self.valid = False
+      return
+
+    for predicate, _, value_timestamp in values:
+      bucket = int(predicate[len(self.BUCKET_PREFIX):], 16)
+      scheduled_time = value_timestamp / 1e6
+      if scheduled_time > self.bucket_times.get(bucket, 0):
+        self.bucket_times[bucket] = scheduled_time
+
+    self.last_read = now
+    self.valid = True
+
+  def MayHaveTasks(self, queue, since):
+    with self.lock:
+      now = time.time()
+      if now - self.last_refresh >= self.refresh_time:
+        self.last_refresh = now
+        self._Refresh()
+
+      if not self.valid:
+        return True
+
+      scheduled_time = self.bucket_times.get(self._Bucket(queue), 0)
+      return scheduled_time >= since - self.CLOCK_SKEW
+
+
+class ClientTaskHintsInit(registry.InitHook):
+  """Creates the client task hints configured for this process."""
+
+  def RunOnce(self):
+    global HINTS  # pylint: disable=global-statement
+
+    hints_name = config_lib.CONFIG["Frontend.client_task_hints"]
+    try:
+      cls = ClientTaskHints.GetPlugin(hints_name)
+    except KeyError:
+      raise RuntimeError("No client task hints %s found." % hints_name)
+
+    HINTS = cls()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""Tests for grr.lib.client_task_hints."""
+
+from grr.lib import client_task_hints
+from grr.lib import data_store
+from grr.lib import flags
+from grr.lib import queue_manager
+from grr.lib import test_lib
+from grr.lib import utils
+from grr.lib.rdfvalues import client as rdf_client
+from grr.lib.rdfvalues import flows as rdf_flows
+
+
+class LocalClientTaskHintsTest(test_lib.GRRBaseTest):
+  """Tests for the in-process hints."""
+
+  def setUp(self):
+    super(LocalClientTaskHintsTest, self).setUp()
+    self.hints = client_task_hints.LocalClientTaskHints(num_buckets=1024)
+    self.queue = rdf_client.ClientURN("C.1000000000000000").Queue()
+
+  def testOnlyTasksScheduledLaterAreHinted(self):
+    with test_lib.FakeTime(1000):
+      self.assertFalse(self.hints.MayHaveTasks(self.queue, 900))
+
+      self.hints.Scheduled([self.queue])
+      self.assertTrue(self.hints.MayHaveTasks(self.queue, 900))
+      self.assertFalse(self.hints.MayHaveTasks(self.queue, 1100))
+
+  def testOtherQueuesAreNotHinted(self):
+    other_queue = rdf_client.ClientURN("C.1000000000000001").Queue()
+    self.assertNotEqual(
+        self.hints._Bucket(self.queue), self.hints._Bucket(other_queue))
+
+    with test_lib.FakeTime(1000):
+      self.hints.Scheduled([other_queue])
+      self.assertFalse(self.hints.MayHaveTasks(self.queue, 900))
+
+  def testQueueManagerHintsScheduledTasks(self):
+    task = rdf_flows.GrrMessage(
+        queue=self.queue, session_id="aff4:/Test", generate_task_id=True)
+
+    with utils.Stubber(client_task_hints, "HINTS", self.hints):
+      with test_lib.FakeTime(1000):
+        queue_manager.QueueManager(token=self.token).Schedule([task])
+
+    self.assertTrue(self.hints.MayHaveTasks(self.queue, 1000))
+
+  def testTasksAreWrittenBeforeTheyAreHinted(self):
+    task = rdf_flows.GrrMessage(
+        queue=self.queue, session_id="aff4:/Test", generate_task_id=True)
+
+    # A data store which only applies unsynced writes when it is flushed.
+    deferred_writes = []
+    multi_set = data_store.DB.MultiSet
+
+    def DeferredMultiSet(*args, **kwargs):
+      if kwargs.get("sync"):
+        multi_set(*args, **kwargs)
+      else:
+        deferred_writes.append((args, kwargs))
+
+    manager = queue_manager.QueueManager(token=self.token)
+    tasks_when_hinted = []
+    scheduled = self.hints.Scheduled
+
+    def Scheduled(queues):
+      tasks_when_hinted.extend(manager.Query(self.queue))
+      scheduled(queues)
+
+    with utils.MultiStubber((client_task_hints, "HINTS", self.hints),
+                            (data_store.DB, "MultiSet", DeferredMultiSet),
+                            (self.hints, "Scheduled", Scheduled)):
+      manager.Schedule([task])
+
+    self.assertFalse(deferred_writes)
+    self.assertEqual([t.task_id for t in tasks_when_hinted], [task.task_id])
+
+
+class DataStoreClientTaskHintsTest(test_lib.GRRBaseTest):
+  """Tests for the hints shared through the data store."""
+
+  def setUp(self):
+    super(DataStoreClientTaskHintsTest, self).setUp()
+    # The hints of the scheduling process and of the frontend.
+    self.worker_hints = client_task_hints.DataStoreClientTaskHints(
+        num_buckets=1024, refresh_time=10)
+    self.frontend_hints = client_task_hints.DataStoreClientTaskHints(
+        num_buckets=1024, refresh_time=10)
+    self.queue = rdf_client.ClientURN("C.1000000000000000").Queue()
+
+  def testHintsAreSharedAfterRefresh(self):
+    with test_lib.FakeTime(1000):
+      self.assertFalse(self.frontend_hints.MayHaveTasks(self.queue, 990))
+
+    with test_lib.FakeTime(1001):
+      self.worker_hints.Scheduled([self.queue])
+      # The frontend still uses the hints it read a second ago.
+      self.assertFalse(self.frontend_hints.MayHaveTasks(self.queue, 990))
+
+    with test_lib.FakeTime(1010):
+      self.assertTrue(self.frontend_hints.MayHaveTasks(self.queue, 990))
+
+  def testRefreshOnlyReadsUpdatedBuckets(self):
+    other_queue = rdf_client.ClientURN("C.1000000000000001").Queue()
+
+    with test_lib.FakeTime(1000):
+      self.worker_hints.Scheduled([other_queue])
+      self.assertFalse(self.frontend_hints.MayHaveTasks(self.queue, 990))
+
+    with test_lib.FakeTime(1100):
+      self.worker_hints.Scheduled([self.queue])
+
+    with test_lib.FakeTime(1200):
+      self.assertTrue(self.frontend_hints.MayHaveTasks(self.queue, 1050))
+      self.assertTrue(self.frontend_hints.MayHaveTasks(other_queue, 990))
+      self.assertFalse(self.frontend_hints.MayHaveTasks(other_queue, 1050))
+
+  def testLocalTasksAreHintedBeforeRefresh(self):
+    with test_lib.FakeTime(1000):
+      self.assertFalse(self.frontend_hints.MayHaveTasks(self.queue, 990))
+      self.frontend_hints.Scheduled([self.queue])
+      self.assertTrue(self.frontend_hints.MayHaveTasks(self.queue, 990))
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
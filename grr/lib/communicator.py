@@ -287,14 +287,50 @@ class Communicator(object):
     # A cache for encrypted ciphers
     self.encrypted_cipher_cache = utils.FastStore(max_size=50000)
 
+  # Large bundles are sampled in this many slices of this size before they are
+  # compressed so data which is already compressed can be skipped.
+  COMPRESSION_SAMPLES = 4
+  COMPRESSION_SAMPLE_SIZE = 16 * 1024
+
+  # Bundles whose samples don't shrink below this ratio are sent uncompressed.
+  MAX_COMPRESSION_RATIO = 0.9
+
+  def _CompressionLevel(self, data):
+    """Returns the zlib compression level for data or 0 for no compression."""
+    if len(data) >= self.COMPRESSION_SAMPLES * self.COMPRESSION_SAMPLE_SIZE:
+      step = len(data) / self.COMPRESSION_SAMPLES
+      sample = "".join(data[i:i + self.COMPRESSION_SAMPLE_SIZE]
+                       for i in xrange(0, len(data), step))
+      if (len(zlib.compress(sample, 1)) >
+          len(sample) * self.MAX_COMPRESSION_RATIO):
+        return 0
+
+    if len(data) < config_lib.CONFIG["Network.compression_large_bundle_size"]:
+      return config_lib.CONFIG["Network.compression_fast_level"]
+    return config_lib.CONFIG["Network.compression_level"]
+
   def EncodeMessageList(self, message_list, signed_message_list):
-    """Encode the MessageList into the signed_message_list rdfvalue."""
+    """Encode the MessageList into the signed_message_list rdfvalue.
+
+    Bundles are compressed with a fast zlib level when they are small and a
+    better one when they are large. Bundles which mostly contain data that is
+    already compressed, e.g. file uploads, are not compressed again. The level
+    does not matter to the receiver, which always uses zlib.decompress.
+
+    Args:
+      message_list: The MessageList to encode.
+      signed_message_list: The SignedMessageList to fill in.
+    """
     # By default uncompress
     uncompressed_data = message_list.SerializeToString()
     signed_message_list.message_list = uncompressed_data
 
     if config_lib.CONFIG["Network.compression"] == "ZCOMPRESS":
-      compressed_data = zlib.compress(uncompressed_data)
+      level = self._CompressionLevel(uncompressed_data)
+      if not level:
+        return
+
+      compressed_data = zlib.compress(uncompressed_data, level)
 
       # Only compress if it buys us something.
       if len(compressed_data) < len(uncompressed_data):
@@ -316,6 +352,11 @@ class Communicator(object):
     self.server_cipher_age = rdfvalue.RDFDatetime.Now()
     return self.server_cipher
 
+  def _GetRemoteCipher(self, destination):
+    """Returns a cipher for sending messages to destination."""
+    remote_public_key = self._GetRemotePublicKey(destination)
+    return Cipher(self.common_name, self.private_key, remote_public_key)
+
   def EncodeMessages(self,
                      message_list,
                      result,
@@ -360,8 +401,7 @@ class Communicator(object):
       # it's the only cipher it ever uses.
       cipher = self._GetServerCipher()
     else:
-      remote_public_key = self._GetRemotePublicKey(destination)
-      cipher = Cipher(self.common_name, self.private_key, remote_public_key)
+      cipher = self._GetRemoteCipher(destination)
 
     # Make a nonce for this transaction
     if timestamp is None:
@@ -443,7 +483,9 @@ class Communicator(object):
       raise DecodingError("Compression scheme not supported")
 
     try:
-      result = rdf_flows.MessageList.FromSerializedString(data)
+      # Decoding from a buffer keeps the messages as views into data instead
+      # of copying each of them out.
+      result = rdf_flows.MessageList.FromSerializedString(buffer(data))
     except rdfvalue.DecodeError:
       raise DecodingError("RDFValue parsing failed.")
 
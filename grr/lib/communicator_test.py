@@ -3,8 +3,10 @@
 
 
 import array
+import os
 import pdb
 import time
+import zlib
 
 
 import requests
@@ -28,6 +30,8 @@ from grr.lib.flows.general import ca_enroller
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import crypto as rdf_crypto
 from grr.lib.rdfvalues import flows as rdf_flows
+from grr.lib.rdfvalues import paths as rdf_paths
+from grr.lib.rdfvalues import protodict as rdf_protodict
 
 # pylint: mode=test
 
@@ -186,6 +190,39 @@ class ClientCommsTest(test_lib.GRRBaseTest):
               "client_pings_by_label", fields=["testlabel"]),
           1)
 
+  def _EncodeForClient(self):
+    message_list = rdf_flows.MessageList()
+    message_list.job.Append(session_id="aff4:/W:session", name="Echo")
+
+    result = rdf_flows.ClientCommunication()
+    self.server_communicator.EncodeMessages(
+        message_list, result, destination=self.client_communicator.common_name)
+
+    decoded_messages, source, _ = self.client_communicator.DecryptMessage(
+        result.SerializeToString())
+    self.assertEqual(source, self.server_communicator.common_name)
+    self.assertEqual(len(decoded_messages), 1)
+    return result
+
+  def testServerCipherIsReusedUntilRotation(self):
+    """The server only does RSA operations once per client and rotation."""
+    self.MakeClientAFF4Record()
+    rotation_time = config_lib.CONFIG["Frontend.cipher_rotation_time"]
+
+    now = rdfvalue.RDFDatetime.Now()
+    with test_lib.FakeTime(now):
+      first = self._EncodeForClient()
+      second = self._EncodeForClient()
+
+    self.assertEqual(first.encrypted_cipher, second.encrypted_cipher)
+    # Every packet still gets its own iv.
+    self.assertNotEqual(first.packet_iv, second.packet_iv)
+
+    with test_lib.FakeTime(now.AsSecondsFromEpoch() + rotation_time + 1):
+      third = self._EncodeForClient()
+
+    self.assertNotEqual(first.encrypted_cipher, third.encrypted_cipher)
+
   def testServerReplayAttack(self):
     """Test that replaying encrypted messages to the server invalidates them."""
     self.MakeClientAFF4Record()
@@ -873,6 +910,174 @@ class ThreadedWorkerHTTPClientTests(HTTPClientTests):
     self.client_communicator.client_worker._in_queue.queue.clear()
 
 
+def _StatEntryMessages(count=1000):
+  """Returns messages with the StatEntries of the test data files.
+
+  The test data is listed repeatedly, as if it was copied to several
+  directories, until there are enough StatEntries.
+
+  Args:
+    count: The number of messages to return.
+
+  Returns:
+    A list of GrrMessages.
+  """
+  paths = []
+  for root, _, files in os.walk(config_lib.CONFIG["Test.data_dir"]):
+    paths.extend(os.path.join(root, filename) for filename in files)
+
+  messages = []
+  while len(messages) < count:
+    path = paths[len(messages) % len(paths)]
+    st = os.lstat(path)
+    stat_entry = rdf_client.StatEntry(
+        pathspec=rdf_paths.PathSpec(
+            path="/copy%d%s" % (len(messages) / len(paths), path),
+            pathtype=rdf_paths.PathSpec.PathType.OS),
+        st_mode=st.st_mode,
+        st_ino=st.st_ino,
+        st_uid=st.st_uid,
+        st_gid=st.st_gid,
+        st_size=st.st_size,
+        st_atime=int(st.st_atime),
+        st_mtime=int(st.st_mtime),
+        st_ctime=int(st.st_ctime))
+    messages.append(
+        rdf_flows.GrrMessage(
+            session_id="aff4:/C.1000000000000000/flows/F:ABCDEF12",
+            request_id=1,
+            response_id=len(messages) + 1,
+            payload=stat_entry))
+  return messages
+
+
+def _UploadMessages(count=20, chunk_size=512 * 1024):
+  """Returns messages with compressed file chunks like TransferBuffer sends."""
+  messages = []
+  for i in range(count):
+    blob = rdf_protodict.DataBlob(
+        data=zlib.compress(os.urandom(chunk_size / 2) * 2),
+        compression=rdf_protodict.DataBlob.CompressionType.ZCOMPRESSION)
+    messages.append(
+        rdf_flows.GrrMessage(
+            session_id="aff4:/flows/W:TransferStore",
+            request_id=1,
+            response_id=i + 1,
+            payload=blob))
+  return messages
+
+
+class MessageListCompressionTest(test_lib.GRRBaseTest):
+  """Tests the compression of message bundles."""
+
+  def _Encode(self, messages):
+    message_list = rdf_flows.MessageList(job=messages)
+    signed_message_list = rdf_flows.SignedMessageList()
+    comms = communicator.Communicator()
+    comms.EncodeMessageList(message_list, signed_message_list)
+
+    decoded = comms.DecompressMessageList(signed_message_list)
+    self.assertEqual(list(decoded.job), list(message_list.job))
+    return signed_message_list
+
+  def testSmallBundlesUseFastLevel(self):
+    messages = _StatEntryMessages(count=10)
+    with utils.Stubber(zlib, "compress", self._RecordLevel(zlib.compress)):
+      signed_message_list = self._Encode(messages)
+
+    self.assertEqual(signed_message_list.compression,
+                     rdf_flows.SignedMessageList.CompressionType.ZCOMPRESSION)
+    self.assertEqual(self.levels,
+                     [config_lib.CONFIG["Network.compression_fast_level"]])
+
+  def testLargeBundlesUseConfiguredLevel(self):
+    messages = _StatEntryMessages()
+    with test_lib.ConfigOverrider({
+        "Network.compression_large_bundle_size": 1024
+    }):
+      with utils.Stubber(zlib, "compress", self._RecordLevel(zlib.compress)):
+        signed_message_list = self._Encode(messages)
+
+    self.assertEqual(signed_message_list.compression,
+                     rdf_flows.SignedMessageList.CompressionType.ZCOMPRESSION)
+    self.assertEqual(self.levels[-1],
+                     config_lib.CONFIG["Network.compression_level"])
+
+  def testCompressedUploadsAreNotCompressedAgain(self):
+    signed_message_list = self._Encode(_UploadMessages(count=4))
+    self.assertEqual(signed_message_list.compression,
+                     rdf_flows.SignedMessageList.CompressionType.UNCOMPRESSED)
+
+  def testCompressionDisabled(self):
+    with test_lib.ConfigOverrider({"Network.compression": "UNCOMPRESSED"}):
+      signed_message_list = self._Encode(_StatEntryMessages(count=10))
+
+    self.assertEqual(signed_message_list.compression,
+                     rdf_flows.SignedMessageList.CompressionType.UNCOMPRESSED)
+
+  def testMessagesAreDecodedWithoutCopies(self):
+    for config in ["UNCOMPRESSED", "ZCOMPRESS"]:
+      with test_lib.ConfigOverrider({"Network.compression": config}):
+        message_list = rdf_flows.MessageList(job=_StatEntryMessages(count=5))
+        signed_message_list = rdf_flows.SignedMessageList()
+        comms = communicator.Communicator()
+        comms.EncodeMessageList(message_list, signed_message_list)
+
+        decoded = comms.DecompressMessageList(signed_message_list)
+
+        # The messages are views into the decompressed data.
+        for _, wire_format in decoded.job.wrapped_list:
+          self.assertIs(wire_format[2].__class__, buffer)
+        self.assertEqual(list(decoded.job), list(message_list.job))
+
+  def _RecordLevel(self, compress):
+    self.levels = []
+
+    def Compress(data, level=6):
+      self.levels.append(level)
+      return compress(data, level)
+
+    return Compress
+
+
+class MessageListCompressionBenchmarks(test_lib.MicroBenchmarks):
+  """Compares adaptive compression to always compressing with zlib's default."""
+
+  units = "ms"
+
+  def setUp(self):
+    super(MessageListCompressionBenchmarks, self).setUp(["Size"],
+                                                        ["<20"])
+
+  def _Benchmark(self, name, messages, repetitions=10):
+    message_list = rdf_flows.MessageList(job=messages)
+    comms = communicator.Communicator()
+
+    start = time.time()
+    for _ in range(repetitions):
+      data = message_list.SerializeToString()
+      compressed_data = zlib.compress(data)
+      if len(compressed_data) >= len(data):
+        compressed_data = data
+    self.AddResult("%s (default level)" % name,
+                   (time.time() - start) / repetitions, repetitions,
+                   len(compressed_data))
+
+    start = time.time()
+    for _ in range(repetitions):
+      signed_message_list = rdf_flows.SignedMessageList()
+      comms.EncodeMessageList(message_list, signed_message_list)
+    self.AddResult("%s (adaptive)" % name, (time.time() - start) / repetitions,
+                   repetitions, len(signed_message_list.message_list))
+
+  @test_lib.SetLabel("benchmark")
+  def testEncodeMessageList(self):
+    """Encodes bundles of StatEntries and of file uploads."""
+    self._Benchmark("Small StatEntry bundle", _StatEntryMessages(count=100))
+    self._Benchmark("Large StatEntry bundle", _StatEntryMessages(count=5000))
+    self._Benchmark("Upload bundle", _UploadMessages())
+
+
 def main(argv):
   test_lib.main(argv)
 
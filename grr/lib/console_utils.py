@@ -413,6 +413,33 @@ def MigrateAllHuntsFinishedAndError(token=None):
     print "Done %d out of %d hunts." % (index, len(hunts_list))
 
 
+def RebuildAllHuntsClientStats(token=None):
+  """Rebuilds the client stats of all hunts from their collections.
+
+  Hunts created before the client stats were kept have their counts and
+  completion timeline computed from the clients collections on every read.
+
+  Args:
+    token: The token to use.
+  """
+  hunts_list = list(
+      aff4.FACTORY.Open(
+          "aff4:/hunts", token=token).ListChildren())
+  all_hunts = aff4.FACTORY.MultiOpen(
+      hunts_list,
+      aff4_type=hunts_implementation.GRRHunt,
+      mode="r",
+      token=token)
+
+  index = 0
+  for hunt in all_hunts:
+    print "Rebuilding client stats of hunt %s." % hunt.urn
+    hunt.RebuildClientStats()
+
+    index += 1
+    print "Done %d out of %d hunts." % (index, len(hunts_list))
+
+
 def ClientIdToHostname(client_id, token=None):
   """Quick helper for scripts to get a hostname from a client ID."""
   client = OpenClient(client_id, token=token)[0]
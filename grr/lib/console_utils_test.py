@@ -4,11 +4,14 @@
 
 from grr.lib import aff4
 from grr.lib import console_utils
+from grr.lib import data_store
 from grr.lib import flags
 from grr.lib import test_lib
+from grr.lib.hunts import standard_test
 
 
-class ConsoleUtilsTest(test_lib.FlowTestsBaseclass):
+class ConsoleUtilsTest(test_lib.FlowTestsBaseclass,
+                       standard_test.StandardHuntTestMixin):
   """Test the console utils library."""
 
   def testClientIdToHostname(self):
@@ -55,6 +58,22 @@ class ConsoleUtilsTest(test_lib.FlowTestsBaseclass):
     self.assertEqual(len(res), 1)
     self.assertEqual(res[0].urn, client.urn)
 
+  def testRebuildAllHuntsClientStats(self):
+    self.client_ids = self.SetupClients(2)
+    hunt_urn = self.StartHunt()
+    self.AssignTasksToClients()
+    self.RunHunt()
+
+    hunt_obj = aff4.FACTORY.Open(hunt_urn, token=self.token)
+    data_store.DB.DeleteSubject(
+        hunt_obj.client_stats_urn, sync=True, token=self.token)
+    self.assertIsNone(hunt_obj.client_stats.Read())
+
+    console_utils.RebuildAllHuntsClientStats(token=self.token)
+
+    self.assertIsNotNone(hunt_obj.client_stats.Read())
+    self.assertEqual(hunt_obj.GetClientsCounts(), (2, 2, 1))
+
 
 class ConsoleUtilsTestLoader(test_lib.GRRTestLoader):
   base_class = ConsoleUtilsTest
@@ -139,33 +139,9 @@ class MutationPool(object):
 
   def Flush(self):
     """Flushing actually applies all the operations in the pool."""
-    DB.DeleteSubjects(
-        self.delete_subject_requests, token=self.token, sync=False)
-
-    for req in self.delete_attributes_requests:
-      subject, attributes, start, end = req
-      DB.DeleteAttributes(
-          subject,
-          attributes,
-          start=start,
-          end=end,
-          token=self.token,
-          sync=False)
-
-    for req in self.set_requests:
-      subject, values, timestamp, replace, to_delete = req
-      DB.MultiSet(
-          subject,
-          values,
-          timestamp=timestamp,
-          replace=replace,
-          to_delete=to_delete,
-          token=self.token,
-          sync=False)
-
     if (self.delete_subject_requests or self.delete_attributes_requests or
         self.set_requests):
-      DB.Flush()
+      DB.ApplyMutations(self)
 
     self.delete_subject_requests = []
     self.set_requests = []
@@ -193,6 +169,10 @@ class DataStore(object):
   TIMESTAMPS = [ALL_TIMESTAMPS, NEWEST_TIMESTAMP]
   LEASE_ATTRIBUTE = "aff4:lease"
 
+  # Attributes used by the queue primitives below.
+  QUEUE_ITEM_ATTRIBUTE = "aff4:sequential_value"
+  QUEUE_LOCK_ATTRIBUTE = "aff4:lease"
+
   mutation_pool_cls = MutationPool
 
   flusher_thread = None
@@ -282,6 +262,40 @@ class DataStore(object):
     for subject in subjects:
       self.DeleteSubject(subject, sync=sync, token=token)
 
+  def ApplyMutations(self, mutation_pool):
+    """Applies all the mutations queued in a MutationPool.
+
+    Data stores which support bulk writes should override this to apply the
+    whole pool in as few round trips as possible. This default implementation
+    issues one call per queued request and then flushes the data store.
+
+    Deletions are applied before any values are set.
+
+    Args:
+      mutation_pool: The MutationPool holding the mutations to apply.
+    """
+    token = mutation_pool.token
+    self.DeleteSubjects(
+        mutation_pool.delete_subject_requests, token=token, sync=False)
+
+    for req in mutation_pool.delete_attributes_requests:
+      subject, attributes, start, end = req
+      self.DeleteAttributes(
+          subject, attributes, start=start, end=end, token=token, sync=False)
+
+    for req in mutation_pool.set_requests:
+      subject, values, timestamp, replace, to_delete = req
+      self.MultiSet(
+          subject,
+          values,
+          timestamp=timestamp,
+          replace=replace,
+          to_delete=to_delete,
+          token=token,
+          sync=False)
+
+    self.Flush()
+
   def Set(self,
           subject,
           attribute,
@@ -646,6 +660,127 @@ class DataStore(object):
       ts, v = r[attribute]
       yield (s, ts, v)
 
+  def _SelectQueueRecords(self, rows, item_rdf_type, now, limit,
+                          record_filter, max_filtered):
+    """Picks the records to claim from scanned queue rows.
+
+    Args:
+      rows: Pairs (subject, result_dict) as returned by ScanAttributes for the
+        queue item and lock attributes.
+      item_rdf_type: The RDFValue class of the queue items.
+      now: The current time as an RDFDatetime. Records leased until after this
+        time are skipped.
+      limit: The maximum number of records to pick.
+      record_filter: A callable called on each unclaimed item, items for which
+        it returns True are not picked.
+      max_filtered: If non-zero, stop after this many consecutive filtered
+        items.
+
+    Returns:
+      A pair (records, orphaned) where records is a list of (subject, item)
+      and orphaned is a list of subjects that have a lock but no item.
+    """
+    records = []
+    orphaned = []
+    filtered_count = 0
+
+    for subject, values in rows:
+      if self.QUEUE_ITEM_ATTRIBUTE not in values:
+        # Unlikely case, but could happen if, say, a thread refreshed a claim
+        # so late that another thread already deleted the record.
+        orphaned.append(subject)
+        continue
+      if self.QUEUE_LOCK_ATTRIBUTE in values:
+        timestamp = rdfvalue.RDFDatetime.FromSerializedString(
+            values[self.QUEUE_LOCK_ATTRIBUTE][1])
+        if timestamp > now:
+          continue
+      item = item_rdf_type.FromSerializedString(
+          values[self.QUEUE_ITEM_ATTRIBUTE][1])
+      if record_filter(item):
+        filtered_count += 1
+        if max_filtered and filtered_count >= max_filtered:
+          break
+        continue
+      records.append((subject, item))
+      filtered_count = 0
+      if len(records) >= limit:
+        break
+
+    return records, orphaned
+
+  def QueueClaimRecords(self,
+                        queue_id,
+                        item_rdf_type,
+                        limit=10000,
+                        timeout="30m",
+                        after_urn=None,
+                        record_filter=lambda x: False,
+                        max_filtered=1000,
+                        token=None):
+    """Claims up to limit unclaimed records of a queue.
+
+    The records of a queue are stored as rows below queue_id/Records. A record
+    is claimed by setting its lock attribute to the time the claim expires.
+    Data stores which can scan and write in a single operation should override
+    this; the default implementation scans the rows and then writes all the
+    locks in one mutation pool.
+
+    Args:
+      queue_id: The urn of the queue.
+      item_rdf_type: The RDFValue class of the queue items.
+      limit: The number of records to claim.
+      timeout: The duration of the claim.
+      after_urn: If set, only claim records which come after this urn.
+      record_filter: A callable called on each unclaimed item, items for which
+        it returns True are neither returned nor claimed.
+      max_filtered: If non-zero, stop looking for records after this many
+        consecutive filtered items.
+      token: The security token to authenticate with.
+
+    Returns:
+      A list of (id, item) where id identifies the record for later calls to
+      the other queue methods.
+    """
+    now = rdfvalue.RDFDatetime.Now()
+    rows = self.ScanAttributes(
+        rdfvalue.RDFURN(queue_id).Add("Records"),
+        [self.QUEUE_ITEM_ATTRIBUTE, self.QUEUE_LOCK_ATTRIBUTE],
+        max_records=4 * limit,
+        after_urn=after_urn,
+        token=token)
+    records, orphaned = self._SelectQueueRecords(
+        rows, item_rdf_type, now, limit, record_filter, max_filtered)
+
+    expiration = rdfvalue.RDFDatetime.Now() + rdfvalue.Duration(timeout)
+    with self.GetMutationPool(token=token) as mutation_pool:
+      for subject in orphaned:
+        mutation_pool.DeleteAttributes(subject, [self.QUEUE_LOCK_ATTRIBUTE])
+      for subject, _ in records:
+        mutation_pool.Set(subject, self.QUEUE_LOCK_ATTRIBUTE, expiration)
+
+    return records
+
+  def QueueRefreshClaims(self, ids, timeout="30m", token=None):
+    """Extends the claims on the records identified by ids."""
+    expiration = rdfvalue.RDFDatetime.Now() + rdfvalue.Duration(timeout)
+    with self.GetMutationPool(token=token) as mutation_pool:
+      for subject in ids:
+        mutation_pool.Set(subject, self.QUEUE_LOCK_ATTRIBUTE, expiration)
+
+  def QueueReleaseRecords(self, ids, token=None):
+    """Releases the claims on the records identified by ids."""
+    with self.GetMutationPool(token=token) as mutation_pool:
+      for subject in ids:
+        mutation_pool.DeleteAttributes(subject, [self.QUEUE_LOCK_ATTRIBUTE])
+
+  def QueueDeleteRecords(self, ids, token=None):
+    """Deletes the records identified by ids."""
+    with self.GetMutationPool(token=token) as mutation_pool:
+      for subject in ids:
+        mutation_pool.DeleteAttributes(
+            subject, [self.QUEUE_LOCK_ATTRIBUTE, self.QUEUE_ITEM_ATTRIBUTE])
+
   def ReadBlob(self, identifier, token=None):
     return self.ReadBlobs([identifier], token=token).values()[0]
 
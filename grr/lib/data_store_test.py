@@ -1782,7 +1782,7 @@ class _DataStoreTest(test_lib.GRRBaseTest):
         "DeleteAttributes", "MultiDeleteAttributes", "DeleteSubject",
         "DeleteSubjects", "MultiResolvePrefix", "MultiSet", "Resolve",
         "ResolveMulti", "ResolvePrefix", "ScanAttribute", "ScanAttributes",
-        "Set", "DBSubjectLock"
+        "Set", "DBSubjectLock", "ApplyMutations"
     ]
 
     implementation = data_store.DB
@@ -1881,6 +1881,129 @@ class _DataStoreTest(test_lib.GRRBaseTest):
         self.test_row, predicate, token=self.token)
     self.assertIsNone(stored)
 
+  @DeletionTest
+  def testPoolAppliesMutationsToManySubjects(self):
+    predicate = "metadata:predicate"
+    subjects = ["aff4:/row:%d" % i for i in range(10)]
+    for subject in subjects:
+      data_store.DB.Set(subject, predicate, "old", token=self.token)
+
+    with data_store.DB.GetMutationPool(token=self.token) as pool:
+      pool.DeleteSubject(subjects[0])
+      pool.DeleteAttributes(subjects[1], [predicate])
+      for subject in subjects[2:]:
+        pool.Set(subject, predicate, "new")
+
+      # Deletions are applied before any value is set.
+      pool.Set(subjects[0], "metadata:other", "recreated")
+
+    stored, _ = data_store.DB.Resolve(
+        subjects[0], predicate, token=self.token)
+    self.assertIsNone(stored)
+    stored, _ = data_store.DB.Resolve(
+        subjects[0], "metadata:other", token=self.token)
+    self.assertEqual(stored, "recreated")
+
+    stored, _ = data_store.DB.Resolve(
+        subjects[1], predicate, token=self.token)
+    self.assertIsNone(stored)
+
+    for subject in subjects[2:]:
+      stored, _ = data_store.DB.Resolve(subject, predicate, token=self.token)
+      self.assertEqual(stored, "new")
+
+  def _AddQueueRecords(self, queue_urn, count):
+    subjects = [queue_urn.Add("Records").Add("%04d" % i) for i in range(count)]
+    self._ClearDB(subjects)
+    for i, subject in enumerate(subjects):
+      data_store.DB.Set(
+          subject,
+          data_store.DB.QUEUE_ITEM_ATTRIBUTE,
+          rdfvalue.RDFInteger(i).SerializeToString(),
+          token=self.token)
+    data_store.DB.Flush()
+    return subjects
+
+  @DeletionTest
+  def testQueueClaimRecords(self):
+    queue_urn = rdfvalue.RDFURN("aff4:/queue_test")
+    subjects = self._AddQueueRecords(queue_urn, 10)
+
+    claimed = data_store.DB.QueueClaimRecords(
+        queue_urn, rdfvalue.RDFInteger, limit=6, token=self.token)
+    self.assertEqual([subject for subject, _ in claimed], subjects[:6])
+    self.assertEqual([item for _, item in claimed], range(6))
+
+    claimed = data_store.DB.QueueClaimRecords(
+        queue_urn, rdfvalue.RDFInteger, limit=6, token=self.token)
+    self.assertEqual([item for _, item in claimed], range(6, 10))
+
+    self.assertFalse(
+        data_store.DB.QueueClaimRecords(
+            queue_urn, rdfvalue.RDFInteger, token=self.token))
+
+    # Released records can be claimed again, deleted ones are gone.
+    data_store.DB.QueueReleaseRecords(subjects[:2], token=self.token)
+    data_store.DB.QueueDeleteRecords(subjects[2:4], token=self.token)
+    data_store.DB.Flush()
+    claimed = data_store.DB.QueueClaimRecords(
+        queue_urn, rdfvalue.RDFInteger, token=self.token)
+    self.assertEqual([item for _, item in claimed], [0, 1])
+
+    stored, _ = data_store.DB.Resolve(
+        subjects[2], data_store.DB.QUEUE_ITEM_ATTRIBUTE, token=self.token)
+    self.assertIsNone(stored)
+
+  @DeletionTest
+  def testQueueClaimRecordsWithFilterAndExpiredClaims(self):
+    queue_urn = rdfvalue.RDFURN("aff4:/queue_test")
+    self._AddQueueRecords(queue_urn, 10)
+
+    with test_lib.FakeTime(1000):
+      claimed = data_store.DB.QueueClaimRecords(
+          queue_urn,
+          rdfvalue.RDFInteger,
+          timeout="10s",
+          record_filter=lambda x: int(x) % 2,
+          token=self.token)
+      self.assertEqual([item for _, item in claimed], [0, 2, 4, 6, 8])
+
+      data_store.DB.QueueRefreshClaims(
+          [subject for subject, _ in claimed[:1]],
+          timeout="1h",
+          token=self.token)
+      data_store.DB.Flush()
+
+    with test_lib.FakeTime(1100):
+      claimed = data_store.DB.QueueClaimRecords(
+          queue_urn, rdfvalue.RDFInteger, token=self.token)
+      self.assertEqual([item for _, item in claimed], range(1, 10))
+
+  def testApplyMutationsChecksWriteAccess(self):
+    self._InstallACLChecks("w")
+
+    pool = data_store.DB.GetMutationPool(token=self.token)
+    pool.Set(self.test_row, "metadata:predicate", "hello")
+    self.assertRaises(access_control.UnauthorizedAccess, pool.Flush)
+
+  def testMutationPoolFlushWritesBufferedValues(self):
+    data_store.DB.Set(
+        self.test_row,
+        "metadata:buffered",
+        "buffered",
+        sync=False,
+        token=self.token)
+
+    with data_store.DB.GetMutationPool(token=self.token) as pool:
+      pool.Set(self.test_row, "metadata:pooled", "pooled")
+
+    stored, _ = data_store.DB.Resolve(
+        self.test_row, "metadata:buffered", token=self.token)
+    self.assertEqual(stored, "buffered")
+    stored, _ = data_store.DB.Resolve(
+        self.test_row, "metadata:pooled", token=self.token)
+    self.assertEqual(stored, "pooled")
+
 
 class DataStoreCSVBenchmarks(test_lib.MicroBenchmarks):
   """Long running benchmarks where the results are dumped to a CSV file.
@@ -2585,6 +2708,52 @@ class DataStoreBenchmarks(test_lib.MicroBenchmarks):
     elapsed_time = time.time() - start_time
     self.AddResult("Seq. Coll. full sequential read", elapsed_time, 1)
 
+  @test_lib.SetLabel("benchmark")
+  def testQueueClaims(self):
+    """Simulates consumers of a queue such as the hunt results queue."""
+    queue_urn = rdfvalue.RDFURN("aff4:/benchmark_queue")
+    collections = 4
+    records_per_collection = 2500
+    batch = 1000
+
+    start_time = time.time()
+    with data_store.DB.GetMutationPool(token=self.token) as pool:
+      for i in xrange(collections * records_per_collection):
+        pool.Set(
+            queue_urn.Add("Records").Add("%08d" % i),
+            data_store.DB.QUEUE_ITEM_ATTRIBUTE,
+            rdfvalue.RDFString("collection%d" % (i % collections)))
+    self.AddResult("Queue add", time.time() - start_time,
+                   collections * records_per_collection)
+
+    # Like the hunt result consumers, every pass only claims records of one
+    # collection, refreshes the claims while working and then deletes them.
+    start_time = time.time()
+    claimed_count = 0
+    for i in xrange(collections):
+      wanted = "collection%d" % i
+      after_urn = None
+      while True:
+        claimed = data_store.DB.QueueClaimRecords(
+            queue_urn,
+            rdfvalue.RDFString,
+            limit=batch,
+            after_urn=after_urn,
+            record_filter=lambda x, wanted=wanted: x != wanted,
+            max_filtered=0,
+            token=self.token)
+        if not claimed:
+          break
+        ids = [record_id for record_id, _ in claimed]
+        data_store.DB.QueueRefreshClaims(ids, token=self.token)
+        data_store.DB.QueueDeleteRecords(ids, token=self.token)
+        claimed_count += len(claimed)
+        after_urn = ids[-1]
+
+    self.assertEqual(claimed_count, collections * records_per_collection)
+    self.AddResult("Queue claim, refresh and delete",
+                   time.time() - start_time, claimed_count)
+
   @test_lib.SetLabel("benchmark")
   def testSimulateFlows(self):
     self.flow_ids = []
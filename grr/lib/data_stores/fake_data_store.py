@@ -150,6 +150,11 @@ class FakeDataStore(data_store.DataStore):
                  replace=replace,
                  sync=sync)
 
+  @utils.Synchronized
+  def ApplyMutations(self, mutation_pool):
+    """Applies all the mutations in the pool under a single store lock."""
+    super(FakeDataStore, self).ApplyMutations(mutation_pool)
+
   @utils.Synchronized
   def DeleteAttributes(self,
                        subject,
@@ -539,6 +539,20 @@ class HTTPDataStore(data_store.DataStore):
                        token=None):
     self.security_manager.CheckDataStoreAccess(token, [subject], "w")
 
+    request = self._BuildDeleteAttributesRequest(
+        subject, attributes, start=start, end=end, sync=sync, token=token)
+
+    typ = rdf_data_server.DataStoreCommand.Command.DELETE_ATTRIBUTES
+    self._MakeRequestSyncOrAsync(request, typ, sync)
+
+  def _BuildDeleteAttributesRequest(self,
+                                    subject,
+                                    attributes,
+                                    start=None,
+                                    end=None,
+                                    sync=True,
+                                    token=None):
+    """Builds the request for DeleteAttributes."""
     request = rdf_data_store.DataStoreRequest(subject=[subject])
 
     if isinstance(attributes, basestring):
@@ -563,18 +577,80 @@ class HTTPDataStore(data_store.DataStore):
     for attr in attributes:
       request.values.Append(attribute=attr)
 
-    typ = rdf_data_server.DataStoreCommand.Command.DELETE_ATTRIBUTES
-    self._MakeRequestSyncOrAsync(request, typ, sync)
+    return request
 
   def DeleteSubject(self, subject, sync=False, token=None):
     self.security_manager.CheckDataStoreAccess(token, [subject], "w")
 
+    request = self._BuildDeleteSubjectRequest(subject, token=token)
+
+    typ = rdf_data_server.DataStoreCommand.Command.DELETE_SUBJECT
+    self._MakeRequestSyncOrAsync(request, typ, sync)
+
+  def _BuildDeleteSubjectRequest(self, subject, token=None):
     request = rdf_data_store.DataStoreRequest(subject=[subject])
     if token:
       request.token = token
 
-    typ = rdf_data_server.DataStoreCommand.Command.DELETE_SUBJECT
-    self._MakeRequestSyncOrAsync(request, typ, sync)
+    return request
+
+  def ApplyMutations(self, mutation_pool):
+    """Applies the mutations in the pool with one request per data server."""
+    token = mutation_pool.token or data_store.default_token
+    subjects = set(mutation_pool.delete_subject_requests)
+    subjects.update(req[0] for req in mutation_pool.delete_attributes_requests)
+    subjects.update(req[0] for req in mutation_pool.set_requests)
+    self.security_manager.CheckDataStoreAccess(token, list(subjects), "w")
+
+    mutation_type = rdf_data_store.DataStoreMutation.Type
+    # Maps each data server to the request holding its mutations. Mutations
+    # are appended in the order the data server must apply them.
+    batches = {}
+
+    def _Append(subject, typ, request):
+      server = self.cache.Get(subject)
+      if server not in batches:
+        batches[server] = rdf_data_store.DataStoreRequest(sync=False)
+        if token:
+          batches[server].token = token
+      batches[server].mutations.Append(type=typ, request=request)
+
+    for subject in mutation_pool.delete_subject_requests:
+      _Append(subject, mutation_type.DELETE_SUBJECT,
+              self._BuildDeleteSubjectRequest(subject, token=token))
+
+    for subject, attributes, start, end in (
+        mutation_pool.delete_attributes_requests):
+      _Append(subject, mutation_type.DELETE_ATTRIBUTES,
+              self._BuildDeleteAttributesRequest(
+                  subject,
+                  attributes,
+                  start=start,
+                  end=end,
+                  sync=False,
+                  token=token))
+
+    for subject, values, timestamp, replace, to_delete in (
+        mutation_pool.set_requests):
+      _Append(subject, mutation_type.MULTI_SET,
+              self._BuildMultiSetRequest(
+                  subject,
+                  values,
+                  timestamp=timestamp,
+                  replace=replace,
+                  sync=False,
+                  to_delete=to_delete,
+                  token=token))
+
+    # Send all the batches first so the data servers work on them in
+    # parallel, then wait for all of them to finish.
+    typ = rdf_data_server.DataStoreCommand.Command.APPLY_MUTATIONS
+    for server, request in batches.iteritems():
+      cmd = rdf_data_server.DataStoreCommand(command=typ, request=request)
+      server.GetConnection().MakeRequestAndContinue(cmd, None)
+
+    for server in batches:
+      server.Sync()
 
   def _MakeRequest(self,
                    subjects,
@@ -687,6 +763,27 @@ class HTTPDataStore(data_store.DataStore):
     """MultiSet."""
     self.security_manager.CheckDataStoreAccess(token, [subject], "w")
 
+    request = self._BuildMultiSetRequest(
+        subject,
+        values,
+        timestamp=timestamp,
+        replace=replace,
+        sync=sync,
+        to_delete=to_delete,
+        token=token)
+
+    typ = rdf_data_server.DataStoreCommand.Command.MULTI_SET
+    self._MakeRequestSyncOrAsync(request, typ, sync)
+
+  def _BuildMultiSetRequest(self,
+                            subject,
+                            values,
+                            timestamp=None,
+                            replace=True,
+                            sync=True,
+                            to_delete=None,
+                            token=None):
+    """Builds the request for MultiSet."""
     request = rdf_data_store.DataStoreRequest(sync=sync)
     token = token or data_store.default_token
     if token:
@@ -728,8 +825,7 @@ class HTTPDataStore(data_store.DataStore):
         if v is not None:
           new_value.value.SetValue(v)
 
-    typ = rdf_data_server.DataStoreCommand.Command.MULTI_SET
-    self._MakeRequestSyncOrAsync(request, typ, sync)
+    return request
 
   def ResolveMulti(self,
                    subject,
@@ -388,6 +388,146 @@ class MySQLAdvancedDataStore(data_store.DataStore):
       if max_records and result_count >= max_records:
         return
 
+  def QueueClaimRecords(self,
+                        queue_id,
+                        item_rdf_type,
+                        limit=10000,
+                        timeout="30m",
+                        after_urn=None,
+                        record_filter=lambda x: False,
+                        max_filtered=1000,
+                        token=None):
+    """Claims queue records in a single transaction.
+
+    Unclaimed records are selected and locked with SELECT ... FOR UPDATE so
+    concurrent claims block instead of handing out the same records, then the
+    leases of all the claimed records are written with one delete and one
+    bulk insert.
+
+    See DataStore.QueueClaimRecords for the arguments.
+
+    Returns:
+      A list of (id, item).
+    """
+    records_prefix = self._CleanSubjectPrefix(
+        rdfvalue.RDFURN(queue_id).Add("Records"))
+    self.security_manager.CheckDataStoreAccess(token, [records_prefix], "qrw")
+    after_urn = utils.SmartStr(
+        self._CleanAfterURN(after_urn, records_prefix) or "")
+
+    now = rdfvalue.RDFDatetime.Now()
+    expiration = now + rdfvalue.Duration(timeout)
+    item_attribute = utils.SmartUnicode(self.QUEUE_ITEM_ATTRIBUTE)
+    lock_attribute = utils.SmartUnicode(self.QUEUE_LOCK_ATTRIBUTE)
+
+    # Unexpired leases are skipped by the database. The lease value is a
+    # serialized RDFDatetime, i.e. a decimal string.
+    select_query = """
+    SELECT subjects.subject, item.value
+      FROM subjects
+      JOIN aff4 item ON item.subject_hash=subjects.hash
+                     AND item.attribute_hash=unhex(md5(%s))
+      LEFT JOIN aff4 lease ON lease.subject_hash=subjects.hash
+                           AND lease.attribute_hash=unhex(md5(%s))
+      WHERE subjects.subject LIKE %s AND subjects.subject > %s
+            AND (lease.value IS NULL
+                 OR CAST(lease.value AS UNSIGNED) <= %s)
+      ORDER BY subjects.subject
+      LIMIT %s
+      FOR UPDATE
+    """
+    select_args = [item_attribute, lock_attribute, records_prefix + "%",
+                   after_urn, int(now), 4 * limit]
+
+    # Leases left behind by records that were deleted while claimed. They are
+    # only removed from the range of subjects the claim scanned so the cost of
+    # a claim does not grow with the size of the queue.
+    orphans_query = """
+    DELETE lease FROM aff4 lease
+      JOIN subjects ON lease.subject_hash=subjects.hash
+      LEFT JOIN aff4 item ON item.subject_hash=lease.subject_hash
+                          AND item.attribute_hash=unhex(md5(%s))
+      WHERE lease.attribute_hash=unhex(md5(%s))
+            AND subjects.subject LIKE %s AND subjects.subject > %s
+            AND item.id IS NULL
+    """
+    orphans_args = [item_attribute, lock_attribute, records_prefix + "%",
+                    after_urn]
+
+    def _Claim(cursor):
+      cursor.execute(select_query, select_args)
+      fetched = cursor.fetchall()
+
+      # Nothing to clean up if nothing was scanned, e.g. with limit=0.
+      if fetched:
+        if len(fetched) < select_args[-1]:
+          # The scan reached the end of the queue.
+          cursor.execute(orphans_query, orphans_args)
+        else:
+          cursor.execute(orphans_query + " AND subjects.subject <= %s",
+                         orphans_args + [fetched[-1]["subject"]])
+
+      rows = ((row["subject"], {
+          self.QUEUE_ITEM_ATTRIBUTE: (0, self._Decode(item_attribute,
+                                                      row["value"]))
+      }) for row in fetched)
+      records, _ = self._SelectQueueRecords(
+          rows, item_rdf_type, now, limit, record_filter, max_filtered)
+
+      for query in self._BuildSetLeases([s for s, _ in records], expiration):
+        cursor.execute(query["query"], query["args"])
+      return records
+
+    return self._RunInTransaction(_Claim)
+
+  def QueueRefreshClaims(self, ids, timeout="30m", token=None):
+    """Extends the claims on all the records in one transaction."""
+    if not ids:
+      return
+    self.security_manager.CheckDataStoreAccess(token, list(ids), "w")
+    expiration = rdfvalue.RDFDatetime.Now() + rdfvalue.Duration(timeout)
+    self._ExecuteTransaction(self._BuildSetLeases(ids, expiration))
+
+  def QueueReleaseRecords(self, ids, token=None):
+    """Releases the claims on all the records with a single query."""
+    if not ids:
+      return
+    self.security_manager.CheckDataStoreAccess(token, list(ids), "w")
+    self._ExecuteQueries(
+        self._BuildDeleteMany(ids, [self.QUEUE_LOCK_ATTRIBUTE]))
+
+  def QueueDeleteRecords(self, ids, token=None):
+    """Deletes all the records with a single query."""
+    if not ids:
+      return
+    self.security_manager.CheckDataStoreAccess(token, list(ids), "w")
+    self._ExecuteQueries(
+        self._BuildDeleteMany(
+            ids, [self.QUEUE_LOCK_ATTRIBUTE, self.QUEUE_ITEM_ATTRIBUTE]))
+
+  def _BuildDeleteMany(self, subjects, attributes):
+    """Build a DELETE query removing attributes from many subjects."""
+    subjects = [utils.SmartUnicode(s) for s in subjects]
+    attributes = [utils.SmartUnicode(a) for a in attributes]
+    query = ("DELETE aff4 FROM aff4 WHERE subject_hash IN (%s) "
+             "AND attribute_hash IN (%s)" %
+             (", ".join(["unhex(md5(%s))"] * len(subjects)),
+              ", ".join(["unhex(md5(%s))"] * len(attributes))))
+    return [{"query": query, "args": subjects + attributes}]
+
+  def _BuildSetLeases(self, subjects, expiration):
+    """Build the queries replacing the queue lease of many subjects."""
+    if not subjects:
+      return []
+
+    lock_attribute = utils.SmartUnicode(self.QUEUE_LOCK_ATTRIBUTE)
+    data = self._Encode(expiration)
+    transaction = self._BuildDeleteMany(subjects, [lock_attribute])
+    transaction.extend(
+        self._BuildInserts([[utils.SmartUnicode(s), lock_attribute, data, None]
+                            for s in subjects]))
+    return transaction
+
   def MultiSet(self,
                subject,
                values,
@@ -455,6 +595,91 @@ class MySQLAdvancedDataStore(data_store.DataStore):
         with self.buffer_lock:
           self.to_insert.extend(to_insert)
 
+  def ApplyMutations(self, mutation_pool):
+    """Applies all the mutations in the pool as a single transaction."""
+    token = mutation_pool.token
+    subjects = set(mutation_pool.delete_subject_requests)
+    subjects.update(req[0] for req in mutation_pool.delete_attributes_requests)
+    subjects.update(req[0] for req in mutation_pool.set_requests)
+    self.security_manager.CheckDataStoreAccess(token, list(subjects), "w")
+
+    transaction = []
+    for subject in mutation_pool.delete_subject_requests:
+      transaction.extend(self._BuildDelete(subject))
+
+    for subject, attributes, start, end in (
+        mutation_pool.delete_attributes_requests):
+      if isinstance(attributes, basestring):
+        raise ValueError(
+            "String passed to DeleteAttributes (non string iterable expected).")
+
+      timestamp = self._MakeTimestamp(start, end)
+      for attribute in attributes:
+        transaction.extend(
+            self._BuildDelete(subject, utils.SmartUnicode(attribute),
+                              timestamp))
+
+    to_insert = []
+    to_replace = []
+    for subject, values, timestamp, replace, to_delete in (
+        mutation_pool.set_requests):
+      subject = utils.SmartUnicode(subject)
+      to_delete = set(utils.SmartUnicode(a) for a in to_delete or [])
+
+      for attribute, sequence in values.items():
+        attribute = utils.SmartUnicode(attribute)
+        for value in sequence:
+          if isinstance(value, tuple):
+            value, entry_timestamp = value
+          else:
+            entry_timestamp = timestamp
+
+          if entry_timestamp is None:
+            entry_timestamp = timestamp
+
+          if entry_timestamp is not None:
+            entry_timestamp = int(entry_timestamp)
+
+          row = [subject, attribute, self._Encode(value), entry_timestamp]
+          # Replacing rows are deleted first by _BuildReplaces so there is no
+          # need to count the existing rows here.
+          if replace or attribute in to_delete:
+            to_replace.append(row)
+          else:
+            to_insert.append(row)
+
+        to_delete.discard(attribute)
+
+      for attribute in to_delete:
+        transaction.extend(self._BuildDelete(subject, attribute))
+
+    if to_replace:
+      transaction.extend(self._BuildReplaces(to_replace))
+    if to_insert:
+      transaction.extend(self._BuildInserts(to_insert))
+
+    # Like a Flush(), applying a pool also writes everything buffered before
+    # with sync=False. Those writes go first so they are never visible after
+    # the writes of the pool.
+    transaction = self._TakeBufferedWrites() + transaction
+    if transaction:
+      self._ExecuteTransaction(transaction)
+
+  def _TakeBufferedWrites(self):
+    """Empties the write buffer and returns the queries writing it."""
+    with self.buffer_lock:
+      to_insert = self.to_insert
+      to_replace = self.to_replace
+      self.to_replace = []
+      self.to_insert = []
+
+    transaction = []
+    if to_replace:
+      transaction.extend(self._BuildReplaces(to_replace))
+    if to_insert:
+      transaction.extend(self._BuildInserts(to_insert))
+    return transaction
+
   def _CountExistingRows(self, subject, attribute):
     query = ("SELECT count(*) AS total FROM aff4 "
              "WHERE subject_hash=unhex(md5(%s)) "
@@ -479,17 +704,7 @@ class MySQLAdvancedDataStore(data_store.DataStore):
     # locking the whole Flush() method. Long term, we should stop flushing the
     # data store and use MutationPools everywhere.
     super(MySQLAdvancedDataStore, self).Flush()
-    with self.buffer_lock:
-      to_insert = self.to_insert
-      to_replace = self.to_replace
-      self.to_replace = []
-      self.to_insert = []
-
-    transaction = []
-    if to_replace:
-      transaction.extend(self._BuildReplaces(to_replace))
-    if to_insert:
-      transaction.extend(self._BuildInserts(to_insert))
+    transaction = self._TakeBufferedWrites()
     if transaction:
       self._ExecuteTransaction(transaction)
 
@@ -527,16 +742,16 @@ class MySQLAdvancedDataStore(data_store.DataStore):
     aff4_q["args"] = []
 
     seen = {}
-    seen["subjects"] = []
-    seen["attributes"] = []
+    seen["subjects"] = set()
+    seen["attributes"] = set()
 
     for (subject, attribute, value, timestamp) in values:
       if subject not in seen["subjects"]:
         subjects_q["args"].extend([subject, subject])
-        seen["subjects"].append(subject)
+        seen["subjects"].add(subject)
       if attribute not in seen["attributes"]:
         attributes_q["args"].extend([attribute, attribute])
-        seen["attributes"].append(attribute)
+        seen["attributes"].add(attribute)
       aff4_q["args"].extend([subject, attribute, timestamp, timestamp, value])
 
     subjects_q["query"] += ", ".join(["(unhex(md5(%s)), %s)"] *
@@ -590,6 +805,25 @@ class MySQLAdvancedDataStore(data_store.DataStore):
 
   def _ExecuteTransaction(self, transaction):
     """Get connection from pool and execute transaction."""
+
+    def _Execute(cursor):
+      for query in transaction:
+        cursor.execute(query["query"], query["args"])
+
+    self._RunInTransaction(_Execute)
+
+  def _RunInTransaction(self, function):
+    """Runs function(cursor) inside a transaction and returns its result.
+
+    The function may run more than once if the transaction has to be retried
+    so it must not have side effects outside of the data store.
+
+    Args:
+      function: A callable taking the cursor to issue queries with.
+
+    Returns:
+      The return value of function.
+    """
     while True:
       # Connectivity issues and deadlocks should not cause threads to die and
       # create inconsistency.  Any MySQL errors here should be temporary in
@@ -598,12 +832,10 @@ class MySQLAdvancedDataStore(data_store.DataStore):
       connection = self.pool.GetConnection()
       try:
         connection.cursor.execute("START TRANSACTION")
-        for query in transaction:
-          connection.cursor.execute(query["query"], query["args"])
+        result = function(connection.cursor)
         connection.cursor.execute("COMMIT")
-        results = connection.cursor.fetchall()
         self.pool.PutConnection(connection)
-        return results
+        return result
       except MySQLdb.Error as e:
         # If there was an error attempt to clean up this connection and let it
         # drop
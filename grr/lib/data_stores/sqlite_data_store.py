@@ -22,6 +22,7 @@ import logging
 from grr.lib import aff4
 from grr.lib import config_lib
 from grr.lib import data_store
+from grr.lib import rdfvalue
 from grr.lib import utils
 from grr.lib.data_stores import common
 
@@ -662,32 +663,36 @@ class SqliteDataStore(data_store.DataStore):
     self.security_manager.CheckDataStoreAccess(token, [subject], "w")
     # All operations are synchronized.
     _ = sync
+    with self.cache.Get(subject) as sqlite_connection:
+      self._MultiSet(sqlite_connection, subject, values, timestamp, replace,
+                     to_delete)
+
+  def _MultiSet(self, sqlite_connection, subject, values, timestamp, replace,
+                to_delete):
+    """Sets values on an already locked connection."""
     if timestamp is None or timestamp == self.NEWEST_TIMESTAMP:
       timestamp = time.time() * 1000000
 
     to_delete = set(to_delete or [])
-
-    with self.cache.Get(subject) as sqlite_connection:
-      if replace:
-        to_delete.update(values.keys())
-
-      # Delete attribute if needed.
-      if to_delete:
-        for attribute in to_delete:
-          sqlite_connection.DeleteAttribute(subject, attribute)
-
-      for attribute, seq in values.items():
-        for v in seq:
-          element_timestamp = None
-          if isinstance(v, (list, tuple)):
-            v, element_timestamp = v
-          if element_timestamp is None:
-            element_timestamp = timestamp
-
-          element_timestamp = long(element_timestamp)
-          value = self._Encode(v)
-          sqlite_connection.SetAttribute(subject, attribute, value,
-                                         element_timestamp)
+    if replace:
+      to_delete.update(values.keys())
+
+    # Delete attribute if needed.
+    for attribute in to_delete:
+      sqlite_connection.DeleteAttribute(subject, attribute)
+
+    for attribute, seq in values.items():
+      for v in seq:
+        element_timestamp = None
+        if isinstance(v, (list, tuple)):
+          v, element_timestamp = v
+        if element_timestamp is None:
+          element_timestamp = timestamp
+
+        element_timestamp = long(element_timestamp)
+        value = self._Encode(v)
+        sqlite_connection.SetAttribute(subject, attribute, value,
+                                       element_timestamp)
 
   def DeleteAttributes(self,
                        subject,
@@ -705,18 +710,23 @@ class SqliteDataStore(data_store.DataStore):
           "String passed to DeleteAttributes (non string iterable expected).")
 
     with self.cache.Get(subject) as sqlite_connection:
-      if start is None and end is None:
-        # This is done when we delete all attributes at once without
-        # caring about timestamps.
-        for attribute in list(attributes):
-          sqlite_connection.DeleteAttribute(subject, attribute)
-      else:
-        # This code path is taken when we have a timestamp range.
-        start = start or 0
-        if end is None:
-          end = (2**63) - 1  # sys.maxint
-        for attribute in list(attributes):
-          sqlite_connection.DeleteAttributeRange(subject, attribute, start, end)
+      self._DeleteAttributes(sqlite_connection, subject, attributes, start, end)
+
+  def _DeleteAttributes(self, sqlite_connection, subject, attributes, start,
+                        end):
+    """Deletes attributes on an already locked connection."""
+    if start is None and end is None:
+      # This is done when we delete all attributes at once without
+      # caring about timestamps.
+      for attribute in list(attributes):
+        sqlite_connection.DeleteAttribute(subject, attribute)
+    else:
+      # This code path is taken when we have a timestamp range.
+      start = start or 0
+      if end is None:
+        end = (2**63) - 1  # sys.maxint
+      for attribute in list(attributes):
+        sqlite_connection.DeleteAttributeRange(subject, attribute, start, end)
 
   def DeleteSubject(self, subject, sync=False, token=None):
     _ = sync
@@ -725,6 +735,59 @@ class SqliteDataStore(data_store.DataStore):
     with self.cache.Get(subject) as sqlite_connection:
       sqlite_connection.DeleteSubject(subject)
 
+  def ApplyMutations(self, mutation_pool):
+    """Applies the mutations in the pool, grouped by database file.
+
+    Every database file is locked once and committed once, no matter how many
+    subjects in the pool it holds.
+
+    Args:
+      mutation_pool: The MutationPool holding the mutations to apply.
+    """
+    token = mutation_pool.token
+    subjects = set(mutation_pool.delete_subject_requests)
+    subjects.update(req[0] for req in mutation_pool.delete_attributes_requests)
+    subjects.update(req[0] for req in mutation_pool.set_requests)
+    self.security_manager.CheckDataStoreAccess(token, list(subjects), "w")
+
+    for req in mutation_pool.delete_attributes_requests:
+      if isinstance(req[1], basestring):
+        raise ValueError(
+            "String passed to DeleteAttributes (non string iterable expected).")
+
+    # Maps database filename to a list of (operation, args) where operations
+    # are kept in the order they need to be applied. Connections are fetched
+    # again when the operations are applied since the cache may expire them.
+    by_database = {}
+
+    def _Queue(subject, operation, args):
+      filename = self.cache.Get(subject).Filename()
+      by_database.setdefault(filename, []).append((operation,
+                                                   (subject,) + args))
+
+    for subject in mutation_pool.delete_subject_requests:
+      _Queue(subject, "delete_subject", ())
+
+    for subject, attributes, start, end in (
+        mutation_pool.delete_attributes_requests):
+      _Queue(subject, "delete_attributes", (attributes, start, end))
+
+    for subject, values, timestamp, replace, to_delete in (
+        mutation_pool.set_requests):
+      _Queue(subject, "set", (values, timestamp, replace, to_delete))
+
+    for operations in by_database.itervalues():
+      # All the operations for a database share the same connection.
+      _, first_args = operations[0]
+      with self.cache.Get(first_args[0]) as sqlite_connection:
+        for operation, args in operations:
+          if operation == "delete_subject":
+            sqlite_connection.DeleteSubject(*args)
+          elif operation == "delete_attributes":
+            self._DeleteAttributes(sqlite_connection, *args)
+          else:
+            self._MultiSet(sqlite_connection, *args)
+
   def MultiResolvePrefix(self,
                          subjects,
                          attribute_prefix,
@@ -887,6 +950,68 @@ class SqliteDataStore(data_store.DataStore):
             raw_results, key=lambda x: x[0]), max_records):
       yield r
 
+  def QueueClaimRecords(self,
+                        queue_id,
+                        item_rdf_type,
+                        limit=10000,
+                        timeout="30m",
+                        after_urn=None,
+                        record_filter=lambda x: False,
+                        max_filtered=1000,
+                        token=None):
+    """Claims queue records while holding the database of the queue.
+
+    When all the records live in one database file, the scan and the lease
+    writes happen under the lock of that connection and are committed once.
+    Otherwise this falls back to the generic implementation.
+
+    See DataStore.QueueClaimRecords for the arguments.
+
+    Returns:
+      A list of (id, item).
+    """
+    records_prefix = self._CleanSubjectPrefix(
+        rdfvalue.RDFURN(queue_id).Add("Records"))
+    connections = list(self.cache.GetPrefix(records_prefix))
+    if len(connections) != 1:
+      return super(SqliteDataStore, self).QueueClaimRecords(
+          queue_id,
+          item_rdf_type,
+          limit=limit,
+          timeout=timeout,
+          after_urn=after_urn,
+          record_filter=record_filter,
+          max_filtered=max_filtered,
+          token=token)
+
+    self.security_manager.CheckDataStoreAccess(token, [records_prefix], "qrw")
+    after_urn = self._CleanAfterURN(after_urn, records_prefix)
+
+    now = rdfvalue.RDFDatetime.Now()
+    with connections[0] as sqlite_connection:
+      rows = self._GroupSubjects(
+          list(
+              sqlite_connection.ScanAttributes(
+                  records_prefix,
+                  [self.QUEUE_ITEM_ATTRIBUTE, self.QUEUE_LOCK_ATTRIBUTE],
+                  after_urn=after_urn,
+                  max_records=4 * limit)), 4 * limit)
+      records, orphaned = self._SelectQueueRecords(
+          rows, item_rdf_type, now, limit, record_filter, max_filtered)
+
+      for subject in orphaned:
+        sqlite_connection.DeleteAttribute(subject, self.QUEUE_LOCK_ATTRIBUTE)
+
+      expiration = rdfvalue.RDFDatetime.Now() + rdfvalue.Duration(timeout)
+      value = self._Encode(expiration)
+      timestamp = long(time.time() * 1000000)
+      for subject, _ in records:
+        sqlite_connection.DeleteAttribute(subject, self.QUEUE_LOCK_ATTRIBUTE)
+        sqlite_connection.SetAttribute(subject, self.QUEUE_LOCK_ATTRIBUTE,
+                                       value, timestamp)
+
+    return records
+
   def ResolveMulti(self,
                    subject,
                    attributes,
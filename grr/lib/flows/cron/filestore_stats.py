@@ -1,5 +1,5 @@
 #!/usr/bin/env python
-"""Filestore stats crons."""
+"""Filestore stats and maintenance crons."""
 
 from grr.lib import aff4
 from grr.lib import flow
@@ -145,3 +145,17 @@ class FilestoreStatsCronFlow(cronjobs.SystemCronFlow):
       for consumer in self.consumers:
         consumer.Save(self.stats)
       self.stats.Close()
+
+
+class HashFilterRebuildCronFlow(cronjobs.SystemCronFlow):
+  """Rebuilds the bloom filters in front of the hash file stores."""
+  frequency = rdfvalue.Duration("1d")
+  lifetime = rdfvalue.Duration("12h")
+
+  @flow.StateHandler()
+  def Start(self):
+    for path in [filestore.HashFileStore.PATH, filestore.NSRLFileStore.PATH]:
+      store = aff4.FACTORY.Open(
+          path, aff4_type=filestore.HashFileStore, token=self.token)
+      store.RebuildHashFilter()
+      self.HeartBeat()
@@ -82,6 +82,32 @@ class FilestoreStatsCronFlowTest(test_lib.FlowTestsBaseclass):
     self.assertEqual(clientcount.data[2].y_value, 5)
 
 
+class HashFilterRebuildCronFlowTest(test_lib.FlowTestsBaseclass):
+
+  def testFiltersAreBuilt(self):
+    with aff4.FACTORY.Create(
+        "aff4:/files/hash/generic/sha256/" + "a" * 64,
+        aff4_filestore.FileStoreImage,
+        token=self.token):
+      pass
+
+    for _ in test_lib.TestFlowHelper(
+        "HashFilterRebuildCronFlow", token=self.token):
+      pass
+
+    # A new process picks up the filters from the data store.
+    aff4_filestore.HashFilter.FlushCache()
+    hash_fs = aff4.FACTORY.Open(
+        aff4_filestore.HashFileStore.PATH, token=self.token)
+    hash_filter = hash_fs.GetHashFilter()
+    self.assertTrue(hash_filter.MayContain("a" * 64))
+    self.assertFalse(hash_filter.MayContain("b" * 64))
+
+    nsrl_fs = aff4.FACTORY.Open(
+        aff4_filestore.NSRLFileStore.PATH, token=self.token)
+    self.assertIsNotNone(nsrl_fs.GetHashFilter().bloom_filter)
+
+
 def main(argv):
   # Run the full test suite
   test_lib.GrrTestProgram(argv=argv)
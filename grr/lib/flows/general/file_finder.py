@@ -60,7 +60,8 @@ class FileFinder(transfer.MultiGetFileMixin, fingerprint.FingerprintFileMixin,
         type_enum.SIZE: (self.SizeCondition, 0),
         type_enum.CONTENTS_REGEX_MATCH: (self.ContentsRegexMatchCondition, 1),
         type_enum.CONTENTS_LITERAL_MATCH: (self.ContentsLiteralMatchCondition,
-                                           1)
+                                           1),
+        type_enum.CONTENTS_MULTI_MATCH: (self.ContentsMultiMatchCondition, 1)
     }
 
   def _ConditionWeight(self, condition_options):
@@ -216,6 +217,33 @@ class FileFinder(transfer.MultiGetFileMixin, fingerprint.FingerprintFileMixin,
         request_data=dict(
             original_result=response, condition_index=condition_index + 1))
 
+  def ContentsMultiMatchCondition(self, response, condition_options,
+                                  condition_index):
+    """Applies multi pattern match condition to responses."""
+    if not (self.args.process_non_regular_files or
+            stat.S_ISREG(response.stat_entry.st_mode)):
+      return
+
+    options = condition_options.contents_multi_match
+    grep_spec = rdf_client.GrepSpec(
+        target=response.stat_entry.pathspec,
+        literals=options.literals,
+        regexes=options.regexes,
+        mode=options.mode,
+        start_offset=options.start_offset,
+        length=options.length,
+        bytes_before=options.bytes_before,
+        bytes_after=options.bytes_after,
+        xor_in_key=options.xor_in_key,
+        xor_out_key=options.xor_out_key)
+
+    self.CallClient(
+        searching_actions.Grep,
+        request=grep_spec,
+        next_state="ProcessGrep",
+        request_data=dict(
+            original_result=response, condition_index=condition_index + 1))
+
   @flow.StateHandler()
   def ProcessGrep(self, responses):
     for response in responses:
@@ -349,6 +349,38 @@ class TestFileFinderFlow(test_lib.FlowTestsBaseclass):
     self.assertEqual(fd[0].matches[0].data,
                      "MZ\x90\x00\x03\x00\x00\x00\x04\x00\x00\x00\xff")
 
+  def testMultiMatchCondition(self):
+    expected_files = ["auth.log"]
+    non_expected_files = ["dpkg.log", "dpkg_false.log"]
+
+    multi_condition = rdf_file_finder.FileFinderCondition(
+        condition_type=(
+            rdf_file_finder.FileFinderCondition.Type.CONTENTS_MULTI_MATCH),
+        contents_multi_match=(
+            rdf_file_finder.FileFinderContentsMultiMatchCondition(
+                mode="FIRST_HIT",
+                bytes_before=10,
+                bytes_after=10,
+                literals=["not there", "session closed for user dearjohn"],
+                regexes=["session opened for user .*?john"])))
+
+    self.RunFlowAndCheckResults(
+        conditions=[multi_condition],
+        expected_files=expected_files,
+        non_expected_files=non_expected_files)
+
+    fd = aff4.FACTORY.Open(
+        self.last_session_id.Add(flow_runner.RESULTS_SUFFIX),
+        aff4_type=sequential_collection.GeneralIndexedCollection,
+        token=self.token)
+    self.assertEqual(len(fd), 1)
+    self.assertEqual(len(fd[0].matches), 1)
+    self.assertEqual(fd[0].matches[0].offset, 350)
+    self.assertEqual(fd[0].matches[0].data,
+                     "session): session opened for user dearjohn by (uid=0")
+    self.assertEqual(fd[0].matches[0].pattern,
+                     "session opened for user .*?john")
+
   def testRegexMatchConditionWithDifferentActions(self):
     expected_files = ["auth.log"]
     non_expected_files = ["dpkg.log", "dpkg_false.log"]
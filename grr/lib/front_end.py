@@ -9,6 +9,7 @@ import logging
 
 from grr.lib import access_control
 from grr.lib import aff4
+from grr.lib import client_task_hints
 from grr.lib import communicator
 from grr.lib import config_lib
 from grr.lib import data_store
@@ -35,9 +36,44 @@ class ServerCommunicator(communicator.Communicator):
     super(ServerCommunicator, self).__init__(
         certificate=certificate, private_key=private_key)
     self.pub_key_cache = utils.FastStore(max_size=50000)
+    # Session ciphers for encrypting responses, keyed by client. Ciphers are
+    # regenerated once they are older than the rotation time.
+    self.cipher_cache = utils.AgeBasedCache(
+        max_size=config_lib.CONFIG["Frontend.cipher_cache_size"],
+        max_age=config_lib.CONFIG["Frontend.cipher_rotation_time"])
     # Our common name as an RDFURN.
     self.common_name = rdfvalue.RDFURN(self.certificate.GetCN())
 
+  def _GetRemoteCipher(self, destination):
+    """Returns a cached session cipher for sending messages to destination.
+
+    Creating a cipher costs an RSA encryption and an RSA signature, so we reuse
+    the cipher for repeated polls by the same client until it expires.
+
+    Args:
+      destination: The CN of the client we are sending messages to.
+
+    Returns:
+      A communicator.Cipher instance.
+    """
+    remote_public_key = self._GetRemotePublicKey(destination)
+    try:
+      cached_key, cipher = self.cipher_cache.Get(str(destination))
+      # The client may have been enrolled again with a new key.
+      if cached_key is remote_public_key:
+        stats.STATS.IncrementCounter(
+            "grr_frontendserver_cipher_cache", fields=["hits"])
+        return cipher
+    except KeyError:
+      pass
+
+    stats.STATS.IncrementCounter(
+        "grr_frontendserver_cipher_cache", fields=["misses"])
+    cipher = communicator.Cipher(self.common_name, self.private_key,
+                                 remote_public_key)
+    self.cipher_cache.Put(str(destination), (remote_public_key, cipher))
+    return cipher
+
   def _GetRemotePublicKey(self, common_name):
     try:
       # See if we have this client already cached.
@@ -194,6 +230,17 @@ class FrontEndServer(object):
         max_threads=config_lib.CONFIG["Threadpool.size"])
     self.thread_pool.Start()
 
+    # Clients whose queue was found empty, mapped to the time it was read.
+    # Entries expire so that idle clients are still queried regularly.
+    self.idle_clients = utils.AgeBasedCache(
+        max_size=config_lib.CONFIG["Frontend.idle_client_cache_size"],
+        max_age=config_lib.CONFIG["Frontend.task_hint_reconcile_time"])
+    # Clients that were sent tasks recently. Until their lease expires these
+    # tasks can reappear in the queue without being scheduled again.
+    self.leased_clients = utils.AgeBasedCache(
+        max_size=config_lib.CONFIG["Frontend.idle_client_cache_size"],
+        max_age=message_expiry_time)
+
     # Well known flows are run on the front end.
     self.well_known_flows = (
         flow.WellKnownFlow.GetAllWellKnownFlows(token=self.token))
@@ -261,6 +308,31 @@ class FrontEndServer(object):
 
     return source, len(messages)
 
+  def _IsIdle(self, client, queue):
+    """Checks if the client's queue is known to be empty.
+
+    Args:
+       client: The ClientURN object specifying this client.
+       queue: The client's queue.
+
+    Returns:
+       True if the queue was empty on a recent poll and the client task hints
+       show no tasks scheduled since.
+    """
+    if client_task_hints.HINTS is None:
+      return False
+
+    try:
+      idle_since = self.idle_clients.Get(client)
+    except KeyError:
+      return False
+
+    if client_task_hints.HINTS.MayHaveTasks(queue, idle_since):
+      self.idle_clients.ExpireObject(client)
+      return False
+
+    return True
+
   def DrainTaskSchedulerQueueForClient(self, client, max_count):
     """Drains the client's Task Scheduler queue.
 
@@ -283,13 +355,24 @@ class FrontEndServer(object):
       return []
 
     client = rdf_client.ClientURN(client)
+    queue = client.Queue()
+
+    if self._IsIdle(client, queue):
+      stats.STATS.IncrementCounter("grr_frontendserver_idle_polls")
+      return []
 
     start_time = time.time()
     # Drain the queue for this client
     new_tasks = queue_manager.QueueManager(token=self.token).QueryAndOwn(
-        queue=client.Queue(),
-        limit=max_count,
-        lease_seconds=self.message_expiry_time)
+        queue=queue, limit=max_count, lease_seconds=self.message_expiry_time)
+
+    if new_tasks:
+      self.leased_clients.Put(client, start_time)
+    else:
+      try:
+        self.leased_clients.Get(client)
+      except KeyError:
+        self.idle_clients.Put(client, start_time)
 
     initial_ttl = rdf_flows.GrrMessage().task_ttl
     check_before_sending = []
@@ -490,11 +573,18 @@ class FrontendInit(registry.InitHook):
         "frontend_inactive_request_count", fields=[("source", str)])
     stats.STATS.RegisterEventMetric(
         "frontend_request_latency", fields=[("source", str)])
+    # Time complete requests wait for a worker thread.
+    stats.STATS.RegisterEventMetric(
+        "frontend_request_queueing_time", fields=[("source", str)])
 
     stats.STATS.RegisterEventMetric("grr_frontendserver_handle_time")
     stats.STATS.RegisterCounterMetric("grr_frontendserver_handle_num")
+    # Polls answered without reading the client's queue.
+    stats.STATS.RegisterCounterMetric("grr_frontendserver_idle_polls")
     stats.STATS.RegisterGaugeMetric("grr_frontendserver_client_cache_size", int)
     stats.STATS.RegisterCounterMetric("grr_messages_sent")
 
     stats.STATS.RegisterCounterMetric(
         "grr_pub_key_cache", fields=[("type", str)])
+    stats.STATS.RegisterCounterMetric(
+        "grr_frontendserver_cipher_cache", fields=[("type", str)])
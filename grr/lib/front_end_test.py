@@ -4,6 +4,7 @@
 
 
 
+from grr.lib import client_task_hints
 from grr.lib import communicator
 from grr.lib import config_lib
 from grr.lib import data_store
@@ -505,6 +506,77 @@ class GRRFEServerTest(test_lib.FlowTestsBaseclass):
         [True] * 2 + [False] * (rdf_flows.GrrMessage().task_ttl - 2))
 
 
+  def _WriteTaskWithoutHint(self):
+    queue = self.client_id.Queue()
+    task = rdf_flows.GrrMessage(
+        queue=queue, session_id="aff4:/Test", generate_task_id=True)
+    manager = queue_manager.QueueManager(token=self.token)
+    data_store.DB.MultiSet(
+        queue, {manager._TaskIdToColumn(task.task_id):
+                    [task.SerializeToString()]},
+        token=self.token)
+
+  def testIdleClientPollsSkipTheQueue(self):
+    hints = client_task_hints.LocalClientTaskHints(num_buckets=1024)
+    with utils.Stubber(client_task_hints, "HINTS", hints):
+      with test_lib.FakeTime(1000):
+        self.assertEqual(
+            self.server.DrainTaskSchedulerQueueForClient(self.client_id, 5),
+            [])
+
+      # A task not reported to the hints is missed by idle polls.
+      with test_lib.FakeTime(1001):
+        self._WriteTaskWithoutHint()
+        with test_lib.Instrument(queue_manager.QueueManager,
+                                 "QueryAndOwn") as query:
+          self.assertEqual(
+              self.server.DrainTaskSchedulerQueueForClient(self.client_id, 5),
+              [])
+          self.assertEqual(query.call_count, 0)
+
+      # But the queue is read again once the hint is old enough.
+      with test_lib.FakeTime(1000 + 601):
+        tasks = self.server.DrainTaskSchedulerQueueForClient(self.client_id, 5)
+        self.assertEqual(len(tasks), 1)
+
+  def testScheduledTasksAreSentToIdleClients(self):
+    hints = client_task_hints.LocalClientTaskHints(num_buckets=1024)
+    with utils.Stubber(client_task_hints, "HINTS", hints):
+      with test_lib.FakeTime(1000):
+        self.assertEqual(
+            self.server.DrainTaskSchedulerQueueForClient(self.client_id, 5),
+            [])
+
+      with test_lib.FakeTime(1001):
+        task = rdf_flows.GrrMessage(
+            queue=self.client_id.Queue(),
+            session_id="aff4:/Test",
+            generate_task_id=True)
+        queue_manager.QueueManager(token=self.token).Schedule([task])
+
+      with test_lib.FakeTime(1002):
+        tasks = self.server.DrainTaskSchedulerQueueForClient(self.client_id, 5)
+        self.assertEqual(len(tasks), 1)
+
+  def testClientsWithLeasedTasksAreNotIdle(self):
+    hints = client_task_hints.LocalClientTaskHints(num_buckets=1024)
+    with utils.Stubber(client_task_hints, "HINTS", hints):
+      with test_lib.FakeTime(1000):
+        self._WriteTaskWithoutHint()
+        tasks = self.server.DrainTaskSchedulerQueueForClient(self.client_id, 5)
+        self.assertEqual(len(tasks), 1)
+
+      # The task is leased so the queue looks empty.
+      with test_lib.FakeTime(1001):
+        self.assertEqual(
+            self.server.DrainTaskSchedulerQueueForClient(self.client_id, 5),
+            [])
+
+      # Once the lease expires the task is sent again.
+      with test_lib.FakeTime(1000 + self.message_expiry_time + 1):
+        tasks = self.server.DrainTaskSchedulerQueueForClient(self.client_id, 5)
+        self.assertEqual(len(tasks), 1)
+
 def main(args):
   test_lib.main(args)
 
@@ -94,6 +94,118 @@ class HuntResultsMetadata(aff4.AFF4Object):
         versioned=False)
 
 
+class HuntClientStats(object):
+  """Counts of a hunt's clients by status, bucketed by the time of the change.
+
+  The counters live in a single data store row next to the hunt's collections,
+  so the totals and the completion timeline of a hunt are read without reading
+  the clients collections themselves.
+
+  Clients are only registered while the hunt is being processed, which holds
+  the lease on the hunt, so a bucket is updated by reading it once and then
+  overwriting it with the counts kept in memory.
+  """
+
+  STARTED = "started"
+  COMPLETED = "completed"
+  ERRORS = "errors"
+  STATUSES = (STARTED, COMPLETED, ERRORS)
+
+  # Buckets are a second wide, the resolution of the completion timeline.
+  # Only the seconds in which clients changed status take a cell.
+  BUCKET_SIZE = 1
+
+  PREFIX = "hunt_client_stats:"
+  VERSION_ATTRIBUTE = PREFIX + "version"
+  VERSION = 1
+
+  def __init__(self, urn, token=None):
+    self.urn = urn
+    self.token = token
+    self.lock = threading.Lock()
+    # Maps (status, bucket) to the counts already read or written.
+    self.counts = {}
+
+  def _Attribute(self, status, bucket):
+    return "%s%s:%012d" % (self.PREFIX, status, bucket)
+
+  def _Bucket(self, timestamp):
+    return timestamp.AsSecondsFromEpoch() // self.BUCKET_SIZE
+
+  def Initialize(self, mutation_pool):
+    """Marks the counters as maintained for a new hunt."""
+    mutation_pool.Set(self.urn, self.VERSION_ATTRIBUTE, self.VERSION)
+
+  def Add(self, status, timestamp=None):
+    """Counts a client changing to the given status."""
+    if timestamp is None:
+      timestamp = rdfvalue.RDFDatetime.Now()
+
+    bucket = self._Bucket(timestamp)
+    attribute = self._Attribute(status, bucket)
+    with self.lock:
+      count = self.counts.get((status, bucket))
+      if count is None:
+        count, _ = data_store.DB.Resolve(
+            self.urn, attribute, token=self.token)
+
+      count = int(count or 0) + 1
+      data_store.DB.Set(self.urn, attribute, count, token=self.token)
+      self.counts[(status, bucket)] = count
+
+  def Read(self):
+    """Reads the counters.
+
+    Returns:
+      A dict mapping every status to a sorted list of (bucket start time in
+      seconds, count) tuples, or None if the hunt predates the counters.
+    """
+    values = data_store.DB.ResolvePrefix(
+        self.urn,
+        self.PREFIX,
+        timestamp=data_store.DB.NEWEST_TIMESTAMP,
+        token=self.token)
+
+    result = dict((status, []) for status in self.STATUSES)
+    initialized = False
+    for attribute, value, _ in values:
+      if attribute == self.VERSION_ATTRIBUTE:
+        initialized = True
+        continue
+
+      status, bucket = attribute[len(self.PREFIX):].split(":")
+      if status in result:
+        result[status].append((int(bucket) * self.BUCKET_SIZE, int(value)))
+
+    if not initialized:
+      return None
+
+    for buckets in result.values():
+      buckets.sort()
+    return result
+
+  def Rebuild(self, timestamps):
+    """Replaces the counters.
+
+    Args:
+      timestamps: A dict mapping statuses to iterables of RDFDatetime, one for
+        every client that changed to the status.
+    """
+    counts = {}
+    for status, status_timestamps in timestamps.items():
+      for timestamp in status_timestamps:
+        attribute = self._Attribute(status, self._Bucket(timestamp))
+        counts[attribute] = counts.get(attribute, 0) + 1
+
+    values = dict((attribute, [count]) for attribute, count in counts.items())
+    values[self.VERSION_ATTRIBUTE] = [self.VERSION]
+
+    with self.lock:
+      data_store.DB.DeleteSubject(self.urn, sync=True, token=self.token)
+      data_store.DB.MultiSet(self.urn, values, token=self.token)
+      self.counts = {}
+
+
 class HuntRunner(object):
   """The runner for hunts.
 
@@ -927,6 +1039,8 @@ class GRRHunt(flow.FlowBase):
 
   args_type = None
 
+  _client_stats = None
+
   def Initialize(self):
     super(GRRHunt, self).Initialize()
     # Hunts run in multiple threads so we need to protect access.
@@ -974,6 +1088,18 @@ class GRRHunt(flow.FlowBase):
   def clients_with_results_collection_urn(self):
     return self.urn.Add("ClientsWithResults")
 
+  @property
+  def client_stats_urn(self):
+    return self.urn.Add("ClientStats")
+
+  @property
+  def client_stats(self):
+    # The urn of new hunts is only assigned after they are initialized.
+    if self._client_stats is None:
+      self._client_stats = HuntClientStats(
+          self.client_stats_urn, token=self.token)
+    return self._client_stats
+
   @property
   def output_plugins_status_collection_urn(self):
     return self.urn.Add("OutputPluginsStatus")
@@ -1017,9 +1143,11 @@ class GRRHunt(flow.FlowBase):
 
   def RegisterClient(self, client_urn):
     self._AddURNToCollection(client_urn, self.all_clients_collection_urn)
+    self.client_stats.Add(HuntClientStats.STARTED)
 
   def RegisterCompletedClient(self, client_urn):
     self._AddURNToCollection(client_urn, self.completed_clients_collection_urn)
+    self.client_stats.Add(HuntClientStats.COMPLETED)
 
   def RegisterClientWithResults(self, client_urn):
     self._AddURNToCollection(client_urn,
@@ -1031,6 +1159,7 @@ class GRRHunt(flow.FlowBase):
       error.log_message = utils.SmartUnicode(log_message)
 
     self._AddHuntErrorToCollection(error, self.clients_errors_collection_urn)
+    self.client_stats.Add(HuntClientStats.ERRORS)
 
   def OnDelete(self, deletion_pool=None):
     super(GRRHunt, self).OnDelete(deletion_pool=deletion_pool)
@@ -1051,6 +1180,10 @@ class GRRHunt(flow.FlowBase):
     ]
     deletion_pool.MultiMarkForDeletion(symlinks_urns)
 
+    # The client stats row is written directly to the data store, so it is
+    # not indexed as a child of the hunt.
+    deletion_pool.MarkForDeletion(self.client_stats_urn)
+
   @flow.StateHandler()
   def RunClient(self, client_id):
     """This method runs the hunt on a specific client.
@@ -1190,13 +1323,19 @@ class GRRHunt(flow.FlowBase):
                 payload=response, source=client_id) for response in responses
         ]
 
-        for msg in msgs:
-          hunts_results.HuntResultCollection.StaticAdd(
-              self.results_collection_urn, self.token, msg)
+        # Write all results and a single notification for them at once.
+        with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
+          hunts_results.HuntResultCollection.StaticAddMany(
+              self.results_collection_urn,
+              self.token,
+              msgs,
+              mutation_pool=mutation_pool)
 
-        for msg in msgs:
-          multi_type_collection.MultiTypeCollection.StaticAdd(
-              self.multi_type_output_urn, self.token, msg)
+          multi_type_collection.MultiTypeCollection.StaticAddMany(
+              self.multi_type_output_urn,
+              self.token,
+              msgs,
+              mutation_pool=mutation_pool)
 
         if responses:
           self.RegisterClientWithResults(client_id)
@@ -1336,6 +1475,8 @@ class GRRHunt(flow.FlowBase):
           token=self.token):
         pass
 
+    self.client_stats.Initialize(mutation_pool)
+
   def MarkClientDone(self, client_id):
     """Adds a client_id to the list of completed tasks."""
     self.RegisterCompletedClient(client_id)
@@ -1362,6 +1503,14 @@ class GRRHunt(flow.FlowBase):
     """
 
   def GetClientsCounts(self):
+    """Returns the numbers of started, completed and failed clients."""
+    client_stats = self.client_stats.Read()
+    if client_stats is not None:
+      return tuple(
+          sum(count for _, count in client_stats[status])
+          for status in HuntClientStats.STATUSES)
+
+    # Hunts created before the client stats were kept.
     collections = aff4.FACTORY.MultiOpen(
         [
             self.all_clients_collection_urn,
@@ -1409,6 +1558,44 @@ class GRRHunt(flow.FlowBase):
         "OUTSTANDING": outstanding
     }
 
+  def GetClientCompletionStats(self):
+    """Returns when the hunt's clients were started and completed.
+
+    Returns:
+      A (started, completed) tuple. Both are sorted lists of (time in seconds,
+      number of clients) tuples, counting the clients that changed to the
+      status during the second.
+    """
+    client_stats = self.client_stats.Read()
+    if client_stats is not None:
+      return (client_stats[HuntClientStats.STARTED],
+              client_stats[HuntClientStats.COMPLETED])
+
+    # Hunts created before the client stats were kept.
+    clients_by_status = self.GetClientsByStatus()
+    result = []
+    for status in ["STARTED", "COMPLETED"]:
+      histogram = {}
+      for client in clients_by_status[status]:
+        age = client.age.AsSecondsFromEpoch()
+        histogram[age] = histogram.get(age, 0) + 1
+      result.append(sorted(histogram.items()))
+
+    return tuple(result)
+
+  def RebuildClientStats(self):
+    """Recomputes the client stats of the hunt from its collections."""
+    timestamps = {}
+    for status, collection_urn in [
+        (HuntClientStats.STARTED, self.all_clients_collection_urn),
+        (HuntClientStats.COMPLETED, self.completed_clients_collection_urn),
+        (HuntClientStats.ERRORS, self.clients_errors_collection_urn)
+    ]:
+      items = self._GetCollectionItems(collection_urn)
+      timestamps[status] = [item.age for item in items]
+
+    self.client_stats.Rebuild(timestamps)
+
   def GetClientStates(self, client_list, client_chunk=50):
     """Take in a client list and return dicts with their age and hostname."""
     for client_group in utils.Grouper(client_list, client_chunk):
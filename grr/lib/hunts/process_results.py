@@ -2,13 +2,18 @@
 """Cron job to process hunt results.
 """
 
+import threading
+import time
+
 import logging
 
 from grr.lib import aff4
+from grr.lib import config_lib
 from grr.lib import flow
 from grr.lib import output_plugin
 from grr.lib import rdfvalue
 from grr.lib import stats
+from grr.lib import threadpool
 from grr.lib import utils
 
 from grr.lib.aff4_objects import cronjobs
@@ -43,11 +48,81 @@ class ResultsProcessingError(Exception):
     return "\n".join(messages)
 
 
+class _PipelineTask(object):
+  """A call which runs on a thread pool and is waited for later."""
+
+  def __init__(self, target, *args):
+    self.target = target
+    self.args = args
+    self.result = None
+    self.exception = None
+    self.done = threading.Event()
+
+  def Run(self):
+    try:
+      self.result = self.target(*self.args)
+    except Exception as e:  # pylint: disable=broad-except
+      self.exception = e
+    finally:
+      self.done.set()
+
+  def Start(self, pool, name):
+    """Runs the task on the pool, or right away if the pool is None."""
+    if pool is None:
+      self.Run()
+    else:
+      pool.AddTask(
+          target=self.Run, args=(), name=name, blocking=True, inline=False)
+    return self
+
+  def Wait(self, timeout=None):
+    """Waits for the task, returning True if it has finished."""
+    self.done.wait(timeout)
+    return self.done.is_set()
+
+  def GetResult(self):
+    """Waits for the task and returns its result or raises its exception."""
+    self.done.wait()
+    if self.exception is not None:
+      raise self.exception  # pylint: disable=raising-bad-type
+    return self.result
+
+
+class _QueueDepth(object):
+  """Exports the number of items waiting in one stage of the pipeline."""
+
+  def __init__(self, stage):
+    self.stage = stage
+    self.depth = 0
+    self.lock = threading.Lock()
+
+  def Add(self, delta):
+    with self.lock:
+      self.depth += delta
+      stats.STATS.SetGaugeValue(
+          "hunt_results_processing_queue_depth",
+          self.depth,
+          fields=[self.stage])
+
+
 class ProcessHuntResultCollectionsCronFlow(cronjobs.SystemCronFlow):
   """Periodic cron flow that processes hunt results.
 
   The ProcessHuntResultCollectionsCronFlow reads hunt results stored in
   HuntResultCollections and feeds runs output plugins on them.
+
+  Results are processed as a pipeline of stages:
+
+    - claim: notifications are claimed for one hunt at a time, as the
+      notification queue is locked while claiming. With
+      Cron.hunt_results_processing_threads set, several claimed hunts are
+      processed at once.
+    - read: when hunts are processed concurrently, the results of the next
+      batch are read while the output plugins process the current one.
+    - output: with Cron.hunt_output_plugin_threads set, every output plugin
+      type runs on its own thread pool, so a slow plugin only holds up the
+      hunts using it. With Cron.hunt_output_plugin_backoff set, a failing
+      plugin is skipped for an exponentially growing time.
   """
 
   frequency = rdfvalue.Duration("5m")
@@ -58,6 +133,20 @@ class ProcessHuntResultCollectionsCronFlow(cronjobs.SystemCronFlow):
 
   DEFAULT_BATCH_SIZE = 5000
 
+  # Locks on the collection and its metadata are held for this long and
+  # refreshed whenever a batch is done or output plugins take long.
+  LEASE_TIME = 600
+  LEASE_REFRESH_INTERVAL = 60
+
+  MAX_PLUGIN_BACKOFF = 3600
+
+  READER_POOL_NAME = "grr_hunt_results_reader"
+  PROCESSING_POOL_NAME = "grr_hunt_results_processing"
+  PLUGIN_POOL_PREFIX = "grr_hunt_output_plugin_"
+
+  queue_depths = dict(
+      (stage, _QueueDepth(stage)) for stage in ["process", "read", "output"])
+
   def CheckIfRunningTooLong(self):
     if self.args.max_running_time:
       elapsed = (rdfvalue.RDFDatetime.Now().AsSecondsFromEpoch() -
@@ -82,35 +171,146 @@ class ProcessHuntResultCollectionsCronFlow(cronjobs.SystemCronFlow):
       used_plugins.append((plugin_def, plugin_def.GetPluginForState(state)))
     return output_plugins, used_plugins
 
-  def RunPlugins(self, hunt_urn, plugins, results, exceptions_by_plugin):
+  def _GetPool(self, name, threads):
+    if threads <= 0:
+      return None
+
+    # The pool only grows once its queue is full, so all threads are started
+    # right away to run the tasks concurrently.
+    pool = threadpool.ThreadPool.Factory(
+        name, min_threads=threads, max_threads=threads)
+    pool.Start()
+    return pool
+
+  def _RefreshLeases(self, *locked_objects):
+    with self.processing_lock:
+      self.HeartBeat()
+    for obj in locked_objects:
+      obj.UpdateLease(self.LEASE_TIME)
+
+  def _RecordStage(self, stage, start_time, num_results):
+    stats.STATS.RecordEvent(
+        "hunt_results_processing_latency",
+        time.time() - start_time,
+        fields=[stage])
+    stats.STATS.IncrementCounter(
+        "hunt_results_processing_results", delta=num_results, fields=[stage])
+
+  def RunPlugin(self, hunt_urn, plugin_def, plugin, results):
+    """Runs one output plugin on a batch of results.
+
+    Args:
+      hunt_urn: The urn of the hunt the results belong to.
+      plugin_def: The OutputPluginDescriptor of the plugin.
+      plugin: The output plugin.
+      results: A list of the results.
+
+    Returns:
+      A pair of the OutputPluginBatchProcessingStatus and the exception the
+      plugin raised, if any.
+    """
+    try:
+      plugin.ProcessResponses(results)
+      plugin.Flush()
+
+      plugin_status = output_plugin.OutputPluginBatchProcessingStatus(
+          plugin_descriptor=plugin_def,
+          status="SUCCESS",
+          batch_size=len(results))
+      stats.STATS.IncrementCounter(
+          "hunt_results_ran_through_plugin",
+          delta=len(results),
+          fields=[plugin_def.plugin_name])
+      return plugin_status, None
+
+    except Exception as e:  # pylint: disable=broad-except
+      logging.exception("Error processing hunt results: hunt %s, "
+                        "plugin %s", hunt_urn, utils.SmartStr(plugin))
+      self.Log("Error processing hunt results (hunt %s, "
+               "plugin %s): %s" % (hunt_urn, utils.SmartStr(plugin), e))
+      stats.STATS.IncrementCounter(
+          "hunt_output_plugin_errors", fields=[plugin_def.plugin_name])
+
+      plugin_status = output_plugin.OutputPluginBatchProcessingStatus(
+          plugin_descriptor=plugin_def,
+          status="ERROR",
+          summary=utils.SmartStr(e),
+          batch_size=len(results))
+      return plugin_status, e
+
+  def _SkippedPluginStatus(self, hunt_urn, plugin_def, results):
+    """Returns the status of a batch skipped while the plugin backs off."""
+    errors, _ = self.plugin_backoff[(hunt_urn, plugin_def)]
+    stats.STATS.IncrementCounter(
+        "hunt_output_plugin_skipped_batches", fields=[plugin_def.plugin_name])
+    return output_plugin.OutputPluginBatchProcessingStatus(
+        plugin_descriptor=plugin_def,
+        status="ERROR",
+        summary="Skipped after %d consecutive errors." % errors,
+        batch_size=len(results))
+
+  def _UpdateBackoff(self, hunt_urn, plugin_def, failed):
+    key = (hunt_urn, plugin_def)
+    if not failed:
+      self.plugin_backoff.pop(key, None)
+      return
+
+    backoff = config_lib.CONFIG["Cron.hunt_output_plugin_backoff"]
+    if backoff <= 0:
+      return
+
+    errors, _ = self.plugin_backoff.get(key, (0, 0))
+    errors += 1
+    delay = min(backoff * 2**(errors - 1), self.MAX_PLUGIN_BACKOFF)
+    self.plugin_backoff[key] = (errors, time.time() + delay)
+
+  def RunPlugins(self,
+                 hunt_urn,
+                 plugins,
+                 results,
+                 exceptions_by_plugin,
+                 locked_objects=()):
+    """Runs all output plugins of a hunt on a batch of results.
+
+    Args:
+      hunt_urn: The urn of the hunt the results belong to.
+      plugins: A list of (OutputPluginDescriptor, output plugin) pairs.
+      results: A list of the results.
+      exceptions_by_plugin: A dict the exceptions raised by the plugins are
+        added to, keyed by the OutputPluginDescriptor.
+      locked_objects: Locked aff4 objects whose leases are refreshed while
+        waiting for the plugins.
+    """
+    start_time = time.time()
+    threads = config_lib.CONFIG["Cron.hunt_output_plugin_threads"]
+
+    tasks = []
     for plugin_def, plugin in plugins:
-      try:
-        plugin.ProcessResponses(results)
-        plugin.Flush()
-
-        plugin_status = output_plugin.OutputPluginBatchProcessingStatus(
-            plugin_descriptor=plugin_def,
-            status="SUCCESS",
-            batch_size=len(results))
-        stats.STATS.IncrementCounter(
-            "hunt_results_ran_through_plugin",
-            delta=len(results),
-            fields=[plugin_def.plugin_name])
+      _, retry_time = self.plugin_backoff.get((hunt_urn, plugin_def), (0, 0))
+      if time.time() < retry_time:
+        tasks.append((plugin_def, None))
+        continue
 
-      except Exception as e:  # pylint: disable=broad-except
-        logging.exception("Error processing hunt results: hunt %s, "
-                          "plugin %s", hunt_urn, utils.SmartStr(plugin))
-        self.Log("Error processing hunt results (hunt %s, "
-                 "plugin %s): %s" % (hunt_urn, utils.SmartStr(plugin), e))
-        stats.STATS.IncrementCounter(
-            "hunt_output_plugin_errors", fields=[plugin_def.plugin_name])
-
-        plugin_status = output_plugin.OutputPluginBatchProcessingStatus(
-            plugin_descriptor=plugin_def,
-            status="ERROR",
-            summary=utils.SmartStr(e),
-            batch_size=len(results))
-        exceptions_by_plugin.setdefault(plugin_def, []).append(e)
+      pool = self._GetPool(self.PLUGIN_POOL_PREFIX + plugin_def.plugin_name,
+                           threads)
+      self.queue_depths["output"].Add(1)
+      task = _PipelineTask(self.RunPlugin, hunt_urn, plugin_def, plugin,
+                           results)
+      tasks.append((plugin_def, task.Start(
+          pool, "output_plugin_%s" % plugin_def.plugin_name)))
+
+    for plugin_def, task in tasks:
+      if task is None:
+        plugin_status = self._SkippedPluginStatus(hunt_urn, plugin_def, results)
+      else:
+        while not task.Wait(self.LEASE_REFRESH_INTERVAL):
+          self._RefreshLeases(*locked_objects)
+        self.queue_depths["output"].Add(-1)
+
+        plugin_status, exception = task.GetResult()
+        self._UpdateBackoff(hunt_urn, plugin_def, exception is not None)
+        if exception is not None:
+          exceptions_by_plugin.setdefault(plugin_def, []).append(exception)
 
       aff4.FACTORY.Open(
           hunt_urn.Add("OutputPluginsStatus"),
@@ -124,48 +324,130 @@ class ProcessHuntResultCollectionsCronFlow(cronjobs.SystemCronFlow):
             mode="w",
             token=self.token).Add(plugin_status)
 
-  def ProcessOneHunt(self, exceptions_by_hunt):
-    """Reads results for one hunt and process them."""
-    hunt_results_urn, results = (
+    self._RecordStage("output", start_time, len(results))
+
+  def ReadResults(self, collection_obj, batch):
+    """Reads the results of a batch of notifications from the collection."""
+    start_time = time.time()
+    results = list(
+        collection_obj.MultiResolve([(ts, suffix) for (_, ts, suffix) in batch
+                                    ]))
+    self._RecordStage("read", start_time, len(results))
+    return results
+
+  def _ReadBatches(self, collection_obj, notifications, batch_size):
+    """Yields batches of notifications together with their results.
+
+    If the hunt results are processed concurrently, the results of the next
+    batch are read while the current batch is processed.
+
+    Args:
+      collection_obj: The HuntResultCollection.
+      notifications: A list of (id, timestamp, suffix) notification tuples.
+      batch_size: The number of results in a batch.
+
+    Yields:
+      Pairs of a list of notification tuples and a list of their results.
+    """
+    pool = self._GetPool(
+        self.READER_POOL_NAME,
+        config_lib.CONFIG["Cron.hunt_results_processing_threads"])
+
+    batches = utils.Grouper(notifications, batch_size)
+    if pool is None:
+      for batch in batches:
+        yield batch, self.ReadResults(collection_obj, batch)
+      return
+
+    def StartRead(batch):
+      self.queue_depths["read"].Add(1)
+      return _PipelineTask(self.ReadResults, collection_obj, batch).Start(
+          pool, "read_hunt_results")
+
+    next_batch = next(batches, None)
+    next_read = next_batch and StartRead(next_batch)
+    try:
+      while next_batch:
+        batch, read = next_batch, next_read
+        next_batch = next(batches, None)
+        next_read = next_batch and StartRead(next_batch)
+
+        try:
+          results = read.GetResult()
+        finally:
+          self.queue_depths["read"].Add(-1)
+        yield batch, results
+    finally:
+      # If processing stopped early, the read of the next batch is abandoned.
+      if next_batch:
+        self.queue_depths["read"].Add(-1)
+
+  def ClaimNotifications(self):
+    """Claims the result notifications of the next hunt to process."""
+    start_time = time.time()
+    hunt_results_urn, notifications = (
         hunts_results.HuntResultQueue.ClaimNotificationsForCollection(
             start_time=self.args.start_processing_time,
             token=self.token,
             lease_time=self.lifetime))
     logging.debug("Found %d results for hunt %s",
-                  len(results), hunt_results_urn)
-    if not results:
-      return 0
-
+                  len(notifications), hunt_results_urn)
+    self._RecordStage("claim", start_time, len(notifications))
+    return hunt_results_urn, notifications
+
+  def ProcessHuntResults(self, hunt_results_urn, notifications,
+                         exceptions_by_hunt):
+    """Runs the output plugins of one hunt on the claimed results.
+
+    Args:
+      hunt_results_urn: The urn of the hunt's HuntResultCollection.
+      notifications: A list of the claimed (id, timestamp, suffix) tuples.
+      exceptions_by_hunt: A dict the exceptions raised by output plugins are
+        added to.
+
+    Returns:
+      The number of results processed in the last batch.
+    """
     hunt_urn = rdfvalue.RDFURN(hunt_results_urn.Dirname())
     batch_size = self.args.batch_size or self.DEFAULT_BATCH_SIZE
     metadata_urn = hunt_urn.Add("ResultsMetadata")
     exceptions_by_plugin = {}
     num_processed_for_hunt = 0
+    results = []
     with aff4.FACTORY.OpenWithLock(
         hunt_results_urn,
         aff4_type=hunts_results.HuntResultCollection,
-        lease_time=600,
+        lease_time=self.LEASE_TIME,
         token=self.token) as collection_obj:
       with aff4.FACTORY.OpenWithLock(
-          metadata_urn, lease_time=600, token=self.token) as metadata_obj:
+          metadata_urn, lease_time=self.LEASE_TIME,
+          token=self.token) as metadata_obj:
         all_plugins, used_plugins = self.LoadPlugins(metadata_obj)
         num_processed = int(
             metadata_obj.Get(metadata_obj.Schema.NUM_PROCESSED_RESULTS))
-        for batch in utils.Grouper(results, batch_size):
-          results = list(
-              collection_obj.MultiResolve([(ts, suffix)
-                                           for (_, ts, suffix) in batch]))
-          self.RunPlugins(hunt_urn, used_plugins, results, exceptions_by_plugin)
-
+        for batch, results in self._ReadBatches(collection_obj, notifications,
+                                                batch_size):
+          self.RunPlugins(
+              hunt_urn,
+              used_plugins,
+              results,
+              exceptions_by_plugin,
+              locked_objects=(collection_obj, metadata_obj))
+
+          # A notification for a batch of results is only deleted once all
+          # its results are processed.
+          processed_ids = set(record_id for (record_id, _, _) in batch)
+          next_index = num_processed_for_hunt + len(batch)
+          if next_index < len(notifications):
+            processed_ids.discard(notifications[next_index][0])
           hunts_results.HuntResultQueue.DeleteNotifications(
-              [record_id for (record_id, _, _) in batch], token=self.token)
+              list(processed_ids), token=self.token)
           num_processed += len(batch)
           num_processed_for_hunt += len(batch)
-          self.HeartBeat()
-          collection_obj.UpdateLease(600)
+          self._RefreshLeases(collection_obj)
           metadata_obj.Set(
               metadata_obj.Schema.NUM_PROCESSED_RESULTS(num_processed))
-          metadata_obj.UpdateLease(600)
+          metadata_obj.UpdateLease(self.LEASE_TIME)
           if self.CheckIfRunningTooLong():
             logging.warning("Run too long, stopping.")
             break
@@ -175,26 +457,139 @@ class ProcessHuntResultCollectionsCronFlow(cronjobs.SystemCronFlow):
             metadata_obj.Schema.NUM_PROCESSED_RESULTS(num_processed))
 
     if exceptions_by_plugin:
-      for plugin, exceptions in exceptions_by_plugin.items():
-        exceptions_by_hunt.setdefault(hunt_urn, {}).setdefault(
-            plugin, []).extend(exceptions)
+      with self.processing_lock:
+        for plugin, exceptions in exceptions_by_plugin.items():
+          exceptions_by_hunt.setdefault(hunt_urn, {}).setdefault(
+              plugin, []).extend(exceptions)
 
     logging.debug("Processed %d results.", num_processed_for_hunt)
     return len(results)
 
+  def ProcessOneHunt(self, exceptions_by_hunt):
+    """Reads results for one hunt and process them."""
+    hunt_results_urn, notifications = self.ClaimNotifications()
+    if not notifications:
+      return 0
+
+    return self.ProcessHuntResults(hunt_results_urn, notifications,
+                                   exceptions_by_hunt)
+
+  def ProcessHuntsConcurrently(self, exceptions_by_hunt, threads):
+    """Claims hunts one by one and processes up to threads of them at once.
+
+    Notifications claimed for a hunt that is still being processed are
+    processed by the same thread afterwards, as the hunt's collection is
+    locked. Claiming stops once no notifications are left and all claimed
+    hunts are processed.
+
+    Args:
+      exceptions_by_hunt: A dict the exceptions raised by output plugins are
+        added to.
+      threads: The maximum number of hunts to process at once.
+
+    Raises:
+      Exception: The first error processing a hunt, once all hunts are done.
+    """
+    pool = self._GetPool(self.PROCESSING_POOL_NAME, threads)
+    condition = threading.Condition()
+    # Maps the collections being processed to the claimed notifications
+    # waiting for them.
+    waiting = {}
+    # The number of running workers, the number of workers done so far and
+    # the errors they raised.
+    state = dict(running=0, done=0, errors=[])
+
+    def ProcessHunt(hunt_results_urn, notifications):
+      try:
+        while notifications:
+          try:
+            self.ProcessHuntResults(hunt_results_urn, notifications,
+                                    exceptions_by_hunt)
+          finally:
+            self.queue_depths["process"].Add(-1)
+
+          with condition:
+            if waiting[hunt_results_urn]:
+              notifications = waiting[hunt_results_urn].pop(0)
+            else:
+              # Notifications claimed from now on start a new worker.
+              del waiting[hunt_results_urn]
+              notifications = None
+      except Exception as e:  # pylint: disable=broad-except
+        logging.exception("Error processing results of %s", hunt_results_urn)
+        with condition:
+          state["errors"].append(e)
+          # The leases of the dropped notifications expire and they are
+          # claimed again by a later run.
+          dropped = waiting.pop(hunt_results_urn, [])
+          self.queue_depths["process"].Add(-len(dropped))
+      finally:
+        with condition:
+          state["running"] -= 1
+          state["done"] += 1
+          condition.notify_all()
+
+    while not self.CheckIfRunningTooLong():
+      with condition:
+        while state["running"] >= threads:
+          condition.wait()
+        done_before_claim = state["done"]
+
+      hunt_results_urn, notifications = self.ClaimNotifications()
+
+      with condition:
+        if not notifications:
+          if state["done"] != done_before_claim:
+            # New results may have come in while a hunt was processed.
+            continue
+          if not state["running"]:
+            break
+          condition.wait()
+          continue
+
+        self.queue_depths["process"].Add(1)
+        if hunt_results_urn in waiting:
+          waiting[hunt_results_urn].append(notifications)
+          continue
+
+        waiting[hunt_results_urn] = []
+        state["running"] += 1
+
+      pool.AddTask(
+          target=ProcessHunt,
+          args=(hunt_results_urn, notifications),
+          name="process_hunt_results",
+          blocking=True,
+          inline=False)
+
+    with condition:
+      while state["running"]:
+        condition.wait()
+
+    if state["errors"]:
+      raise state["errors"][0]
+
   @flow.StateHandler()
   def Start(self):
     self.start_time = rdfvalue.RDFDatetime.Now()
+    self.processing_lock = threading.RLock()
+    # Maps (hunt urn, OutputPluginDescriptor) to the number of consecutive
+    # errors of the plugin and the time it is run again.
+    self.plugin_backoff = {}
 
     exceptions_by_hunt = {}
     if not self.args.max_running_time:
       self.args.max_running_time = rdfvalue.Duration("%ds" % int(
           ProcessHuntResultCollectionsCronFlow.lifetime.seconds * 0.6))
 
-    while not self.CheckIfRunningTooLong():
-      count = self.ProcessOneHunt(exceptions_by_hunt)
-      if not count:
-        break
+    threads = config_lib.CONFIG["Cron.hunt_results_processing_threads"]
+    if threads > 0:
+      self.ProcessHuntsConcurrently(exceptions_by_hunt, threads)
+    else:
+      while not self.CheckIfRunningTooLong():
+        count = self.ProcessOneHunt(exceptions_by_hunt)
+        if not count:
+          break
 
     if exceptions_by_hunt:
       e = ResultsProcessingError()
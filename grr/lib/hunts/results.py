@@ -2,8 +2,11 @@
 """Classes to store and manage hunt results.
 """
 
+import itertools
+
 from grr.lib import access_control
 from grr.lib import aff4
+from grr.lib import data_store
 from grr.lib import rdfvalue
 from grr.lib import registry
 from grr.lib.aff4_objects import queue as aff4_queue
@@ -23,6 +26,10 @@ class HuntResultQueue(aff4_queue.Queue):
   """A global queue of hunt results which need to be processed."""
   rdf_type = HuntResultNotification
 
+  # The maximum number of results claimed at once. Notifications may stand for
+  # many results each, so the results are counted and not the notifications.
+  MAX_CLAIMED_RESULTS = 100000
+
   @classmethod
   def ClaimNotificationsForCollection(cls,
                                       token=None,
@@ -48,21 +55,31 @@ class HuntResultQueue(aff4_queue.Queue):
       notifications were retrieved for and results is a list of tuples (id,
       timestamp, suffix) where id identifies the notification within the queue
       and (stimestmp, suffix) identifies the GrrMessage within the result
-      collection.
+      collection. Results of the same notification are listed consecutively.
+      Notifications are claimed until they add up to MAX_CLAIMED_RESULTS
+      results.
 
     """
 
     class CollectionFilter(object):
 
-      def __init__(self, collection):
+      def __init__(self, collection, max_results):
         self.collection = collection
+        self.max_results = max_results
+        self.result_count = 0
 
       def FilterRecord(self, notification):
         if self.collection is None:
           self.collection = notification.result_collection_urn
-        return self.collection != notification.result_collection_urn
-
-    f = CollectionFilter(collection)
+        if self.collection != notification.result_collection_urn:
+          return True
+        # The first notification is always claimed, however large it is.
+        if self.result_count >= self.max_results:
+          return True
+        self.result_count += notification.count
+        return False
+
+    f = CollectionFilter(collection, cls.MAX_CLAIMED_RESULTS)
     results = []
     with aff4.FACTORY.OpenWithLock(
         RESULT_NOTIFICATION_QUEUE,
@@ -76,8 +93,10 @@ class HuntResultQueue(aff4_queue.Queue):
           record_filter=f.FilterRecord,
           start_time=start_time,
           timeout=lease_time,
-          limit=100000):
-        results.append((record_id, value.timestamp, value.suffix))
+          limit=cls.MAX_CLAIMED_RESULTS):
+        # A notification may stand for a batch of results.
+        for i in xrange(value.count):
+          results.append((record_id, value.timestamp, value.suffix + i))
     return (f.collection, results)
 
   @classmethod
@@ -112,6 +131,50 @@ class HuntResultCollection(sequential_collection.GrrMessageCollection):
             suffix=ts[1]))
     return ts
 
+  @classmethod
+  def StaticAddMany(cls,
+                    collection_urn,
+                    token,
+                    rdf_values,
+                    mutation_pool=None,
+                    **kwargs):
+    """Adds a batch of results, queueing a single notification for them.
+
+    Args:
+      collection_urn: The urn of the collection to add to.
+      token: The database access token to write with.
+      rdf_values: A list of GrrMessages to add to the collection.
+      mutation_pool: An optional MutationPool object to write to. The
+        notification is written through the same pool, after the results.
+      **kwargs: Keyword arguments to pass through to the underlying database
+        call.
+
+    Returns:
+      A list of (timestamp, suffix) pairs which identify the values within the
+      collection.
+    """
+    pool = mutation_pool or data_store.DB.GetMutationPool(token=token)
+    result = super(HuntResultCollection, cls).StaticAddMany(
+        collection_urn, token, rdf_values, mutation_pool=pool, **kwargs)
+
+    # Results sharing a timestamp have consecutive suffixes.
+    for timestamp, batch in itertools.groupby(result, lambda x: x[0]):
+      batch = list(batch)
+      HuntResultQueue.StaticAdd(
+          RESULT_NOTIFICATION_QUEUE,
+          token,
+          HuntResultNotification(
+              result_collection_urn=collection_urn,
+              timestamp=timestamp,
+              suffix=batch[0][1],
+              count=len(batch)),
+          mutation_pool=pool)
+
+    if not mutation_pool:
+      pool.Flush()
+
+    return result
+
 
 class ResultQueueInitHook(registry.InitHook):
   pre = ["AFF4InitHook"]
@@ -6,6 +6,7 @@ from grr.lib import aff4
 from grr.lib import flags
 from grr.lib import rdfvalue
 from grr.lib import test_lib
+from grr.lib import utils
 from grr.lib.hunts import results as hunts_results
 from grr.lib.rdfvalues import flows as rdf_flows
 
@@ -58,6 +59,69 @@ class ResultTest(test_lib.AFF4ObjectTest):
         values_read.append(message.request_id)
     self.assertEqual(sorted(values_read), range(5))
 
+  def testStaticAddManyQueuesOneNotification(self):
+    collection_urn = rdfvalue.RDFURN(
+        "aff4:/testStaticAddManyQueuesOneNotification/collection")
+    with aff4.FACTORY.Create(
+        collection_urn,
+        aff4_type=hunts_results.HuntResultCollection,
+        mode="w",
+        token=self.token):
+      pass
+    hunts_results.HuntResultCollection.StaticAddMany(
+        collection_urn, self.token,
+        [rdf_flows.GrrMessage(request_id=i) for i in range(5)])
+
+    # The results of the batch share a single notification.
+    results = hunts_results.HuntResultQueue.ClaimNotificationsForCollection(
+        token=self.token)
+    self.assertEqual(collection_urn, results[0])
+    self.assertEqual(5, len(results[1]))
+    self.assertEqual(1, len(set(record_id for record_id, _, _ in results[1])))
+
+    with aff4.FACTORY.Create(
+        collection_urn,
+        aff4_type=hunts_results.HuntResultCollection,
+        mode="r",
+        token=self.token) as collection:
+      values_read = [message.request_id for message in collection.MultiResolve(
+          [(ts, suffix) for (_, ts, suffix) in results[1]])]
+    self.assertEqual(sorted(values_read), range(5))
+
+  def testClaimIsLimitedByResultCount(self):
+    collection_urn = rdfvalue.RDFURN(
+        "aff4:/testClaimIsLimitedByResultCount/collection")
+    with aff4.FACTORY.Create(
+        collection_urn,
+        aff4_type=hunts_results.HuntResultCollection,
+        mode="w",
+        token=self.token):
+      pass
+    for batch in range(4):
+      hunts_results.HuntResultCollection.StaticAddMany(
+          collection_urn, self.token,
+          [rdf_flows.GrrMessage(request_id=batch * 6 + i) for i in range(6)])
+
+    # Notifications are claimed until they stand for at least 10 results.
+    with utils.Stubber(hunts_results.HuntResultQueue, "MAX_CLAIMED_RESULTS",
+                       10):
+      results_1 = (
+          hunts_results.HuntResultQueue.ClaimNotificationsForCollection(
+              token=self.token))
+      self.assertEqual(12, len(results_1[1]))
+      self.assertEqual(2,
+                       len(set(record_id for record_id, _, _ in results_1[1])))
+
+      results_2 = (
+          hunts_results.HuntResultQueue.ClaimNotificationsForCollection(
+              token=self.token))
+      self.assertEqual(12, len(results_2[1]))
+
+      results_3 = (
+          hunts_results.HuntResultQueue.ClaimNotificationsForCollection(
+              token=self.token))
+      self.assertEqual(0, len(results_3[1]))
+
   def testNotificationClaimsTimeout(self):
     collection_urn = "aff4:/testNotificationClaimsTimeout/collection"
     with aff4.FACTORY.Create(
@@ -699,5 +699,13 @@ class StandardHuntInitHook(registry.InitHook):
         "hunt_output_plugin_errors", fields=[("plugin", str)])
     stats.STATS.RegisterCounterMetric(
         "hunt_results_ran_through_plugin", fields=[("plugin", str)])
+    stats.STATS.RegisterCounterMetric(
+        "hunt_output_plugin_skipped_batches", fields=[("plugin", str)])
+    stats.STATS.RegisterCounterMetric(
+        "hunt_results_processing_results", fields=[("stage", str)])
+    stats.STATS.RegisterEventMetric(
+        "hunt_results_processing_latency", fields=[("stage", str)])
+    stats.STATS.RegisterGaugeMetric(
+        "hunt_results_processing_queue_depth", int, fields=[("stage", str)])
     stats.STATS.RegisterCounterMetric("hunt_results_compacted")
     stats.STATS.RegisterCounterMetric("hunt_results_compaction_locking_errors")
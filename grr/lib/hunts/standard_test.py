@@ -4,6 +4,7 @@
 
 
 import math
+import threading
 import time
 
 
@@ -79,6 +80,29 @@ class LongRunningDummyHuntOutputPlugin(output_plugin.OutputPlugin):
     time.time = lambda: 100
 
 
+class ConcurrentDummyHuntOutputPlugin(output_plugin.OutputPlugin):
+  """Waits until two instances process results at the same time."""
+  lock = threading.Lock()
+  num_running = 0
+  all_running = threading.Event()
+  ran_concurrently = []
+
+  def ProcessResponses(self, unused_responses):
+    cls = ConcurrentDummyHuntOutputPlugin
+    with cls.lock:
+      cls.num_running += 1
+      if cls.num_running == 2:
+        cls.all_running.set()
+
+    cls.ran_concurrently.append(cls.all_running.wait(10))
+
+
+class SlowDummyHuntOutputPlugin(output_plugin.OutputPlugin):
+
+  def ProcessResponses(self, unused_responses):
+    time.sleep(0.1)
+
+
 class VerifiableDummyHuntOutputPlugin(output_plugin.OutputPlugin):
 
   def ProcessResponses(self, unused_responses):
@@ -390,6 +414,46 @@ class StandardHuntTest(test_lib.FlowTestsBaseclass, StandardHuntTestMixin):
       self.assertEqual(finished, 0)
       self.assertEqual(errors, 0)
 
+  def _RunHuntOnClientsOneByOne(self):
+    with test_lib.FakeTime(1000):
+      hunt_urn = self.StartHunt()
+
+    for i, client_id in enumerate(self.client_ids):
+      with test_lib.FakeTime(1010 + i * 10):
+        self.AssignTasksToClients([client_id])
+        # Every other client does not have the file.
+        self.RunHunt(client_ids=[client_id], failrate=1 + i % 2)
+
+    return hunt_urn
+
+  def testClientStatsAreUpdatedAsClientsProgress(self):
+    hunt_urn = self._RunHuntOnClientsOneByOne()
+
+    hunt_obj = aff4.FACTORY.Open(hunt_urn, token=self.token)
+    with utils.Stubber(hunt_obj, "GetClientsByStatus", None):
+      self.assertEqual(hunt_obj.GetClientsCounts(), (10, 10, 5))
+      timeline = [(1010 + i * 10, 1) for i in range(10)]
+      self.assertEqual(hunt_obj.GetClientCompletionStats(),
+                       (timeline, timeline))
+
+  def testClientStatsAreReadFromCollectionsUntilRebuilt(self):
+    hunt_urn = self._RunHuntOnClientsOneByOne()
+
+    hunt_obj = aff4.FACTORY.Open(hunt_urn, token=self.token)
+    expected_stats = hunt_obj.GetClientCompletionStats()
+
+    # Hunts created before the client stats were kept have none.
+    data_store.DB.DeleteSubject(
+        hunt_obj.client_stats_urn, sync=True, token=self.token)
+    self.assertIsNone(hunt_obj.client_stats.Read())
+    self.assertEqual(hunt_obj.GetClientsCounts(), (10, 10, 5))
+    self.assertEqual(hunt_obj.GetClientCompletionStats(), expected_stats)
+
+    hunt_obj.RebuildClientStats()
+    with utils.Stubber(hunt_obj, "GetClientsByStatus", None):
+      self.assertEqual(hunt_obj.GetClientsCounts(), (10, 10, 5))
+      self.assertEqual(hunt_obj.GetClientCompletionStats(), expected_stats)
+
   def testProcessHunResultsCronFlowDoesNothingWhenThereAreNoResults(self):
     # There's no hunt, nothing. Just assert that cron job completes
     # successfully.
@@ -848,6 +912,196 @@ class StandardHuntTest(test_lib.FlowTestsBaseclass, StandardHuntTestMixin):
     self.assertEqual(10, self.num_processed)
     del self.num_processed
 
+  def testHuntsAreProcessedConcurrently(self):
+    ConcurrentDummyHuntOutputPlugin.num_running = 0
+    ConcurrentDummyHuntOutputPlugin.all_running.clear()
+    ConcurrentDummyHuntOutputPlugin.ran_concurrently = []
+
+    for _ in range(2):
+      self.StartHunt(output_plugins=[
+          output_plugin.OutputPluginDescriptor(
+              plugin_name="ConcurrentDummyHuntOutputPlugin")
+      ])
+
+    self.AssignTasksToClients()
+    self.RunHunt(failrate=-1)
+    with test_lib.ConfigOverrider({
+        "Cron.hunt_results_processing_threads": 2,
+        "Cron.hunt_output_plugin_threads": 2
+    }):
+      self.ProcessHuntOutputPlugins()
+
+    self.assertEqual(ConcurrentDummyHuntOutputPlugin.ran_concurrently,
+                     [True, True])
+
+  def testConcurrentProcessingProcessesAllBatches(self):
+    self.StartHunt(output_plugins=[
+        output_plugin.OutputPluginDescriptor(
+            plugin_name="DummyHuntOutputPlugin")
+    ])
+    self.StartHunt(output_plugins=[
+        output_plugin.OutputPluginDescriptor(
+            plugin_name="StatefulDummyHuntOutputPlugin")
+    ])
+
+    self.AssignTasksToClients()
+    self.RunHunt(failrate=-1)
+    with test_lib.ConfigOverrider({
+        "Cron.hunt_results_processing_threads": 3,
+        "Cron.hunt_output_plugin_threads": 2
+    }):
+      self.ProcessHuntOutputPlugins(batch_size=3)
+
+    self.assertEqual(DummyHuntOutputPlugin.num_calls, 4)
+    self.assertEqual(DummyHuntOutputPlugin.num_responses, 10)
+    self.assertListEqual(StatefulDummyHuntOutputPlugin.data, [0, 1, 2, 3])
+
+  def testHuntResultsArrivingDuringConcurrentProcessingAreHandled(self):
+    self.StartHunt(output_plugins=[
+        output_plugin.OutputPluginDescriptor(
+            plugin_name="DummyHuntOutputPlugin")
+    ])
+
+    self.num_processed = 0
+
+    def ProcessResponsesStub(_, responses):
+      if not self.num_processed:
+        self.AssignTasksToClients(self.client_ids[5:])
+        self.RunHunt(failrate=-1)
+      self.num_processed += len(responses)
+
+    with utils.Stubber(DummyHuntOutputPlugin, "ProcessResponses",
+                       ProcessResponsesStub):
+      self.AssignTasksToClients(self.client_ids[:5])
+      self.RunHunt(failrate=-1)
+      with test_lib.ConfigOverrider({
+          "Cron.hunt_results_processing_threads": 2
+      }):
+        self.ProcessHuntOutputPlugins()
+
+    self.assertEqual(10, self.num_processed)
+    del self.num_processed
+
+  @mock.patch.object(
+      FailingDummyHuntOutputPlugin,
+      "ProcessResponses",
+      side_effect=RuntimeError("Oh, no"))
+  def testFailingOutputPluginIsSkippedWhileBackingOff(self,
+                                                      process_responses_mock):
+    hunt_urn = self.StartHunt(output_plugins=[
+        output_plugin.OutputPluginDescriptor(
+            plugin_name="FailingDummyHuntOutputPlugin"),
+        output_plugin.OutputPluginDescriptor(
+            plugin_name="DummyHuntOutputPlugin")
+    ])
+
+    self.AssignTasksToClients()
+    self.RunHunt(failrate=-1)
+
+    prev_skipped_count = stats.STATS.GetMetricValue(
+        "hunt_output_plugin_skipped_batches",
+        fields=["FailingDummyHuntOutputPlugin"])
+    with test_lib.ConfigOverrider({"Cron.hunt_output_plugin_backoff": 60}):
+      with self.assertRaises(process_results.ResultsProcessingError) as e:
+        self.ProcessHuntOutputPlugins(batch_size=1)
+
+    self.assertEqual(process_responses_mock.call_count, 1)
+    self.assertEqual(len(e.exception.exceptions_by_hunt[hunt_urn].values()[0]),
+                     1)
+    self.assertEqual(DummyHuntOutputPlugin.num_calls, 10)
+
+    skipped_count = stats.STATS.GetMetricValue(
+        "hunt_output_plugin_skipped_batches",
+        fields=["FailingDummyHuntOutputPlugin"])
+    self.assertEqual(skipped_count - prev_skipped_count, 9)
+
+    errors = aff4.FACTORY.Open(
+        hunt_urn.Add("OutputPluginsErrors"),
+        aff4_type=implementation.PluginStatusCollection,
+        token=self.token)
+    self.assertEqual(len(errors), 10)
+    self.assertEqual(
+        sorted(set(status.summary for status in errors)),
+        ["Oh, no", "Skipped after 1 consecutive errors."])
+
+  def testLeasesAreRefreshedWhileOutputPluginsRun(self):
+    self.StartHunt(output_plugins=[
+        output_plugin.OutputPluginDescriptor(
+            plugin_name="SlowDummyHuntOutputPlugin")
+    ])
+    self.AssignTasksToClients(self.client_ids[:1])
+    self.RunHunt(failrate=-1)
+
+    refreshed_objects = []
+
+    def RefreshLeases(_, *locked_objects):
+      refreshed_objects.append(len(locked_objects))
+
+    cron_cls = process_results.ProcessHuntResultCollectionsCronFlow
+    with utils.MultiStubber(
+        (cron_cls, "LEASE_REFRESH_INTERVAL", 0.01),
+        (cron_cls, "_RefreshLeases", RefreshLeases)):
+      with test_lib.ConfigOverrider({"Cron.hunt_output_plugin_threads": 1}):
+        self.ProcessHuntOutputPlugins()
+
+    # The collection and its metadata are refreshed while the plugin runs,
+    # and the collection once more after the batch.
+    self.assertIn(2, refreshed_objects)
+    self.assertEqual(refreshed_objects[-1], 1)
+
+  def testUpdatesPipelineStatsCounters(self):
+    self.StartHunt(output_plugins=[
+        output_plugin.OutputPluginDescriptor(
+            plugin_name="DummyHuntOutputPlugin")
+    ])
+    self.AssignTasksToClients()
+    self.RunHunt(failrate=-1)
+
+    stages = ["claim", "read", "output"]
+    prev_counts = [
+        stats.STATS.GetMetricValue(
+            "hunt_results_processing_results", fields=[stage])
+        for stage in stages
+    ]
+    with test_lib.ConfigOverrider({
+        "Cron.hunt_results_processing_threads": 2,
+        "Cron.hunt_output_plugin_threads": 2
+    }):
+      self.ProcessHuntOutputPlugins(batch_size=4)
+
+    counts = [
+        stats.STATS.GetMetricValue(
+            "hunt_results_processing_results", fields=[stage])
+        for stage in stages
+    ]
+    self.assertEqual([c - p for c, p in zip(counts, prev_counts)], [10] * 3)
+    for stage in ["process", "read", "output"]:
+      self.assertEqual(
+          stats.STATS.GetMetricValue(
+              "hunt_results_processing_queue_depth", fields=[stage]), 0)
+
+  def testStoppingEarlyAbandonsPrefetchedRead(self):
+    self.StartHunt(output_plugins=[
+        output_plugin.OutputPluginDescriptor(
+            plugin_name="DummyHuntOutputPlugin")
+    ])
+    self.AssignTasksToClients()
+    self.RunHunt(failrate=-1)
+
+    # Stop after the first batch while the second one is being read.
+    cron_cls = process_results.ProcessHuntResultCollectionsCronFlow
+    with utils.Stubber(cron_cls, "CheckIfRunningTooLong",
+                       lambda _: DummyHuntOutputPlugin.num_calls > 0):
+      with test_lib.ConfigOverrider({
+          "Cron.hunt_results_processing_threads": 2
+      }):
+        self.ProcessHuntOutputPlugins(batch_size=3)
+
+    self.assertEqual(DummyHuntOutputPlugin.num_calls, 1)
+    self.assertEqual(
+        stats.STATS.GetMetricValue(
+            "hunt_results_processing_queue_depth", fields=["read"]), 0)
+
   def _AppendFlowRequest(self, flows, client_id, file_id):
     flows.Append(
         client_ids=["C.1%015d" % client_id],
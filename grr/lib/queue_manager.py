@@ -7,15 +7,19 @@ import collections
 import os
 import random
 import socket
+import threading
 import time
 
 import logging
 
+from grr.lib import client_task_hints
 from grr.lib import config_lib
 from grr.lib import data_store
+from grr.lib import queue_notifier
 from grr.lib import rdfvalue
 from grr.lib import registry
 from grr.lib import stats
+from grr.lib import threadpool
 from grr.lib import utils
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import flows as rdf_flows
@@ -89,8 +93,11 @@ class QueueManager(object):
 
   notification_shard_counters = {}
 
-  def __init__(self, store=None, token=None):
+  def __init__(self, store=None, token=None, worker_pool=None):
     self.token = token
+    # If set, notifications are only read from the shards the worker_pool
+    # assigns to this worker.
+    self.worker_pool = worker_pool
     if store is None:
       store = data_store.DB
 
@@ -105,11 +112,18 @@ class QueueManager(object):
     self.client_messages_to_delete = {}
     self.new_client_messages = []
     self.notifications = {}
+    # Queues whose workers should be woken up once pending writes are flushed.
+    self.queues_to_wake = set()
+    # Queues that got new tasks, reported to the client task hints once the
+    # tasks are written.
+    self.queues_with_new_tasks = set()
 
     self.prev_frozen_timestamps = []
     self.frozen_timestamp = None
 
     self.num_notification_shards = config_lib.CONFIG["Worker.queue_shards"]
+    self.notification_fetch_threads = config_lib.CONFIG[
+        "Worker.notification_fetch_threads"]
 
   def GetNotificationShard(self, queue):
     queue_name = str(queue)
@@ -123,6 +137,22 @@ class QueueManager(object):
     else:
       return queue
 
+  def _GetNotificationShardToRead(self, queue):
+    """Returns the next shard to read notifications from or None."""
+    if self.worker_pool is None:
+      return self.GetNotificationShard(queue)
+
+    queue_shards = self.worker_pool.GetShardsToRead(
+        self.GetAllNotificationShards(queue))
+    if not queue_shards:
+      return None
+
+    queue_name = str(queue)
+    QueueManager.notification_shard_counters.setdefault(queue_name, 0)
+    QueueManager.notification_shard_counters[queue_name] += 1
+    return queue_shards[QueueManager.notification_shard_counters[queue_name] %
+                        len(queue_shards)]
+
   def GetAllNotificationShards(self, queue):
     result = [queue]
     for i in range(1, self.num_notification_shards):
@@ -137,7 +167,8 @@ class QueueManager(object):
     NOTE: pending writes/deletions are not copied. On the other hand, if the
     original object has a frozen timestamp, a copy will have it as well.
     """
-    result = QueueManager(store=self.data_store, token=self.token)
+    result = QueueManager(
+        store=self.data_store, token=self.token, worker_pool=self.worker_pool)
     result.prev_frozen_timestamps = self.prev_frozen_timestamps
     result.frozen_timestamp = self.frozen_timestamp
     return result
@@ -410,12 +441,15 @@ class QueueManager(object):
               timestamp=timestamp,
               mutation_pool=mutation_pool)
 
+    self._RecordNewTasks()
+
     if self.notifications:
       for notification, timestamp in self.notifications.itervalues():
         self.NotifyQueue(
             notification, timestamp=timestamp, mutation_pool=mutation_pool)
 
       mutation_pool.Flush()
+      self._WakeWorkers()
 
     self.to_write = {}
     self.to_delete = {}
@@ -523,6 +557,12 @@ class QueueManager(object):
     if timestamp is None:
       timestamp = self.frozen_timestamp
 
+    # The hints are published right after the writes below, so they must not be
+    # deferred by the data store. Writes to a mutation pool are hinted only once
+    # the pool is flushed.
+    if client_task_hints.HINTS is not None and client_task_hints.HINTS.enabled:
+      sync = True
+
     for queue, queued_tasks in utils.GroupBy(tasks,
                                              lambda x: x.queue).iteritems():
       if queue:
@@ -530,6 +570,7 @@ class QueueManager(object):
                              [task.SerializeToString()])
                             for task in queued_tasks])
 
+        self.queues_with_new_tasks.add(queue)
         if mutation_pool:
           mutation_pool.MultiSet(queue, to_schedule, timestamp=timestamp)
         else:
@@ -540,6 +581,20 @@ class QueueManager(object):
               sync=sync,
               token=self.token)
 
+    if not mutation_pool:
+      self._RecordNewTasks()
+
+  def _RecordNewTasks(self):
+    """Tells the client task hints about queues that have new tasks.
+
+    This must only be called once the tasks are written, otherwise a client
+    polling in between may be considered idle.
+    """
+    if self.queues_with_new_tasks and client_task_hints.HINTS is not None:
+      client_task_hints.HINTS.Scheduled(sorted(self.queues_with_new_tasks))
+
+    self.queues_with_new_tasks = set()
+
   def _SortByPriority(self, notifications, queue, output_dict=None):
     """Sort notifications by priority into output_dict."""
     if output_dict is None:
@@ -565,10 +620,40 @@ class QueueManager(object):
     """Retrieves session ids for processing grouped by priority."""
     # Check which sessions have new data.
     # Read all the sessions that have notifications.
-    queue_shard = self.GetNotificationShard(queue)
+    queue_shard = self._GetNotificationShardToRead(queue)
+    if queue_shard is None:
+      return {}
+
     return self._SortByPriority(
         self._GetUnsortedNotifications(queue_shard).values(), queue)
 
+  def MultiGetNotificationsByPriority(self, queues):
+    """Retrieves notifications grouped by priority for a number of queues.
+
+    One notification shard is picked for every queue, just like
+    GetNotificationsByPriority does. The shards are fetched concurrently if
+    Worker.notification_fetch_threads is set.
+
+    Args:
+      queues: A list of queue urns.
+    Returns:
+      A dict mapping each queue to a dict of notifications keyed by priority.
+    """
+    result = dict((queue, {}) for queue in queues)
+    queues_to_read = []
+    queue_shards = []
+    for queue in queues:
+      queue_shard = self._GetNotificationShardToRead(queue)
+      if queue_shard is not None:
+        queues_to_read.append(queue)
+        queue_shards.append(queue_shard)
+
+    for queue, notifications in zip(
+        queues_to_read, self._MultiGetUnsortedNotifications(queue_shards)):
+      result[queue] = self._SortByPriority(notifications.values(), queue)
+
+    return result
+
   def GetNotificationsByPriorityForAllShards(self, queue):
     """Same as GetNotificationsByPriority but for all shards.
 
@@ -579,16 +664,15 @@ class QueueManager(object):
     Returns:
       dict of notifications objects keyed by priority.
     """
-    output_dict = {}
-    for queue_shard in self.GetAllNotificationShards(queue):
-      self._GetUnsortedNotifications(
-          queue_shard, notifications_by_session_id=output_dict)
-
+    output_dict = self._GetUnsortedNotificationsForAllShards(queue)
     return self._SortByPriority(output_dict.values(), queue)
 
   def GetNotifications(self, queue):
     """Returns all queue notifications sorted by priority."""
-    queue_shard = self.GetNotificationShard(queue)
+    queue_shard = self._GetNotificationShardToRead(queue)
+    if queue_shard is None:
+      return []
+
     notifications = self._GetUnsortedNotifications(queue_shard).values()
     notifications.sort(
         key=lambda notification: notification.priority, reverse=True)
@@ -604,32 +688,124 @@ class QueueManager(object):
     Returns:
       List of rdf_flows.GrrNotification objects
     """
-    notifications_by_session_id = {}
-    for queue_shard in self.GetAllNotificationShards(queue):
-      notifications_by_session_id = self._GetUnsortedNotifications(
-          queue_shard, notifications_by_session_id=notifications_by_session_id)
+    notifications_by_session_id = self._GetUnsortedNotificationsForAllShards(
+        queue)
 
     notifications = notifications_by_session_id.values()
     notifications.sort(
         key=lambda notification: notification.priority, reverse=True)
     return notifications
 
+  def _GetUnsortedNotificationsForAllShards(self, queue):
+    """Returns notifications of all shards of a queue keyed by session id."""
+    notifications_by_session_id = {}
+    for shard_notifications in self._MultiGetUnsortedNotifications(
+        self.GetAllNotificationShards(queue)):
+      for notification in shard_notifications.itervalues():
+        self._MergeNotification(notification, notifications_by_session_id)
+
+    return notifications_by_session_id
+
+  def _MultiGetUnsortedNotifications(self, queue_shards):
+    """Fetches the notifications of a number of queue shards.
+
+    If Worker.notification_fetch_threads is set, the shards are scanned
+    concurrently on a shared thread pool so that a pass over many shards costs
+    roughly one data store round trip instead of one per shard.
+
+    Args:
+      queue_shards: A list of queue shard urns.
+    Returns:
+      A list of dicts of notifications keyed by session id, one for every
+      queue shard in the order given.
+
+    Raises:
+      Exception: Any error raised while scanning one of the shards.
+    """
+    # All the shards are read with the same upper bound so the result is a
+    # consistent snapshot even if the timestamp is not frozen.
+    end_time = self.frozen_timestamp or rdfvalue.RDFDatetime.Now()
+
+    if self.notification_fetch_threads <= 0 or len(queue_shards) < 2:
+      return [
+          self._GetUnsortedNotifications(
+              queue_shard, end_time=end_time) for queue_shard in queue_shards
+      ]
+
+    pool = threadpool.ThreadPool.Factory(
+        "grr_notification_fetcher",
+        min_threads=1,
+        max_threads=self.notification_fetch_threads)
+    pool.Start()
+
+    results = [None] * len(queue_shards)
+    errors = []
+    finished = threading.Semaphore(0)
+
+    def FetchShard(index, queue_shard):
+      try:
+        results[index] = self._GetUnsortedNotifications(
+            queue_shard, end_time=end_time)
+      except Exception as e:  # pylint: disable=broad-except
+        errors.append(e)
+      finally:
+        finished.release()
+
+    for index, queue_shard in enumerate(queue_shards):
+      pool.AddTask(
+          target=FetchShard,
+          args=(index, queue_shard),
+          name="fetch_notifications_%s" % queue_shard)
+
+    for _ in queue_shards:
+      finished.acquire()
+
+    if errors:
+      raise errors[0]
+
+    return results
+
+  def _MergeNotification(self, notification, notifications_by_session_id):
+    """Adds a notification unless a more recent one is already present."""
+    existing = notifications_by_session_id.get(notification.session_id)
+    if existing:
+      # If we have a notification for this session_id already, we only store
+      # the one that was scheduled last.
+      if notification.first_queued > existing.first_queued:
+        notifications_by_session_id[notification.session_id] = notification
+      elif notification.first_queued == existing.first_queued and (
+          notification.last_status > existing.last_status):
+        # Multiple notifications with the same timestamp should not happen.
+        # We can still do the correct thing and use the latest one.
+        logging.warn(
+            "Notifications with equal first_queued fields detected: %s %s",
+            notification, existing)
+        notifications_by_session_id[notification.session_id] = notification
+    else:
+      notifications_by_session_id[notification.session_id] = notification
+
   def _GetUnsortedNotifications(self,
                                 queue_shard,
-                                notifications_by_session_id=None):
+                                notifications_by_session_id=None,
+                                end_time=None):
     """Returns all the available notifications for a queue_shard.
 
     Args:
       queue_shard: urn of queue shard
       notifications_by_session_id: store notifications in this dict rather than
         creating a new one
+      end_time: only return notifications written up to this time. Defaults
+        to the frozen timestamp or the current time.
 
     Returns:
       dict of notifications. keys are session ids.
     """
     if notifications_by_session_id is None:
       notifications_by_session_id = {}
-    end_time = self.frozen_timestamp or rdfvalue.RDFDatetime.Now()
+    if end_time is None:
+      end_time = self.frozen_timestamp or rdfvalue.RDFDatetime.Now()
+
+    fetch_start = time.time()
     for predicate, serialized_notification, ts in self.data_store.ResolvePrefix(
         queue_shard,
         self.NOTIFY_PREDICATE_PREFIX,
@@ -660,22 +836,12 @@ class QueueManager(object):
       notification.session_id = session_id
       notification.timestamp = ts
 
-      existing = notifications_by_session_id.get(notification.session_id)
-      if existing:
-        # If we have a notification for this session_id already, we only store
-        # the one that was scheduled last.
-        if notification.first_queued > existing.first_queued:
-          notifications_by_session_id[notification.session_id] = notification
-        elif notification.first_queued == existing.first_queued and (
-            notification.last_status > existing.last_status):
-          # Multiple notifications with the same timestamp should not happen.
-          # We can still do the correct thing and use the latest one.
-          logging.warn(
-              "Notifications with equal first_queued fields detected: %s %s",
-              notification, existing)
-          notifications_by_session_id[notification.session_id] = notification
-      else:
-        notifications_by_session_id[notification.session_id] = notification
+      self._MergeNotification(notification, notifications_by_session_id)
+
+    stats.STATS.RecordEvent(
+        "notification_shard_fetch_latency",
+        time.time() - fetch_start,
+        fields=[queue_shard.Path()])
 
     return notifications_by_session_id
 
@@ -741,6 +907,9 @@ class QueueManager(object):
     for session_id, data in serialized_notifications.iteritems():
       values[self.NOTIFY_PREDICATE_TEMPLATE % session_id] = [(data, timestamp)]
 
+    if values:
+      self.queues_to_wake.add(queue)
+
     if mutation_pool:
       mutation_pool.MultiSet(
           self.GetNotificationShard(queue), values, replace=False)
@@ -751,6 +920,18 @@ class QueueManager(object):
           sync=sync,
           replace=False,
           token=self.token)
+      self._WakeWorkers()
+
+  def _WakeWorkers(self):
+    """Tells idle workers about queues that have new notifications.
+
+    This must only be called once the notifications are written, otherwise a
+    worker may wake up before it can see them.
+    """
+    if self.queues_to_wake and queue_notifier.NOTIFIER is not None:
+      queue_notifier.NOTIFIER.Notify(sorted(self.queues_to_wake))
+
+    self.queues_to_wake = set()
 
   def DeleteNotification(self, session_id, start=None, end=None):
     self.DeleteNotifications([session_id], start=start, end=end)
@@ -964,3 +1145,5 @@ class QueueManagerInit(registry.InitHook):
         "notification_queue_count",
         int,
         fields=[("queue_name", str), ("priority", str)])
+    stats.STATS.RegisterEventMetric(
+        "notification_shard_fetch_latency", fields=[("queue_shard", str)])
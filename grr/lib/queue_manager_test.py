@@ -594,6 +594,31 @@ class MultiShardedQueueManagerTest(QueueManagerTest):
     notifications = manager.GetNotificationsForAllShards(queues.HUNTS)
     self.assertEqual(len(notifications), 2)
 
+  def testMultiGetNotificationsByPriority(self):
+    manager = queue_manager.QueueManager(token=self.token)
+    manager.QueueNotification(
+        session_id=rdfvalue.SessionID(
+            base="aff4:/hunts", queue=queues.HUNTS, flow_name="42"),
+        priority=rdf_flows.GrrMessage.Priority.HIGH_PRIORITY)
+    manager.QueueNotification(session_id=rdfvalue.SessionID(
+        base="aff4:/flows", queue=queues.FLOWS, flow_name="43"))
+    manager.Flush()
+
+    found = {}
+    for _ in range(manager.num_notification_shards):
+      result = manager.MultiGetNotificationsByPriority(
+          [queues.HUNTS, queues.FLOWS])
+      self.assertItemsEqual(result, [queues.HUNTS, queues.FLOWS])
+      for queue, notifications_by_priority in result.items():
+        for priority, notifications in notifications_by_priority.items():
+          for notification in notifications:
+            found[notification.session_id.Basename()] = (queue, priority)
+
+    self.assertEqual(found, {
+        "H:42": (queues.HUNTS, rdf_flows.GrrMessage.Priority.HIGH_PRIORITY),
+        "F:43": (queues.FLOWS, rdf_flows.GrrMessage.Priority.MEDIUM_PRIORITY)
+    })
+
   def testNotificationRequeueing(self):
     with test_lib.ConfigOverrider({"Worker.queue_shards": 1}):
       session_id = rdfvalue.SessionID(
@@ -641,6 +666,23 @@ class MultiShardedQueueManagerTest(QueueManagerTest):
           self.assertEqual(len(notifications), 0)
 
 
+class ParallelShardFetchQueueManagerTest(MultiShardedQueueManagerTest):
+  """Test for QueueManager fetching notification shards concurrently."""
+
+  def setUp(self):
+    super(ParallelShardFetchQueueManagerTest, self).setUp()
+
+    self.fetch_config_overrider = test_lib.ConfigOverrider({
+        "Worker.queue_shards": 4,
+        "Worker.notification_fetch_threads": 4
+    })
+    self.fetch_config_overrider.Start()
+
+  def tearDown(self):
+    self.fetch_config_overrider.Stop()
+    super(ParallelShardFetchQueueManagerTest, self).tearDown()
+
+
 def main(argv):
   test_lib.main(argv)
 
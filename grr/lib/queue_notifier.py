@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""Wakeup channels that let idle workers wait for new notifications.
+
+Workers that find nothing to do normally sleep for a fixed polling interval
+before checking the data store again. A queue notifier lets the QueueManager
+tell idle workers that notifications were written to a queue so they can pick
+them up immediately. Polling the data store always remains the fallback, so a
+lost wakeup only costs one polling interval.
+"""
+
+
+import errno
+import os
+import select
+import socket
+import threading
+import time
+
+import logging
+
+from grr.lib import config_lib
+from grr.lib import registry
+
+# The notifier used by this process. Initialized by QueueNotifierInit.
+NOTIFIER = None
+
+
+class QueueNotifier(object):
+  """The queue notifier base class.
+
+  The base class never wakes workers up early: Wait() just sleeps.
+  """
+
+  __metaclass__ = registry.MetaclassRegistry
+
+  def Notify(self, queues):
+    """Signals that notifications were written to the given queues.
+
+    Args:
+      queues: A list of queue urns.
+    """
+
+  def Wait(self, queues, timeout):
+    """Blocks until one of the queues is notified or the timeout expires.
+
+    Args:
+      queues: A list of queue urns the caller processes.
+      timeout: The maximum time to wait in seconds.
+
+    Returns:
+      True if the caller was woken up by a notification, False on timeout.
+    """
+    time.sleep(timeout)
+    return False
+
+
+class PollingQueueNotifier(QueueNotifier):
+  """Workers only ever poll the data store."""
+
+
+class LocalQueueNotifier(QueueNotifier):
+  """Wakes up workers running in the same process as the notifying code."""
+
+  def __init__(self):
+    super(LocalQueueNotifier, self).__init__()
+    self.condition = threading.Condition()
+    self.pending = set()
+
+  def Notify(self, queues):
+    with self.condition:
+      self.pending.update(str(queue) for queue in queues)
+      self.condition.notify_all()
+
+  def Wait(self, queues, timeout):
+    queue_names = set(str(queue) for queue in queues)
+    deadline = time.time() + timeout
+    with self.condition:
+      while not self.pending & queue_names:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          return False
+
+        self.condition.wait(remaining)
+
+      self.pending -= queue_names
+      return True
+
+
+class UnixSocketQueueNotifier(QueueNotifier):
+  """Wakes up workers on this host through unix datagram sockets.
+
+  Every waiting worker binds a socket in Worker.queue_notifier_socket_dir. A
+  notification sends the names of the notified queues to all the sockets found
+  there. Sockets left behind by dead workers are removed on the first failed
+  send.
+  """
+
+  def __init__(self):
+    super(UnixSocketQueueNotifier, self).__init__()
+    self.socket_dir = config_lib.CONFIG["Worker.queue_notifier_socket_dir"]
+    self.lock = threading.Lock()
+    self.send_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    self.send_socket.setblocking(False)
+    self.receive_socket = None
+    self.receive_path = None
+
+  def _Bind(self):
+    """Creates the socket this process receives notifications on."""
+    try:
+      os.makedirs(self.socket_dir)
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+
+    self.receive_path = os.path.join(
+        self.socket_dir, "worker_%d_%d.sock" % (os.getpid(), id(self)))
+    try:
+      os.unlink(self.receive_path)
+    except OSError:
+      pass
+
+    receive_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    receive_socket.bind(self.receive_path)
+    receive_socket.setblocking(False)
+    self.receive_socket = receive_socket
+
+  def Notify(self, queues):
+    message = "\n".join(str(queue) for queue in queues)
+    try:
+      names = os.listdir(self.socket_dir)
+    except OSError:
+      # No worker is waiting on this host.
+      return
+
+    for name in names:
+      path = os.path.join(self.socket_dir, name)
+      try:
+        self.send_socket.sendto(message, path)
+      except socket.error as e:
+        if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+          # The worker owning this socket is gone.
+          try:
+            os.unlink(path)
+          except OSError:
+            pass
+        elif e.errno != errno.EAGAIN:
+          logging.warning("Unable to notify worker at %s: %s", path, e)
+
+  def _Drain(self):
+    """Reads all pending datagrams and returns the queues they name."""
+    queue_names = set()
+    while True:
+      try:
+        queue_names.update(self.receive_socket.recv(65536).split("\n"))
+      except socket.error as e:
+        if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+          return queue_names
+        raise
+
+  def Wait(self, queues, timeout):
+    with self.lock:
+      if self.receive_socket is None:
+        self._Bind()
+
+      queue_names = set(str(queue) for queue in queues)
+      deadline = time.time() + timeout
+      while True:
+        # Notifications received while the worker was busy are already
+        # waiting in the socket buffer so they are not lost.
+        if self._Drain() & queue_names:
+          return True
+
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          return False
+
+        select.select([self.receive_socket], [], [], remaining)
+
+
+class QueueNotifierInit(registry.InitHook):
+  """Creates the queue notifier configured for this process."""
+
+  def RunOnce(self):
+    global NOTIFIER  # pylint: disable=global-statement
+
+    notifier_name = config_lib.CONFIG["Worker.queue_notifier"]
+    try:
+      cls = QueueNotifier.GetPlugin(notifier_name)
+    except KeyError:
+      raise RuntimeError("No queue notifier %s found." % notifier_name)
+
+    NOTIFIER = cls()
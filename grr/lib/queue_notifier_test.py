@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Tests for grr.lib.queue_notifier."""
+
+import os
+import threading
+import time
+
+from grr.lib import flags
+from grr.lib import queue_manager
+from grr.lib import queue_notifier
+from grr.lib import queues
+from grr.lib import rdfvalue
+from grr.lib import test_lib
+from grr.lib import utils
+
+
+class LocalQueueNotifierTest(test_lib.GRRBaseTest):
+  """Tests for the in-process notifier."""
+
+  def setUp(self):
+    super(LocalQueueNotifierTest, self).setUp()
+    self.notifier = queue_notifier.LocalQueueNotifier()
+
+  def testWaitTimesOutWithoutNotifications(self):
+    self.assertFalse(self.notifier.Wait([queues.FLOWS], 0.01))
+
+  def testNotificationBeforeWaitIsNotLost(self):
+    self.notifier.Notify([queues.FLOWS])
+    self.assertTrue(self.notifier.Wait([queues.FLOWS], 10))
+    # The wakeup is consumed.
+    self.assertFalse(self.notifier.Wait([queues.FLOWS], 0.01))
+
+  def testOtherQueuesDoNotWakeUp(self):
+    self.notifier.Notify([queues.HUNTS])
+    self.assertFalse(self.notifier.Wait([queues.FLOWS], 0.01))
+
+  def testWaitIsInterruptedByNotify(self):
+    notify_thread = threading.Thread(
+        target=lambda: self.notifier.Notify([queues.FLOWS]))
+
+    start = time.time()
+    notify_thread.start()
+    self.assertTrue(self.notifier.Wait([queues.FLOWS], 60))
+    notify_thread.join()
+    self.assertLess(time.time() - start, 60)
+
+  def testQueueManagerWakesWorkersAfterFlush(self):
+    with utils.Stubber(queue_notifier, "NOTIFIER", self.notifier):
+      manager = queue_manager.QueueManager(token=self.token)
+      manager.QueueNotification(session_id=rdfvalue.SessionID(
+          base="aff4:/flows", queue=queues.FLOWS, flow_name="123"))
+      self.assertFalse(self.notifier.Wait([queues.FLOWS], 0.01))
+
+      manager.Flush()
+      self.assertTrue(self.notifier.Wait([queues.FLOWS], 0.01))
+
+
+class UnixSocketQueueNotifierTest(test_lib.GRRBaseTest):
+  """Tests for the unix socket notifier."""
+
+  def setUp(self):
+    super(UnixSocketQueueNotifierTest, self).setUp()
+    self.config_overrider = test_lib.ConfigOverrider({
+        "Worker.queue_notifier_socket_dir": os.path.join(self.temp_dir, "s")
+    })
+    self.config_overrider.Start()
+
+  def tearDown(self):
+    self.config_overrider.Stop()
+    super(UnixSocketQueueNotifierTest, self).tearDown()
+
+  def testNotifyWakesUpWaitingWorker(self):
+    worker_notifier = queue_notifier.UnixSocketQueueNotifier()
+    frontend_notifier = queue_notifier.UnixSocketQueueNotifier()
+
+    # Binds the worker's socket.
+    self.assertFalse(worker_notifier.Wait([queues.FLOWS], 0.01))
+
+    frontend_notifier.Notify([queues.HUNTS])
+    self.assertFalse(worker_notifier.Wait([queues.FLOWS], 0.01))
+
+    frontend_notifier.Notify([queues.FLOWS])
+    self.assertTrue(worker_notifier.Wait([queues.FLOWS], 10))
+
+  def testStaleSocketsAreRemoved(self):
+    worker_notifier = queue_notifier.UnixSocketQueueNotifier()
+    worker_notifier.Wait([queues.FLOWS], 0.01)
+    worker_notifier.receive_socket.close()
+
+    queue_notifier.UnixSocketQueueNotifier().Notify([queues.FLOWS])
+    self.assertFalse(os.path.exists(worker_notifier.receive_path))
+
+
+def main(argv):
+  # Run the full test suite
+  test_lib.GrrTestProgram(argv=argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -103,11 +103,11 @@ class RDFValue(object):
     Raises:
       InitializeError: if we can not be initialized from this parameter.
     """
-    # Default timestamp is now.
-    if age is None:
-      age = RDFDatetime(age=0)
-
-    self._age = age
+    # Without an age the class default of 0 is used. It is only turned into an
+    # RDFDatetime when the age is accessed since values are created a lot more
+    # often than their age is looked at.
+    if age is not None:
+      self._age = age
 
     # Allow an RDFValue to be initialized from an identical RDFValue.
     if initializer.__class__ == self.__class__:
@@ -433,12 +433,12 @@ class RDFDatetime(RDFInteger):
   def __init__(self, initializer=None, age=None):
     super(RDFDatetime, self).__init__(None, age)
 
-    if isinstance(initializer, RDFInteger):
-      self._value = initializer._value  # pylint: disable=protected-access
-
-    elif isinstance(initializer, (int, long, float)):
+    if isinstance(initializer, (int, long, float)):
       self._value = int(initializer)
 
+    elif isinstance(initializer, RDFInteger):
+      self._value = initializer._value  # pylint: disable=protected-access
+
     elif initializer is not None:
       raise InitializeError("Unknown initializer for RDFDateTime: %s." %
                             type(initializer))
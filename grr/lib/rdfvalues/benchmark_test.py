@@ -6,6 +6,9 @@
 from grr.lib import test_lib
 from grr.lib import type_info
 from grr.lib.rdfvalues import client as rdf_client
+from grr.lib.rdfvalues import file_finder as rdf_file_finder
+from grr.lib.rdfvalues import flows as rdf_flows
+from grr.lib.rdfvalues import paths as rdf_paths
 from grr.lib.rdfvalues import structs as rdf_structs
 from grr.proto import jobs_pb2
 from grr.proto import knowledge_base_pb2
@@ -337,3 +340,195 @@ class RDFValueBenchmark(test_lib.AverageMicroBenchmarks):
 
     self.TimeIt(RDFStructDecodeEncode)
     self.TimeIt(ProtoDecodeEncode)
+
+  def _MakeStatEntry(self, i):
+    return rdf_client.StatEntry(
+        pathspec=rdf_paths.PathSpec(
+            path="/usr/lib/file%d" % i,
+            pathtype=rdf_paths.PathSpec.PathType.OS),
+        st_mode=33261,
+        st_ino=1063090 + i,
+        st_dev=64512,
+        st_nlink=1,
+        st_uid=139592,
+        st_gid=5000,
+        st_size=17 * i,
+        st_atime=1336469177,
+        st_mtime=1336129892,
+        st_ctime=1336129892)
+
+  def _MakeMessageList(self, count):
+    message_list = rdf_flows.MessageList()
+    for i in range(count):
+      message_list.job.Append(
+          session_id="aff4:/C.0000000000000001/flows/F:123456",
+          request_id=1,
+          response_id=i,
+          name="ListDirectory",
+          payload=self._MakeStatEntry(i))
+
+    return message_list.SerializeToString()
+
+  def testZeroCopyDecodeMessageList(self):
+    """Compare copying and zero copy decoding of a large MessageList."""
+    repeats = self.REPEATS / 50
+    data = self._MakeMessageList(self.REPEATS)
+
+    def Decode():
+      message_list = rdf_flows.MessageList.FromSerializedString(data)
+      self.assertEqual(message_list.job[100].response_id, 100)
+
+    def ZeroCopyDecode():
+      message_list = rdf_flows.MessageList.FromSerializedString(buffer(data))
+      self.assertEqual(message_list.job[100].response_id, 100)
+
+    def DecodeAllPayloads():
+      message_list = rdf_flows.MessageList.FromSerializedString(data)
+      for message in message_list.job:
+        message.payload.pathspec.path  # pylint: disable=pointless-statement
+
+    def ZeroCopyDecodeAllPayloads():
+      message_list = rdf_flows.MessageList.FromSerializedString(buffer(data))
+      for message in message_list.job:
+        message.payload.pathspec.path  # pylint: disable=pointless-statement
+
+    self.TimeIt(Decode, "MessageList Decode", repetitions=repeats)
+    self.TimeIt(ZeroCopyDecode, "MessageList Zero Copy Decode",
+                repetitions=repeats)
+    self.TimeIt(DecodeAllPayloads, "MessageList Decode Payloads",
+                repetitions=repeats)
+    self.TimeIt(ZeroCopyDecodeAllPayloads,
+                "MessageList Zero Copy Decode Payloads", repetitions=repeats)
+
+  def testReserializeUnmodified(self):
+    """Decode and serialize messages without modifying them."""
+    repeats = self.REPEATS / 50
+    data = self._MakeMessageList(self.REPEATS)
+    stat_entry = self._MakeStatEntry(1).SerializeToString()
+
+    def MessageListDecodeEncode():
+      message_list = rdf_flows.MessageList.FromSerializedString(buffer(data))
+      for message in message_list.job:
+        message.SerializeToString()
+
+    def StatEntryDecodeEncode():
+      result = rdf_client.StatEntry.FromSerializedString(stat_entry)
+      self.assertEqual(result.pathspec.path, "/usr/lib/file1")
+      result.SerializeToString()
+
+    def StatEntryDecodeModifyEncode():
+      result = rdf_client.StatEntry.FromSerializedString(stat_entry)
+      result.pathspec.path = "/usr/lib/other"
+      result.SerializeToString()
+
+    self.TimeIt(MessageListDecodeEncode, "MessageList Reserialize Messages",
+                repetitions=repeats)
+    self.TimeIt(StatEntryDecodeEncode, "StatEntry Decode/Encode")
+    self.TimeIt(StatEntryDecodeModifyEncode, "StatEntry Decode/Modify/Encode")
+
+  def testAcceleratedCodec(self):
+    """Compare the _semantic extension with the python wire format codec."""
+    stat_entry = self._MakeStatEntry(1).SerializeToString()
+    message = rdf_flows.GrrMessage(
+        session_id="aff4:/C.0000000000000001/flows/F:123456",
+        request_id=1,
+        response_id=5,
+        task_id=1234567,
+        name="ListDirectory",
+        payload=self._MakeStatEntry(1)).SerializeToString()
+
+    def StatEntryEncodeDecode():
+      result = rdf_client.StatEntry.FromSerializedString(
+          self._MakeStatEntry(1).SerializeToString())
+      self.assertEqual(result.st_size, 17)
+      self.assertEqual(result.pathspec.path, "/usr/lib/file1")
+
+    def StatEntryDecodeModifyEncode():
+      result = rdf_client.StatEntry.FromSerializedString(stat_entry)
+      result.st_size = 3
+      result.pathspec.path = "/usr/lib/other"
+      result.SerializeToString()
+
+    def GrrMessageEncodeDecode():
+      result = rdf_flows.GrrMessage.FromSerializedString(
+          rdf_flows.GrrMessage(
+              session_id="aff4:/C.0000000000000001/flows/F:123456",
+              request_id=1,
+              response_id=5,
+              name="ListDirectory",
+              payload=rdf_client.StatEntry.FromSerializedString(
+                  stat_entry)).SerializeToString())
+      self.assertEqual(result.response_id, 5)
+
+    def GrrMessageDecodeModifyEncode():
+      result = rdf_flows.GrrMessage.FromSerializedString(message)
+      self.assertEqual(result.payload.st_size, 17)
+      result.response_id = 6
+      result.payload.st_size = 3
+      result.SerializeToString()
+
+    codecs = [("Python", False)]
+    if rdf_structs.ACCELERATED_CODEC:
+      codecs.append(("Accelerated", True))
+
+    try:
+      for codec_name, accelerated in codecs:
+        rdf_structs.UseAcceleratedCodec(accelerated)
+        for function in (StatEntryEncodeDecode, StatEntryDecodeModifyEncode,
+                         GrrMessageEncodeDecode, GrrMessageDecodeModifyEncode):
+          self.TimeIt(function, "%s %s" % (codec_name, function.__name__))
+    finally:
+      rdf_structs.UseAcceleratedCodec()
+
+  def testHotTypes(self):
+    """Encode and decode the most frequently serialized types."""
+    pathspec = rdf_paths.PathSpec(
+        path="/usr/lib/file1",
+        pathtype=rdf_paths.PathSpec.PathType.OS,
+        offset=1024,
+        nested_path=rdf_paths.PathSpec(
+            path="/file", pathtype=rdf_paths.PathSpec.PathType.TSK))
+    stat_entry = self._MakeStatEntry(1)
+    buffer_reference = rdf_client.BufferReference(
+        offset=4096, length=10, data="0123456789", pathspec=pathspec)
+    file_finder_result = rdf_file_finder.FileFinderResult(
+        stat_entry=stat_entry, matches=[buffer_reference, buffer_reference])
+    grr_message = rdf_flows.GrrMessage(
+        session_id="aff4:/C.0000000000000001/flows/F:123456",
+        request_id=1,
+        response_id=5,
+        task_id=1234567,
+        name="FileFinder",
+        payload=file_finder_result)
+
+    for value in (pathspec, stat_entry, buffer_reference, file_finder_result,
+                  grr_message):
+      cls = value.__class__
+      data = value.SerializeToString()
+      fields = [desc.name for desc, _ in value.ListSetFields()]
+      # GrrMessage only allows to access its args through the payload.
+      rdf_fields = [x if x != "args" else "payload" for x in fields]
+
+      def RDFStructEncode():
+        # Values which were not parsed encode all their fields every time.
+        value.SerializeToString()
+
+      def RDFStructDecode():
+        result = cls.FromSerializedString(data)
+        for field in rdf_fields:
+          getattr(result, field)
+
+      proto = cls.protobuf.FromString(data)
+
+      def ProtoEncode():
+        proto.SerializeToString()
+
+      def ProtoDecode():
+        result = cls.protobuf.FromString(data)
+        for field in fields:
+          getattr(result, field)
+
+      self.TimeIt(RDFStructEncode, "%s RDFStruct Encode" % cls.__name__)
+      self.TimeIt(RDFStructDecode, "%s RDFStruct Decode" % cls.__name__)
+      self.TimeIt(ProtoEncode, "%s Protobuf Encode" % cls.__name__)
+      self.TimeIt(ProtoDecode, "%s Protobuf Decode" % cls.__name__)
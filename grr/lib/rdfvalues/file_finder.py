@@ -29,6 +29,10 @@ class FileFinderContentsLiteralMatchCondition(rdf_structs.RDFProtoStruct):
   protobuf = flows_pb2.FileFinderContentsLiteralMatchCondition
 
 
+class FileFinderContentsMultiMatchCondition(rdf_structs.RDFProtoStruct):
+  protobuf = flows_pb2.FileFinderContentsMultiMatchCondition
+
+
 class FileFinderCondition(rdf_structs.RDFProtoStruct):
   protobuf = flows_pb2.FileFinderCondition
 
@@ -4,6 +4,7 @@
 
 
 from grr.lib import aff4
+from grr.lib import test_lib
 from grr.lib.rdfvalues import test_base
 from grr.server import foreman as rdf_foreman
 
@@ -530,3 +531,116 @@ class ForemanIntegerClientRuleTest(test_base.RDFValueTestCase):
         r.Evaluate(
             CollectAff4Objects(r.GetPathsToCheck(), client_id, self.token),
             client_id))
+
+
+class ForemanRuleIndexTest(test_lib.GRRBaseTest):
+  """Tests that compiled rules match the same clients as the rules."""
+
+  def _Rule(self, match_mode, *client_rules):
+    return rdf_foreman.ForemanRule(
+        created=1000,
+        expires=2**62,
+        client_rule_set=rdf_foreman.ForemanClientRuleSet(
+            match_mode=match_mode, rules=list(client_rules)))
+
+  def _OsRule(self, **kwargs):
+    return rdf_foreman.ForemanClientRule(
+        rule_type=rdf_foreman.ForemanClientRule.Type.OS,
+        os=rdf_foreman.ForemanOsClientRule(**kwargs))
+
+  def _LabelRule(self, match_mode, *label_names):
+    return rdf_foreman.ForemanClientRule(
+        rule_type=rdf_foreman.ForemanClientRule.Type.LABEL,
+        label=rdf_foreman.ForemanLabelClientRule(
+            match_mode=match_mode, label_names=list(label_names)))
+
+  def _RegexRule(self, attribute_name, regex, path="/"):
+    return rdf_foreman.ForemanClientRule(
+        rule_type=rdf_foreman.ForemanClientRule.Type.REGEX,
+        regex=rdf_foreman.ForemanRegexClientRule(
+            path=path, attribute_name=attribute_name, attribute_regex=regex))
+
+  def _IntegerRule(self, attribute_name, operator, value):
+    return rdf_foreman.ForemanClientRule(
+        rule_type=rdf_foreman.ForemanClientRule.Type.INTEGER,
+        integer=rdf_foreman.ForemanIntegerClientRule(
+            attribute_name=attribute_name, operator=operator, value=value))
+
+  def testMatchesSameClientsAsRuleSets(self):
+    set_modes = rdf_foreman.ForemanClientRuleSet.MatchMode
+    label_modes = rdf_foreman.ForemanLabelClientRule.MatchMode
+    operators = rdf_foreman.ForemanIntegerClientRule.Operator
+
+    rules = [
+        self._Rule(set_modes.MATCH_ALL, self._OsRule(os_windows=True)),
+        self._Rule(set_modes.MATCH_ANY,
+                   self._OsRule(os_linux=True),
+                   self._LabelRule(label_modes.MATCH_ANY, "foo")),
+        self._Rule(set_modes.MATCH_ALL,
+                   self._LabelRule(label_modes.MATCH_ALL, "foo", "bar")),
+        self._Rule(set_modes.MATCH_ALL,
+                   self._LabelRule(label_modes.DOES_NOT_MATCH_ALL, "foo",
+                                   "bar")),
+        self._Rule(set_modes.MATCH_ALL,
+                   self._LabelRule(label_modes.DOES_NOT_MATCH_ANY, "foo")),
+        self._Rule(set_modes.MATCH_ALL, self._RegexRule("Host", "host-[01]$")),
+        # Regexes with groups are not combined with the others.
+        self._Rule(set_modes.MATCH_ALL, self._RegexRule("Host", r"(\d)$")),
+        self._Rule(set_modes.MATCH_ALL,
+                   self._RegexRule("Host", "host"),
+                   self._RegexRule("Host", "(?x) 2 $")),
+        self._Rule(set_modes.MATCH_ALL,
+                   self._IntegerRule("Install Date", operators.LESS_THAN, 20)),
+        self._Rule(set_modes.MATCH_ANY,
+                   self._IntegerRule("Install Date", operators.EQUAL, 20),
+                   self._IntegerRule("Install Date", operators.GREATER_THAN,
+                                     30)),
+        self._Rule(set_modes.MATCH_ALL,
+                   self._IntegerRule("Install Date", operators.GREATER_THAN,
+                                     15),
+                   self._IntegerRule("Install Date", operators.LESS_THAN, 35)),
+        self._Rule(set_modes.MATCH_ALL,
+                   self._RegexRule("type", "AFF4Volume", path="fs/os"),
+                   self._OsRule(os_darwin=True)),
+        self._Rule(set_modes.MATCH_ANY),
+        self._Rule(set_modes.MATCH_ALL),
+    ]
+
+    client_ids = self.SetupClients(4)
+    systems = ["Windows", "Linux", "Darwin", "Linux"]
+    labels = [["foo"], ["foo", "bar"], [], ["bar"]]
+    install_dates = [10, 20, 30, 40]
+    for client_id, system, label_names, install_date in zip(
+        client_ids, systems, labels, install_dates):
+      with aff4.FACTORY.Open(client_id, mode="rw", token=self.token) as fd:
+        fd.Set(fd.Schema.SYSTEM(system))
+        fd.Set(fd.Schema.INSTALL_DATE(install_date))
+        fd.AddLabels(*label_names, owner="GRR")
+
+    aff4.FACTORY.Create(
+        client_ids[2].Add("fs/os"), aff4.AFF4Volume, token=self.token).Close()
+
+    index = rdf_foreman.ForemanRuleIndex(rules)
+    for client_id in client_ids:
+      expected = []
+      for rule in rules:
+        objects = CollectAff4Objects(rule.client_rule_set.GetPathsToCheck(),
+                                     client_id, self.token)
+        if rule.client_rule_set.Evaluate(objects, client_id):
+          expected.append(rule)
+
+      client = aff4.FACTORY.Open(client_id, token=self.token)
+      self.assertEqual(
+          index.MatchingRules(client, 0, token=self.token), expected)
+
+  def testOnlyRulesCreatedLaterAreMatched(self):
+    rules = [
+        self._Rule(rdf_foreman.ForemanClientRuleSet.MatchMode.MATCH_ALL)
+    ]
+    client_id, = self.SetupClients(1)
+    client = aff4.FACTORY.Open(client_id, token=self.token)
+
+    index = rdf_foreman.ForemanRuleIndex(rules)
+    self.assertEqual(index.MatchingRules(client, 999), rules)
+    self.assertEqual(index.MatchingRules(client, 1000), [])
+
@@ -46,6 +46,10 @@ class RegularExpression(rdfvalue.RDFString):
 
     return self._regex.finditer(text)
 
+  def Compile(self):
+    """Returns the compiled regular expression."""
+    return self._regex
+
   def __str__(self):
     return "<RegularExpression: %r/>" % self._value
 
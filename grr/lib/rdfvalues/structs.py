@@ -9,7 +9,7 @@ import struct
 
 # pylint: disable=g-import-not-at-top
 try:
-  from grr.accelerated import _semantic
+  from grr import _semantic
 except ImportError:
   _semantic = None
 
@@ -193,29 +193,111 @@ def SplitBuffer(buff, index=0, length=None):
       raise rdfvalue.DecodeError("Unexpected Tag.")
 
 
+def SplitBufferIntoViews(buff, view_tags, index=0, length=None):
+  """Parses the buffer as a protobuf without copying embedded data.
+
+  This works like SplitBuffer() but the values of the given length delimited
+  tags are returned as buffer objects pointing into buff instead of copies.
+
+  Args:
+    buff: The buffer to parse. Usually a buffer object itself.
+    view_tags: A set of encoded tags to return views for.
+    index: The position to start parsing.
+    length: Optional length to parse until.
+
+  Yields:
+    Splits the buffer into tuples of
+        (encoded_tag, encoded_length, wire_format).
+  """
+  buffer_len = length or len(buff)
+  while index < buffer_len:
+    encoded_tag, data_index = ReadTag(buff, index)
+
+    tag_type = ORD_MAP[encoded_tag[0]] & TAG_TYPE_MASK
+    if tag_type == WIRETYPE_VARINT:
+      _, new_index = VarintReader(buff, data_index)
+      yield (encoded_tag, "", buff[data_index:new_index])
+      index = new_index
+
+    elif tag_type == WIRETYPE_FIXED64:
+      yield (encoded_tag, "", buff[data_index:data_index + 8])
+      index = 8 + data_index
+
+    elif tag_type == WIRETYPE_FIXED32:
+      yield (encoded_tag, "", buff[data_index:data_index + 4])
+      index = 4 + data_index
+
+    elif tag_type == WIRETYPE_LENGTH_DELIMITED:
+      length, start = VarintReader(buff, data_index)
+      if encoded_tag in view_tags:
+        data = buffer(buff, start, length)
+      else:
+        data = buff[start:start + length]
+
+      yield (encoded_tag, buff[data_index:start], data)
+      index = start + length
+
+    else:
+      raise rdfvalue.DecodeError("Unexpected Tag.")
+
+
 def SerializeEntries(entries):
   """Serializes given triplets of python and wire values and a descriptor."""
   output = []
   for python_format, wire_format, type_descriptor in entries:
 
-    if wire_format is None or (python_format and
+    if wire_format is None or (python_format is not None and
                                type_descriptor.IsDirty(python_format)):
-      wire_format = type_descriptor.ConvertToWireFormat(python_format)
+      wire_format = type_descriptor.Encode(python_format)
+
+    elif wire_format[2].__class__ is buffer:
+      # Zero copy decoded data has to be copied once we write it out.
+      wire_format = (wire_format[0], wire_format[1], str(wire_format[2]))
 
     output.extend(wire_format)
 
   return "".join(output)
 
 
+def _WireFormatWithoutView(wire_format):
+  """Returns wire_format with a zero copy buffer view turned into a string."""
+  if wire_format is not None and wire_format[2].__class__ is buffer:
+    return (wire_format[0], wire_format[1], str(wire_format[2]))
+
+  return wire_format
+
+
 def ReadIntoObject(buff, index, value_obj, length=0):
-  """Reads all tags until the next end group and store in the value_obj."""
+  """Reads all tags until the next end group and store in the value_obj.
+
+  If buff is a buffer object, embedded protobufs are not copied out of it.
+  Their wire format keeps a view into buff instead and they are only parsed
+  (again without copying) when they are accessed.
+
+  Args:
+    buff: The string or buffer to read from.
+    index: The position to start reading.
+    value_obj: The RDFStruct to read into.
+    length: Optional length to read until.
+  """
   raw_data = value_obj.GetRawData()
   count = 0
 
+  if buff.__class__ is buffer:
+    if value_obj.zero_copy_encoded_tags:
+      # Only embedded protobufs can be decoded from a view, all other values
+      # are copied just as they would be by SplitBuffer().
+      fields = SplitBufferIntoViews(
+          buff, value_obj.zero_copy_encoded_tags, index=index, length=length)
+    else:
+      # Nothing in here can keep a view so it is cheaper to parse a copy.
+      fields = SplitBuffer(str(buff), index=index, length=length)
+  else:
+    fields = SplitBuffer(buff, index=index, length=length)
+
   # Split the buffer into tags and wire_format representations, then collect
   # these into the raw data cache.
-  for (encoded_tag, encoded_length, encoded_field) in SplitBuffer(
-      buff, index=index, length=length):
+  for (encoded_tag, encoded_length, encoded_field) in fields:
 
     type_info_obj = value_obj.type_infos_by_encoded_tag.get(encoded_tag)
 
@@ -252,12 +334,63 @@ def ReadIntoObject(buff, index, value_obj, length=0):
   value_obj.SetRawData(raw_data)
 
 
-# pylint: disable=invalid-name
+def _AcceleratedSplitBuffer(buff, index=0, length=None):
+  try:
+    return _semantic.split_buffer(buff, index=index, length=length)
+  except ValueError as e:
+    raise rdfvalue.DecodeError(str(e))
+
+
+def _AcceleratedSplitBufferIntoViews(buff, view_tags, index=0, length=None):
+  try:
+    return _semantic.split_buffer_into_views(
+        buff, view_tags, index=index, length=length)
+  except ValueError as e:
+    raise rdfvalue.DecodeError(str(e))
+
+
+# The pure python wire format codec.
+PYTHON_CODEC = dict(
+    ReadTag=ReadTag,
+    VarintEncode=VarintEncode,
+    VarintReader=VarintReader,
+    SignedVarintReader=SignedVarintReader,
+    SplitBuffer=SplitBuffer,
+    SplitBufferIntoViews=SplitBufferIntoViews)
+
+# The same functions implemented by the _semantic extension.
 if _semantic:
-  VarintEncode = _semantic.varint_encode
-  VarintReader = _semantic.varint_decode
-  SplitBuffer = _semantic.split_buffer
-# pylint: enable=invalid-name
+  ACCELERATED_CODEC = dict(
+      ReadTag=_semantic.read_tag,
+      VarintEncode=_semantic.varint_encode,
+      VarintReader=_semantic.varint_decode,
+      SignedVarintReader=_semantic.signed_varint_decode,
+      SplitBuffer=_AcceleratedSplitBuffer,
+      SplitBufferIntoViews=_AcceleratedSplitBufferIntoViews)
+else:
+  ACCELERATED_CODEC = None
+
+
+def UseAcceleratedCodec(enabled=True):
+  """Selects the implementation of the wire format codec.
+
+  The _semantic extension is used by default if it is installed.
+
+  Args:
+    enabled: Use the _semantic extension if True, the python code otherwise.
+
+  Returns:
+    True if the extension is now in use, False if it is not available.
+  """
+  if enabled and ACCELERATED_CODEC:
+    globals().update(ACCELERATED_CODEC)
+    return True
+
+  globals().update(PYTHON_CODEC)
+  return False
+
+
+UseAcceleratedCodec()
 
 
 class ProtoType(type_info.TypeInfoObject):
@@ -290,6 +423,10 @@ class ProtoType(type_info.TypeInfoObject):
   # access.
   set_default_on_access = False
 
+  # Set if the field can be decoded from a view into the serialized data (see
+  # ReadIntoObject()).
+  zero_copy = False
+
   def __init__(self,
                field_number=None,
                required=False,
@@ -317,6 +454,14 @@ class ProtoType(type_info.TypeInfoObject):
 
     return result
 
+  def __getstate__(self):
+    # The compiled conversion functions are closures which can not be pickled.
+    # Copies compile their own on first use.
+    state = self.__dict__.copy()
+    state.pop("Encode", None)
+    state.pop("Decode", None)
+    return state
+
   def CalculateTags(self):
     # In python Varint encoding is expensive so we want to move as much of the
     # hard work from the Write() methods which are called frequently to the type
@@ -325,6 +470,51 @@ class ProtoType(type_info.TypeInfoObject):
     self.tag = self.field_number << 3 | self.wire_type
     self.encoded_tag = VarintEncode(self.tag)
 
+    # The compiled conversion functions embed the tag.
+    self.ClearCompiled()
+
+  def Compile(self):
+    """Builds the conversion functions specialized for this field.
+
+    They are stored in the instance, where they take precedence over the
+    Encode() and Decode() methods below which only compile them on first use.
+    Everything they need (the encoded tag, the nested type, the enum names...)
+    is resolved here once instead of on every call.
+    """
+    self.Encode = self.CompileEncoder()
+    self.Decode = self.CompileDecoder()
+
+  def ClearCompiled(self):
+    """Discards the compiled conversion functions after a change."""
+    self.__dict__.pop("Encode", None)
+    self.__dict__.pop("Decode", None)
+
+  def Encode(self, value):
+    """Converts value to the wire format. See ConvertToWireFormat()."""
+    self.Compile()
+    return self.Encode(value)
+
+  def Decode(self, value, container=None):
+    """Converts value from the wire format. See ConvertFromWireFormat()."""
+    self.Compile()
+    return self.Decode(value, container)
+
+  def CompileEncoder(self):
+    """Returns a function converting values of this field to the wire format.
+
+    This must be implemented by every type. The function takes the python
+    format value and returns the wire format tuple.
+    """
+    raise NotImplementedError
+
+  def CompileDecoder(self):
+    """Returns a function converting values of this field from the wire format.
+
+    This must be implemented by every type. The function takes the wire format
+    tuple and the containing struct and returns the python format value.
+    """
+    raise NotImplementedError
+
   def IsDirty(self, unused_python_format):
     """Return and clear the dirty state of the python object."""
     return False
@@ -348,7 +538,8 @@ class ProtoType(type_info.TypeInfoObject):
     concatenates all the wire formats together to form the final message without
     delegating to the field descriptors.
 
-    This function is HOT.
+    This function is HOT. Fields are converted by the function returned from
+    CompileDecoder(), so the hot paths use Decode() directly.
 
     Args:
       value: A parameter stored in the wire format for this type.
@@ -358,7 +549,7 @@ class ProtoType(type_info.TypeInfoObject):
       The parameter encoded in the python format representation.
 
     """
-    raise NotImplementedError
+    return self.Decode(value, container)
 
   def ConvertToWireFormat(self, value):
     """Convert the parameter into the internal storage format.
@@ -366,7 +557,8 @@ class ProtoType(type_info.TypeInfoObject):
     This function is the inverse of ConvertFromWireFormat(). See the description
     above for the exact layout of the internal wire format.
 
-    This function is HOT.
+    This function is HOT. Fields are converted by the function returned from
+    CompileEncoder(), so the hot paths use Encode() directly.
 
     Args:
       value: A python format representation of the value as coerced by the
@@ -376,7 +568,7 @@ class ProtoType(type_info.TypeInfoObject):
       The parameter encoded in the wire format representation.
 
     """
-    raise NotImplementedError
+    return self.Encode(value)
 
   def _FormatDescriptionComment(self):
     result = "".join(["\n  // %s\n" % x for x in self.description.splitlines()])
@@ -459,17 +651,26 @@ class ProtoString(ProtoType):
     except UnicodeError:
       raise type_info.TypeValueError("Not a valid unicode string")
 
-  def ConvertFromWireFormat(self, value, container=None):
+  def CompileDecoder(self):
     """Internally strings are utf8 encoded."""
-    try:
-      return unicode(value[2], "utf8")
-    except UnicodeError:
-      raise rdfvalue.DecodeError("Unicode decoding error")
 
-  def ConvertToWireFormat(self, value):
+    def Decode(value, container=None):
+      try:
+        return unicode(value[2], "utf8")
+      except UnicodeError:
+        raise rdfvalue.DecodeError("Unicode decoding error")
+
+    return Decode
+
+  def CompileEncoder(self):
     """Internally strings are utf8 encoded."""
-    value = value.encode("utf8")
-    return (self.encoded_tag, VarintEncode(len(value)), value)
+    encoded_tag = self.encoded_tag
+
+    def Encode(value):
+      value = value.encode("utf8")
+      return (encoded_tag, VarintEncode(len(value)), value)
+
+    return Encode
 
   def Definition(self):
     """Return a string with the definition of this field."""
@@ -509,11 +710,20 @@ class ProtoBinary(ProtoType):
 
     return value
 
-  def ConvertFromWireFormat(self, value, container=None):
-    return value[2]
+  def CompileDecoder(self):
 
-  def ConvertToWireFormat(self, value):
-    return (self.encoded_tag, VarintEncode(len(value)), value)
+    def Decode(value, container=None):
+      return value[2]
+
+    return Decode
+
+  def CompileEncoder(self):
+    encoded_tag = self.encoded_tag
+
+    def Encode(value):
+      return (encoded_tag, VarintEncode(len(value)), value)
+
+    return Encode
 
   def Definition(self):
     """Return a string with the definition of this field."""
@@ -542,11 +752,20 @@ class ProtoUnsignedInteger(ProtoType):
     # Integers default to 0 if not specified.
     super(ProtoUnsignedInteger, self).__init__(default=default, **kwargs)
 
-  def ConvertFromWireFormat(self, value, container=None):
-    return VarintReader(value[2], 0)[0]
+  def CompileDecoder(self):
 
-  def ConvertToWireFormat(self, value):
-    return (self.encoded_tag, "", VarintEncode(value))
+    def Decode(value, container=None):
+      return VarintReader(value[2], 0)[0]
+
+    return Decode
+
+  def CompileEncoder(self):
+    encoded_tag = self.encoded_tag
+
+    def Encode(value):
+      return (encoded_tag, "", VarintEncode(value))
+
+    return Encode
 
   def Validate(self, value, **_):
     try:
@@ -569,11 +788,20 @@ class ProtoSignedInteger(ProtoUnsignedInteger):
 
   proto_type_name = "int64"
 
-  def ConvertFromWireFormat(self, value, container=None):
-    return SignedVarintReader(value[2])[0]
+  def CompileDecoder(self):
 
-  def ConvertToWireFormat(self, value):
-    return (self.encoded_tag, "", SignedVarintEncode(value))
+    def Decode(value, container=None):
+      return SignedVarintReader(value[2], 0)[0]
+
+    return Decode
+
+  def CompileEncoder(self):
+    encoded_tag = self.encoded_tag
+
+    def Encode(value):
+      return (encoded_tag, "", SignedVarintEncode(value))
+
+    return Encode
 
 
 class ProtoFixed32(ProtoUnsignedInteger):
@@ -586,11 +814,27 @@ class ProtoFixed32(ProtoUnsignedInteger):
   proto_type_name = "sfixed32"
   wire_type = WIRETYPE_FIXED32
 
-  def ConvertToWireFormat(self, value):
-    return (self.encoded_tag, "", struct.pack("<L", long(value)))
+  # The struct format of the wire format and the python type it is packed from.
+  _struct_format = "<L"
+  _python_type = long
 
-  def ConvertFromWireFormat(self, value, container=None):
-    return struct.unpack("<L", value[2])[0]
+  def CompileEncoder(self):
+    encoded_tag = self.encoded_tag
+    pack = struct.Struct(self._struct_format).pack
+    python_type = self._python_type
+
+    def Encode(value):
+      return (encoded_tag, "", pack(python_type(value)))
+
+    return Encode
+
+  def CompileDecoder(self):
+    unpack = struct.Struct(self._struct_format).unpack
+
+    def Decode(value, container=None):
+      return unpack(value[2])[0]
+
+    return Decode
 
 
 class ProtoFixed64(ProtoFixed32):
@@ -599,11 +843,7 @@ class ProtoFixed64(ProtoFixed32):
   proto_type_name = "sfixed64"
   wire_type = WIRETYPE_FIXED64
 
-  def ConvertToWireFormat(self, value):
-    return (self.encoded_tag, "", struct.pack("<Q", long(value)))
-
-  def ConvertFromWireFormat(self, value, container=None):
-    return struct.unpack("<Q", value[2])[0]
+  _struct_format = "<Q"
 
 
 class ProtoFixedU32(ProtoFixed32):
@@ -613,11 +853,7 @@ class ProtoFixedU32(ProtoFixed32):
   """
   proto_type_name = "fixed32"
 
-  def ConvertToWireFormat(self, value):
-    return (self.encoded_tag, "", struct.pack("<l", long(value)))
-
-  def ConvertFromWireFormat(self, value, container=None):
-    return struct.unpack("<l", value[2])[0]
+  _struct_format = "<l"
 
 
 class ProtoFloat(ProtoFixed32):
@@ -627,18 +863,15 @@ class ProtoFloat(ProtoFixed32):
   """
   proto_type_name = "float"
 
+  _struct_format = "<f"
+  _python_type = float
+
   def Validate(self, value, **_):
     if not rdfvalue.RDFInteger.IsNumeric(value):
       raise type_info.TypeValueError("Invalid value %s for Float" % value)
 
     return value
 
-  def ConvertToWireFormat(self, value):
-    return (self.encoded_tag, "", struct.pack("<f", float(value)))
-
-  def ConvertFromWireFormat(self, value, container=None):
-    return struct.unpack("<f", value[2])[0]
-
 
 class ProtoDouble(ProtoFixed64):
   """A double.
@@ -647,18 +880,15 @@ class ProtoDouble(ProtoFixed64):
   """
   proto_type_name = "double"
 
+  _struct_format = "<d"
+  _python_type = float
+
   def Validate(self, value, **_):
     if not rdfvalue.RDFInteger.IsNumeric(value):
       raise type_info.TypeValueError("Invalid value %s for Integer" % value)
 
     return value
 
-  def ConvertToWireFormat(self, value):
-    return (self.encoded_tag, "", struct.pack("<d", float(value)))
-
-  def ConvertFromWireFormat(self, value, container=None):
-    return struct.unpack("<d", value[2])[0]
-
 
 class EnumNamedValue(rdfvalue.RDFInteger):
   """A class that wraps enums.
@@ -769,12 +999,22 @@ class ProtoEnum(ProtoSignedInteger):
   def Format(self, value):
     yield self.reverse_enum.get(value, str(value))
 
-  def ConvertToWireFormat(self, value):
-    return (self.encoded_tag, "", SignedVarintEncode(int(value)))
+  def CompileEncoder(self):
+    encoded_tag = self.encoded_tag
 
-  def ConvertFromWireFormat(self, value, container=None):
-    value = SignedVarintReader(value[2], 0)[0]
-    return EnumNamedValue(value, name=self.reverse_enum.get(value))
+    def Encode(value):
+      return (encoded_tag, "", SignedVarintEncode(int(value)))
+
+    return Encode
+
+  def CompileDecoder(self):
+    names = self.reverse_enum
+
+    def Decode(value, container=None):
+      value = SignedVarintReader(value[2], 0)[0]
+      return EnumNamedValue(value, name=names.get(value))
+
+    return Decode
 
 
 class ProtoBoolean(ProtoEnum):
@@ -801,10 +1041,13 @@ class ProtoBoolean(ProtoEnum):
 
     return rdfvalue.RDFBool(super(ProtoBoolean, self).Validate(value))
 
-  def ConvertFromWireFormat(self, value, container=None):
-    return rdfvalue.RDFBool(
-        super(ProtoBoolean, self).ConvertFromWireFormat(
-            value, container=container))
+  def CompileDecoder(self):
+    decode_enum = super(ProtoBoolean, self).CompileDecoder()
+
+    def Decode(value, container=None):
+      return rdfvalue.RDFBool(decode_enum(value, container))
+
+    return Decode
 
 
 class ProtoEmbedded(ProtoType):
@@ -824,6 +1067,8 @@ class ProtoEmbedded(ProtoType):
   # the owner protobuf.
   set_default_on_access = True
 
+  zero_copy = True
+
   def __init__(self, nested=None, **kwargs):
     super(ProtoEmbedded, self).__init__(**kwargs)
 
@@ -850,17 +1095,37 @@ class ProtoEmbedded(ProtoType):
       raise type_info.TypeValueError(
           "Only RDFProtoStructs can be nested, not %s" % nested.__name__)
 
-  def ConvertFromWireFormat(self, value, container=None):
+  def CompileDecoder(self):
     """The wire format is simply a string."""
-    result = self.type()
-    ReadIntoObject(value[2], 0, result)
+    nested_type = self.type
 
-    return result
+    def Decode(value, container=None):
+      result = nested_type()
+      ReadIntoObject(value[2], 0, result)
 
-  def ConvertToWireFormat(self, value):
+      # The new object is identical to its wire format. It only has to be
+      # serialized again once it is modified.
+      result.RememberSerialized(value[2])
+      result.dirty = False
+
+      return result
+
+    return Decode
+
+  def CompileEncoder(self):
     """Encode the nested protobuf into wire format."""
-    output = SerializeEntries(value.GetRawData().itervalues())
-    return (self.encoded_tag, VarintEncode(len(output)), output)
+    encoded_tag = self.encoded_tag
+
+    def Encode(value):
+      output = value.GetUnmodifiedSerialization()
+      if output is None:
+        output = SerializeEntries(value.GetRawData().itervalues())
+      else:
+        output = str(output)
+
+      return (encoded_tag, VarintEncode(len(output)), output)
+
+    return Encode
 
   def LateBind(self, target=None):
     """Late binding callback.
@@ -883,6 +1148,7 @@ class ProtoEmbedded(ProtoType):
 
     # The target type is now resolved.
     self.type = target
+    self.ClearCompiled()
 
     # Register us in our owner.
     self.owner.AddDescriptor(self)
@@ -892,7 +1158,10 @@ class ProtoEmbedded(ProtoType):
     if proto.dirty:
       return True
 
-    for python_format, _, type_descriptor in proto.GetRawData().itervalues():
+    # GetRawData() would make the proto forget the data it was parsed from.
+    # pylint: disable=protected-access
+    for python_format, _, type_descriptor in proto._data.itervalues():
+      # pylint: enable=protected-access
       if python_format is not None and type_descriptor.IsDirty(python_format):
         proto.dirty = True
         return True
@@ -956,6 +1225,13 @@ class ProtoDynamicEmbedded(ProtoType):
     super(ProtoDynamicEmbedded, self).__init__(**kwargs)
     self._type = dynamic_cb
 
+  def CompileDecoder(self):
+    # The type depends on the container so there is nothing to specialize.
+    return self.ConvertFromWireFormat
+
+  def CompileEncoder(self):
+    return self.ConvertToWireFormat
+
   def ConvertFromWireFormat(self, value, container=None):
     """The wire format is simply a string."""
     return self._type(container).FromSerializedString(value[2])
@@ -1095,9 +1371,10 @@ class RepeatedFieldHelper(object):
     if self.dirty:
       return True
 
-    # If any of the items is dirty we are also dirty.
+    # If any of the items is dirty we are also dirty. Items which were never
+    # decoded can not have been modified.
     for item in self.wrapped_list:
-      if self.type_descriptor.IsDirty(item[0]):
+      if item[0] is not None and self.type_descriptor.IsDirty(item[0]):
         self.dirty = True
         return True
 
@@ -1107,6 +1384,16 @@ class RepeatedFieldHelper(object):
     return RepeatedFieldHelper(
         wrapped_list=self.wrapped_list[:], type_descriptor=self.type_descriptor)
 
+  def __getstate__(self):
+    # Buffer views can not be pickled or deep copied, so they are stored as
+    # strings.
+    state = self.__dict__.copy()
+    state["wrapped_list"] = [
+        (python_format, _WireFormatWithoutView(wire_format))
+        for python_format, wire_format in self.wrapped_list
+    ]
+    return state
+
   def Append(self, rdf_value=utils.NotAValue, wire_format=None, **kwargs):
     """Append the value to our internal list."""
     if rdf_value is utils.NotAValue:
@@ -1126,12 +1413,14 @@ class RepeatedFieldHelper(object):
                                        type(rdf_value), e))
 
     self.wrapped_list.append((rdf_value, wire_format))
+    self.dirty = True
 
     return rdf_value
 
   def Pop(self, item):
     result = self[item]
     self.wrapped_list.pop(item)
+    self.dirty = True
     return result
 
   def Extend(self, iterable):
@@ -1153,8 +1442,7 @@ class RepeatedFieldHelper(object):
 
     python_format, wire_format = self.wrapped_list[item]
     if python_format is None:
-      python_format = self.type_descriptor.ConvertFromWireFormat(
-          wire_format, container=self.container)
+      python_format = self.type_descriptor.Decode(wire_format, self.container)
 
       self.wrapped_list[item] = (python_format, wire_format)
 
@@ -1213,6 +1501,7 @@ class ProtoList(ProtoType):
     self.late_bound = delegate.late_bound
 
     self.wire_type = delegate.wire_type
+    self.zero_copy = delegate.zero_copy
 
     super(ProtoList, self).__init__(
         name=delegate.name,
@@ -1247,26 +1536,28 @@ class ProtoList(ProtoType):
 
     return result
 
-  def ConvertFromWireFormat(self, value, container=None):
-    result = RepeatedFieldHelper(type_descriptor=self.delegate)
-    for wire_format in SplitBuffer(value[2]):
-      result.wrapped_list.append((None, wire_format))
+  def CompileDecoder(self):
+    delegate = self.delegate
 
-    return result
+    def Decode(value, container=None):
+      result = RepeatedFieldHelper(type_descriptor=delegate)
+      for wire_format in SplitBuffer(value[2]):
+        result.wrapped_list.append((None, wire_format))
 
-  def ConvertToWireFormat(self, value):
-    """Convert to the wire format.
+      return result
 
-    Args:
-      value: is of type RepeatedFieldHelper.
+    return Decode
 
-    Returns:
-      A wire format representation of the value.
-    """
-    output = SerializeEntries(
-        (python_format, wire_format, value.type_descriptor)
-        for python_format, wire_format in value.wrapped_list)
-    return ("", "", output)
+  def CompileEncoder(self):
+    """The wire format of a RepeatedFieldHelper is that of all its items."""
+
+    def Encode(value):
+      output = SerializeEntries(
+          (python_format, wire_format, value.type_descriptor)
+          for python_format, wire_format in value.wrapped_list)
+      return ("", "", output)
+
+    return Encode
 
   def Format(self, value):
     yield "["
@@ -1294,6 +1585,8 @@ class ProtoList(ProtoType):
     self.late_bound = False
     self.delegate = field_desc
     self.wire_type = self.delegate.wire_type
+    self.zero_copy = self.delegate.zero_copy
+    self.ClearCompiled()
     self.owner.AddDescriptor(self)
 
 
@@ -1426,19 +1719,25 @@ class ProtoRDFValue(ProtoType):
 
     return value
 
-  def ConvertFromWireFormat(self, value, container=None):
+  def CompileDecoder(self):
     # Wire format should be compatible with the data_store_type for the
     # rdfvalue. We use the delegate primitive descriptor to perform the
     # conversion.
-    value = self.primitive_desc.ConvertFromWireFormat(
-        value, container=container)
+    decode_primitive = self.primitive_desc.CompileDecoder()
+    rdf_type = self.type
 
-    result = self.type(value)
+    def Decode(value, container=None):
+      return rdf_type(decode_primitive(value, container))
 
-    return result
+    return Decode
 
-  def ConvertToWireFormat(self, value):
-    return self.primitive_desc.ConvertToWireFormat(value.SerializeToDataStore())
+  def CompileEncoder(self):
+    encode_primitive = self.primitive_desc.CompileEncoder()
+
+    def Encode(value):
+      return encode_primitive(value.SerializeToDataStore())
+
+    return Encode
 
   def Copy(self, field_number=None):
     """Returns descriptor copy, optionally changing field number."""
@@ -1479,6 +1778,7 @@ class RDFStructMetaclass(rdfvalue.RDFValueMetaclass):
 
     cls.type_infos_by_field_number = {}
     cls.type_infos_by_encoded_tag = {}
+    cls.zero_copy_encoded_tags = set()
 
     # Build the class by parsing an existing protobuf class.
     if cls.protobuf is not None:
@@ -1546,6 +1846,11 @@ class RDFStruct(rdfvalue.RDFValue):
   # Stores the raw data here.
   _data = None
 
+  # The serialized data the raw data was parsed from. Used to return the
+  # original data when serializing a struct none of whose fields were accessed
+  # or modified since it was parsed.
+  _serialized = None
+
   # A list of fields which will be removed from this class's type descriptor
   # set.
   suppressions = []
@@ -1595,13 +1900,15 @@ class RDFStruct(rdfvalue.RDFValue):
     self._data = {}
     for name, (obj, serialized, t_info) in other.GetRawData().iteritems():
       if serialized is None:
-        serialized = t_info.ConvertToWireFormat(obj)
+        serialized = t_info.Encode(obj)
 
       self._data[name] = (None, serialized, t_info)
 
   def Clear(self):
     """Clear all the fields."""
     self._data = {}
+    self._serialized = None
+    self.dirty = True
 
   def HasField(self, field_name):
     """Checks if the field exists."""
@@ -1644,12 +1951,24 @@ class RDFStruct(rdfvalue.RDFValue):
 
     return result
 
+  def _DataWithoutViews(self):
+    """Returns the raw data with zero copy buffer views turned into strings."""
+    return dict((name, (obj, _WireFormatWithoutView(serialized), t_info))
+                for name, (obj, serialized, t_info) in self._data.iteritems())
+
   def __deepcopy__(self, memo):
     result = self.__class__()
-    result.SetRawData(copy.deepcopy(self._data, memo))
+    result.SetRawData(copy.deepcopy(self._DataWithoutViews(), memo))
 
     return result
 
+  def __getstate__(self):
+    # Buffer views can not be pickled, so they are stored as strings.
+    state = self.__dict__.copy()
+    state["_data"] = self._DataWithoutViews()
+    state.pop("_serialized", None)
+    return state
+
   def GetRawData(self):
     """Retrieves the raw python representation of the object.
 
@@ -1658,6 +1977,8 @@ class RDFStruct(rdfvalue.RDFValue):
     Returns:
       the raw python object representation (a dict).
     """
+    # The caller may modify the raw data.
+    self._serialized = None
     return self._data
 
   def ListSetFields(self):
@@ -1672,13 +1993,45 @@ class RDFStruct(rdfvalue.RDFValue):
 
   def SetRawData(self, data):
     self._data = data
+    self._serialized = None
     self.dirty = True
 
+  def RememberSerialized(self, serialized):
+    """Records that the current raw data was parsed from serialized."""
+    self._serialized = serialized
+
+  def GetUnmodifiedSerialization(self):
+    """Returns the data this struct was parsed from if it was not modified.
+
+    Decoding a field, setting fields or handing out the raw data forgets the
+    serialized data, so a decoded field can never be modified in place behind
+    its back. Decoded embedded structs keep their own serialized data.
+
+    Returns:
+      The string or buffer passed to RememberSerialized() or None.
+    """
+    return self._serialized
+
   def SerializeToString(self):
+    serialized = self.GetUnmodifiedSerialization()
+    if serialized is not None:
+      return str(serialized)
+
     return SerializeEntries(self._data.itervalues())
 
   def ParseFromString(self, string):
+    """Parses the struct from its serialized form.
+
+    Args:
+      string: The serialized data. This can also be a buffer object, in which
+        case embedded protobufs keep pointing into it instead of being copied
+        (see ReadIntoObject()).
+    """
+    unparsed = not self._data
     ReadIntoObject(string, 0, self)
+    if unparsed:
+      self.RememberSerialized(string)
+
     self.dirty = True
 
   def __eq__(self, other):
@@ -1731,7 +2084,9 @@ class RDFStruct(rdfvalue.RDFValue):
     attr = type_descriptor.name
     # A value of None means we clear the field.
     if value is None:
-      self._data.pop(attr, None)
+      if self._data.pop(attr, None) is not None:
+        self.dirty = True
+        self._serialized = None
       return
 
     # Validate the value and obtain the python format representation.
@@ -1742,6 +2097,7 @@ class RDFStruct(rdfvalue.RDFValue):
 
     # Make sure to invalidate our parent's cache if needed.
     self.dirty = True
+    self._serialized = None
 
     return value
 
@@ -1775,12 +2131,15 @@ class RDFStruct(rdfvalue.RDFValue):
 
       return default
 
+    # The returned value may be modified in place, so the serialized data can
+    # not be trusted any more.
+    self._serialized = None
+
     python_format, wire_format, type_descriptor = entry
 
     # Decode on demand and cache for next time.
     if python_format is None:
-      python_format = type_descriptor.ConvertFromWireFormat(
-          wire_format, container=self)
+      python_format = type_descriptor.Decode(wire_format, self)
 
       self._data[attr] = (python_format, wire_format, type_descriptor)
 
@@ -1836,6 +2195,7 @@ class RDFStruct(rdfvalue.RDFValue):
 
     # Make sure to invalidate our parent's cache if needed.
     self.dirty = True
+    self._serialized = None
 
   @classmethod
   def AddDescriptor(cls, field_desc):
@@ -1870,6 +2230,32 @@ class EnumContainer(object):
       setattr(self, k, v)
 
 
+def _MakeFieldProperty(field_desc):
+  """Creates the property accessing a field of an RDFProtoStruct."""
+  name = field_desc.name
+
+  def Getter(self):
+    # This is Get() for a known field. Unset fields fall back to it to handle
+    # the defaults.
+    entry = self._data.get(name)
+    if entry is None:
+      return self.Get(name)
+
+    self._serialized = None
+
+    python_format = entry[0]
+    if python_format is None:
+      python_format = field_desc.Decode(entry[1], self)
+      self._data[name] = (python_format, entry[1], field_desc)
+
+    return python_format
+
+  def Setter(self, value):
+    self._Set(value, field_desc)  # pylint: disable=protected-access
+
+  return property(Getter, Setter, None, field_desc.description)
+
+
 class RDFProtoStruct(RDFStruct):
   """An RDFStruct which uses protobufs for serialization.
 
@@ -2157,18 +2543,16 @@ class RDFProtoStruct(RDFStruct):
     # We store an index of the type info by tag values to speed up parsing.
     cls.type_infos_by_field_number[field_desc.field_number] = field_desc
     cls.type_infos_by_encoded_tag[field_desc.encoded_tag] = field_desc
+    if field_desc.zero_copy:
+      cls.zero_copy_encoded_tags.add(field_desc.encoded_tag)
 
     cls.type_infos.Append(field_desc)
     cls.late_bound_type_infos.pop(field_desc.name, None)
 
     # Add direct accessors only if the class does not already have them.
     if not hasattr(cls, field_desc.name):
-      # This lambda is a class method so pylint: disable=protected-access
       # This is much faster than __setattr__/__getattr__
-      setattr(cls, field_desc.name,
-              property(lambda self: self.Get(field_desc.name),
-                       lambda self, x: self._Set(x, field_desc), None,
-                       field_desc.description))
+      setattr(cls, field_desc.name, _MakeFieldProperty(field_desc))
 
   def UnionCast(self):
     union_field = getattr(self, self.union_field)
@@ -3,6 +3,8 @@
 """Test RDFStruct implementations."""
 
 
+import copy
+import pickle
 
 from google.protobuf import descriptor_pool
 from google.protobuf import message_factory
@@ -459,6 +461,188 @@ class RDFStructsTest(test_base.RDFValueTestCase):
     # old result instead.
     self.assertTrue("booo" in path.SerializeToString())
 
+  def _MakeNestedStruct(self):
+    tested = TestStruct(foobar="top", int=1)
+    tested.nested.foobar = "nested"
+    tested.nested.nested.int = 42
+    for i in range(3):
+      tested.repeat_nested.Append(foobar="item %d" % i, int=i)
+
+    return tested.SerializeToString()
+
+  def testUnmodifiedStructSerializesToOriginalData(self):
+    serialized = self._MakeNestedStruct()
+
+    tested = TestStruct.FromSerializedString(serialized)
+    self.assertIs(tested.SerializeToString(), serialized)
+
+    # Accessed fields may be modified in place, so the original data is
+    # forgotten. Reading fields does not change the result though.
+    self.assertEqual(tested.nested.nested.int, 42)
+    self.assertEqual(tested.repeat_nested[2].foobar, "item 2")
+    self.assertIsNone(tested.GetUnmodifiedSerialization())
+    self.assertEqual(tested.SerializeToString(), serialized)
+
+  def testDirtyCheckKeepsSerializedDataOfEmbeddedStructs(self):
+    serialized = self._MakeNestedStruct()
+
+    tested = TestStruct.FromSerializedString(serialized)
+    nested = tested.nested
+    nested_serialized = nested.GetUnmodifiedSerialization()
+    self.assertIsNotNone(nested_serialized)
+
+    # Serializing the parent checks if the nested struct is dirty, which must
+    # not make it forget its own serialized data.
+    self.assertEqual(tested.SerializeToString(), serialized)
+    self.assertIs(nested.GetUnmodifiedSerialization(), nested_serialized)
+
+  def testModifyingAccessedFieldInvalidatesSerializedData(self):
+    serialized = self._MakeNestedStruct()
+
+    tested = TestStruct.FromSerializedString(serialized)
+    repeat_nested = tested.repeat_nested
+    repeat_nested[1].int = 5
+
+    result = TestStruct.FromSerializedString(tested.SerializeToString())
+    self.assertEqual([x.int for x in result.repeat_nested], [0, 5, 2])
+
+  def testModifiedStructIsSerializedAgain(self):
+    serialized = self._MakeNestedStruct()
+
+    tested = TestStruct.FromSerializedString(serialized)
+    tested.nested.nested.int = 43
+    self.assertEqual(
+        TestStruct.FromSerializedString(tested.SerializeToString())
+        .nested.nested.int, 43)
+
+    tested = TestStruct.FromSerializedString(serialized)
+    tested.repeat_nested.Append(foobar="item 3")
+    self.assertEqual(
+        len(TestStruct.FromSerializedString(
+            tested.SerializeToString()).repeat_nested), 4)
+
+    tested = TestStruct.FromSerializedString(serialized)
+    tested.repeated.Append("new")
+    self.assertEqual(
+        list(TestStruct.FromSerializedString(tested.SerializeToString())
+             .repeated), ["new"])
+
+    tested = TestStruct.FromSerializedString(serialized)
+    tested.nested.nested = None
+    self.assertFalse(
+        TestStruct.FromSerializedString(tested.SerializeToString()).nested
+        .HasField("nested"))
+
+    tested = TestStruct.FromSerializedString(serialized)
+    tested.nested.Clear()
+    self.assertFalse(
+        TestStruct.FromSerializedString(tested.SerializeToString()).nested
+        .HasField("foobar"))
+
+  def testZeroCopyDecoding(self):
+    serialized = self._MakeNestedStruct()
+
+    tested = TestStruct.FromSerializedString(buffer(serialized))
+    self.assertEqual(tested, TestStruct.FromSerializedString(serialized))
+
+    # Embedded structs are views into the original data, other fields are
+    # regular strings.
+    raw_data = tested.GetRawData()
+    self.assertIs(raw_data["nested"][1][2].__class__, buffer)
+    self.assertIs(raw_data["foobar"][1][2].__class__, str)
+    self.assertIs(
+        tested.repeat_nested.wrapped_list[0][1][2].__class__, buffer)
+    self.assertEqual(tested.nested.foobar, "nested")
+    self.assertEqual(tested.nested.nested.int, 42)
+
+    self.assertEqual(tested.SerializeToString(), serialized)
+    self.assertIs(tested.SerializeToString().__class__, str)
+
+    # Modified zero copy structs can be serialized.
+    tested.foobar = "changed"
+    tested.repeat_nested[1].int = 5
+    result = TestStruct.FromSerializedString(tested.SerializeToString())
+    self.assertEqual(result.foobar, "changed")
+    self.assertEqual(result.nested.nested.int, 42)
+    self.assertEqual([x.int for x in result.repeat_nested], [0, 5, 2])
+
+    # Copies share the views.
+    self.assertEqual(tested.Copy(), tested)
+
+  def testZeroCopyStructsCanBeCopiedAndPickled(self):
+    serialized = self._MakeNestedStruct()
+    expected = TestStruct.FromSerializedString(serialized)
+
+    tested = TestStruct.FromSerializedString(buffer(serialized))
+    self.assertEqual(copy.deepcopy(tested), expected)
+    self.assertEqual(copy.copy(tested), expected)
+    self.assertEqual(pickle.loads(pickle.dumps(tested)), expected)
+
+    # Decoded repeated fields still hold views of their items.
+    tested = TestStruct.FromSerializedString(buffer(serialized))
+    self.assertIs(
+        tested.repeat_nested.wrapped_list[0][1][2].__class__, buffer)
+    self.assertEqual(copy.deepcopy(tested), expected)
+    self.assertEqual(pickle.loads(pickle.dumps(tested)), expected)
+
+  def testAcceleratedCodecMatchesPython(self):
+    if not structs.ACCELERATED_CODEC:
+      self.skipTest("The _semantic extension is not installed.")
+
+    python = structs.PYTHON_CODEC
+    accelerated = structs.ACCELERATED_CODEC
+
+    for value in [0, 1, 127, 128, 300, 2**32, 2**63, 2**64 - 1]:
+      encoded = python["VarintEncode"](value)
+      self.assertEqual(accelerated["VarintEncode"](value), encoded)
+      self.assertEqual(accelerated["VarintReader"]("x" + encoded, 1),
+                       python["VarintReader"]("x" + encoded, 1))
+
+    for value in [-2**63, -1, 0, 5, 2**63 - 1]:
+      encoded = structs.SignedVarintEncode(value)
+      self.assertEqual(accelerated["SignedVarintReader"](encoded, 0),
+                       (value, len(encoded)))
+
+    serialized = self._MakeNestedStruct()
+    self.assertEqual(accelerated["ReadTag"](serialized, 0),
+                     python["ReadTag"](serialized, 0))
+    self.assertEqual(
+        list(accelerated["SplitBuffer"](serialized)),
+        list(python["SplitBuffer"](serialized)))
+
+    views = accelerated["SplitBufferIntoViews"](
+        buffer(serialized), TestStruct.zero_copy_encoded_tags)
+    expected = python["SplitBufferIntoViews"](
+        buffer(serialized), TestStruct.zero_copy_encoded_tags)
+    for field, expected_field in zip(views, expected):
+      self.assertEqual(field[:2], expected_field[:2])
+      self.assertIs(field[2].__class__, expected_field[2].__class__)
+      self.assertEqual(str(field[2]), str(expected_field[2]))
+
+    self.assertRaises(ValueError, accelerated["VarintEncode"], -1)
+    self.assertRaises(IndexError, accelerated["VarintReader"], "\x80", 0)
+    self.assertRaises(ValueError, accelerated["ReadTag"], "\x80", 0)
+    self.assertRaises(rdfvalue.DecodeError, accelerated["SplitBuffer"],
+                      "\x0a\x05abc")
+    self.assertRaises(rdfvalue.DecodeError, accelerated["SplitBuffer"],
+                      "\x0b")
+
+  def testCompiledCodecs(self):
+    descriptor = TestStruct.type_infos["foobar"]
+    sample = TestStruct(foobar="hello", int=3)
+    self.assertEqual(TestStruct.FromSerializedString(
+        sample.SerializeToString()).foobar, "hello")
+
+    # Copies with a different field number must not reuse the compiled tag.
+    copied = descriptor.Copy(field_number=10)
+    self.assertEqual(copied.Encode("x")[0], structs.VarintEncode(10 << 3 | 2))
+    self.assertEqual(descriptor.Encode("x")[0],
+                     structs.VarintEncode(1 << 3 | 2))
+
+    # Compiled descriptors can still be pickled.
+    restored = pickle.loads(pickle.dumps(descriptor))
+    self.assertEqual(restored.Encode("x"), descriptor.Encode("x"))
+
   def testWireFormatAccess(self):
 
     m = rdf_flows.SignedMessageList()
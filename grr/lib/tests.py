@@ -15,8 +15,10 @@ try:
 except ImportError:
   pass
 
+from grr.lib import bloom_filter_test
 from grr.lib import build_test
 from grr.lib import client_index_test
+from grr.lib import client_task_hints_test
 from grr.lib import communicator_test
 from grr.lib import config_lib_test
 from grr.lib import config_validation_test
@@ -38,6 +40,7 @@ from grr.lib import objectfilter_test
 from grr.lib import output_plugin_test
 from grr.lib import parsers_test
 from grr.lib import queue_manager_test
+from grr.lib import queue_notifier_test
 from grr.lib import rekall_profile_server_test
 from grr.lib import repacking_test
 from grr.lib import stats_test
@@ -47,9 +50,11 @@ from grr.lib import throttle_test
 from grr.lib import type_info_test
 from grr.lib import uploads_test
 from grr.lib import utils_test
+from grr.lib import worker_pool_test
 
 from grr.lib.aff4_objects import tests
 from grr.lib.authorization import tests
+from grr.lib.blob_stores import tests
 from grr.lib.builders import tests
 from grr.lib.checks import tests
 from grr.lib.data_stores import tests
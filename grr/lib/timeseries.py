@@ -2,16 +2,53 @@
 """Operations on a series of points, indexed by time.
 """
 
-import copy
+import array
+import bisect
+import itertools
+
+# pylint: disable=g-import-not-at-top
+try:
+  import numpy
+except ImportError:
+  numpy = None
+# pylint: enable=g-import-not-at-top
 
 from grr.lib import rdfvalue
 
 NORMALIZE_MODE_GAUGE = 1
 NORMALIZE_MODE_COUNTER = 2
 
+NAN = float("nan")
+
+try:
+  array.array("q")
+  TIMESTAMP_TYPECODE = "q"
+except ValueError:
+  # Python 2 has no "q" but "l" is 64 bit on the platforms the server runs on.
+  TIMESTAMP_TYPECODE = "l"
+
+
+def _IsNaN(value):
+  return value != value  # pylint: disable=comparison-with-itself
+
+
+def _ToArray(typecode, values):
+  """Converts a numpy array to an array.array without boxing every value."""
+  if typecode == "d":
+    values = values.astype(numpy.float64)
+  else:
+    values = values.astype(numpy.int64)
+  return array.array(typecode, values.tobytes())
+
 
 class Timeseries(object):
-  """Timeseries contains a sequence of points, each with a timestamp."""
+  """Timeseries contains a sequence of points, each with a timestamp.
+
+  The points are kept in two parallel arrays: a double array of values and an
+  integer array of timestamps in microseconds. Missing values are stored as
+  NaN and reported as None. If numpy is installed, the operations on the whole
+  series are vectorized.
+  """
 
   def __init__(self, initializer=None):
     """Create a timeseries with an optional initializer.
@@ -23,13 +60,63 @@ class Timeseries(object):
       RuntimeError: If initializer is not understood.
     """
     if initializer is None:
-      self.data = []
+      self.values = array.array("d")
+      self.timestamps = array.array(TIMESTAMP_TYPECODE)
+      # True as long as all the values are integers. Used to report values
+      # with the type they were added with.
+      self.integral = True
       return
     if isinstance(initializer, Timeseries):
-      self.data = copy.deepcopy(initializer.data)
+      self.values = array.array("d", initializer.values)
+      self.timestamps = array.array(TIMESTAMP_TYPECODE, initializer.timestamps)
+      self.integral = initializer.integral
       return
     raise RuntimeError("Unrecognized initializer.")
 
+  @classmethod
+  def FromValueTimestampPairs(cls, value_timestamp_pairs):
+    """Builds a series from (value, timestamp) pairs in a single pass.
+
+    This is the bulk version of MultiAppend, used to turn the (value,
+    timestamp) lists returned by StatsStore.MultiReadStats into series.
+
+    Args:
+      value_timestamp_pairs: A list of (value, timestamp) tuples ordered by
+        timestamp.
+
+    Returns:
+      A new Timeseries.
+
+    Raises:
+      RuntimeError: If the timestamps are not ordered.
+    """
+    result = cls()
+    if not value_timestamp_pairs:
+      return result
+
+    values, timestamps = zip(*value_timestamp_pairs)
+    timestamps = array.array(TIMESTAMP_TYPECODE,
+                             [result._NormalizeTime(t) for t in timestamps])
+    for previous, current in itertools.izip(timestamps, timestamps[1:]):
+      if current < previous:
+        raise RuntimeError("Next timestamp must be larger.")
+
+    result.integral = all(isinstance(v, (int, long)) for v in values)
+    result.values = array.array("d", [NAN if v is None else v for v in values])
+    result.timestamps = timestamps
+    return result
+
+  @property
+  def data(self):
+    """The points of the series as a list of [value, timestamp] pairs."""
+    if self.integral:
+      convert = int
+    else:
+      convert = float
+
+    return [[None if _IsNaN(v) else convert(v), t]
+            for v, t in itertools.izip(self.values, self.timestamps)]
+
   def _NormalizeTime(self, time):
     """Normalize a time to be an int measured in microseconds."""
     if isinstance(time, rdfvalue.RDFDatetime):
@@ -52,9 +139,16 @@ class Timeseries(object):
     """
 
     timestamp = self._NormalizeTime(timestamp)
-    if self.data and timestamp < self.data[-1][1]:
+    if self.timestamps and timestamp < self.timestamps[-1]:
       raise RuntimeError("Next timestamp must be larger.")
-    self.data.append([value, timestamp])
+
+    if value is None:
+      value = NAN
+    elif not isinstance(value, (int, long)):
+      self.integral = False
+
+    self.values.append(value)
+    self.timestamps.append(timestamp)
 
   def MultiAppend(self, value_timestamp_pairs):
     """Adds multiple value<->timestamp pairs.
@@ -74,14 +168,19 @@ class Timeseries(object):
       start_time: If set, timestamps before start_time will be dropped.
       stop_time: If set, timestamps at or past stop_time will be dropped.
     """
+    # Timestamps are ordered so the range can be found by bisection.
+    start_index = 0
+    if start_time is not None:
+      start_index = bisect.bisect_left(self.timestamps,
+                                       self._NormalizeTime(start_time))
 
-    start_time = self._NormalizeTime(start_time)
-    stop_time = self._NormalizeTime(stop_time)
-    self.data = [
-        p for p in self.data
-        if (start_time is None or p[1] >= start_time
-           ) and (stop_time is None or p[1] < stop_time)
-    ]
+    stop_index = len(self.timestamps)
+    if stop_time is not None:
+      stop_index = bisect.bisect_left(self.timestamps,
+                                      self._NormalizeTime(stop_time))
+
+    self.values = self.values[start_index:stop_index]
+    self.timestamps = self.timestamps[start_index:stop_index]
 
   def Normalize(self, period, start_time, stop_time, mode=NORMALIZE_MODE_GAUGE):
     """Normalize the series to have a fixed period over a fixed time range.
@@ -119,33 +218,93 @@ class Timeseries(object):
     period = self._NormalizeTime(period)
     start_time = self._NormalizeTime(start_time)
     stop_time = self._NormalizeTime(stop_time)
-    if not self.data:
+    if not self.values:
       return
 
     self.FilterRange(start_time, stop_time)
 
-    grouped = {}
-    for value, timestamp in self.data:
-      offset = timestamp - start_time
-      shifted_offset = offset - (offset % period)
-      grouped.setdefault(shifted_offset, []).append(value)
-
-    self.data = []
-    last_value = None
-    for offset in range(0, stop_time - start_time, period):
-      g = grouped.get(offset)
-      if mode == NORMALIZE_MODE_GAUGE:
-        v = None
-        if g:
-          v = float(sum(g)) / float(len(g))
-        self.data.append([v, offset + start_time])
-      else:
-        if g:
-          for v in g:
-            if v < last_value:
-              raise RuntimeError("Next value must not be smaller.")
-            last_value = v
-        self.data.append([last_value, offset + start_time])
+    bucket_count = len(xrange(0, stop_time - start_time, period))
+    if numpy is not None:
+      values = self._NormalizeVectorized(period, start_time, bucket_count, mode)
+    else:
+      values = self._NormalizeLoop(period, start_time, bucket_count, mode)
+
+    if mode == NORMALIZE_MODE_GAUGE:
+      self.integral = False
+
+    self.values = values
+    self.timestamps = array.array(
+        TIMESTAMP_TYPECODE, xrange(start_time, start_time + bucket_count *
+                                   period, period))
+
+  def _NormalizeLoop(self, period, start_time, bucket_count, mode):
+    """Computes the normalized values one point at a time."""
+    result = array.array("d", [NAN]) * bucket_count
+    if mode == NORMALIZE_MODE_GAUGE:
+      sums = [0.0] * bucket_count
+      counts = [0] * bucket_count
+      for value, timestamp in itertools.izip(self.values, self.timestamps):
+        if not _IsNaN(value):
+          index = (timestamp - start_time) // period
+          sums[index] += value
+          counts[index] += 1
+
+      for index, count in enumerate(counts):
+        if count:
+          result[index] = sums[index] / count
+    else:
+      last_value = NAN
+      for value, timestamp in itertools.izip(self.values, self.timestamps):
+        if _IsNaN(value):
+          continue
+        if value < last_value:
+          raise RuntimeError("Next value must not be smaller.")
+        last_value = value
+        result[(timestamp - start_time) // period] = value
+
+      # Carry the last value seen forward into intervals without points.
+      last_value = NAN
+      for index, value in enumerate(result):
+        if _IsNaN(value):
+          result[index] = last_value
+        else:
+          last_value = value
+
+    return result
+
+  def _NormalizeVectorized(self, period, start_time, bucket_count, mode):
+    """Computes the normalized values with numpy."""
+    values = numpy.frombuffer(self.values, dtype=numpy.float64)
+    timestamps = numpy.frombuffer(self.timestamps, dtype=numpy.int64)
+    valid = ~numpy.isnan(values)
+    values = values[valid]
+    indices = (timestamps[valid] - start_time) // period
+
+    if mode == NORMALIZE_MODE_GAUGE:
+      sums = numpy.bincount(indices, weights=values, minlength=bucket_count)
+      counts = numpy.bincount(indices, minlength=bucket_count)
+      with numpy.errstate(invalid="ignore", divide="ignore"):
+        result = numpy.where(counts > 0, sums / counts, numpy.nan)
+      return _ToArray("d", result)
+
+    if numpy.any(values[1:] < values[:-1]):
+      raise RuntimeError("Next value must not be smaller.")
+
+    result = numpy.full(bucket_count, numpy.nan)
+    if values.size:
+      # The last point of every interval wins.
+      last_in_interval = numpy.append(indices[1:] != indices[:-1], True)
+      result[indices[last_in_interval]] = values[last_in_interval]
+
+      # Carry the last value seen forward into intervals without points.
+      positions = numpy.where(numpy.isnan(result), 0,
+                              numpy.arange(bucket_count))
+      numpy.maximum.accumulate(positions, out=positions)
+      first = indices[0]
+      result = result[positions]
+      result[:first] = numpy.nan
+
+    return _ToArray("d", result)
 
   def MakeIncreasing(self):
     """Makes the time series increasing.
@@ -159,15 +318,29 @@ class Timeseries(object):
     larger than the previous level.
 
     """
+    if numpy is not None:
+      values = numpy.frombuffer(self.values, dtype=numpy.float64).copy()
+      valid = ~numpy.isnan(values)
+      present = values[valid]
+      previous = present[:-1]
+      # Assume that it was only reset once.
+      resets = (previous != 0) & (previous > present[1:])
+      present[1:] += numpy.cumsum(numpy.where(resets, previous, 0))
+      values[valid] = present
+      self.values = _ToArray("d", values)
+      return
+
     offset = 0
     last_value = None
-    for p in self.data:
-      if last_value and last_value > p[0]:
+    for index, value in enumerate(self.values):
+      if _IsNaN(value):
+        continue
+      if last_value and last_value > value:
         # Assume that it was only reset once.
         offset += last_value
-      last_value = p[0]
+      last_value = value
       if offset:
-        p[0] += offset
+        self.values[index] = value + offset
 
   def ToDeltas(self):
     """Convert the sequence to the sequence of differences between points.
@@ -175,15 +348,19 @@ class Timeseries(object):
     The value of each point v[i] is replaced by v[i+1] - v[i], except for the
     last point which is dropped.
     """
-    if len(self.data) < 2:
-      self.data = []
+    if len(self.values) < 2:
+      self.values = array.array("d")
+      self.timestamps = array.array(TIMESTAMP_TYPECODE)
       return
-    for i in range(0, len(self.data) - 1):
-      if self.data[i][0] is None or self.data[i + 1][0] is None:
-        self.data[i][0] = None
-      else:
-        self.data[i][0] = self.data[i + 1][0] - self.data[i][0]
-    del self.data[-1]
+
+    # Missing values propagate as NaN.
+    if numpy is not None:
+      self.values = _ToArray(
+          "d", numpy.diff(numpy.frombuffer(self.values, dtype=numpy.float64)))
+    else:
+      self.values = array.array(
+          "d", [b - a for a, b in itertools.izip(self.values, self.values[1:])])
+    del self.timestamps[-1]
 
   def Add(self, other):
     """Add other to self pointwise.
@@ -198,24 +375,48 @@ class Timeseries(object):
     Raises:
       RuntimeError: other does not contain the same timestamps as self.
     """
-    if len(self.data) != len(other.data):
+    if len(self.values) != len(other.values):
       raise RuntimeError("Can only add series of identical lengths.")
-    for i in range(len(self.data)):
-      if self.data[i][1] != other.data[i][1]:
-        raise RuntimeError("Timestamp mismatch.")
-      if self.data[i][0] is None and other.data[i][0] is None:
+    if self.timestamps != other.timestamps:
+      raise RuntimeError("Timestamp mismatch.")
+
+    self.integral = self.integral and other.integral
+    if numpy is not None:
+      values = numpy.frombuffer(self.values, dtype=numpy.float64)
+      other_values = numpy.frombuffer(other.values, dtype=numpy.float64)
+      missing = numpy.isnan(values)
+      other_missing = numpy.isnan(other_values)
+      result = (numpy.where(missing, 0, values) +
+                numpy.where(other_missing, 0, other_values))
+      result[missing & other_missing] = numpy.nan
+      self.values = _ToArray("d", result)
+      return
+
+    for index, other_value in enumerate(other.values):
+      if _IsNaN(other_value):
         continue
-      self.data[i][0] = (self.data[i][0] or 0) + (other.data[i][0] or 0)
+      value = self.values[index]
+      if _IsNaN(value):
+        value = 0
+      self.values[index] = value + other_value
 
   def Rescale(self, multiplier):
     """Multiply pointwise by multiplier."""
-    for p in self.data:
-      if p[0] is not None:
-        p[0] *= multiplier
+    if not isinstance(multiplier, (int, long)):
+      self.integral = False
+
+    if numpy is not None:
+      self.values = _ToArray(
+          "d", numpy.frombuffer(self.values, dtype=numpy.float64) * multiplier)
+    else:
+      self.values = array.array("d", [v * multiplier for v in self.values])
 
   def Mean(self):
     """Return the arithmatic mean of all values."""
-    values = [v for v, _ in self.data if v is not None]
+    values = [v for v in self.values if not _IsNaN(v)]
     if not values:
       return None
+    if self.integral:
+      # Integer series have an integer mean, just like Python's division.
+      return long(sum(values)) // len(values)
     return sum(values) / len(values)
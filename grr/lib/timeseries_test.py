@@ -4,6 +4,7 @@
 from grr.lib import flags
 from grr.lib import test_lib
 from grr.lib import timeseries
+from grr.lib import utils
 
 
 class TimeseriesTest(test_lib.GRRBaseTest):
@@ -117,6 +118,61 @@ class TimeseriesTest(test_lib.GRRBaseTest):
     self.assertEqual(100, len(s.data))
     self.assertEqual(50, s.Mean())
 
+  def testFromValueTimestampPairs(self):
+    s = timeseries.Timeseries.FromValueTimestampPairs([(1, 1000), (None, 2000),
+                                                       (2.5, 3000)])
+    self.assertEqual([[1, 1000], [None, 2000], [2.5, 3000]], s.data)
+
+    self.assertRaises(RuntimeError,
+                      timeseries.Timeseries.FromValueTimestampPairs,
+                      [(1, 2000), (2, 1000)])
+
+  def testMissingValues(self):
+    s1 = timeseries.Timeseries()
+    s2 = timeseries.Timeseries()
+    for i, (v1, v2) in enumerate([(1, None), (None, None), (None, 2)]):
+      s1.Append(v1, i * 1000)
+      s2.Append(v2, i * 1000)
+
+    s1.Add(s2)
+    self.assertEqual([[1, 0], [None, 1000], [2, 2000]], s1.data)
+
+    s1.ToDeltas()
+    self.assertEqual([[None, 0], [None, 1000]], s1.data)
+
+  def testNormalizeCounterCarriesLastValue(self):
+    s = timeseries.Timeseries()
+    s.Append(5, 250)
+    s.Append(7, 260)
+    s.Append(9, 700)
+    s.Normalize(100, 0, 1000, mode=timeseries.NORMALIZE_MODE_COUNTER)
+    self.assertEqual([None, None, 7, 7, 7, 7, 7, 9, 9, 9],
+                     [v for v, _ in s.data])
+
+    s = timeseries.Timeseries()
+    s.Append(5, 100)
+    s.Append(4, 200)
+    self.assertRaises(
+        RuntimeError,
+        s.Normalize,
+        100,
+        0,
+        1000,
+        mode=timeseries.NORMALIZE_MODE_COUNTER)
+
+
+class TimeseriesWithoutNumpyTest(TimeseriesTest):
+  """Runs the same tests with the pure Python implementation."""
+
+  def setUp(self):
+    super(TimeseriesWithoutNumpyTest, self).setUp()
+    self.numpy_stubber = utils.Stubber(timeseries, "numpy", None)
+    self.numpy_stubber.Start()
+
+  def tearDown(self):
+    self.numpy_stubber.Stop()
+    super(TimeseriesWithoutNumpyTest, self).tearDown()
+
 
 def main(argv):
   test_lib.main(argv)
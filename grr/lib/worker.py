@@ -15,6 +15,7 @@ from grr.lib import flags
 from grr.lib import flow
 from grr.lib import master
 from grr.lib import queue_manager as queue_manager_lib
+from grr.lib import queue_notifier
 from grr.lib import queues as queues_config
 from grr.lib import registry
 # pylint: disable=unused-import
@@ -23,6 +24,7 @@ from grr.lib import server_stubs
 from grr.lib import stats
 from grr.lib import threadpool
 from grr.lib import utils
+from grr.lib import worker_pool as worker_pool_lib
 from grr.lib.rdfvalues import flows as rdf_flows
 
 
@@ -89,6 +91,12 @@ class GRRWorker(object):
     self.token = token
     self.last_active = 0
 
+    # With shard assignment, workers mostly read the notification shards they
+    # own and only look at other shards when they are idle.
+    self.worker_pool = None
+    if config_lib.CONFIG["Worker.shard_assignment"]:
+      self.worker_pool = worker_pool_lib.WorkerPool(token=token)
+
     # Well known flows are just instantiated.
     self.well_known_flows = flow.WellKnownFlow.GetAllWellKnownFlows(token=token)
     self.flow_lease_time = config_lib.CONFIG["Worker.flow_lease_time"]
@@ -114,14 +122,23 @@ class GRRWorker(object):
           else:
             interval = self.SHORT_POLLING_INTERVAL
 
-          time.sleep(interval)
+          self._WaitForNotifications(interval)
         else:
           self.last_active = time.time()
 
     except KeyboardInterrupt:
       logging.info("Caught interrupt, exiting.")
+      if self.worker_pool:
+        self.worker_pool.Leave()
       self.thread_pool.Join()
 
+  def _WaitForNotifications(self, timeout):
+    """Waits until our queues are notified or the polling interval expires."""
+    if queue_notifier.NOTIFIER is None:
+      time.sleep(timeout)
+    elif queue_notifier.NOTIFIER.Wait(self.queues, timeout):
+      stats.STATS.IncrementCounter("worker_queue_notifier_wakeups")
+
   def RunOnce(self):
     """Processes one set of messages from Task Scheduler.
 
@@ -134,18 +151,13 @@ class GRRWorker(object):
     start_time = time.time()
     processed = 0
 
-    queue_manager = queue_manager_lib.QueueManager(token=self.token)
-    for queue in self.queues:
-      # Freezeing the timestamp used by queue manager to query/delete
-      # notifications to avoid possible race conditions.
-      queue_manager.FreezeTimestamp()
-
-      fetch_messages_start = time.time()
-      notifications_by_priority = queue_manager.GetNotificationsByPriority(
-          queue)
-      stats.STATS.RecordEvent("worker_time_to_retrieve_notifications",
-                              time.time() - fetch_messages_start)
+    if self.worker_pool:
+      self.worker_pool.Heartbeat()
 
+    queue_manager = queue_manager_lib.QueueManager(
+        token=self.token, worker_pool=self.worker_pool)
+    for queue, notifications_by_priority in self._IterNotificationsByPriority(
+        queue_manager):
       # Process stuck flows first
       stuck_flows = notifications_by_priority.pop(queue_manager.STUCK_PRIORITY,
                                                   [])
@@ -183,12 +195,61 @@ class GRRWorker(object):
         if flags.FLAGS.debug:
           pdb.post_mortem()
 
-      queue_manager.UnfreezeTimestamp()
       # If we have spent too much time, stop.
       if (time.time() - start_time) > self.RUN_ONCE_MAX_SECONDS:
-        return processed
+        break
+
+    if self.worker_pool:
+      # If there was nothing to do in our own shards, help the other workers
+      # on the next run and go back to our own shards after that.
+      self.worker_pool.stealing = not processed and not self.worker_pool.stealing
+
     return processed
 
+  def _IterNotificationsByPriority(self, queue_manager):
+    """Yields notifications by priority for every queue this worker serves.
+
+    The queue manager's timestamp is frozen while the notifications yielded
+    are being processed. If Worker.notification_fetch_threads is set, all the
+    queues are fetched concurrently up front under a single frozen timestamp.
+
+    Args:
+      queue_manager: The QueueManager to fetch notifications with.
+
+    Yields:
+      Tuples of (queue, dict of notifications keyed by priority).
+    """
+    if queue_manager.notification_fetch_threads > 0:
+      queue_manager.FreezeTimestamp()
+      try:
+        fetch_messages_start = time.time()
+        notifications = queue_manager.MultiGetNotificationsByPriority(
+            self.queues)
+        stats.STATS.RecordEvent("worker_time_to_retrieve_notifications",
+                                time.time() - fetch_messages_start)
+
+        for queue in self.queues:
+          yield queue, notifications[queue]
+      finally:
+        queue_manager.UnfreezeTimestamp()
+
+      return
+
+    for queue in self.queues:
+      # Freezeing the timestamp used by queue manager to query/delete
+      # notifications to avoid possible race conditions.
+      queue_manager.FreezeTimestamp()
+      try:
+        fetch_messages_start = time.time()
+        notifications_by_priority = queue_manager.GetNotificationsByPriority(
+            queue)
+        stats.STATS.RecordEvent("worker_time_to_retrieve_notifications",
+                                time.time() - fetch_messages_start)
+
+        yield queue, notifications_by_priority
+      finally:
+        queue_manager.UnfreezeTimestamp()
+
   def ProcessStuckFlows(self, stuck_flows, queue_manager):
     stats.STATS.IncrementCounter("grr_flows_stuck", len(stuck_flows))
 
@@ -228,6 +289,11 @@ class GRRWorker(object):
     """
     now = time.time()
     processed = 0
+    if self.worker_pool:
+      assignment = self.worker_pool.assignment
+    else:
+      assignment = "disabled"
+
     for notification in active_notifications:
       if notification.session_id not in self.queued_flows:
         if time_limit and time.time() - now > time_limit:
@@ -237,7 +303,7 @@ class GRRWorker(object):
         self.queued_flows.Put(notification.session_id, 1)
         self.thread_pool.AddTask(
             target=self._ProcessMessages,
-            args=(notification, queue_manager.Copy()),
+            args=(notification, queue_manager.Copy(), assignment),
             name=self.__class__.__name__)
 
     return processed
@@ -263,11 +329,16 @@ class GRRWorker(object):
       logging.error("Flow %s: %s", flow_obj, e)
       raise FlowProcessingError(e)
 
-  def _ProcessMessages(self, notification, queue_manager):
+  def _ProcessMessages(self, notification, queue_manager,
+                       assignment="disabled"):
     """Does the real work with a single flow."""
     flow_obj = None
     session_id = notification.session_id
 
+    # Lock contention per shard assignment mode shows how much lock round
+    # trips shard assignment saves.
+    stats.STATS.IncrementCounter(
+        "worker_flow_lock_attempts", fields=[assignment])
     try:
       # Take a lease on the flow:
       flow_name = session_id.FlowName()
@@ -331,6 +402,8 @@ class GRRWorker(object):
       # indicate we are wasting time trying to process work that has already
       # been completed by other workers.
       stats.STATS.IncrementCounter("worker_flow_lock_error")
+      stats.STATS.IncrementCounter(
+          "worker_flow_lock_contention", fields=[assignment])
 
     except FlowProcessingError:
       # Do nothing as we expect the error to be correctly logged and accounted
@@ -364,3 +437,10 @@ class WorkerInit(registry.InitHook):
     stats.STATS.RegisterEventMetric(
         "worker_flow_processing_time", fields=[("flow", str)])
     stats.STATS.RegisterEventMetric("worker_time_to_retrieve_notifications")
+    stats.STATS.RegisterCounterMetric("worker_queue_notifier_wakeups")
+    stats.STATS.RegisterCounterMetric(
+        "worker_flow_lock_attempts", fields=[("shard_assignment", str)])
+    stats.STATS.RegisterCounterMetric(
+        "worker_flow_lock_contention", fields=[("shard_assignment", str)])
+    stats.STATS.RegisterCounterMetric("worker_pool_rebalances")
+    stats.STATS.RegisterGaugeMetric("worker_pool_size", int)
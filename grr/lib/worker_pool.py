@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""Assignment of notification shards to the workers of a worker pool.
+
+Workers that have shard assignment enabled heartbeat into the data store. The
+live workers are placed on a consistent hash ring and every notification shard
+is owned by exactly one of them, so workers mostly process disjoint sets of
+sessions instead of racing each other for the same flow locks. When a worker
+joins or leaves the pool only the shards next to it on the ring move.
+
+A worker only heartbeats while it is running, so the shards of a worker that
+stops or leaves the pool are taken over by the remaining workers.
+"""
+
+
+import bisect
+import hashlib
+import os
+import socket
+import time
+
+import logging
+
+from grr.lib import config_lib
+from grr.lib import data_store
+from grr.lib import rdfvalue
+from grr.lib import stats
+
+
+class HashRing(object):
+  """A consistent hash ring mapping keys to members."""
+
+  def __init__(self, members, replicas=64):
+    """Constructor.
+
+    Args:
+      members: A list of member names.
+      replicas: The number of points every member gets on the ring. More
+        points spread the keys more evenly.
+    """
+    self.members = sorted(set(members))
+    ring = []
+    for member in self.members:
+      for i in range(replicas):
+        ring.append((self._Hash("%s#%d" % (member, i)), member))
+
+    ring.sort()
+    self._hashes = [point for point, _ in ring]
+    self._owners = [member for _, member in ring]
+
+  def _Hash(self, key):
+    return int(hashlib.md5(key).hexdigest()[:16], 16)
+
+  def GetOwner(self, key):
+    """Returns the member owning the key or None if the ring is empty."""
+    if not self._hashes:
+      return None
+
+    index = bisect.bisect(self._hashes, self._Hash(key)) % len(self._hashes)
+    return self._owners[index]
+
+
+class WorkerPool(object):
+  """Tracks the live workers of the pool and the shards this worker owns."""
+
+  POOL_URN = rdfvalue.RDFURN("aff4:/worker_pool")
+  HEARTBEAT_PREFIX = "worker:heartbeat:"
+
+  # Workers that missed this many heartbeats are considered gone.
+  MISSED_HEARTBEATS = 3
+
+  def __init__(self, worker_id=None, token=None):
+    """Constructor.
+
+    Args:
+      worker_id: A name unique to this worker. Defaults to host name and pid.
+      token: The token to use for the data store.
+    """
+    if worker_id is None:
+      worker_id = "%s_%d" % (socket.gethostname(), os.getpid())
+
+    self.worker_id = worker_id
+    self.token = token
+    self.heartbeat_interval = config_lib.CONFIG["Worker.heartbeat_interval"]
+    self.last_heartbeat = 0
+    self.ring = HashRing([worker_id])
+
+    # Set by the worker when it is idle and should take work from shards owned
+    # by other workers.
+    self.stealing = False
+
+  def Heartbeat(self, force=False):
+    """Announces this worker and refreshes the pool membership.
+
+    Args:
+      force: Heartbeat even if the heartbeat interval has not passed yet.
+    """
+    now = time.time()
+    if not force and now - self.last_heartbeat < self.heartbeat_interval:
+      return
+
+    self.last_heartbeat = now
+    data_store.DB.Set(
+        self.POOL_URN,
+        self.HEARTBEAT_PREFIX + self.worker_id,
+        "",
+        token=self.token)
+
+    cutoff = (now - self.MISSED_HEARTBEATS * self.heartbeat_interval) * 1e6
+    members = [self.worker_id]
+    stale = []
+    for predicate, _, ts in data_store.DB.ResolvePrefix(
+        self.POOL_URN,
+        self.HEARTBEAT_PREFIX,
+        timestamp=data_store.DB.NEWEST_TIMESTAMP,
+        token=self.token):
+      if ts < cutoff:
+        stale.append(predicate)
+      else:
+        members.append(predicate[len(self.HEARTBEAT_PREFIX):])
+
+    if stale:
+      data_store.DB.DeleteAttributes(
+          self.POOL_URN, stale, end=int(cutoff), token=self.token)
+
+    ring = HashRing(members)
+    if ring.members != self.ring.members:
+      logging.info("Worker pool changed, %d workers are active.",
+                   len(ring.members))
+      stats.STATS.IncrementCounter("worker_pool_rebalances")
+      self.ring = ring
+
+    stats.STATS.SetGaugeValue("worker_pool_size", len(self.ring.members))
+
+  def Leave(self):
+    """Removes this worker from the pool so its shards are taken over."""
+    data_store.DB.DeleteAttributes(
+        self.POOL_URN, [self.HEARTBEAT_PREFIX + self.worker_id],
+        token=self.token)
+    self.ring = HashRing([self.worker_id])
+
+  def Owns(self, queue_shard):
+    return self.ring.GetOwner(str(queue_shard)) == self.worker_id
+
+  def GetShardsToRead(self, queue_shards):
+    """Returns the shards this worker should read notifications from.
+
+    Args:
+      queue_shards: All the notification shards of a queue.
+
+    Returns:
+      The shards owned by this worker, or all of them when stealing.
+    """
+    if self.stealing:
+      return queue_shards
+
+    return [shard for shard in queue_shards if self.Owns(shard)]
+
+  @property
+  def assignment(self):
+    """Describes how notifications are currently picked, for stats."""
+    if self.stealing:
+      return "stolen"
+    return "owned"
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""Tests for grr.lib.worker_pool."""
+
+from grr.lib import flags
+from grr.lib import queue_manager
+from grr.lib import queues
+from grr.lib import test_lib
+from grr.lib import worker_pool
+
+
+class HashRingTest(test_lib.GRRBaseTest):
+  """Tests for the consistent hash ring."""
+
+  def testEmptyRingHasNoOwner(self):
+    self.assertIsNone(worker_pool.HashRing([]).GetOwner("aff4:/F"))
+
+  def testOnlyNeighbouringKeysMoveWhenMemberLeaves(self):
+    keys = ["aff4:/F/%d" % i for i in range(200)]
+    before = worker_pool.HashRing(["a", "b", "c"])
+    after = worker_pool.HashRing(["a", "b"])
+
+    for key in keys:
+      if before.GetOwner(key) != "c":
+        self.assertEqual(before.GetOwner(key), after.GetOwner(key))
+
+    owners = set(before.GetOwner(key) for key in keys)
+    self.assertEqual(owners, set(["a", "b", "c"]))
+
+
+class WorkerPoolTest(test_lib.GRRBaseTest):
+  """Tests for the worker pool membership."""
+
+  def setUp(self):
+    super(WorkerPoolTest, self).setUp()
+    self.config_overrider = test_lib.ConfigOverrider({
+        "Worker.queue_shards": 8,
+        "Worker.heartbeat_interval": 10
+    })
+    self.config_overrider.Start()
+
+  def tearDown(self):
+    self.config_overrider.Stop()
+    super(WorkerPoolTest, self).tearDown()
+
+  def _GetShards(self):
+    manager = queue_manager.QueueManager(token=self.token)
+    return manager.GetAllNotificationShards(queues.FLOWS)
+
+  def testWorkersSplitShards(self):
+    pool1 = worker_pool.WorkerPool(worker_id="worker1", token=self.token)
+    pool2 = worker_pool.WorkerPool(worker_id="worker2", token=self.token)
+
+    with test_lib.FakeTime(1000):
+      pool1.Heartbeat()
+      pool2.Heartbeat()
+      pool1.Heartbeat(force=True)
+
+    shards = self._GetShards()
+    shards1 = pool1.GetShardsToRead(shards)
+    shards2 = pool2.GetShardsToRead(shards)
+    self.assertFalse(set(shards1) & set(shards2))
+    self.assertItemsEqual(shards1 + shards2, shards)
+
+    pool1.stealing = True
+    self.assertEqual(pool1.GetShardsToRead(shards), shards)
+
+  def testDeadWorkersShardsAreTakenOver(self):
+    pool1 = worker_pool.WorkerPool(worker_id="worker1", token=self.token)
+    pool2 = worker_pool.WorkerPool(worker_id="worker2", token=self.token)
+
+    with test_lib.FakeTime(1000):
+      pool2.Heartbeat()
+      pool1.Heartbeat()
+    self.assertEqual(pool1.ring.members, ["worker1", "worker2"])
+
+    # worker2 misses its heartbeats.
+    with test_lib.FakeTime(1000 + 10 * 4):
+      pool1.Heartbeat()
+    self.assertEqual(pool1.ring.members, ["worker1"])
+
+    shards = self._GetShards()
+    self.assertEqual(pool1.GetShardsToRead(shards), shards)
+
+  def testLeave(self):
+    pool1 = worker_pool.WorkerPool(worker_id="worker1", token=self.token)
+    pool2 = worker_pool.WorkerPool(worker_id="worker2", token=self.token)
+
+    with test_lib.FakeTime(1000):
+      pool2.Heartbeat()
+      pool2.Leave()
+      pool1.Heartbeat()
+    self.assertEqual(pool1.ring.members, ["worker1"])
+
+  def testQueueManagerOnlyReadsOwnedShards(self):
+    pool = worker_pool.WorkerPool(worker_id="worker1", token=self.token)
+    pool.ring = worker_pool.HashRing(["worker1", "worker2"])
+    manager = queue_manager.QueueManager(token=self.token, worker_pool=pool)
+
+    owned = pool.GetShardsToRead(self._GetShards())
+    read = set()
+    for _ in range(20):
+      read.add(manager._GetNotificationShardToRead(queues.FLOWS))
+
+    self.assertItemsEqual(read, owned)
+
+
+def main(argv):
+  # Run the full test suite
+  test_lib.GrrTestProgram(argv=argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -798,7 +798,8 @@ def Start(db,
       cmd.LOCK_SUBJECT: (reqhandler_cls.SERVICE.LockSubject, "w"),
       cmd.EXTEND_SUBJECT: (reqhandler_cls.SERVICE.ExtendSubject, "w"),
       cmd.UNLOCK_SUBJECT: (reqhandler_cls.SERVICE.UnlockSubject, "w"),
-      cmd.SCAN_ATTRIBUTES: (reqhandler_cls.SERVICE.ScanAttributes, "r")
+      cmd.SCAN_ATTRIBUTES: (reqhandler_cls.SERVICE.ScanAttributes, "r"),
+      cmd.APPLY_MUTATIONS: (reqhandler_cls.SERVICE.ApplyMutations, "w")
   }
 
   # Initialize nonce store for authentication.
@@ -109,7 +109,17 @@ class DataStoreService(object):
   @RPCWrapper
   def MultiSet(self, request, unused_response):
     """Set multiple attributes for a given subject at once."""
+    values, to_delete = self._MultiSetValues(request)
+    self.db.MultiSet(
+        request.subject[0],
+        values,
+        to_delete=to_delete,
+        sync=request.sync,
+        replace=False,
+        token=request.token)
 
+  def _MultiSetValues(self, request):
+    """Extracts the values and attributes to delete of a MultiSet request."""
     values = {}
     to_delete = set()
 
@@ -125,13 +135,7 @@ class DataStoreService(object):
         values.setdefault(value.attribute, []).append(
             (value.value.GetValue(), timestamp))
 
-    self.db.MultiSet(
-        request.subject[0],
-        values,
-        to_delete=to_delete,
-        sync=request.sync,
-        replace=False,
-        token=request.token)
+    return values, to_delete
 
   @RPCWrapper
   def ResolveMulti(self, request, response):
@@ -213,6 +217,30 @@ class DataStoreService(object):
     token = request.token
     self.db.DeleteSubject(subject, token=token)
 
+  @RPCWrapper
+  def ApplyMutations(self, request, unused_response):
+    """Applies a batch of mutations through a single mutation pool."""
+    mutation_type = rdf_data_store.DataStoreMutation.Type
+    pool = self.db.GetMutationPool(token=request.token)
+
+    for mutation in request.mutations:
+      mutation_request = mutation.request
+      subject = mutation_request.subject[0]
+      if mutation.type == mutation_type.MULTI_SET:
+        values, to_delete = self._MultiSetValues(mutation_request)
+        pool.MultiSet(subject, values, replace=False, to_delete=to_delete)
+      elif mutation.type == mutation_type.DELETE_ATTRIBUTES:
+        timestamp = self.FromTimestampSpec(mutation_request.timestamp)
+        start, end = timestamp  # pylint: disable=unpacking-non-sequence
+        attributes = [v.attribute for v in mutation_request.values]
+        pool.DeleteAttributes(subject, attributes, start=start, end=end)
+      elif mutation.type == mutation_type.DELETE_SUBJECT:
+        pool.DeleteSubject(subject)
+      else:
+        raise data_store.Error("Unknown mutation type %s" % mutation.type)
+
+    self.db.ApplyMutations(pool)
+
   def _NewTransaction(self, subject, duration, response):
     transid = utils.SmartStr(uuid.uuid4())
     now = time.time() * 1e6
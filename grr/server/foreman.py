@@ -3,7 +3,10 @@
 """RDFValue instances related to the foreman implementation."""
 
 
+import bisect
 import itertools
+import re
+import time
 
 from grr.lib import aff4
 from grr.lib import utils
@@ -237,3 +240,332 @@ class ForemanRule(rdf_structs.RDFProtoStruct):
 class ForemanRules(rdf_protodict.RDFValueArray):
   """A list of rules that the foreman will apply."""
   rdf_type = ForemanRule
+
+
+class _IntervalIndex(object):
+  """Integer client rules on one attribute.
+
+  Every rule either bounds the value from one side or asks for one value.
+  Bounded rules are kept sorted by their bound, so the matching ones form a
+  contiguous slice found by bisection. A lookup takes O(log n + k) for k
+  matching rules.
+  """
+
+  def __init__(self):
+    # Sorted upper bounds and the ids of the clauses they belong to.
+    self.highs = []
+    self.at_most = []
+    # Sorted lower bounds and the ids of the clauses they belong to.
+    self.lows = []
+    self.at_least = []
+    # Maps values to the ids of the clauses asking for them.
+    self.equal = {}
+
+  def AddAtMost(self, clause_id, high):
+    position = bisect.bisect_right(self.highs, high)
+    self.highs.insert(position, high)
+    self.at_most.insert(position, clause_id)
+
+  def AddAtLeast(self, clause_id, low):
+    position = bisect.bisect_right(self.lows, low)
+    self.lows.insert(position, low)
+    self.at_least.insert(position, clause_id)
+
+  def AddEqual(self, clause_id, value):
+    self.equal.setdefault(value, []).append(clause_id)
+
+  def Matching(self, value):
+    """Returns the ids of the clauses whose interval contains the value."""
+    result = self.at_most[bisect.bisect_left(self.highs, value):]
+    result.extend(self.at_least[:bisect.bisect_right(self.lows, value)])
+    result.extend(self.equal.get(value, []))
+    return result
+
+
+class _RegexIndex(object):
+  """Regex client rules on one attribute combined into a single regex.
+
+  A value not matching the combined regex matches none of the rules, so most
+  values are rejected with one search. Regexes with groups or inline flags
+  would change meaning when combined and are always searched on their own.
+  """
+
+  FLAGS = re.I | re.S | re.M
+
+  def __init__(self):
+    self.regexes = []
+    self.combined = None
+
+  def Add(self, clause_id, regex):
+    self.regexes.append((clause_id, regex))
+
+    patterns = [
+        "(?:%s)" % r.pattern for _, r in self.regexes
+        if not r.groups and r.flags == self.FLAGS
+    ]
+    self.combined = None
+    if patterns:
+      try:
+        self.combined = re.compile("|".join(patterns), self.FLAGS)
+      except (re.error, AssertionError, OverflowError):
+        # Too many groups in the combined regex.
+        pass
+
+  def Matching(self, value):
+    """Returns the ids of the clauses whose regex is found in the value."""
+    combined_match = self.combined is None or self.combined.search(value)
+    return [clause_id for clause_id, regex in self.regexes
+            if ((combined_match or regex.groups or regex.flags != self.FLAGS)
+                and regex.search(value))]
+
+
+class _PathIndex(object):
+  """The client rules applying to one aff4 path under the client."""
+
+  # The prefixes of the System attribute ForemanOsClientRule checks for.
+  OS_NAMES = ("Windows", "Linux", "Darwin")
+
+  def __init__(self):
+    self.clause_ids = []
+    # Maps OS names to the ids of the OS clauses selecting them.
+    self.os_clauses = {}
+    # Maps label names to the ids of the label clauses naming them.
+    self.label_clauses = {}
+    # The number of distinct labels and the match mode of each label clause.
+    self.label_modes = {}
+    # Integer and regex clauses by attribute name.
+    self.integer_clauses = {}
+    self.regex_clauses = {}
+
+  def AddOsRule(self, clause_id, rule):
+    self.clause_ids.append(clause_id)
+    for name, selected in zip(
+        self.OS_NAMES, [rule.os_windows, rule.os_linux, rule.os_darwin]):
+      if selected:
+        self.os_clauses.setdefault(name, []).append(clause_id)
+
+  def AddLabelRule(self, clause_id, rule):
+    self.clause_ids.append(clause_id)
+    names = set(rule.label_names)
+    for name in names:
+      self.label_clauses.setdefault(name, []).append(clause_id)
+    self.label_modes[clause_id] = (len(names), rule.match_mode)
+
+  def AddIntegerRule(self, clause_id, rule):
+    self.clause_ids.append(clause_id)
+
+    op = rule.operator
+    value = int(rule.value)
+    intervals = self.integer_clauses.setdefault(rule.attribute_name,
+                                                _IntervalIndex())
+    if op == ForemanIntegerClientRule.Operator.LESS_THAN:
+      intervals.AddAtMost(clause_id, value - 1)
+    elif op == ForemanIntegerClientRule.Operator.GREATER_THAN:
+      intervals.AddAtLeast(clause_id, value + 1)
+    elif op == ForemanIntegerClientRule.Operator.EQUAL:
+      intervals.AddEqual(clause_id, value)
+    # Unknown operators never match.
+
+  def AddRegexRule(self, clause_id, rule):
+    self.clause_ids.append(clause_id)
+    self.regex_clauses.setdefault(rule.attribute_name, _RegexIndex()).Add(
+        clause_id, rule.attribute_regex.Compile())
+
+  def Matching(self, fd):
+    """Returns the ids of the clauses matching the given aff4 object."""
+    if fd is None:
+      return set()
+
+    result = set()
+    if self.os_clauses:
+      attribute = aff4.Attribute.NAMES.get("System")
+      if attribute is not None:
+        value = utils.SmartStr(fd.Get(attribute))
+        for name in self.OS_NAMES:
+          if value.startswith(name):
+            result.update(self.os_clauses.get(name, []))
+
+    if self.label_modes:
+      result.update(self._MatchingLabelClauses(set(fd.GetLabelsNames())))
+
+    for attribute_name, intervals in self.integer_clauses.iteritems():
+      attribute = aff4.Attribute.NAMES.get(attribute_name)
+      if attribute is None:
+        continue
+      try:
+        value = int(fd.Get(attribute))
+      except (ValueError, TypeError):
+        # Not an integer attribute.
+        continue
+      result.update(intervals.Matching(value))
+
+    for attribute_name, regexes in self.regex_clauses.iteritems():
+      attribute = aff4.Attribute.NAMES.get(attribute_name)
+      if attribute is not None:
+        result.update(regexes.Matching(utils.SmartStr(fd.Get(attribute))))
+
+    return result
+
+  def _MatchingLabelClauses(self, client_label_names):
+    hits = dict.fromkeys(self.label_modes, 0)
+    for name in client_label_names:
+      for clause_id in self.label_clauses.get(name, []):
+        hits[clause_id] += 1
+
+    modes = ForemanLabelClientRule.MatchMode
+    result = []
+    for clause_id, (num_names, match_mode) in self.label_modes.iteritems():
+      count = hits[clause_id]
+      if match_mode == modes.MATCH_ALL:
+        matches = count == num_names
+      elif match_mode == modes.MATCH_ANY:
+        matches = count > 0
+      elif match_mode == modes.DOES_NOT_MATCH_ALL:
+        matches = count < num_names
+      elif match_mode == modes.DOES_NOT_MATCH_ANY:
+        matches = count == 0
+      else:
+        raise ValueError("Unexpected match mode value: %s" % match_mode)
+
+      if matches:
+        result.append(clause_id)
+
+    return result
+
+
+class ForemanRuleIndex(object):
+  """Foreman rules compiled for evaluating them against many clients.
+
+  The client rules of all foreman rules are numbered and grouped by the aff4
+  path they apply to. OS and label rules are looked up by OS and label name,
+  integer rules in sorted interval lists and regex rules in one combined regex
+  per attribute.
+
+  Rule sets are first evaluated against the client object alone and further
+  aff4 objects are only opened for rule sets this did not decide.
+  """
+
+  def __init__(self, rules):
+    self.rules = rules
+    self.latest_rule = max([rule.created for rule in rules] or [0])
+    # The times the first and the last of the rules expire.
+    self.first_expiry = min([rule.expires for rule in rules] or [0])
+    self.last_expiry = max([rule.expires for rule in rules] or [0])
+
+    # The match mode and clause ids of each rule's client rule set.
+    self.rule_sets = []
+    # Maps relative aff4 paths to the _PathIndex of their clauses.
+    self.paths = {}
+
+    clause_id = 0
+    for rule in rules:
+      rule_set = rule.client_rule_set
+      clause_ids = []
+      for client_rule in rule_set.rules:
+        self._AddClientRule(clause_id, client_rule.UnionCast())
+        clause_ids.append(clause_id)
+        clause_id += 1
+
+      self.rule_sets.append((rule_set.match_mode, clause_ids))
+
+  def _AddClientRule(self, clause_id, client_rule):
+    if isinstance(client_rule, ForemanOsClientRule):
+      self._GetPathIndex("/").AddOsRule(clause_id, client_rule)
+    elif isinstance(client_rule, ForemanLabelClientRule):
+      self._GetPathIndex("/").AddLabelRule(clause_id, client_rule)
+    elif isinstance(client_rule, ForemanIntegerClientRule):
+      self._GetPathIndex(client_rule.path).AddIntegerRule(
+          clause_id, client_rule)
+    elif isinstance(client_rule, ForemanRegexClientRule):
+      self._GetPathIndex(client_rule.path).AddRegexRule(clause_id,
+                                                        client_rule)
+    else:
+      raise ValueError("Unexpected client rule: %s" % client_rule)
+
+  def _GetPathIndex(self, path):
+    return self.paths.setdefault(path, _PathIndex())
+
+  def _Decide(self, rule_set, matching, evaluated):
+    """Returns the result of a rule set or None if it is still undecided."""
+    match_mode, clause_ids = rule_set
+    if match_mode == ForemanClientRuleSet.MatchMode.MATCH_ALL:
+      if any(c in evaluated and c not in matching for c in clause_ids):
+        return False
+      if all(c in matching for c in clause_ids):
+        return True
+    elif match_mode == ForemanClientRuleSet.MatchMode.MATCH_ANY:
+      if any(c in matching for c in clause_ids):
+        return True
+      if all(c in evaluated for c in clause_ids):
+        return False
+    else:
+      raise ValueError("Unexpected match mode value: %s" % match_mode)
+
+    return None
+
+  def MatchingRules(self, client, since, token=None):
+    """Returns the rules matching a client.
+
+    Args:
+      client: The client's aff4 object.
+      since: Only rules created after this time are checked.
+      token: The token used to open further aff4 objects.
+
+    Returns:
+      A list of the matching unexpired rules, in the order of the rules.
+    """
+    client_id = client.urn
+    now = time.time() * 1e6
+
+    candidates = [
+        index for index, rule in enumerate(self.rules)
+        if rule.expires >= now and rule.created > since
+    ]
+    if not candidates:
+      return []
+
+    # Paths grouped by the aff4 object they refer to for this client.
+    paths_by_urn = {}
+    for path in self.paths:
+      paths_by_urn.setdefault(client_id.Add(path), []).append(path)
+
+    matching = set()
+    evaluated = set()
+
+    def EvaluateObject(urn, fd):
+      for path in paths_by_urn.pop(urn, []):
+        path_index = self.paths[path]
+        matching.update(path_index.Matching(fd))
+        evaluated.update(path_index.clause_ids)
+
+    EvaluateObject(client_id, client)
+
+    results = {}
+    undecided = []
+    for index in candidates:
+      result = self._Decide(self.rule_sets[index], matching, evaluated)
+      if result is None:
+        undecided.append(index)
+      else:
+        results[index] = result
+
+    if undecided:
+      # Only the paths still needed by undecided rule sets are opened.
+      needed = set()
+      for index in undecided:
+        needed.update(self.rule_sets[index][1])
+
+      urns = [
+          urn for urn, paths in paths_by_urn.iteritems()
+          if any(needed.intersection(self.paths[p].clause_ids) for p in paths)
+      ]
+      fds = dict((fd.urn, fd) for fd in aff4.FACTORY.MultiOpen(
+          urns, token=token))
+      for urn in urns:
+        EvaluateObject(urn, fds.get(urn))
+
+      for index in undecided:
+        results[index] = self._Decide(self.rule_sets[index], matching,
+                                      evaluated)
+
+    return [self.rules[index] for index in candidates if results[index]]
@@ -3,12 +3,17 @@
 
 
 
+import asyncore
 import BaseHTTPServer
 import cgi
+import collections
 import cStringIO
+import io
+import os
 import pdb
 import socket
 import SocketServer
+import tempfile
 import threading
 import time
 
@@ -30,6 +35,7 @@ from grr.lib import master
 from grr.lib import rdfvalue
 from grr.lib import server_startup
 from grr.lib import stats
+from grr.lib import threadpool
 from grr.lib import utils
 from grr.lib.rdfvalues import flows as rdf_flows
 
@@ -282,8 +288,406 @@ class GRRHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
                                        **kwargs)
 
 
+class BufferedRequest(object):
+  """A fully received request, presented to the handler as a connection.
+
+  GRRHTTPServerHandler reads the request through rfile and writes the response
+  to wfile, both of which are created by calling makefile() on the connection.
+  This object hands out the buffered request data and collects the response so
+  the handler can run on a worker thread without touching the real socket.
+  """
+
+  def __init__(self, request_fd):
+    self.request_fd = request_fd
+    self.response = io.BytesIO()
+
+  def makefile(self, mode="r", unused_bufsize=-1):
+    if "w" in mode:
+      return _ResponseFile(self.response)
+    return self.request_fd
+
+  def settimeout(self, unused_timeout):
+    pass
+
+
+class _ResponseFile(object):
+  """The wfile of a BufferedRequest, which survives the handler closing it."""
+
+  def __init__(self, buffer_fd):
+    self.buffer_fd = buffer_fd
+    self.closed = False
+
+  def write(self, data):
+    self.buffer_fd.write(data)
+
+  def flush(self):
+    pass
+
+  def close(self):
+    self.closed = True
+
+
+class HTTPRequestChannel(asyncore.dispatcher):
+  """Reads a single request from a client connection and writes the response.
+
+  The channel buffers the request until it is complete, without blocking the
+  event loop, and then passes it to the server for processing on a worker
+  thread. Once the response is ready it is written back and the connection is
+  closed, just like the HTTP/1.0 responses of GRRHTTPServerHandler.
+  """
+
+  RECV_BLOCK_SIZE = 64 * 1024
+  MAX_HEADER_SIZE = 64 * 1024
+
+  # Requests larger than this are spooled to disk.
+  SPOOL_SIZE = 1024 * 1024
+
+  def __init__(self, server, sock, client_address):
+    asyncore.dispatcher.__init__(self, sock, map=server.socket_map)
+    self.server = server
+    self.client_address = client_address
+
+    self.request_fd = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_SIZE)
+    self.headers = ""
+    self.headers_complete = False
+    self.request_complete = False
+
+    # Body framing state: the number of bytes still expected with a
+    # Content-Length or the parser state of a chunked body.
+    self.content_remaining = 0
+    self.chunked = False
+    self.chunk_buffer = ""
+    self.chunk_remaining = 0
+    self.in_trailer = False
+
+    self.response = None
+    self.response_offset = 0
+
+  def readable(self):
+    return not self.request_complete
+
+  def writable(self):
+    return self.response is not None
+
+  def handle_read(self):
+    data = self.recv(self.RECV_BLOCK_SIZE)
+    if not data or self.request_complete:
+      return
+
+    if not self.headers_complete:
+      self.headers += data
+      end = self.headers.find("\r\n\r\n")
+      if end == -1:
+        if len(self.headers) > self.MAX_HEADER_SIZE:
+          logging.error("Request headers from %s too large.",
+                        self.client_address[0])
+          self.close()
+        return
+
+      data = self.headers[end + 4:]
+      self.headers = self.headers[:end + 4]
+      self.request_fd.write(self.headers)
+      self.headers_complete = True
+      self._ParseHeaders()
+
+    self.request_fd.write(data)
+    if self.chunked:
+      self.request_complete = self._ConsumeChunks(data)
+    else:
+      self.content_remaining -= len(data)
+      self.request_complete = self.content_remaining <= 0
+
+    if self.request_complete:
+      self.request_fd.seek(0)
+      self.server.DispatchRequest(self)
+
+  def _ParseHeaders(self):
+    """Works out how the request body is delimited."""
+    for line in self.headers.split("\r\n")[1:]:
+      name, _, value = line.partition(":")
+      name = name.strip().lower()
+      value = value.strip()
+      if name == "content-length":
+        try:
+          self.content_remaining = int(value)
+        except ValueError:
+          pass
+      elif name == "transfer-encoding" and value.lower() == "chunked":
+        self.chunked = True
+
+  def _ConsumeChunks(self, data):
+    """Follows a chunked body, returning True once it has been received."""
+    self.chunk_buffer += data
+    while True:
+      if self.chunk_remaining:
+        consumed = min(self.chunk_remaining, len(self.chunk_buffer))
+        self.chunk_remaining -= consumed
+        self.chunk_buffer = self.chunk_buffer[consumed:]
+        if self.chunk_remaining:
+          return False
+        continue
+
+      end = self.chunk_buffer.find("\r\n")
+      if end == -1:
+        return False
+
+      line = self.chunk_buffer[:end]
+      self.chunk_buffer = self.chunk_buffer[end + 2:]
+      if self.in_trailer:
+        # The trailer ends with an empty line.
+        if not line:
+          return True
+        continue
+
+      try:
+        chunk_size = int(line.split(";")[0], 16)
+      except ValueError:
+        # Let the handler report the broken encoding.
+        return True
+
+      if chunk_size == 0:
+        self.in_trailer = True
+      else:
+        # The chunk data is followed by \r\n.
+        self.chunk_remaining = chunk_size + 2
+
+  def SetResponse(self, response):
+    self.response = response
+    self.request_fd.close()
+    if not response:
+      self.close()
+
+  def handle_write(self):
+    sent = self.send(
+        buffer(self.response, self.response_offset, self.RECV_BLOCK_SIZE))
+    self.response_offset += sent
+    if self.response_offset >= len(self.response):
+      self.response = None
+      self.close()
+
+  def handle_close(self):
+    self.close()
+
+  def handle_error(self):
+    logging.exception("Error handling connection from %s.",
+                      self.client_address[0])
+    self.close()
+
+  def close(self):
+    asyncore.dispatcher.close(self)
+    self.server.RemoveChannel(self)
+
+
+class _WakeupDispatcher(asyncore.file_dispatcher):
+  """Interrupts the event loop when worker threads finish requests."""
+
+  def __init__(self, server):
+    self.read_fd, self.write_fd = os.pipe()
+    asyncore.file_dispatcher.__init__(self, self.read_fd, map=server.socket_map)
+    self.server = server
+    os.close(self.read_fd)
+
+  def writable(self):
+    return False
+
+  def Wakeup(self):
+    try:
+      os.write(self.write_fd, "x")
+    except OSError:
+      pass
+
+  def handle_read(self):
+    try:
+      self.recv(4096)
+    except OSError:
+      pass
+
+    self.server.ProcessCompletedRequests()
+
+  def close(self):
+    asyncore.file_dispatcher.close(self)
+    os.close(self.write_fd)
+
+
+class AsyncGRRHTTPServer(asyncore.dispatcher):
+  """An event loop based GRR HTTP frontend server.
+
+  Connections are accepted and read by a single thread running the event loop.
+  Complete requests are processed by GRRHTTPServerHandler on a bounded pool of
+  worker threads, so the number of threads does not grow with the number of
+  polling clients. When all workers are busy, requests wait in a queue and
+  once max_pending_requests are waiting no new connections are accepted until
+  the workers catch up.
+  """
+
+  request_queue_size = 500
+
+  def __init__(self,
+               server_address,
+               handler,
+               frontend=None,
+               worker_threads=None,
+               max_pending_requests=None):
+    self.socket_map = {}
+    asyncore.dispatcher.__init__(self, map=self.socket_map)
+
+    stats.STATS.SetGaugeValue("frontend_max_active_count",
+                              self.request_queue_size)
+
+    self.handler = handler
+    if frontend:
+      self.frontend = frontend
+    else:
+      self.frontend = front_end.FrontEndServer(
+          certificate=config_lib.CONFIG["Frontend.certificate"],
+          private_key=config_lib.CONFIG["PrivateKeys.server_key"],
+          max_queue_size=config_lib.CONFIG["Frontend.max_queue_size"],
+          message_expiry_time=config_lib.CONFIG["Frontend.message_expiry_time"],
+          max_retransmission_time=config_lib.CONFIG[
+              "Frontend.max_retransmission_time"])
+    self.server_cert = config_lib.CONFIG["Frontend.certificate"]
+
+    if worker_threads is None:
+      worker_threads = config_lib.CONFIG["Frontend.worker_threads"]
+    if max_pending_requests is None:
+      max_pending_requests = config_lib.CONFIG["Frontend.max_pending_requests"]
+    self.max_pending_requests = max_pending_requests
+
+    (address, _) = server_address
+    if ipaddr.IPAddress(address).version == 4:
+      address_family = socket.AF_INET
+    else:
+      address_family = socket.AF_INET6
+
+    logging.info("Will attempt to listen on %s", server_address)
+    self.create_socket(address_family, socket.SOCK_STREAM)
+    try:
+      self.set_reuse_addr()
+      self.bind(server_address)
+      self.listen(self.request_queue_size)
+    except socket.error:
+      self.close()
+      raise
+    self.server_address = self.socket.getsockname()
+
+    # Requests that are complete but could not be handed to the worker pool
+    # yet. Only accessed from the event loop thread.
+    self.pending = collections.deque()
+    # Channels whose responses are ready, filled by the worker threads.
+    self.completed = collections.deque()
+    self.channels = set()
+
+    # The pool name must be unique, so give every server its own pool.
+    self.thread_pool = threadpool.ThreadPool.Factory(
+        "grr_frontend_%d" % self.server_address[1],
+        min_threads=1,
+        max_threads=worker_threads)
+    self.thread_pool.Start()
+
+    self.wakeup = _WakeupDispatcher(self)
+    self.running = False
+    self.stopped = threading.Event()
+
+  def readable(self):
+    # Apply backpressure: leave new connections in the listen backlog while
+    # too many requests are waiting for a worker.
+    return len(self.pending) < self.max_pending_requests
+
+  def writable(self):
+    return False
+
+  def handle_accept(self):
+    try:
+      pair = self.accept()
+    except socket.error:
+      return
+
+    if pair is None:
+      return
+
+    sock, client_address = pair
+    self.channels.add(HTTPRequestChannel(self, sock, client_address))
+
+  def RemoveChannel(self, channel):
+    self.channels.discard(channel)
+
+  def DispatchRequest(self, channel):
+    """Queues a complete request for processing on the worker pool."""
+    self.pending.append((channel, time.time()))
+    self._DispatchPending()
+
+  def _DispatchPending(self):
+    while self.pending:
+      channel, received_time = self.pending[0]
+      try:
+        self.thread_pool.AddTask(
+            target=self._ProcessRequest,
+            args=(channel, received_time),
+            name="HTTPRequest",
+            blocking=False,
+            inline=False)
+      except threadpool.Full:
+        return
+
+      self.pending.popleft()
+
+  def _ProcessRequest(self, channel, received_time):
+    """Runs the request handler, called on a worker thread."""
+    stats.STATS.RecordEvent(
+        "frontend_request_queueing_time",
+        time.time() - received_time,
+        fields=["http"])
+
+    request = BufferedRequest(channel.request_fd)
+    try:
+      self.handler(request, channel.client_address, self)
+    except Exception as e:  # pylint: disable=broad-except
+      logging.exception("Error handling request from %s: %s",
+                        channel.client_address[0], e)
+
+    self.completed.append((channel, request.response.getvalue()))
+    self.wakeup.Wakeup()
+
+  def ProcessCompletedRequests(self):
+    """Starts sending finished responses back to the clients."""
+    while self.completed:
+      channel, response = self.completed.popleft()
+      channel.SetResponse(response)
+
+    self._DispatchPending()
+
+  def handle_error(self):
+    logging.exception("Error in the frontend event loop.")
+
+  def serve_forever(self):
+    """Runs the event loop until shutdown() is called."""
+    self.running = True
+    self.stopped.clear()
+    try:
+      while self.running:
+        asyncore.loop(timeout=1, use_poll=True, map=self.socket_map, count=1)
+    finally:
+      self.thread_pool.Stop()
+      for channel in list(self.channels):
+        channel.close()
+      self.wakeup.close()
+      self.close()
+      self.stopped.set()
+
+  def shutdown(self):
+    """Stops the event loop and waits for it to exit."""
+    self.running = False
+    self.wakeup.Wakeup()
+    self.stopped.wait()
+
+
 def CreateServer(frontend=None):
   """Start frontend http server."""
+  if config_lib.CONFIG["Frontend.event_loop"]:
+    server_cls = AsyncGRRHTTPServer
+  else:
+    server_cls = GRRHTTPServer
+
   max_port = config_lib.CONFIG.Get("Frontend.port_max",
                                    config_lib.CONFIG["Frontend.bind_port"])
 
@@ -291,7 +695,7 @@ def CreateServer(frontend=None):
 
     server_address = (config_lib.CONFIG["Frontend.bind_address"], port)
     try:
-      httpd = GRRHTTPServer(
+      httpd = server_cls(
           server_address, GRRHTTPServerHandler, frontend=frontend)
       break
     except socket.error as e:
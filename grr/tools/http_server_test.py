@@ -4,6 +4,7 @@
 
 import hashlib
 import os
+import socket
 import threading
 
 
@@ -21,6 +22,7 @@ from grr.lib import file_store
 from grr.lib import flags
 from grr.lib import front_end
 from grr.lib import rdfvalue
+from grr.lib import stats
 from grr.lib import test_lib
 from grr.lib import utils
 from grr.lib import worker_mocks
@@ -34,6 +36,8 @@ from grr.tools import http_server
 class GRRHTTPServerTest(test_lib.GRRBaseTest):
   """Test the http server."""
 
+  server_cls = http_server.GRRHTTPServer
+
   @classmethod
   def setUpClass(cls):
     super(GRRHTTPServerTest, cls).setUpClass()
@@ -41,7 +45,7 @@ class GRRHTTPServerTest(test_lib.GRRBaseTest):
     front_end.FrontendInit().RunOnce()
 
     # Bring up a local server for testing.
-    cls.httpd = http_server.GRRHTTPServer(
+    cls.httpd = cls.server_cls(
         ("127.0.0.1", portpicker.PickUnusedPort()),
         http_server.GRRHTTPServerHandler)
 
@@ -349,6 +353,75 @@ class GRRHTTPServerTest(test_lib.GRRBaseTest):
         self.assertFalse(filestore_fd.Get(filestore_fd.Schema.STAT))
 
 
+class AsyncGRRHTTPServerTest(GRRHTTPServerTest):
+  """Runs the http server tests against the event loop server."""
+
+  server_cls = http_server.AsyncGRRHTTPServer
+
+  def _SendRawRequest(self, data):
+    sock = socket.create_connection(self.httpd.server_address)
+    try:
+      # Send the request in small pieces to exercise incremental parsing.
+      for i in range(0, len(data), 7):
+        sock.sendall(data[i:i + 7])
+
+      response = []
+      while True:
+        received = sock.recv(4096)
+        if not received:
+          break
+        response.append(received)
+      return "".join(response)
+    finally:
+      sock.close()
+
+  def testRequestSentInPieces(self):
+    response = self._SendRawRequest("GET /server.pem HTTP/1.0\r\n\r\n")
+    self.assertTrue(response.startswith("HTTP/1.0 200 OK"))
+    self.assertIn("BEGIN CERTIFICATE", response)
+
+  def testChunkedUploadSentInPieces(self):
+    body = "5;ext=1\r\nhello\r\n6\r\n world\r\n0\r\n\r\n"
+    with test_lib.Instrument(logging, "error") as logger:
+      response = self._SendRawRequest("POST /upload HTTP/1.1\r\n"
+                                      "Transfer-Encoding: chunked\r\n"
+                                      "\r\n" + body)
+
+    # The upload token is missing, so the request is processed and rejected.
+    self.assertTrue(response.startswith("HTTP/1.0 500"))
+    self.assertRegexpMatches("HMAC not provided", str(logger.args))
+
+  def testQueueingTimeIsRecorded(self):
+    before = stats.STATS.GetMetricValue(
+        "frontend_request_queueing_time", fields=["http"]).count
+
+    requests.get(self.base_url + "server.pem")
+
+    after = stats.STATS.GetMetricValue(
+        "frontend_request_queueing_time", fields=["http"]).count
+    self.assertEqual(after, before + 1)
+
+  def testBackpressure(self):
+    server = http_server.AsyncGRRHTTPServer(
+        ("127.0.0.1", portpicker.PickUnusedPort()),
+        http_server.GRRHTTPServerHandler,
+        worker_threads=1,
+        max_pending_requests=2)
+    try:
+      self.assertTrue(server.readable())
+
+      # Queued requests stop the server from accepting connections.
+      server.pending.extend([(None, 0), (None, 0)])
+      self.assertFalse(server.readable())
+
+      server.pending.popleft()
+      self.assertTrue(server.readable())
+    finally:
+      server.thread_pool.Stop()
+      server.wakeup.close()
+      server.close()
+
+
 def main(args):
   test_lib.main(args)
 
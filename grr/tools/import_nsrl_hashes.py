@@ -28,8 +28,17 @@ def _ImportRow(store, row, product_code_list, op_system_code_list):
   file_name = utils.SmartUnicode(row[3])
   file_size = int(row[4])
   special_code = row[7]
-  store.AddHash(sha1, md5, crc, file_name, file_size, product_code_list,
-                op_system_code_list, special_code)
+  # The hash filter is rebuilt once the whole file is imported.
+  store.AddHash(
+      sha1,
+      md5,
+      crc,
+      file_name,
+      file_size,
+      product_code_list,
+      op_system_code_list,
+      special_code,
+      update_filter=False)
 
 
 def ImportFile(store, filename, start):
@@ -94,6 +103,8 @@ def main(unused_argv):
       token=aff4.FACTORY.root_token) as store:
     imported = ImportFile(store, filename, flags.FLAGS.start)
     data_store.DB.Flush()
+    print "Rebuilding the hash filter"
+    store.RebuildHashFilter()
     print "Imported %d hashes" % imported
 
 